@@ -14,6 +14,72 @@ ENV_FILE_PATH = Path(__file__).parent.parent.parent / ".env"
 # Environment variable names
 LANGCHAIN_TRACING_V2 = "LANGCHAIN_TRACING_V2"
 LANGCHAIN_PROJECT = "LANGCHAIN_PROJECT"
+RESPONSE_CACHE_ENABLED = "RESPONSE_CACHE_ENABLED"
+RESPONSE_CACHE_MAX_ENTRIES = "RESPONSE_CACHE_MAX_ENTRIES"
+RESPONSE_CACHE_MAX_BYTES = "RESPONSE_CACHE_MAX_BYTES"
+RESPONSE_CACHE_TTL_SECONDS = "RESPONSE_CACHE_TTL_SECONDS"
+RESPONSE_CACHE_PATH = "RESPONSE_CACHE_PATH"
+RESPONSE_CACHE_COMPACTION_SECONDS = "RESPONSE_CACHE_COMPACTION_SECONDS"
+SEMANTIC_CACHE_ENABLED = "SEMANTIC_CACHE_ENABLED"
+SEMANTIC_CACHE_EMBEDDING_MODEL = "SEMANTIC_CACHE_EMBEDDING_MODEL"
+SEMANTIC_CACHE_THRESHOLD = "SEMANTIC_CACHE_THRESHOLD"
+SEMANTIC_CACHE_CAPACITY = "SEMANTIC_CACHE_CAPACITY"
+REQUEST_COALESCING_ENABLED = "REQUEST_COALESCING_ENABLED"
+MICRO_BATCHING_ENABLED = "MICRO_BATCHING_ENABLED"
+MICRO_BATCH_MAX_SIZE = "MICRO_BATCH_MAX_SIZE"
+MICRO_BATCH_MAX_WAIT_MS = "MICRO_BATCH_MAX_WAIT_MS"
+ADMISSION_CONTROL_ENABLED = "ADMISSION_CONTROL_ENABLED"
+ADMISSION_MAX_CONCURRENCY = "ADMISSION_MAX_CONCURRENCY"
+ADMISSION_MAX_QUEUE = "ADMISSION_MAX_QUEUE"
+REQUEST_DEADLINES_ENABLED = "REQUEST_DEADLINES_ENABLED"
+REQUEST_DEFAULT_TIMEOUT_SECONDS = "REQUEST_DEFAULT_TIMEOUT_SECONDS"
+REQUEST_MAX_TIMEOUT_SECONDS = "REQUEST_MAX_TIMEOUT_SECONDS"
+ADMIN_TOKEN = "ADMIN_TOKEN"
+LLM_BACKEND = "LLM_BACKEND"
+LAZY_BACKEND_STARTUP = "LAZY_BACKEND_STARTUP"
+API_WORKERS = "API_WORKERS"
+API_RELOAD = "API_RELOAD"
+API_GRACEFUL_SHUTDOWN_SECONDS = "API_GRACEFUL_SHUTDOWN_SECONDS"
+METRICS_MULTIPROC_DIR = "METRICS_MULTIPROC_DIR"
+CHAT_SESSIONS_ENABLED = "CHAT_SESSIONS_ENABLED"
+CHAT_SESSION_MAX_SESSIONS = "CHAT_SESSION_MAX_SESSIONS"
+CHAT_SESSION_IDLE_SECONDS = "CHAT_SESSION_IDLE_SECONDS"
+CHAT_SESSION_MAX_CONTEXT_TOKENS = "CHAT_SESSION_MAX_CONTEXT_TOKENS"
+CHAT_SESSION_DB_PATH = "CHAT_SESSION_DB_PATH"
+CHAT_SESSION_RETENTION_SECONDS = "CHAT_SESSION_RETENTION_SECONDS"
+CHAT_PROMPT_MAX_TOKENS = "CHAT_PROMPT_MAX_TOKENS"
+CHAT_HISTORY_MAX_TOKENS = "CHAT_HISTORY_MAX_TOKENS"
+CHAT_HISTORY_SUMMARIZE = "CHAT_HISTORY_SUMMARIZE"
+CHAT_SUMMARY_MAX_TOKENS = "CHAT_SUMMARY_MAX_TOKENS"
+TOKENIZER_PATH = "TOKENIZER_PATH"
+LLM_CONTEXT_WINDOW = "LLM_CONTEXT_WINDOW"
+LLM_MAX_INPUT_TOKENS = "LLM_MAX_INPUT_TOKENS"
+LLM_MAX_OUTPUT_TOKENS = "LLM_MAX_OUTPUT_TOKENS"
+LLM_INPUT_OVERFLOW = "LLM_INPUT_OVERFLOW"
+LOCAL_MODEL_PATH = "LOCAL_MODEL_PATH"
+LOCAL_MODEL_THREADS = "LOCAL_MODEL_THREADS"
+LOCAL_MODEL_MAX_BATCH_SIZE = "LOCAL_MODEL_MAX_BATCH_SIZE"
+LOCAL_MODEL_MAX_WAIT_MS = "LOCAL_MODEL_MAX_WAIT_MS"
+SIMULATED_LOAD_SECONDS = "SIMULATED_LOAD_SECONDS"
+SIMULATED_PREFILL_MS_PER_TOKEN = "SIMULATED_PREFILL_MS_PER_TOKEN"
+SIMULATED_DECODE_TOKENS_PER_SECOND = "SIMULATED_DECODE_TOKENS_PER_SECOND"
+SIMULATED_OUTPUT_TOKENS = "SIMULATED_OUTPUT_TOKENS"
+SIMULATED_MAX_CONCURRENCY = "SIMULATED_MAX_CONCURRENCY"
+SIMULATED_ERROR_RATE = "SIMULATED_ERROR_RATE"
+SIMULATED_SEED = "SIMULATED_SEED"
+OLLAMA_BASE_URL = "OLLAMA_BASE_URL"
+OLLAMA_PROBE_TIMEOUT = "OLLAMA_PROBE_TIMEOUT"
+OLLAMA_HOSTS = "OLLAMA_HOSTS"
+OLLAMA_SESSION_AFFINITY = "OLLAMA_SESSION_AFFINITY"
+OLLAMA_EJECTION_SECONDS = "OLLAMA_EJECTION_SECONDS"
+OLLAMA_ASYNC_BACKEND = "OLLAMA_ASYNC_BACKEND"
+OLLAMA_MAX_CONNECTIONS = "OLLAMA_MAX_CONNECTIONS"
+OLLAMA_MAX_KEEPALIVE_CONNECTIONS = "OLLAMA_MAX_KEEPALIVE_CONNECTIONS"
+OLLAMA_CONNECT_TIMEOUT = "OLLAMA_CONNECT_TIMEOUT"
+OLLAMA_READ_TIMEOUT = "OLLAMA_READ_TIMEOUT"
+OLLAMA_PRELOAD = "OLLAMA_PRELOAD"
+OLLAMA_KEEP_ALIVE = "OLLAMA_KEEP_ALIVE"
+OLLAMA_WARM_CHECK_SECONDS = "OLLAMA_WARM_CHECK_SECONDS"
 
 def load_environment():
     """
@@ -45,5 +111,53 @@ def get_langchain_project():
     """
     return os.getenv(LANGCHAIN_PROJECT)
 
+def get_bool_setting(name, default=False):
+    """
+    Get a boolean setting from an environment variable.
+    
+    Args:
+        name: The name of the environment variable.
+        default: The value to return if the variable is not set.
+    
+    Returns:
+        bool: True for "1", "true", "yes" or "on" (case-insensitive), False for any other value.
+    """
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+def get_int_setting(name, default):
+    """
+    Get an integer setting from an environment variable.
+    
+    Args:
+        name: The name of the environment variable.
+        default: The value to return if the variable is not set or not a valid integer.
+    
+    Returns:
+        int: The value of the environment variable.
+    """
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+def get_float_setting(name, default):
+    """
+    Get a float setting from an environment variable.
+    
+    Args:
+        name: The name of the environment variable.
+        default: The value to return if the variable is not set or not a valid number.
+    
+    Returns:
+        float: The value of the environment variable.
+    """
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
 # Load environment variables when module is imported
 load_environment() 
\ No newline at end of file
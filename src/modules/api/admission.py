@@ -0,0 +1,303 @@
+"""
+Admission control for the Llama 2 chatbot API.
+
+This module limits the number of generation requests served at the same time
+and the number waiting for a slot. Requests that find the wait queue full are
+rejected at once with 429 Too Many Requests and a Retry-After estimated from
+how fast the queue currently drains, instead of piling up in the backend until
+every client times out. A free slot is never handed to a request whose deadline
+passed while it was queued; that request gets 504 Gateway Timeout instead.
+"""
+
+import asyncio
+import json
+import logging
+import math
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple, Union
+
+from src.modules.api.metrics import Histogram
+from src.modules.api.request_context import get_request_context
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request cannot be admitted because the wait queue is full.
+    """
+
+    def __init__(self, retry_after: int):
+        """
+        Initialize the exception.
+
+        Args:
+            retry_after: The suggested number of seconds before retrying.
+        """
+        super().__init__(f"Server overloaded, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+class AdmissionExpired(Exception):
+    """
+    Raised when the deadline of a request passes before it gets a slot.
+    """
+
+class AdmissionController:
+    """
+    Bounded concurrency with a bounded FIFO wait queue.
+
+    The drain rate is estimated from an exponentially weighted moving average
+    (EWMA) of the service time of admitted requests: with max_concurrency slots,
+    about max_concurrency / service_time requests complete per second.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        max_queue: int = 64,
+        ewma_alpha: float = 0.2,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize the admission controller.
+
+        Args:
+            max_concurrency: The maximum number of requests served at once. Defaults to 16.
+            max_queue: The maximum number of requests waiting for a slot. Defaults to 64.
+            ewma_alpha: The weight of the newest service time in the average. Defaults to 0.2.
+            clock: The time source, in seconds. Defaults to time.monotonic.
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.ewma_alpha = ewma_alpha
+        self._clock = clock
+        # Waiting requests, with their deadlines on the controller's clock
+        self._waiters: Deque[Tuple[asyncio.Future, Optional[float]]] = deque()
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.abandoned = 0
+        self.expired = 0
+        self.service_time_ewma: Optional[float] = None
+        self.wait_histogram = Histogram(
+            "llama_admission_wait_seconds",
+            "Time requests spent waiting for a concurrency slot",
+        )
+
+    @property
+    def queued(self) -> int:
+        """The number of requests waiting for a slot."""
+        return sum(1 for waiter, _ in self._waiters if not waiter.done())
+
+    def drain_rate(self) -> Optional[float]:
+        """
+        Estimate how many requests complete per second at full concurrency.
+
+        Returns:
+            The estimated drain rate, or None before the first request completed.
+        """
+        if not self.service_time_ewma:
+            return None
+        return self.max_concurrency / self.service_time_ewma
+
+    def retry_after(self) -> int:
+        """
+        Estimate how long a rejected client should wait before retrying.
+
+        Returns:
+            The number of seconds until the current queue has drained, at least 1.
+        """
+        rate = self.drain_rate()
+        if rate is None:
+            return 1
+        return max(1, math.ceil((self.queued + 1) / rate))
+
+    async def acquire(self, deadline: Optional[float] = None) -> None:
+        """
+        Wait for a concurrency slot.
+
+        Every successful call must be matched by a call to release().
+
+        Args:
+            deadline: The time on the controller's clock after which the request
+                no longer needs a slot, if any.
+
+        Raises:
+            AdmissionRejected: If every slot is busy and the wait queue is full.
+            AdmissionExpired: If the deadline passed before a slot was free.
+        """
+        if deadline is not None and deadline <= self._clock():
+            self.expired += 1
+            raise AdmissionExpired()
+        if self.active < self.max_concurrency and not self.queued:
+            self.active += 1
+            self.admitted += 1
+            self.wait_histogram.observe(0.0)
+            return
+
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected(self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (waiter, deadline)
+        self._waiters.append(entry)
+        started = self._clock()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                if waiter.exception() is None:
+                    # The slot was handed over just before the cancellation; pass it on
+                    self.release()
+                # Otherwise it expired in the queue, and was counted then
+            else:
+                # The client went away or its deadline passed while it was queued
+                try:
+                    self._waiters.remove(entry)
+                except ValueError:
+                    # release() already dropped the cancelled waiter
+                    pass
+                self.abandoned += 1
+            raise
+        self.admitted += 1
+        self.wait_histogram.observe(self._clock() - started)
+
+    def release(self, service_time: Optional[float] = None) -> None:
+        """
+        Give back a concurrency slot, handing it to the next waiting request if any.
+
+        Args:
+            service_time: How long the request held the slot, in seconds, if it was served.
+        """
+        if service_time is not None:
+            alpha = self.ewma_alpha
+            self.service_time_ewma = (
+                service_time if self.service_time_ewma is None
+                else alpha * service_time + (1 - alpha) * self.service_time_ewma
+            )
+        now = self._clock()
+        while self._waiters:
+            waiter, deadline = self._waiters.popleft()
+            if waiter.done():
+                continue
+            if deadline is not None and deadline <= now:
+                # Nobody waits for its response any more; the slot goes to the next one
+                self.expired += 1
+                waiter.set_exception(AdmissionExpired())
+                continue
+            waiter.set_result(None)
+            return
+        self.active -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the admission statistics.
+
+        Returns:
+            A dictionary with the limits, the current load and the counters.
+        """
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "abandoned": self.abandoned,
+            "expired": self.expired,
+            "service_time_ewma_seconds": self.service_time_ewma,
+            "drain_rate_per_second": self.drain_rate(),
+            "wait_seconds": self.wait_histogram.snapshot(),
+        }
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware that applies an AdmissionController to generation requests.
+
+    Only POST requests below path_prefix are limited. A request holds its slot
+    until its response, including a streamed one, has been sent completely. The
+    deadline set on the request context by the DeadlineMiddleware, if any, is
+    passed on to the controller.
+    """
+
+    def __init__(
+        self,
+        app: Any,
+        controller: AdmissionController,
+        path_prefix: Union[str, Tuple[str, ...]] = "/llama/",
+    ):
+        """
+        Initialize the middleware.
+
+        Args:
+            app: The ASGI application to wrap.
+            controller: The admission controller.
+            path_prefix: The path prefix of the limited endpoints, or a tuple of
+                prefixes. Defaults to "/llama/".
+        """
+        self.app = app
+        self.controller = controller
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if (
+            scope["type"] != "http"
+            or scope.get("method") != "POST"
+            or not scope.get("path", "").startswith(self.path_prefix)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        queued_at = time.monotonic()
+        context = get_request_context()
+        try:
+            await self.controller.acquire(context.deadline if context is not None else None)
+        except AdmissionRejected as e:
+            logger.warning(f"Rejecting {scope.get('path')}: {e}")
+            await self._send_rejection(send, e.retry_after)
+            return
+        except AdmissionExpired:
+            logger.info(f"Dropping {scope.get('path')}: its deadline passed while it was queued")
+            await self._send_expiry(send)
+            return
+
+        started = time.monotonic()
+        if context is not None:
+            context.add_timing("queue", started - queued_at)
+        served = False
+        try:
+            await self.app(scope, receive, send)
+            served = True
+        finally:
+            self.controller.release(time.monotonic() - started if served else None)
+
+    @staticmethod
+    async def _send_rejection(send: Any, retry_after: int) -> None:
+        """Send a 429 response with a Retry-After header."""
+        body = json.dumps({"detail": "Server is overloaded, please retry later"}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"retry-after", str(retry_after).encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    @staticmethod
+    async def _send_expiry(send: Any) -> None:
+        """Send a 504 response to a request whose deadline passed while it was queued."""
+        body = json.dumps({"detail": "Request timed out while waiting for a slot"}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 504,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -1,13 +1,35 @@
 """
 API server runner for the Llama 2 chatbot.
 
-This module provides a script to run the FastAPI server with Uvicorn.
+This module provides a script to run the FastAPI server with Uvicorn, either in
+production mode, with several worker processes, or in development mode, with a
+single process that reloads on code changes.
 """
 
+import argparse
 import logging
-import uvicorn
-from src.modules.api.api_service import ApiService
-from src.config.environment_config import load_environment
+import os
+import tempfile
+from typing import List, Optional
+from src.modules.api.startup import startup_timer
+
+with startup_timer.phase("server_imports"):
+    import uvicorn
+    from src.modules.api.api_service import ApiService
+from src.config.environment_config import (
+    ADMISSION_MAX_CONCURRENCY,
+    ADMISSION_MAX_QUEUE,
+    API_GRACEFUL_SHUTDOWN_SECONDS,
+    API_RELOAD,
+    API_WORKERS,
+    CHAT_SESSIONS_ENABLED,
+    LLM_BACKEND,
+    METRICS_MULTIPROC_DIR,
+    get_bool_setting,
+    get_int_setting,
+    load_environment,
+)
+from src.modules.api.worker_metrics import clear_metrics_directory
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -16,32 +38,116 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_environment()
 
-def run_server(host: str = "0.0.0.0", port: int = 8000, reload: bool = True):
+# Import string of the app factory, which every worker process calls
+APP_FACTORY = "src.modules.api.api_server:create_app"
+
+def create_app():
+    """
+    Create the FastAPI application of one server process.
+
+    In production mode the backend is initialized before the process accepts
+    requests, and a preloaded model is loaded first.
+
+    Returns:
+        The FastAPI application.
+    """
+    if get_bool_setting(API_RELOAD, False):
+        return ApiService().get_app()
+    return ApiService(lazy=False, wait_until_warm=True).get_app()
+
+def default_workers() -> int:
+    """
+    Get the number of worker processes to run by default.
+
+    Returns:
+        One per CPU available to the process, or 1 for the in-process Hugging Face
+        backend, which would load the model once per worker, and with chat
+        sessions, which each worker would serve from its own copy in memory.
+    """
+    if os.getenv(LLM_BACKEND, "auto").strip().lower() == "huggingface":
+        return 1
+    if get_bool_setting(CHAT_SESSIONS_ENABLED, True):
+        return 1
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        # Not available on Windows and macOS
+        return os.cpu_count() or 1
+
+def scale_admission_limits(workers: int) -> None:
+    """
+    Split the admission limits of the server between its worker processes.
+
+    ADMISSION_MAX_CONCURRENCY and ADMISSION_MAX_QUEUE are limits for the whole
+    server, but each worker admits requests on its own, so each gets its share,
+    at least 1 request.
+
+    Args:
+        workers: The number of worker processes.
+    """
+    for name, default in ((ADMISSION_MAX_CONCURRENCY, 16), (ADMISSION_MAX_QUEUE, 64)):
+        total = get_int_setting(name, default)
+        os.environ[name] = str(max(1, total // workers))
+
+def run_server(
+    host: str = "0.0.0.0",
+    port: int = 8000,
+    reload: Optional[bool] = None,
+    workers: Optional[int] = None,
+):
     """
     Run the FastAPI server with Uvicorn.
-    
+
     Args:
         host: The host to bind to. Defaults to "0.0.0.0".
         port: The port to bind to. Defaults to 8000.
-        reload: Whether to reload the server on code changes. Defaults to True.
+        reload: Whether to run a single process that reloads on code changes, for
+            development. Defaults to the API_RELOAD setting, or False.
+        workers: The number of worker processes. Defaults to the API_WORKERS
+            setting, or to default_workers() if it is 0 or not set.
     """
     try:
-        # Initialize the API service
-        api_service = ApiService()
-        
-        # Get the FastAPI app
-        app = api_service.get_app()
-        
-        # Run the app with Uvicorn
-        logger.info(f"Starting API server on {host}:{port}")
-        uvicorn.run(app, host=host, port=port, reload=reload)
+        reload = get_bool_setting(API_RELOAD, False) if reload is None else reload
+        os.environ[API_RELOAD] = str(reload).lower()
+        if reload:
+            logger.info(f"Starting API server on {host}:{port} with reload")
+            uvicorn.run(APP_FACTORY, factory=True, host=host, port=port, reload=True)
+            return
+
+        workers = workers or get_int_setting(API_WORKERS, 0) or default_workers()
+        if workers > 1 and get_bool_setting(CHAT_SESSIONS_ENABLED, True):
+            logger.warning(f"Chat sessions are per worker; turns of one session may reach any of the {workers} workers")
+        if workers > 1:
+            # The workers add up their metrics in a shared directory
+            directory = os.getenv(METRICS_MULTIPROC_DIR, "").strip() or tempfile.mkdtemp(prefix="llama-metrics-")
+            clear_metrics_directory(directory)
+            os.environ[METRICS_MULTIPROC_DIR] = directory
+            scale_admission_limits(workers)
+
+        # On SIGTERM, Uvicorn stops accepting connections and lets the responses in
+        # flight finish, for at most the graceful shutdown timeout
+        logger.info(f"Starting API server on {host}:{port} with {workers} worker(s)")
+        uvicorn.run(
+            APP_FACTORY,
+            factory=True,
+            host=host,
+            port=port,
+            workers=workers,
+            timeout_graceful_shutdown=get_int_setting(API_GRACEFUL_SHUTDOWN_SECONDS, 30),
+        )
     except Exception as e:
         logger.error(f"Failed to start API server: {str(e)}")
         raise
 
-def main():
+def main(argv: Optional[List[str]] = None):
     """Main function to run the API server."""
-    run_server()
+    parser = argparse.ArgumentParser(description="Run the Llama 2 chatbot API server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes, defaults to one per CPU")
+    parser.add_argument("--reload", action="store_true", default=None, help="Run one process that reloads on code changes")
+    args = parser.parse_args(argv)
+    run_server(host=args.host, port=args.port, reload=args.reload, workers=args.workers)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
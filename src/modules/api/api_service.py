@@ -2,56 +2,464 @@
 API service for exposing the Llama 2 chatbot via FastAPI and LangServe.
 
 This module provides a FastAPI application that exposes the Llama 2 chatbot as a REST API.
+LangChain and LangServe are only imported when the backend is initialized, which
+can happen in the background after the server started accepting requests.
 """
 
+import asyncio
+import importlib
 import logging
-import subprocess
-import sys
-from fastapi import FastAPI, HTTPException
-from langserve import add_routes
+import os
+import secrets
+from typing import TYPE_CHECKING, Optional
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from src.config.environment_config import (
+    ADMIN_TOKEN,
+    CHAT_HISTORY_MAX_TOKENS,
+    CHAT_HISTORY_SUMMARIZE,
+    CHAT_PROMPT_MAX_TOKENS,
+    CHAT_SESSION_DB_PATH,
+    CHAT_SESSION_IDLE_SECONDS,
+    CHAT_SESSION_MAX_CONTEXT_TOKENS,
+    CHAT_SESSION_MAX_SESSIONS,
+    CHAT_SESSION_RETENTION_SECONDS,
+    CHAT_SESSIONS_ENABLED,
+    CHAT_SUMMARY_MAX_TOKENS,
+    LAZY_BACKEND_STARTUP,
+    LLM_BACKEND,
+    METRICS_MULTIPROC_DIR,
+    ADMISSION_CONTROL_ENABLED,
+    ADMISSION_MAX_CONCURRENCY,
+    ADMISSION_MAX_QUEUE,
+    OLLAMA_ASYNC_BACKEND,
+    OLLAMA_CONNECT_TIMEOUT,
+    OLLAMA_EJECTION_SECONDS,
+    OLLAMA_HOSTS,
+    OLLAMA_KEEP_ALIVE,
+    OLLAMA_MAX_CONNECTIONS,
+    OLLAMA_MAX_KEEPALIVE_CONNECTIONS,
+    OLLAMA_PRELOAD,
+    OLLAMA_READ_TIMEOUT,
+    OLLAMA_SESSION_AFFINITY,
+    OLLAMA_WARM_CHECK_SECONDS,
+    MICRO_BATCHING_ENABLED,
+    MICRO_BATCH_MAX_SIZE,
+    MICRO_BATCH_MAX_WAIT_MS,
+    REQUEST_COALESCING_ENABLED,
+    REQUEST_DEADLINES_ENABLED,
+    REQUEST_DEFAULT_TIMEOUT_SECONDS,
+    REQUEST_MAX_TIMEOUT_SECONDS,
+    RESPONSE_CACHE_COMPACTION_SECONDS,
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_MAX_BYTES,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_PATH,
+    RESPONSE_CACHE_TTL_SECONDS,
+    SEMANTIC_CACHE_CAPACITY,
+    SEMANTIC_CACHE_EMBEDDING_MODEL,
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_THRESHOLD,
+    get_bool_setting,
+    get_float_setting,
+    get_int_setting,
+)
+from src.modules.api.admission import AdmissionController, AdmissionMiddleware
+from src.modules.api.deadlines import DeadlineMiddleware, RequestDeadlines
+from src.modules.api.instrumentation import ApiMetrics, MetricsMiddleware
+from src.modules.api.metrics import Gauge
+from src.modules.api.profiling import ProfilerBusy, SamplingProfiler
+from src.modules.api.request_context import RequestContextMiddleware
+from src.modules.api.startup import ReadinessMiddleware, StartupTimer, startup_timer
+from src.modules.api.worker_metrics import WorkerMetrics
+from src.modules.llm.backend_detection import check_ollama_available, get_ollama_base_url
+from src.modules.llm.token_counter import InputTooLongError
+
+if TYPE_CHECKING:
+    from src.modules.api.response_cache import ResponseCache
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-def check_ollama_installed():
-    """Check if Ollama is installed and available in PATH."""
-    try:
-        if sys.platform.startswith('win'):
-            # Windows
-            result = subprocess.run(['where', 'ollama'], 
-                                   stdout=subprocess.PIPE, 
-                                   stderr=subprocess.PIPE,
-                                   text=True,
-                                   check=False)
-        else:
-            # Linux/Mac
-            result = subprocess.run(['which', 'ollama'], 
-                                   stdout=subprocess.PIPE, 
-                                   stderr=subprocess.PIPE,
-                                   text=True,
-                                   check=False)
-        
-        return result.returncode == 0
-    except Exception as e:
-        logger.error(f"Error checking Ollama installation: {str(e)}")
-        return False
+# Request header carrying the conversation id, used for chat sessions and session affinity
+SESSION_ID_HEADER = "X-Session-ID"
+
+# Path prefixes of the generation endpoints: stateless prompts and chat sessions
+GENERATION_PATH_PREFIXES = ("/llama/", "/chat/")
+
+# Modules imported before the backend is created, timed as the "imports" phase
+BACKEND_MODULES = (
+    "langserve",
+    "src.modules.api.batching",
+    "src.modules.api.callbacks",
+    "src.modules.api.coalescing",
+    "src.modules.api.response_cache",
+)
 
 class ApiService:
     """
     Service for exposing the Llama 2 chatbot via FastAPI and LangServe.
     """
     
-    def __init__(self):
-        """Initialize the API service."""
-        self.app = FastAPI(
-            title="Llama 2 Chatbot API",
-            description="API for a Llama 2 chatbot using LangChain and Ollama (or fallback service)",
-            version="1.0.0",
+    def __init__(
+        self,
+        response_cache: Optional["ResponseCache"] = None,
+        llm_service=None,
+        lazy: Optional[bool] = None,
+        timer: Optional[StartupTimer] = None,
+        wait_until_warm: bool = False,
+    ):
+        """
+        Initialize the API service.
+        
+        Args:
+            response_cache: The cache for /llama responses. Defaults to a cache configured
+                from the RESPONSE_CACHE_* environment variables (None if disabled).
+            llm_service: The LLM service to expose, providing get_chain() and
+                get_model_config(). Defaults to Ollama, or the HuggingFace fallback
+                if Ollama is not available.
+            lazy: Whether to initialize the backend in the background once the server
+                has started, answering /llama requests with 503 until it is ready.
+                Defaults to the LAZY_BACKEND_STARTUP setting, or False.
+            timer: The timer recording the startup phases. Defaults to the process timer.
+            wait_until_warm: Whether server startup waits until the preloaded model is
+                loaded, so that the server only accepts requests once it is warm.
+                Defaults to False.
+        """
+        self.startup = timer if timer is not None else startup_timer
+        self.lazy = get_bool_setting(LAZY_BACKEND_STARTUP, False) if lazy is None else lazy
+        self.wait_until_warm = wait_until_warm
+        self.ready = False
+        self.startup_error: Optional[str] = None
+        self._backend_task: Optional[asyncio.Task] = None
+        with self.startup.phase("app"):
+            self.app = FastAPI(
+                title="Llama 2 Chatbot API",
+                description="API for a Llama 2 chatbot using LangChain and Ollama (or fallback service)",
+                version="1.0.0",
+            )
+            self.using_ollama = False
+            self.llm_service = llm_service
+            self.coalescer = None
+            self.batcher = None
+            self.sessions = None
+            self.response_cache = response_cache
+            self.metrics = ApiMetrics()
+            self.worker_metrics = self._create_worker_metrics()
+            self.profiler = SamplingProfiler()
+            self.admission = self._create_admission_controller()
+            if self.admission is not None:
+                # Added before CORS so that 429 responses still carry the CORS headers
+                self.app.add_middleware(
+                    AdmissionMiddleware,
+                    controller=self.admission,
+                    path_prefix=GENERATION_PATH_PREFIXES,
+                )
+            if self.lazy:
+                self.app.add_middleware(
+                    ReadinessMiddleware,
+                    is_ready=lambda: self.ready,
+                    path_prefix=GENERATION_PATH_PREFIXES,
+                )
+            self.deadlines = self._create_deadlines()
+            if self.deadlines is not None:
+                # Outside admission control, so that queued requests are cancelled too
+                self.app.add_middleware(
+                    DeadlineMiddleware,
+                    deadlines=self.deadlines,
+                    path_prefix=GENERATION_PATH_PREFIXES,
+                )
+            self.app.add_middleware(MetricsMiddleware, metrics=self.metrics, path_prefix=GENERATION_PATH_PREFIXES)
+            self._configure_cors()
+            self.app.add_middleware(RequestContextMiddleware)
+            self._setup_routes()
+        if not self.lazy:
+            self._initialize_backend()
+    
+    def _create_response_cache(self) -> Optional["ResponseCache"]:
+        """
+        Create the response cache from environment settings.
+        
+        Returns:
+            The response cache, or None if caching is disabled. With RESPONSE_CACHE_PATH
+            set, the cache is stored in that file and shared by the worker processes.
+        """
+        if not get_bool_setting(RESPONSE_CACHE_ENABLED, True):
+            logger.info("Response cache disabled")
+            return None
+        path = os.getenv(RESPONSE_CACHE_PATH, "").strip()
+        if path:
+            from src.modules.api.disk_cache import DiskResponseCache
+            logger.info(f"Storing the response cache in {path}")
+            return DiskResponseCache(
+                path,
+                max_entries=get_int_setting(RESPONSE_CACHE_MAX_ENTRIES, 1024),
+                max_bytes=get_int_setting(RESPONSE_CACHE_MAX_BYTES, 16 * 1024 * 1024),
+                ttl_seconds=get_float_setting(RESPONSE_CACHE_TTL_SECONDS, 300.0),
+                compaction_seconds=get_float_setting(RESPONSE_CACHE_COMPACTION_SECONDS, 60.0),
+            )
+        from src.modules.api.response_cache import ResponseCache
+        return ResponseCache(
+            max_entries=get_int_setting(RESPONSE_CACHE_MAX_ENTRIES, 1024),
+            max_bytes=get_int_setting(RESPONSE_CACHE_MAX_BYTES, 16 * 1024 * 1024),
+            ttl_seconds=get_float_setting(RESPONSE_CACHE_TTL_SECONDS, 300.0),
+        )
+    
+    def _create_worker_metrics(self) -> Optional[WorkerMetrics]:
+        """
+        Create the exchange of metrics with the other worker processes.
+        
+        Returns:
+            The worker metrics, or None if METRICS_MULTIPROC_DIR is not set.
+        """
+        directory = os.getenv(METRICS_MULTIPROC_DIR, "").strip()
+        if not directory:
+            return None
+        return WorkerMetrics(self.metrics.registry, directory)
+    
+    def _create_admission_controller(self) -> Optional[AdmissionController]:
+        """
+        Create the admission controller for /llama requests from environment settings.
+        
+        Returns:
+            The admission controller, or None if admission control is disabled.
+        """
+        if not get_bool_setting(ADMISSION_CONTROL_ENABLED, True):
+            logger.info("Admission control disabled")
+            return None
+        admission = AdmissionController(
+            max_concurrency=get_int_setting(ADMISSION_MAX_CONCURRENCY, 16),
+            max_queue=get_int_setting(ADMISSION_MAX_QUEUE, 64),
+        )
+        self.metrics.register(Gauge(
+            "llama_admission_queue_depth",
+            "Requests waiting for a concurrency slot",
+            function=lambda: admission.queued,
+        ))
+        self.metrics.register(Gauge(
+            "llama_admission_active_requests",
+            "Requests holding a concurrency slot",
+            function=lambda: admission.active,
+        ))
+        self.metrics.register(admission.wait_histogram)
+        return admission
+    
+    def _create_deadlines(self) -> Optional[RequestDeadlines]:
+        """
+        Create the deadline settings of generation requests from environment settings.
+        
+        Returns:
+            The deadlines, or None if cancellation on disconnect and deadlines are disabled.
+        """
+        if not get_bool_setting(REQUEST_DEADLINES_ENABLED, True):
+            logger.info("Request deadlines disabled")
+            return None
+        default_timeout = get_float_setting(REQUEST_DEFAULT_TIMEOUT_SECONDS, 0.0)
+        max_timeout = get_float_setting(REQUEST_MAX_TIMEOUT_SECONDS, 600.0)
+        deadlines = RequestDeadlines(
+            default_timeout=default_timeout if default_timeout > 0 else None,
+            max_timeout=max_timeout if max_timeout > 0 else None,
+        )
+        self.metrics.register(deadlines.cancelled)
+        return deadlines
+    
+    def _create_ollama_client(self, base_url: Optional[str] = None):
+        """
+        Create the pooled Ollama client from environment settings.
+        
+        Args:
+            base_url: The URL of the Ollama server. Defaults to OLLAMA_BASE_URL.
+        
+        Returns:
+            The Ollama client, or None to use the LangChain Ollama wrapper.
+        """
+        if not get_bool_setting(OLLAMA_ASYNC_BACKEND, True):
+            return None
+        from src.modules.llm.ollama_client import OllamaClient
+        return OllamaClient(
+            base_url=base_url or get_ollama_base_url(),
+            max_connections=get_int_setting(OLLAMA_MAX_CONNECTIONS, 100),
+            max_keepalive_connections=get_int_setting(OLLAMA_MAX_KEEPALIVE_CONNECTIONS, 20),
+            connect_timeout=get_float_setting(OLLAMA_CONNECT_TIMEOUT, 5.0),
+            read_timeout=get_float_setting(OLLAMA_READ_TIMEOUT, 300.0),
+        )
+    
+    def _ollama_hosts(self):
+        """Get the URLs of the comma-separated OLLAMA_HOSTS setting."""
+        return [url.strip() for url in os.getenv(OLLAMA_HOSTS, "").split(",") if url.strip()]
+    
+    def _ollama_available(self) -> bool:
+        """
+        Probe the Ollama servers over HTTP.
+        
+        Returns:
+            True if OLLAMA_BASE_URL, or one of the OLLAMA_HOSTS, answered.
+        """
+        return any(check_ollama_available(url) for url in self._ollama_hosts() or [None])
+    
+    def _create_ollama_host_pool(self):
+        """
+        Create the pool of Ollama hosts from the comma-separated OLLAMA_HOSTS setting.
+        
+        Returns:
+            The host pool, or None if OLLAMA_HOSTS is not set.
+        """
+        base_urls = self._ollama_hosts()
+        if not base_urls:
+            return None
+        from src.modules.llm.ollama_client import OllamaClient
+        from src.modules.llm.ollama_pool import OllamaHostPool
+        logger.info(f"Routing Ollama requests across {len(base_urls)} hosts")
+        return OllamaHostPool(
+            base_urls,
+            client_factory=lambda url: self._create_ollama_client(url) or OllamaClient(base_url=url),
+            ejection_seconds=get_float_setting(OLLAMA_EJECTION_SECONDS, 10.0),
+            session_affinity=get_bool_setting(OLLAMA_SESSION_AFFINITY, True),
+        )
+    
+    def _ollama_keep_alive(self):
+        """
+        Get the OLLAMA_KEEP_ALIVE setting, e.g. "30m", or -1 to keep the model loaded for ever.
+        
+        Returns:
+            The keep-alive as a number of seconds or a duration string, or None if not set.
+        """
+        value = os.getenv(OLLAMA_KEEP_ALIVE, "").strip()
+        if not value:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            return value
+    
+    def _per_request_config(self, config, request):
+        """
+        Add request-specific settings to the runnable config of a LangServe call.
+        
+        Args:
+            config: The runnable config built from the client's request.
+            request: The FastAPI request.
+            
+        Returns:
+            The updated config.
+        """
+        session_id = request.headers.get(SESSION_ID_HEADER)
+        if session_id:
+            config = {**config, "metadata": {**config.get("metadata", {}), "session_id": session_id}}
+        return config
+    
+    def _create_semantic_cache(self):
+        """
+        Create the semantic cache for the Ollama service from environment settings.
+        
+        Returns:
+            The semantic cache, or None if it is disabled.
+        """
+        if not get_bool_setting(SEMANTIC_CACHE_ENABLED, False):
+            return None
+        from langchain_community.embeddings import OllamaEmbeddings
+        from src.modules.llm.semantic_cache import SemanticCache
+        embedding_model = os.getenv(SEMANTIC_CACHE_EMBEDDING_MODEL, "nomic-embed-text")
+        logger.info(f"Semantic cache enabled with embedding model {embedding_model}")
+        return SemanticCache(
+            OllamaEmbeddings(model=embedding_model),
+            similarity_threshold=get_float_setting(SEMANTIC_CACHE_THRESHOLD, 0.92),
+            capacity=get_int_setting(SEMANTIC_CACHE_CAPACITY, 1000),
+        )
+    
+    def _instrument(self, chain, llm_service):
+        """
+        Attach the generation metrics and stage timing callbacks to a chain.
+        
+        Args:
+            chain: The chain to measure.
+            llm_service: The LLM service of the chain, which names the backend.
+            
+        Returns:
+            The chain with the callbacks.
+        """
+        from src.modules.api.callbacks import GenerationMetricsCallback, StageTimingCallback
+        
+        backend = llm_service.get_model_config().get("backend", type(llm_service).__name__)
+        # Count the prompts of backends that do not report their length
+        length_limits = getattr(llm_service, "length_limits", None)
+        count_tokens = length_limits.counter.count if length_limits is not None else None
+        return chain.with_config(
+            callbacks=[GenerationMetricsCallback(self.metrics, backend, count_tokens), StageTimingCallback()]
+        )
+    
+    def _build_session_chain(self, llm_service):
+        """
+        Create the session store and the chat chain that continues its sessions.
+        
+        Args:
+            llm_service: The LLM service whose model is exposed.
+            
+        Returns:
+            The runnable to register with LangServe, or None if sessions are disabled
+            or not supported by the service.
+        """
+        if not get_bool_setting(CHAT_SESSIONS_ENABLED, True) or not hasattr(llm_service, "get_session_chain"):
+            return None
+        from src.modules.llm.chat_history import HistoryManager
+        from src.modules.llm.chat_sessions import ChatSessionStore
+        from src.modules.llm.session_storage import SQLiteSessionStorage
+        # Sessions paged out of memory, and those left at shutdown, are kept on disk
+        db_path = os.getenv(CHAT_SESSION_DB_PATH, "").strip()
+        storage = SQLiteSessionStorage(
+            db_path,
+            retention_seconds=get_float_setting(CHAT_SESSION_RETENTION_SECONDS, 7 * 24 * 3600.0),
+        ) if db_path else None
+        self.sessions = ChatSessionStore(
+            max_sessions=get_int_setting(CHAT_SESSION_MAX_SESSIONS, 1000),
+            idle_seconds=get_float_setting(CHAT_SESSION_IDLE_SECONDS, 1800.0),
+            max_context_tokens=get_int_setting(CHAT_SESSION_MAX_CONTEXT_TOKENS, 8192),
+            max_prompt_tokens=get_int_setting(CHAT_PROMPT_MAX_TOKENS, 3072),
+            history=HistoryManager(
+                max_history_tokens=get_int_setting(CHAT_HISTORY_MAX_TOKENS, 1536),
+                max_summary_tokens=get_int_setting(CHAT_SUMMARY_MAX_TOKENS, 256),
+                summarize=get_bool_setting(CHAT_HISTORY_SUMMARIZE, True),
+            ),
+            storage=storage,
         )
-        self.using_ollama = False
-        self._configure_cors()
-        self._setup_routes()
+        # Each turn depends on the session, so responses are neither cached nor shared
+        return self._instrument(llm_service.get_session_chain(self.sessions), llm_service)
+    
+    def _build_chain(self, llm_service):
+        """
+        Wrap the service's chain with the API-level layers.
+        
+        Args:
+            llm_service: The LLM service whose chain is exposed.
+            
+        Returns:
+            The runnable to register with LangServe.
+        """
+        from src.modules.api.batching import MicroBatcher
+        from src.modules.api.coalescing import CoalescingRunnable
+        from src.modules.api.response_cache import CachedRunnable
+        
+        model_config = llm_service.get_model_config()
+        # Generations are measured below every layer, so cache hits are not counted
+        chain = self._instrument(llm_service.get_chain(), llm_service)
+        if get_bool_setting(MICRO_BATCHING_ENABLED, False):
+            # Concurrent invokes are sent to the chain as one batch call
+            self.batcher = MicroBatcher(
+                chain,
+                max_batch_size=get_int_setting(MICRO_BATCH_MAX_SIZE, 8),
+                max_wait_ms=get_float_setting(MICRO_BATCH_MAX_WAIT_MS, 10.0),
+            )
+            chain = self.batcher
+            self.metrics.register(self.batcher.batch_size_histogram)
+            self.metrics.register(self.batcher.batch_wait_histogram)
+        if get_bool_setting(REQUEST_COALESCING_ENABLED, True):
+            # Identical concurrent requests share one backend call
+            self.coalescer = CoalescingRunnable(chain, model_config)
+            chain = self.coalescer
+        if self.response_cache is not None:
+            chain = CachedRunnable(chain, self.response_cache, model_config)
+        return chain
     
     def _configure_cors(self):
         """Configure CORS middleware."""
@@ -63,50 +471,319 @@ class ApiService:
             allow_headers=["*"],  # Allows all headers
         )
     
-    def _setup_routes(self):
-        """Set up API routes."""
-        try:
-            # Initialize LLM service based on availability
-            if check_ollama_installed():
-                try:
-                    # Try to use Ollama
-                    from src.modules.llm.ollama_service import OllamaService
-                    llm_service = OllamaService()
-                    self.using_ollama = True
-                    logger.info("Using Ollama service for API")
-                except Exception as e:
-                    logger.warning(f"Failed to initialize Ollama service: {str(e)}. Falling back to alternative service.")
-                    from src.modules.llm.huggingface_service import HuggingFaceService
-                    llm_service = HuggingFaceService()
-                    logger.info("Using HuggingFace service as fallback for API")
-            else:
-                # Use fallback service
-                logger.warning("Ollama not found in PATH. Using fallback service.")
+    def _create_llm_service(self):
+        """
+        Create the LLM service based on the LLM_BACKEND setting and availability.
+        
+        Returns:
+            The provided LLM service, or the one selected by LLM_BACKEND. In "auto"
+            mode, Ollama is used when its server answers an HTTP probe.
+        """
+        llm_service = self.llm_service
+        backend = os.getenv(LLM_BACKEND, "auto").strip().lower()
+        if llm_service is not None:
+            logger.info(f"Using provided {type(llm_service).__name__} for API")
+        elif backend == "simulated":
+            from src.modules.llm.simulated_service import SimulatedService
+            llm_service = SimulatedService(semantic_cache=self._create_semantic_cache())
+            logger.info("Using simulated service for API")
+        elif backend == "huggingface":
+            from src.modules.llm.huggingface_service import HuggingFaceService
+            llm_service = HuggingFaceService()
+            logger.info("Using HuggingFace service for API")
+        elif backend == "ollama" or self._ollama_available():
+            try:
+                # Try to use Ollama
+                from src.modules.llm.ollama_service import OllamaService
+                llm_service = OllamaService(
+                    semantic_cache=self._create_semantic_cache(),
+                    client=self._create_ollama_client(),
+                    host_pool=self._create_ollama_host_pool(),
+                    keep_alive=self._ollama_keep_alive(),
+                    preload=get_bool_setting(OLLAMA_PRELOAD, False),
+                    warm_check_seconds=get_float_setting(OLLAMA_WARM_CHECK_SECONDS, 30.0),
+                )
+                self.using_ollama = True
+                logger.info("Using Ollama service for API")
+            except Exception as e:
+                logger.warning(f"Failed to initialize Ollama service: {str(e)}. Falling back to alternative service.")
                 from src.modules.llm.huggingface_service import HuggingFaceService
                 llm_service = HuggingFaceService()
                 logger.info("Using HuggingFace service as fallback for API")
-            
-            # Add LangServe routes for the chain
+        else:
+            # Use fallback service
+            logger.warning("Ollama server not reachable. Using fallback service.")
+            from src.modules.llm.huggingface_service import HuggingFaceService
+            llm_service = HuggingFaceService()
+            logger.info("Using HuggingFace service as fallback for API")
+        return llm_service
+    
+    def _add_llm_routes(self, llm_service) -> None:
+        """
+        Add the LangServe routes for the service's chain and its chat sessions.
+        
+        Args:
+            llm_service: The LLM service to expose.
+        """
+        from langserve import add_routes
+        
+        self.llm_service = llm_service
+        if self.response_cache is None:
+            self.response_cache = self._create_response_cache()
+        add_routes(
+            self.app,
+            self._build_chain(llm_service),
+            path="/llama",
+            per_req_config_modifier=self._per_request_config,
+            enable_feedback_endpoint=True,
+        )
+        session_chain = self._build_session_chain(llm_service)
+        if session_chain is not None:
+            # The session is named by the X-Session-ID header
             add_routes(
                 self.app,
-                llm_service.get_chain(),
-                path="/llama",
-                enable_feedback=True,
+                session_chain,
+                path="/chat",
+                per_req_config_modifier=self._per_request_config,
             )
-            
-            # Add a health check endpoint
-            @self.app.get("/")
-            async def health_check():
-                return {
-                    "status": "online",
-                    "using_ollama": self.using_ollama,
-                    "message": "Llama 2 Chatbot API is running. Visit /docs for the API documentation."
-                }
-                
-            logger.info("API routes set up successfully")
+        # Regenerate the OpenAPI schema with the new routes
+        self.app.openapi_schema = None
+    
+    def _initialize_backend(self) -> None:
+        """Import the backend modules, create the LLM service and add its routes."""
+        try:
+            with self.startup.phase("imports"):
+                for module in BACKEND_MODULES:
+                    importlib.import_module(module)
+            with self.startup.phase("backend"):
+                llm_service = self._create_llm_service()
+            with self.startup.phase("routes"):
+                self._add_llm_routes(llm_service)
         except Exception as e:
             logger.error(f"Failed to set up API routes: {str(e)}")
             raise
+        self.ready = True
+        self.startup.mark("backend_ready")
+    
+    async def _initialize_backend_in_background(self) -> None:
+        """
+        Initialize the backend while the server answers requests.
+        
+        The imports and the service creation, which may probe Ollama or load a
+        model, run in a worker thread. The routes are added on the event loop.
+        """
+        try:
+            with self.startup.phase("imports"):
+                for module in BACKEND_MODULES:
+                    await asyncio.to_thread(importlib.import_module, module)
+            with self.startup.phase("backend"):
+                llm_service = await asyncio.to_thread(self._create_llm_service)
+            with self.startup.phase("routes"):
+                self._add_llm_routes(llm_service)
+        except Exception as e:
+            self.startup_error = str(e)
+            logger.error(f"Failed to initialize the backend: {str(e)}")
+            return
+        self.ready = True
+        self.startup.mark("backend_ready")
+        await self._start_backend()
+    
+    async def _start_backend(self) -> None:
+        """Start the background work of the LLM service, such as preloading the model."""
+        start = getattr(self.llm_service, "astart", None)
+        if start is not None:
+            await start()
+        wait_warm = getattr(self.llm_service, "wait_warm", None)
+        if self.wait_until_warm and wait_warm is not None:
+            # Server startup, and so accepting connections, waits for the model load
+            await wait_warm()
+    
+    def _is_warm(self) -> Optional[bool]:
+        """
+        Check whether the model is loaded on the backend.
+        
+        Returns:
+            Whether the model is warm, or None if the service does not preload it.
+        """
+        is_warm = getattr(self.llm_service, "is_warm", None)
+        return is_warm() if is_warm is not None else None
+    
+    def _setup_routes(self):
+        """Set up the API routes that do not need the backend."""
+        # Answer inputs that do not fit the context window with 413 rather than 500
+        @self.app.exception_handler(InputTooLongError)
+        async def input_too_long(request, exc: InputTooLongError):
+            return JSONResponse(
+                status_code=413,
+                content={"detail": str(exc), "tokens": exc.tokens, "max_tokens": exc.max_tokens},
+            )
+        
+        # Initialize the backend in the background once the server accepts requests
+        @self.app.on_event("startup")
+        async def start_backend():
+            self.startup.mark("server_started")
+            if self.worker_metrics is not None:
+                self.worker_metrics.start()
+            if self.ready:
+                await self._start_backend()
+            elif self.lazy:
+                self._backend_task = asyncio.create_task(self._initialize_backend_in_background())
+        
+        # Release pooled backend connections on shutdown
+        @self.app.on_event("shutdown")
+        async def close_backend():
+            close = getattr(self.llm_service, "aclose", None)
+            if close is not None:
+                await close()
+            if self.sessions is not None:
+                self.sessions.close()
+            close_cache = getattr(self.response_cache, "close", None)
+            if close_cache is not None:
+                close_cache()
+            if self.worker_metrics is not None:
+                await self.worker_metrics.aclose()
+        
+        # Add a health check endpoint; load balancers can pass require_warm to avoid cold hosts
+        @self.app.get("/")
+        async def health_check(require_warm: bool = False):
+            warm = self._is_warm()
+            body = {
+                "status": "online",
+                "ready": self.ready,
+                "warm": warm,
+                "using_ollama": self.using_ollama,
+                "message": "Llama 2 Chatbot API is running. Visit /docs for the API documentation."
+            }
+            if require_warm and not (self.ready and warm is not False):
+                return JSONResponse(body, status_code=503)
+            return body
+        
+        # Add an endpoint reporting how long each startup phase took
+        @self.app.get("/startup/stats")
+        async def startup_stats():
+            return {"ready": self.ready, "error": self.startup_error, **self.startup.stats()}
+        
+        # Add a Prometheus scrape endpoint
+        @self.app.get("/metrics", response_class=PlainTextResponse)
+        async def metrics():
+            # With several workers, report the sum over all of them
+            exposition = self.worker_metrics.expose() if self.worker_metrics is not None else self.metrics.expose()
+            return PlainTextResponse(
+                exposition,
+                media_type="text/plain; version=0.0.4; charset=utf-8",
+            )
+        
+        # Add an admin endpoint profiling the live server, returning collapsed stacks
+        @self.app.post("/admin/profile", response_class=PlainTextResponse)
+        async def profile(
+            seconds: float = 10.0,
+            interval_ms: float = 5.0,
+            x_admin_token: Optional[str] = Header(default=None),
+        ):
+            admin_token = os.getenv(ADMIN_TOKEN)
+            if not admin_token:
+                raise HTTPException(status_code=404, detail="Not Found")
+            if x_admin_token is None or not secrets.compare_digest(x_admin_token, admin_token):
+                raise HTTPException(status_code=403, detail="Invalid admin token")
+            try:
+                stacks = await asyncio.to_thread(self.profiler.profile, seconds, interval_ms / 1000)
+            except ProfilerBusy as e:
+                raise HTTPException(status_code=409, detail=str(e))
+            return PlainTextResponse(stacks)
+        
+        # Add an endpoint reporting the response cache counters
+        @self.app.get("/cache/stats")
+        async def cache_stats():
+            if self.response_cache is None:
+                return {"enabled": False}
+            return {"enabled": True, **self.response_cache.stats()}
+        
+        # Add an endpoint reporting the request coalescing counters
+        @self.app.get("/coalescing/stats")
+        async def coalescing_stats():
+            if self.coalescer is None:
+                return {"enabled": False}
+            return {"enabled": True, **self.coalescer.stats()}
+        
+        # Add an endpoint reporting the micro-batching histograms
+        @self.app.get("/batching/stats")
+        async def batching_stats():
+            if self.batcher is None:
+                return {"enabled": False}
+            return {"enabled": True, **self.batcher.stats()}
+        
+        # Add an endpoint reporting the admission control queue
+        @self.app.get("/admission/stats")
+        async def admission_stats():
+            if self.admission is None:
+                return {"enabled": False}
+            return {"enabled": True, **self.admission.stats()}
+        
+        # Add an endpoint reporting the requests cancelled on disconnect or deadline expiry
+        @self.app.get("/deadlines/stats")
+        async def deadline_stats():
+            if self.deadlines is None:
+                return {"enabled": False}
+            return {"enabled": True, **self.deadlines.stats()}
+        
+        # Add an endpoint reporting the health of the Ollama hosts
+        @self.app.get("/backends/stats")
+        async def backend_stats():
+            host_pool = getattr(self.llm_service, "host_pool", None)
+            if host_pool is None:
+                return {"enabled": False}
+            return {"enabled": True, **host_pool.stats()}
+        
+        # Add an endpoint reporting the chat session counters
+        @self.app.get("/sessions/stats")
+        async def session_stats():
+            if self.sessions is None:
+                return {"enabled": False}
+            return {"enabled": True, **(await asyncio.to_thread(self.sessions.stats))}
+        
+        # Add endpoints returning and deleting the messages of a chat session
+        @self.app.get("/sessions/{session_id}")
+        async def get_session(session_id: str):
+            session = await self.sessions.aget(session_id, create=False) if self.sessions is not None else None
+            if session is None:
+                raise HTTPException(status_code=404, detail="Session not found")
+            return {
+                "session_id": session_id,
+                "turns": session.turns,
+                "context_tokens": len(session.context or []),
+                "summary": session.summary,
+                "messages": session.history(),
+            }
+        
+        @self.app.delete("/sessions/{session_id}")
+        async def delete_session(session_id: str):
+            if self.sessions is None or not await self.sessions.adelete(session_id):
+                raise HTTPException(status_code=404, detail="Session not found")
+            return {"deleted": True}
+        
+        # Add an endpoint reporting the input length limits and their counters
+        @self.app.get("/tokens/stats")
+        async def token_stats():
+            length_limits = getattr(self.llm_service, "length_limits", None)
+            if length_limits is None:
+                return {"enabled": False}
+            return {"enabled": True, **length_limits.stats()}
+        
+        # Add an endpoint reporting whether the model is loaded on each Ollama host
+        @self.app.get("/warmup/stats")
+        async def warmup_stats():
+            warmer = getattr(self.llm_service, "warmer", None)
+            if warmer is None:
+                return {"enabled": False}
+            return {"enabled": True, **warmer.stats()}
+        
+        # Add an endpoint reporting the semantic cache counters
+        @self.app.get("/cache/semantic/stats")
+        async def semantic_cache_stats():
+            semantic_cache = getattr(self.llm_service, "semantic_cache", None)
+            if semantic_cache is None:
+                return {"enabled": False}
+            return {"enabled": True, **semantic_cache.stats()}
     
     def get_app(self):
         """
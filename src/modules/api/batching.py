@@ -0,0 +1,163 @@
+"""
+Dynamic micro-batching for the Llama 2 chatbot API.
+
+This module provides a chain wrapper that collects concurrent invoke requests for
+a short time window and sends them to the chain as a single batch call. The batch
+runs in a task of its own, outside of any request context; each request records
+the time it waited for its batch as "batch" and the batch call as "chain".
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain.schema.runnable import Runnable, RunnableConfig
+
+from src.modules.api.metrics import Histogram
+from src.modules.api.request_context import get_request_context, start_task
+from src.modules.llm.chain_wrapper import ChainWrapper
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Buckets for the batch size histogram
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+# Buckets for the time requests spend waiting for their batch, in seconds
+BATCH_WAIT_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25)
+
+class _PendingRequest:
+    """An invoke request waiting to be dispatched."""
+
+    __slots__ = ("input", "config", "future", "enqueued_at", "dispatched_at", "batch", "task")
+
+    def __init__(self, input: Any, config: Optional[RunnableConfig], future: "asyncio.Future"):
+        self.input = input
+        self.config = config
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+        self.dispatched_at: Optional[float] = None
+        # The requests dispatched together with this one, and the task running them
+        self.batch: List["_PendingRequest"] = []
+        self.task: Optional["asyncio.Future"] = None
+
+class MicroBatcher(ChainWrapper):
+    """
+    Chain wrapper that groups concurrent ainvoke calls into abatch calls.
+
+    A batch is dispatched as soon as it holds max_batch_size requests, or when the
+    oldest request has waited max_wait_ms. Streams are passed through unchanged.
+    The gain depends on the backend running batch items concurrently or in one
+    forward pass; a backend that loops over the batch only adds the wait time.
+    """
+
+    def __init__(self, bound: Runnable, max_batch_size: int = 8, max_wait_ms: float = 10.0):
+        """
+        Initialize the micro-batcher.
+
+        Args:
+            bound: The chain to call.
+            max_batch_size: The maximum number of requests per batch. Defaults to 8.
+            max_wait_ms: The maximum time a request waits for its batch to fill up,
+                in milliseconds. Defaults to 10.
+        """
+        super().__init__(bound)
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._pending: List[_PendingRequest] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.batch_size_histogram = Histogram(
+            "llama_batch_size", "Number of requests per dispatched batch", BATCH_SIZE_BUCKETS
+        )
+        self.batch_wait_histogram = Histogram(
+            "llama_batch_wait_seconds", "Time requests waited for their batch", BATCH_WAIT_BUCKETS
+        )
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        if kwargs:
+            # Requests with extra arguments cannot share a batch call
+            return await self.bound.ainvoke(input, config, **kwargs)
+
+        loop = asyncio.get_running_loop()
+        request = _PendingRequest(input, config, loop.create_future())
+        self._pending.append(request)
+        if len(self._pending) >= self.max_batch_size:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait_ms / 1000, self._dispatch)
+
+        try:
+            output = await asyncio.shield(request.future)
+        except asyncio.CancelledError:
+            # Drop the request if its batch has not been sent yet, else discard its result
+            if request in self._pending:
+                self._pending.remove(request)
+            request.future.cancel()
+            if request.task is not None and all(other.future.done() for other in request.batch):
+                # Nobody is waiting for the batch any more
+                request.task.cancel()
+            raise
+        finally:
+            self._record_timings(request)
+        return output
+
+    @staticmethod
+    def _record_timings(request: _PendingRequest) -> None:
+        """Record the wait for the batch and the batch call on the request's context."""
+        context = get_request_context()
+        if context is None or request.dispatched_at is None:
+            return
+        context.add_timing("batch", request.dispatched_at - request.enqueued_at)
+        context.add_timing("chain", time.perf_counter() - request.dispatched_at)
+
+    def _dispatch(self) -> None:
+        """Send the pending requests to the chain as one batch."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            # The batch belongs to none of its requests, so their contexts record no stages of it
+            task = start_task(self._run_batch(batch))
+            for request in batch:
+                request.batch = batch
+                request.task = task
+
+    async def _run_batch(self, batch: List[_PendingRequest]) -> None:
+        """Run one batch and hand each result to the request that asked for it."""
+        dispatched_at = time.perf_counter()
+        self.batch_size_histogram.observe(len(batch))
+        for request in batch:
+            request.dispatched_at = dispatched_at
+            self.batch_wait_histogram.observe(dispatched_at - request.enqueued_at)
+
+        try:
+            outputs = await self.bound.abatch(
+                [request.input for request in batch],
+                [request.config or {} for request in batch],
+                return_exceptions=True,
+            )
+        except Exception as e:
+            outputs = [e] * len(batch)
+
+        for request, output in zip(batch, outputs):
+            if request.future.done():
+                continue
+            if isinstance(output, BaseException):
+                request.future.set_exception(output)
+            else:
+                request.future.set_result(output)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the batching statistics.
+
+        Returns:
+            A dictionary with the settings and the batch size and wait time histograms.
+        """
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "batch_size": self.batch_size_histogram.snapshot(),
+            "batch_wait_seconds": self.batch_wait_histogram.snapshot(),
+        }
@@ -0,0 +1,182 @@
+"""
+LangChain callback handlers for the Llama 2 chatbot API.
+
+This module provides a callback handler that measures every generation: time
+to first token, duration, prompt and output tokens, tokens per second, in-flight
+generations, backend errors and cancellations. A second handler records the
+time spent in each stage of the chain on the request context. They are kept apart from the metric
+definitions so that the server can start without importing LangChain.
+"""
+
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain.schema.output import LLMResult
+
+from src.modules.api.instrumentation import ApiMetrics
+from src.modules.api.request_context import RequestContext, get_request_context
+
+class _Run:
+    """Timing and token count of one running generation."""
+
+    __slots__ = ("started", "first_token", "tokens", "prompts")
+
+    def __init__(self, started: float, prompts: List[str]):
+        self.started = started
+        self.first_token: Optional[float] = None
+        self.tokens = 0
+        self.prompts = prompts
+
+class GenerationMetricsCallback(BaseCallbackHandler):
+    """
+    Callback handler that records the metrics of every LLM generation.
+
+    Token counts are taken from the backend's own statistics when it reports
+    them (Ollama's prompt_eval_count and eval_count). Otherwise output tokens are
+    the number of streamed tokens, and prompt tokens are counted with count_tokens.
+    """
+
+    # Called directly on the event loop: every callback is a few dictionary updates
+    run_inline = True
+
+    def __init__(self, metrics: ApiMetrics, backend: str, count_tokens: Optional[Callable[[str], int]] = None):
+        """
+        Initialize the callback handler.
+
+        Args:
+            metrics: The metrics to update.
+            backend: The name of the backend serving the generations, e.g. "ollama".
+            count_tokens: Optional token counter for the prompts of backends that do
+                not report their prompt length.
+        """
+        self.metrics = metrics
+        self.backend = backend
+        self.count_tokens = count_tokens
+        self._runs: Dict[UUID, _Run] = {}
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self._runs[run_id] = _Run(time.perf_counter(), prompts)
+        self.metrics.in_flight.inc()
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.get(run_id)
+        if run is None or not token:
+            return
+        if run.first_token is None:
+            run.first_token = time.perf_counter()
+            self.metrics.time_to_first_token.observe(run.first_token - run.started)
+        run.tokens += 1
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        ended = time.perf_counter()
+        self.metrics.in_flight.dec()
+        self.metrics.generations.inc(backend=self.backend)
+        self.metrics.generation_duration.observe(ended - run.started)
+
+        infos = [generation.generation_info or {} for generations in response.generations for generation in generations]
+        prompt_tokens = sum(info.get("prompt_eval_count") or 0 for info in infos)
+        if not prompt_tokens and self.count_tokens is not None:
+            prompt_tokens = sum(self.count_tokens(prompt) for prompt in run.prompts)
+        if prompt_tokens:
+            self.metrics.prompt_tokens.inc(prompt_tokens, backend=self.backend)
+            self.metrics.prompt_length.observe(prompt_tokens)
+
+        tokens = sum(info.get("eval_count") or 0 for info in infos) or run.tokens
+        if tokens:
+            self.metrics.output_tokens.inc(tokens, backend=self.backend)
+            decoding_time = ended - (run.first_token or run.started)
+            if decoding_time > 0:
+                self.metrics.tokens_per_second.observe(tokens / decoding_time)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        if self._runs.pop(run_id, None) is None:
+            return
+        self.metrics.in_flight.dec()
+        if isinstance(error, asyncio.CancelledError):
+            # A disconnected client or an expired deadline, not a failure of the backend
+            self.metrics.cancelled_generations.inc(backend=self.backend)
+            return
+        self.metrics.backend_errors.inc(backend=self.backend, error_type=type(error).__name__)
+
+def stage_name(name: Optional[str], is_root: bool) -> Optional[str]:
+    """
+    Get the Server-Timing stage of a chain run.
+
+    Args:
+        name: The name of the runnable.
+        is_root: Whether the run is the outermost run of the chain.
+
+    Returns:
+        "chain" for the whole chain, "prompt" for prompt templates, "parse" for
+        output parsers, or None for runs that are not timed separately.
+    """
+    if is_root:
+        return "chain"
+    if name and name.endswith("PromptTemplate"):
+        return "prompt"
+    if name and name.endswith("OutputParser"):
+        return "parse"
+    return None
+
+class StageTimingCallback(BaseCallbackHandler):
+    """
+    Callback handler that records the time spent in each stage of the chain.
+
+    Durations are added to the RequestContext of the request that started the
+    run, as "chain" (the whole chain), "prompt" (prompt formatting), "llm" (the
+    backend call) and "parse" (output parsing). Runs outside of an HTTP request
+    are ignored.
+    """
+
+    # Called directly where the run happens, so that the request context is visible
+    run_inline = True
+
+    def __init__(self):
+        """Initialize the callback handler."""
+        self._runs: Dict[UUID, Tuple[str, float, RequestContext]] = {}
+
+    def _start(self, run_id: UUID, stage: Optional[str]) -> None:
+        """Remember when a timed run started, and for which request."""
+        context = get_request_context()
+        if stage is not None and context is not None:
+            self._runs[run_id] = (stage, time.perf_counter(), context)
+
+    def _end(self, run_id: UUID) -> None:
+        """Add the duration of a finished run to its request's timings."""
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            stage, started, context = run
+            context.add_timing(stage, time.perf_counter() - started)
+
+    def on_chain_start(
+        self,
+        serialized: Dict[str, Any],
+        inputs: Dict[str, Any],
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> None:
+        name = kwargs.get("name") or (serialized or {}).get("name")
+        self._start(run_id, stage_name(name, parent_run_id is None))
+
+    def on_chain_end(self, outputs: Dict[str, Any], *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(run_id, "llm")
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
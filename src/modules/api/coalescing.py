@@ -0,0 +1,194 @@
+"""
+Request coalescing for the Llama 2 chatbot API.
+
+This module provides a chain wrapper that lets concurrent identical requests share
+a single backend call. Streaming requests that arrive while an identical stream
+is running attach to it, receive the chunks produced so far and then follow the
+rest of the stream. The stage timings of a shared call are recorded for every
+request waiting for it.
+"""
+
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain.schema.runnable import Runnable, RunnableConfig
+
+from src.modules.api.request_context import SharedRequestContext, get_request_context, start_task
+from src.modules.api.response_cache import make_cache_key
+from src.modules.llm.chain_wrapper import ChainWrapper
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class _InvokeFlight:
+    """A backend call shared by all identical invoke requests."""
+
+    def __init__(self):
+        self.context = SharedRequestContext()
+        self.task: Optional["asyncio.Task"] = None
+        self.waiters = 0
+
+class _StreamFlight:
+    """A backend stream shared by all identical stream requests."""
+
+    def __init__(self):
+        self.chunks: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.context = SharedRequestContext()
+        self.task: Optional["asyncio.Task"] = None
+        self.condition = asyncio.Condition()
+
+    async def publish(self, chunk: Any) -> None:
+        """Append a chunk and wake up the subscribers."""
+        async with self.condition:
+            self.chunks.append(chunk)
+            self.condition.notify_all()
+
+    async def finish(self, error: Optional[BaseException] = None) -> None:
+        """Mark the stream as complete and wake up the subscribers."""
+        async with self.condition:
+            self.done = True
+            self.error = error
+            self.condition.notify_all()
+
+    async def subscribe(self) -> AsyncIterator[Any]:
+        """Yield every chunk of the stream, starting with the ones already produced."""
+        index = 0
+        while True:
+            async with self.condition:
+                await self.condition.wait_for(lambda: index < len(self.chunks) or self.done)
+                pending = self.chunks[index:]
+                done = self.done
+                error = self.error
+            for chunk in pending:
+                yield chunk
+            index += len(pending)
+            if done and index >= len(self.chunks):
+                if error is not None:
+                    raise error
+                return
+
+class CoalescingRunnable(ChainWrapper):
+    """
+    Chain wrapper that shares one backend call between concurrent identical requests.
+
+    Only the asynchronous entry points used by LangServe are coalesced. The
+    backend call runs in its own task and is cancelled once every request
+    waiting on it has gone away.
+    """
+
+    def __init__(self, bound: Runnable, model_config: Dict[str, Any]):
+        """
+        Initialize the coalescing runnable.
+
+        Args:
+            bound: The chain to call.
+            model_config: The model settings that are part of the request key.
+        """
+        super().__init__(bound)
+        self.model_config = model_config
+        self._invoke_flights: Dict[str, _InvokeFlight] = {}
+        self._stream_flights: Dict[str, _StreamFlight] = {}
+        self.backend_calls = 0
+        self.coalesced_invokes = 0
+        self.coalesced_streams = 0
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        key = make_cache_key(input, self.model_config, config)
+        flight = self._invoke_flights.get(key)
+        context = get_request_context()
+        if flight is None:
+            flight = _InvokeFlight()
+            flight.context.attach(context)
+            flight.task = start_task(self.bound.ainvoke(input, config, **kwargs), flight.context)
+            self._invoke_flights[key] = flight
+            self.backend_calls += 1
+            flight.task.add_done_callback(lambda _, flight=flight: self._forget_invoke(key, flight))
+        else:
+            flight.context.attach(context)
+            self.coalesced_invokes += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.context.detach(context)
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Nobody is waiting for the result any more
+                flight.task.cancel()
+                self._forget_invoke(key, flight)
+
+    def _forget_invoke(self, key: str, flight: _InvokeFlight) -> None:
+        """Remove a finished or abandoned invoke flight, so new requests start a new call."""
+        if self._invoke_flights.get(key) is flight:
+            del self._invoke_flights[key]
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> AsyncIterator[Any]:
+        key = make_cache_key(input, self.model_config, config)
+        flight = self._stream_flights.get(key)
+        context = get_request_context()
+        if flight is None:
+            flight = _StreamFlight()
+            flight.context.attach(context)
+            self._stream_flights[key] = flight
+            flight.task = start_task(self._produce(key, flight, input, config, **kwargs), flight.context)
+            self.backend_calls += 1
+        else:
+            flight.context.attach(context)
+            self.coalesced_streams += 1
+
+        flight.subscribers += 1
+        try:
+            async for chunk in flight.subscribe():
+                yield chunk
+        finally:
+            flight.context.detach(context)
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # Nobody is reading the stream any more
+                flight.task.cancel()
+                if self._stream_flights.get(key) is flight:
+                    del self._stream_flights[key]
+
+    async def _produce(
+        self,
+        key: str,
+        flight: _StreamFlight,
+        input: Any,
+        config: Optional[RunnableConfig],
+        **kwargs: Any,
+    ) -> None:
+        """Run the backend stream and publish its chunks to the flight."""
+        error = None
+        try:
+            async for chunk in self.bound.astream(input, config, **kwargs):
+                await flight.publish(chunk)
+        except asyncio.CancelledError:
+            error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            error = e
+        finally:
+            # Late arrivals start a new stream from here on
+            if self._stream_flights.get(key) is flight:
+                del self._stream_flights[key]
+            await flight.finish(error)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the coalescing statistics.
+
+        Returns:
+            A dictionary with the backend call and coalesced request counters.
+        """
+        return {
+            "backend_calls": self.backend_calls,
+            "coalesced_invokes": self.coalesced_invokes,
+            "coalesced_streams": self.coalesced_streams,
+            "in_flight_invokes": len(self._invoke_flights),
+            "in_flight_streams": len(self._stream_flights),
+        }
@@ -0,0 +1,269 @@
+"""
+Request deadlines and cancellation for the Llama 2 chatbot API.
+
+This module stops the work behind a generation request as soon as nobody will
+read its response: when the client disconnects, or when the deadline the client
+sent in the X-Request-Timeout header has passed. The request is cancelled where
+it is, so a request still waiting for an admission slot leaves the queue, and a
+running one cancels its backend call, which closes the connection to Ollama and
+ends the generation there. The deadline is also kept on the request context, so
+that the admission control never hands a slot to a request that has expired.
+"""
+
+import asyncio
+import json
+import logging
+import math
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from src.modules.api.metrics import Counter
+from src.modules.api.request_context import get_request_context
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Request header carrying the number of seconds the client waits for the response
+DEADLINE_HEADER = "X-Request-Timeout"
+
+# Reasons for which requests are cancelled
+CANCEL_REASON_DISCONNECT = "disconnect"
+CANCEL_REASON_DEADLINE = "deadline"
+
+# Event ending a LangServe event stream whose deadline has passed
+EXPIRED_STREAM_EVENT = b'event: error\r\ndata: {"status_code": 504, "message": "Request timed out"}\r\n\r\n'
+
+class InvalidTimeout(ValueError):
+    """
+    Raised when the X-Request-Timeout header is not a positive number of seconds.
+    """
+
+class RequestDeadlines:
+    """
+    Deadline settings of the generation requests, and the counters of cancelled requests.
+    """
+
+    def __init__(self, default_timeout: Optional[float] = None, max_timeout: Optional[float] = 600.0):
+        """
+        Initialize the deadlines.
+
+        Args:
+            default_timeout: The timeout of requests without the header, in seconds,
+                or None for no deadline. Defaults to None.
+            max_timeout: The longest timeout a client can ask for, in seconds, or
+                None for no limit. Defaults to 600.
+        """
+        self.default_timeout = default_timeout
+        self.max_timeout = max_timeout
+        self.requests = 0
+        self.with_deadline = 0
+        self.completed = 0
+        self.cancelled = Counter(
+            "llama_requests_cancelled_total",
+            "Generation requests cancelled before completion, by reason",
+            ("reason",),
+        )
+
+    def timeout(self, header: Optional[str]) -> Optional[float]:
+        """
+        Get the timeout of a request.
+
+        Args:
+            header: The value of the X-Request-Timeout header, if any.
+
+        Returns:
+            The timeout in seconds, capped at max_timeout, or None for no deadline.
+
+        Raises:
+            InvalidTimeout: If the header is not a positive number.
+        """
+        if header is None or not header.strip():
+            timeout = self.default_timeout
+        else:
+            try:
+                timeout = float(header)
+            except ValueError:
+                raise InvalidTimeout(f"{DEADLINE_HEADER} must be a number of seconds, got {header!r}")
+            if not math.isfinite(timeout) or timeout <= 0:
+                raise InvalidTimeout(f"{DEADLINE_HEADER} must be positive, got {header!r}")
+        if self.max_timeout is not None:
+            timeout = self.max_timeout if timeout is None else min(timeout, self.max_timeout)
+        return timeout
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the deadline statistics.
+
+        Returns:
+            A dictionary with the settings and the numbers of requests, of requests
+            with a deadline, and of requests completed and cancelled.
+        """
+        return {
+            "default_timeout_seconds": self.default_timeout,
+            "max_timeout_seconds": self.max_timeout,
+            "requests": self.requests,
+            "with_deadline": self.with_deadline,
+            "completed": self.completed,
+            "cancelled_on_disconnect": int(self.cancelled.value(reason=CANCEL_REASON_DISCONNECT)),
+            "expired": int(self.cancelled.value(reason=CANCEL_REASON_DEADLINE)),
+        }
+
+class DeadlineMiddleware:
+    """
+    ASGI middleware that cancels generation requests on disconnect or deadline expiry.
+
+    Only POST requests below path_prefix are watched. The request body is read
+    before the request is passed on, so that the middleware alone listens for the
+    disconnect afterwards. A request that expires before its response started
+    gets 504 Gateway Timeout; a streamed response that expires is ended with an
+    error event carrying the same status.
+    """
+
+    def __init__(
+        self,
+        app: Any,
+        deadlines: RequestDeadlines,
+        path_prefix: Union[str, Tuple[str, ...]] = "/llama/",
+    ):
+        """
+        Initialize the middleware.
+
+        Args:
+            app: The ASGI application to wrap.
+            deadlines: The deadline settings and counters.
+            path_prefix: The path prefix of the watched endpoints, or a tuple of
+                prefixes. Defaults to "/llama/".
+        """
+        self.app = app
+        self.deadlines = deadlines
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if (
+            scope["type"] != "http"
+            or scope.get("method") != "POST"
+            or not scope.get("path", "").startswith(self.path_prefix)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        started = time.monotonic()
+        self.deadlines.requests += 1
+        header = next(
+            (value.decode("latin-1") for name, value in scope.get("headers", [])
+             if name.decode("latin-1").lower() == DEADLINE_HEADER.lower()),
+            None,
+        )
+        try:
+            timeout = self.deadlines.timeout(header)
+        except InvalidTimeout as e:
+            await self._send_error(send, 400, str(e))
+            return
+        if timeout is not None:
+            self.deadlines.with_deadline += 1
+            context = get_request_context()
+            if context is not None:
+                context.deadline = started + timeout
+
+        body: List[Dict[str, Any]] = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                self.deadlines.cancelled.inc(reason=CANCEL_REASON_DISCONNECT)
+                return
+            body.append(message)
+            if not message.get("more_body", False):
+                break
+
+        disconnected = asyncio.Event()
+        response_started = False
+        response_status = None
+        response_complete = False
+        event_stream = False
+        cancelling = False
+
+        async def replay() -> Dict[str, Any]:
+            if body:
+                return body.pop(0)
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send_tracking(message: Dict[str, Any]) -> None:
+            nonlocal response_started, response_status, response_complete, event_stream
+            if cancelling:
+                # E.g. the error event of an interrupted stream; the middleware ends the response
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+                response_status = message["status"]
+                event_stream = any(
+                    name.lower() == b"content-type" and value.startswith(b"text/event-stream")
+                    for name, value in message.get("headers", [])
+                )
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_complete = True
+            await send(message)
+
+        async def watch_disconnect() -> None:
+            # The server answers with http.disconnect once the client has gone,
+            # or once the response has been sent completely
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+
+        app_task = asyncio.ensure_future(self.app(scope, replay, send_tracking))
+        watcher = asyncio.ensure_future(watch_disconnect())
+        remaining = None if timeout is None else max(0.0, started + timeout - time.monotonic())
+        try:
+            await asyncio.wait({app_task, watcher}, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            app_task.cancel()
+            raise
+        finally:
+            watcher.cancel()
+
+        if app_task.done() or response_complete:
+            if timeout is not None and response_status == 504:
+                # Expired while waiting for an admission slot
+                self.deadlines.cancelled.inc(reason=CANCEL_REASON_DEADLINE)
+            else:
+                self.deadlines.completed += 1
+            await app_task
+            return
+
+        reason = CANCEL_REASON_DISCONNECT if disconnected.is_set() else CANCEL_REASON_DEADLINE
+        self.deadlines.cancelled.inc(reason=reason)
+        cancelling = True
+        app_task.cancel()
+        try:
+            await app_task
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.debug(f"Cancelled request failed while stopping: {str(e)}")
+        elapsed = time.monotonic() - started
+        logger.info(f"Cancelled {scope.get('path')} after {elapsed:.2f} s: {reason}")
+        if reason != CANCEL_REASON_DEADLINE:
+            return
+        if not response_started:
+            await self._send_error(send, 504, f"Request timed out after {timeout:g} s")
+        else:
+            await send({
+                "type": "http.response.body",
+                "body": EXPIRED_STREAM_EVENT if event_stream else b"",
+                "more_body": False,
+            })
+
+    @staticmethod
+    async def _send_error(send: Any, status: int, detail: str) -> None:
+        """Send a JSON error response."""
+        body = json.dumps({"detail": detail}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,264 @@
+"""
+Disk-backed response cache for the Llama 2 chatbot API.
+
+This module provides a response cache stored in a single SQLite database in WAL
+mode, which the worker processes of a host read and write concurrently, and
+which keeps its entries across restarts. Opening the cache does not read its
+entries: every lookup is one indexed query. Expired entries and the least
+recently used ones beyond the size limits are removed by a background
+compaction, which one process at a time performs on a connection of its own, so
+that lookups in the meantime only wait for SQLite's write lock, if at all.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Minimum time between two updates of an entry's last access, in seconds. Hits
+# within it are reads only, at the price of a coarser LRU order.
+ACCESS_GRANULARITY = 60.0
+
+# Fraction of the size limits that a compaction evicts down to, so that the
+# next one is not due right after
+COMPACTION_TARGET = 0.9
+
+class DiskResponseCache:
+    """
+    Response cache in a SQLite database shared by processes, with TTL and size limits.
+
+    It has the interface of the in-memory ResponseCache. The limits are enforced
+    by the compactions, so the cache may exceed them between two compactions.
+    """
+
+    # Lookups and stores are file I/O, which async callers run in a thread
+    blocking = True
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 1024,
+        max_bytes: int = 16 * 1024 * 1024,
+        ttl_seconds: float = 300.0,
+        compaction_seconds: float = 60.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Open the cache database, creating it if needed.
+
+        Args:
+            path: The path of the database file.
+            max_entries: The maximum number of entries. Defaults to 1024.
+            max_bytes: The maximum total size of the cached values. Defaults to 16 MiB.
+            ttl_seconds: How long an entry stays valid. Defaults to 300 seconds.
+            compaction_seconds: The time between two compactions, in seconds, or 0
+                to compact only when compact() is called. Defaults to 60.
+            clock: The wall-clock time source, in seconds, shared by the processes.
+                Defaults to time.time.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.compaction_seconds = compaction_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._compaction_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.bypasses = 0
+        self.compactions = 0
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = self._connect()
+        # Only applies to a new database; lets compactions give pages back to the file system
+        self._connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_expires_at ON responses (expires_at)")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS cache_meta (name TEXT PRIMARY KEY, value REAL NOT NULL)")
+        self._connection.execute("INSERT OR IGNORE INTO cache_meta (name, value) VALUES ('compacted_at', 0)")
+        self._compaction_connection = self._connect()
+        self._stop = threading.Event()
+        self._compactor: Optional[threading.Thread] = None
+        if compaction_seconds > 0:
+            self._compactor = threading.Thread(target=self._run, name="response-cache-compaction", daemon=True)
+            self._compactor.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection to the database, usable from any thread."""
+        return sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5.0)
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Look up a cached value.
+
+        Args:
+            key: The cache key.
+
+        Returns:
+            The cached value, or None if it is missing or expired.
+        """
+        now = self._clock()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, expires_at, accessed_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] <= now:
+                self.misses += 1
+                self.expirations += row is not None
+                return None
+            if row[2] < now - ACCESS_GRANULARITY:
+                self._connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Any) -> bool:
+        """
+        Store a value, replacing the entry with the same key.
+
+        Args:
+            key: The cache key.
+            value: The value to cache, which must be JSON serializable.
+
+        Returns:
+            True if the value was stored, False if it is larger than the whole cache.
+        """
+        data = json.dumps(value, default=str)
+        size = len(data.encode("utf-8"))
+        if size > self.max_bytes:
+            return False
+        now = self._clock()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, data, size, now + self.ttl_seconds, now),
+            )
+        return True
+
+    def invalidate(self, key: str) -> None:
+        """
+        Remove an entry from the cache.
+
+        Args:
+            key: The cache key.
+        """
+        with self._lock:
+            self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        """Remove all entries from the cache."""
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+
+    def record_bypass(self) -> None:
+        """Count a request that skipped the cache lookup."""
+        with self._lock:
+            self.bypasses += 1
+
+    def compact(self, force: bool = True) -> int:
+        """
+        Remove the expired entries, then the least recently used ones beyond the limits.
+
+        Args:
+            force: Whether to compact even if another process compacted within the
+                last compaction_seconds. Defaults to True.
+
+        Returns:
+            The number of entries removed, or 0 if the compaction was skipped.
+        """
+        now = self._clock()
+        connection = self._compaction_connection
+        with self._compaction_lock:
+            if not force:
+                # Claim the compaction, so that the processes sharing the file take turns
+                claimed = connection.execute(
+                    "UPDATE cache_meta SET value = ? WHERE name = 'compacted_at' AND value <= ?",
+                    (now, now - self.compaction_seconds),
+                ).rowcount
+                if not claimed:
+                    return 0
+            expired = connection.execute("DELETE FROM responses WHERE expires_at <= ?", (now,)).rowcount
+            # Keep the most recently used entries that fit the targets
+            evicted = connection.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM (SELECT key, "
+                "SUM(size) OVER (ORDER BY accessed_at DESC, key ROWS UNBOUNDED PRECEDING) AS total, "
+                "ROW_NUMBER() OVER (ORDER BY accessed_at DESC, key) AS position FROM responses) "
+                "WHERE total > ? OR position > ?)",
+                (int(self.max_bytes * COMPACTION_TARGET), int(self.max_entries * COMPACTION_TARGET)),
+            ).rowcount if self._over_limits(connection) else 0
+            connection.execute("PRAGMA incremental_vacuum")
+            connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        with self._lock:
+            self.expirations += expired
+            self.evictions += evicted
+            self.compactions += 1
+        if expired or evicted:
+            logger.info(f"Removed {expired} expired and {evicted} evicted responses from {self.path}")
+        return expired + evicted
+
+    def _over_limits(self, connection: sqlite3.Connection) -> bool:
+        """Whether the entries exceed a size limit."""
+        entries, size = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return entries > self.max_entries or size > self.max_bytes
+
+    def _run(self) -> None:
+        """Compact the cache periodically, when no other process just did."""
+        while not self._stop.wait(self.compaction_seconds):
+            try:
+                self.compact(force=False)
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to compact the response cache {self.path}: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the cache statistics.
+
+        Returns:
+            A dictionary with the entries and size of the shared cache, and the hit,
+            miss, eviction and compaction counters of this process.
+        """
+        with self._lock:
+            entries, size = self._connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "path": self.path,
+                "entries": entries,
+                "size_bytes": size,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "bypasses": self.bypasses,
+                "compactions": self.compactions,
+            }
+
+    def close(self) -> None:
+        """Stop the compactions and close the database."""
+        self._stop.set()
+        if self._compactor is not None:
+            self._compactor.join()
+        with self._compaction_lock:
+            self._compaction_connection.close()
+        with self._lock:
+            self._connection.close()
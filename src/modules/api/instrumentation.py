@@ -0,0 +1,164 @@
+"""
+Request and generation metrics for the Llama 2 chatbot API.
+
+This module defines the metrics exported on /metrics and an ASGI middleware that
+counts HTTP requests and measures their latency. The generation metrics are
+recorded by the LangChain callback handlers in src.modules.api.callbacks.
+"""
+
+import time
+from typing import Any, Dict, Tuple, Union
+
+from src.modules.api.metrics import Counter, Gauge, Histogram, MetricsRegistry
+
+# Buckets for output token rates, in tokens per second
+TOKEN_RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 200, 500)
+# Buckets for prompt lengths, in tokens
+PROMPT_TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 3072, 4096, 8192)
+
+class ApiMetrics:
+    """
+    The metrics of one API server, exposed together in the Prometheus text format.
+    """
+
+    def __init__(self):
+        """Create and register the API metrics."""
+        self.registry = MetricsRegistry()
+        self.requests = self.register(Counter(
+            "llama_http_requests_total",
+            "HTTP requests by endpoint and status code",
+            ("endpoint", "status"),
+        ))
+        self.request_duration = self.register(Histogram(
+            "llama_http_request_duration_seconds",
+            "Total duration of generation requests, until the last byte was sent",
+        ))
+        self.generations = self.register(Counter(
+            "llama_generations_total",
+            "Generations by the backend that served them",
+            ("backend",),
+        ))
+        self.backend_errors = self.register(Counter(
+            "llama_backend_errors_total",
+            "Failed generations by backend and error type",
+            ("backend", "error_type"),
+        ))
+        self.cancelled_generations = self.register(Counter(
+            "llama_generations_cancelled_total",
+            "Generations cancelled before they finished, e.g. because the client went away",
+            ("backend",),
+        ))
+        self.in_flight = self.register(Gauge(
+            "llama_generations_in_flight",
+            "Generations currently running in the backend",
+        ))
+        self.time_to_first_token = self.register(Histogram(
+            "llama_time_to_first_token_seconds",
+            "Time from the start of a generation to its first token",
+        ))
+        self.generation_duration = self.register(Histogram(
+            "llama_generation_duration_seconds",
+            "Duration of successful generations",
+        ))
+        self.output_tokens = self.register(Counter(
+            "llama_output_tokens_total",
+            "Generated tokens by backend",
+            ("backend",),
+        ))
+        self.tokens_per_second = self.register(Histogram(
+            "llama_output_tokens_per_second",
+            "Decoding speed of successful generations",
+            TOKEN_RATE_BUCKETS,
+        ))
+        self.prompt_tokens = self.register(Counter(
+            "llama_prompt_tokens_total",
+            "Prompt tokens processed by backend",
+            ("backend",),
+        ))
+        self.prompt_length = self.register(Histogram(
+            "llama_prompt_tokens",
+            "Prompt tokens processed per generation",
+            PROMPT_TOKEN_BUCKETS,
+        ))
+
+    def register(self, metric: Any) -> Any:
+        """
+        Add a further metric, e.g. one owned by another component.
+
+        Args:
+            metric: A Counter, Gauge or Histogram.
+
+        Returns:
+            The metric.
+        """
+        return self.registry.register(metric)
+
+    def expose(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format.
+
+        Returns:
+            The exposition text.
+        """
+        return self.registry.expose()
+
+def endpoint_label(path: str, path_prefix: Union[str, Tuple[str, ...]] = "/llama/") -> str:
+    """
+    Get the endpoint label of a request path, with a bounded number of values.
+
+    Args:
+        path: The request path.
+        path_prefix: The path prefix of the generation endpoints, or a tuple of prefixes.
+
+    Returns:
+        The last path segment for generation endpoints below the first prefix
+        (e.g. "invoke"), the same prefixed with the route name for the other
+        prefixes (e.g. "chat_invoke"), and "other" for every other path.
+    """
+    prefixes = (path_prefix,) if isinstance(path_prefix, str) else path_prefix
+    for index, prefix in enumerate(prefixes):
+        if path.startswith(prefix):
+            segment = path.rstrip("/").rsplit("/", 1)[-1]
+            return segment if index == 0 else f"{prefix.strip('/')}_{segment}"
+    return "other"
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that counts HTTP requests and times generation requests.
+    """
+
+    def __init__(self, app: Any, metrics: ApiMetrics, path_prefix: Union[str, Tuple[str, ...]] = "/llama/"):
+        """
+        Initialize the middleware.
+
+        Args:
+            app: The ASGI application to wrap.
+            metrics: The metrics to update.
+            path_prefix: The path prefix of the generation endpoints, or a tuple of
+                prefixes. Defaults to "/llama/".
+        """
+        self.app = app
+        self.metrics = metrics
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            path = scope.get("path", "")
+            self.metrics.requests.inc(endpoint=endpoint_label(path, self.path_prefix), status=status)
+            if scope.get("method") == "POST" and path.startswith(self.path_prefix):
+                self.metrics.request_duration.observe(time.perf_counter() - started)
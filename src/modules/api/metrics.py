@@ -0,0 +1,296 @@
+"""
+Metrics primitives for the Llama 2 chatbot API.
+
+This module provides counters, gauges and histograms with fixed buckets that are
+cheap enough to update on every request, and a registry that renders them in
+the Prometheus text exposition format. The state of every metric can be saved
+and merged with the states of the same metrics in other worker processes.
+
+Updates take no lock. They are made from the event loop thread or under the
+GIL, where a concurrent update from another thread may very rarely be lost,
+which is acceptable for monitoring.
+"""
+
+import bisect
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Default buckets for latencies in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _format_value(value: float) -> str:
+    """Format a sample value for the exposition format."""
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+    """Format label pairs as {name="value",...}, or an empty string if there are none."""
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels:
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+class Counter:
+    """
+    Monotonically increasing counter with optional labels.
+    """
+
+    def __init__(self, name: str, description: str, label_names: Sequence[str] = ()):
+        """
+        Initialize the counter.
+
+        Args:
+            name: The metric name.
+            description: A short description of what is counted.
+            label_names: The names of the labels that every increment must provide.
+        """
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        """
+        Increase the counter.
+
+        Args:
+            amount: The amount to add. Defaults to 1.
+            **labels: The label values.
+        """
+        key = tuple(str(labels[name]) for name in self.label_names)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        """
+        Get the current value for the given label values.
+
+        Args:
+            **labels: The label values.
+
+        Returns:
+            The counter value, 0 if it was never increased.
+        """
+        return self._values.get(tuple(str(labels[name]) for name in self.label_names), 0.0)
+
+    def state(self) -> Dict[str, Any]:
+        """Get the values of the counter, in a form that can be saved as JSON."""
+        return {"values": [[list(key), value] for key, value in list(self._values.items())]}
+
+    def merge(self, states: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Add up the states of the counter in several processes."""
+        totals: Dict[Tuple[str, ...], float] = {}
+        for state in states:
+            for key, value in state["values"]:
+                totals[tuple(key)] = totals.get(tuple(key), 0.0) + value
+        return {"values": [[list(key), value] for key, value in totals.items()]}
+
+    def expose(self, state: Optional[Dict[str, Any]] = None) -> List[str]:
+        """Render the counter, or a saved state of it, in the Prometheus text format."""
+        state = state if state is not None else self.state()
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        for key, value in state["values"]:
+            lines.append(f"{self.name}{_format_labels(list(zip(self.label_names, key)))} {_format_value(value)}")
+        return lines
+
+class Gauge:
+    """
+    Value that can go up and down, or that is read from a function when exposed.
+    """
+
+    def __init__(self, name: str, description: str, function: Optional[Callable[[], float]] = None):
+        """
+        Initialize the gauge.
+
+        Args:
+            name: The metric name.
+            description: A short description of what is measured.
+            function: Optional function returning the current value. When given,
+                the value is read from it on every exposition.
+        """
+        self.name = name
+        self.description = description
+        self.function = function
+        self._value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Increase the gauge."""
+        self._value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        """Decrease the gauge."""
+        self._value -= amount
+
+    def set(self, value: float) -> None:
+        """Set the gauge."""
+        self._value = value
+
+    @property
+    def value(self) -> float:
+        """The current value."""
+        return self.function() if self.function is not None else self._value
+
+    def state(self) -> Dict[str, Any]:
+        """Get the value of the gauge, in a form that can be saved as JSON."""
+        return {"value": self.value}
+
+    def merge(self, states: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Add up the states of the gauge in several processes."""
+        return {"value": sum(state["value"] for state in states)}
+
+    def expose(self, state: Optional[Dict[str, Any]] = None) -> List[str]:
+        """Render the gauge, or a saved state of it, in the Prometheus text format."""
+        state = state if state is not None else self.state()
+        return [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} gauge",
+            f"{self.name} {_format_value(state['value'])}",
+        ]
+
+class Histogram:
+    """
+    Histogram with pre-defined bucket upper bounds.
+
+    Observing a value is a binary search and two additions, so it can stay
+    enabled on the request path.
+    """
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        """
+        Initialize the histogram.
+
+        Args:
+            name: The metric name.
+            description: A short description of what is measured.
+            buckets: The upper bounds of the buckets, in increasing order.
+        """
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        # One counter per bucket plus one for values above the largest bound
+        self._counts: List[int] = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value: float) -> None:
+        """
+        Record a value.
+
+        Args:
+            value: The observed value.
+        """
+        self._counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sum += value
+        self._count += 1
+
+    def snapshot(self, state: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Get the current state of the histogram.
+
+        Args:
+            state: A saved state to use instead of the current one, if any.
+
+        Returns:
+            A dictionary with the cumulative bucket counts, the sum and the count.
+        """
+        state = state if state is not None else self.state()
+        cumulative = []
+        total = 0
+        for bound, count in zip(self.buckets, state["counts"]):
+            total += count
+            cumulative.append((bound, total))
+        return {
+            "buckets": cumulative,
+            "sum": state["sum"],
+            "count": state["count"],
+        }
+
+    def state(self) -> Dict[str, Any]:
+        """Get the bucket counts of the histogram, in a form that can be saved as JSON."""
+        return {"counts": list(self._counts), "sum": self._sum, "count": self._count}
+
+    def merge(self, states: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Add up the states of the histogram in several processes."""
+        return {
+            "counts": [sum(counts) for counts in zip(*(state["counts"] for state in states))] or list(self._counts),
+            "sum": sum(state["sum"] for state in states),
+            "count": sum(state["count"] for state in states),
+        }
+
+    def expose(self, state: Optional[Dict[str, Any]] = None) -> List[str]:
+        """Render the histogram, or a saved state of it, in the Prometheus text format."""
+        snapshot = self.snapshot(state)
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for bound, count in snapshot["buckets"] + [(float("inf"), snapshot["count"])]:
+            lines.append(f'{self.name}_bucket{{le="{_format_value(bound)}"}} {count}')
+        lines.append(f"{self.name}_sum {_format_value(snapshot['sum'])}")
+        lines.append(f"{self.name}_count {snapshot['count']}")
+        return lines
+
+class MetricsRegistry:
+    """
+    Collection of metrics exposed together on a /metrics endpoint.
+    """
+
+    def __init__(self):
+        """Initialize an empty registry."""
+        self._metrics: Dict[str, Any] = {}
+
+    def register(self, metric: Any) -> Any:
+        """
+        Add a metric to the registry.
+
+        Args:
+            metric: A Counter, Gauge or Histogram.
+
+        Returns:
+            The metric, so that creation and registration can be combined.
+        """
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str) -> Any:
+        """
+        Get a registered metric.
+
+        Args:
+            name: The metric name.
+
+        Returns:
+            The metric, or None if no metric has that name.
+        """
+        return self._metrics.get(name)
+
+    def state(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the state of every metric, in a form that can be saved as JSON.
+
+        Returns:
+            The states of the metrics, by name.
+        """
+        return {name: metric.state() for name, metric in list(self._metrics.items())}
+
+    def expose(self, states: Optional[List[Dict[str, Dict[str, Any]]]] = None) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        Args:
+            states: Registry states of several processes to add up, as returned by
+                state(). Defaults to the metrics of this process only.
+
+        Returns:
+            The exposition text.
+        """
+        lines: List[str] = []
+        for name, metric in list(self._metrics.items()):
+            if states is None:
+                lines.extend(metric.expose())
+            else:
+                lines.extend(metric.expose(metric.merge([state[name] for state in states if name in state])))
+        return "\n".join(lines) + "\n"
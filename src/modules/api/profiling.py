@@ -0,0 +1,93 @@
+"""
+On-demand sampling profiler for the Llama 2 chatbot API.
+
+This module samples the Python stacks of every thread of the running server at
+a fixed interval and aggregates them in the collapsed-stack format read by
+flamegraph.pl, speedscope and similar tools. Sampling runs in its own thread,
+so live traffic is profiled as it is served.
+"""
+
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class ProfilerBusy(Exception):
+    """
+    Raised when a profile is requested while another one is running.
+    """
+
+class SamplingProfiler:
+    """
+    Statistical profiler based on sys._current_frames().
+
+    Only one profile runs at a time. The overhead is roughly one stack walk of
+    every thread per interval, so short profiles are safe in production.
+    """
+
+    def __init__(self, interval: float = 0.005, max_seconds: float = 60.0):
+        """
+        Initialize the profiler.
+
+        Args:
+            interval: The time between two samples, in seconds. Defaults to 5 ms.
+            max_seconds: The longest profile that may be requested. Defaults to 60 seconds.
+        """
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _collapse(frame, thread_name: str) -> str:
+        """Render a stack as "thread;outermost;...;innermost"."""
+        frames: List[str] = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+            frame = frame.f_back
+        frames.append(thread_name)
+        return ";".join(reversed(frames))
+
+    def profile(self, seconds: float, interval: Optional[float] = None) -> str:
+        """
+        Sample every thread for the given time.
+
+        Args:
+            seconds: How long to sample, capped at max_seconds.
+            interval: Optional sampling interval overriding the default.
+
+        Returns:
+            The collapsed stacks, one "frames count" line per distinct stack,
+            most frequent first.
+
+        Raises:
+            ProfilerBusy: If another profile is running.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+        try:
+            seconds = max(0.0, min(seconds, self.max_seconds))
+            interval = interval or self.interval
+            own_thread = threading.get_ident()
+            stacks: Counter = Counter()
+            samples = 0
+            deadline = time.perf_counter() + seconds
+            logger.info(f"Profiling for {seconds:.1f}s at {interval * 1000:.1f} ms intervals")
+
+            while time.perf_counter() < deadline:
+                names: Dict[int, str] = {thread.ident: thread.name for thread in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id != own_thread:
+                        stacks[self._collapse(frame, names.get(thread_id, str(thread_id)))] += 1
+                samples += 1
+                time.sleep(interval)
+
+            logger.info(f"Profile finished: {samples} samples, {len(stacks)} distinct stacks")
+            return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        finally:
+            self._lock.release()
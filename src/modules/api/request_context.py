@@ -0,0 +1,255 @@
+"""
+Per-request context for the Llama 2 chatbot API.
+
+This module provides an ASGI middleware that records the incoming request in a
+context variable, so that the layers wrapped around the chain can read request
+headers, add response headers and record stage timings without access to the
+FastAPI request object. Stage timings are returned in a Server-Timing header
+and logged. Work shared by several requests runs in a task of its own, under a
+SharedRequestContext that passes what it records on to each of them.
+"""
+
+import asyncio
+import contextvars
+import logging
+import time
+from typing import Any, Coroutine, Dict, List, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Context variable holding the RequestContext of the request being served
+_current_request: contextvars.ContextVar[Optional["RequestContext"]] = contextvars.ContextVar(
+    "current_request", default=None
+)
+
+class RequestContext:
+    """
+    Information about a single HTTP request, shared with the chain wrappers.
+    """
+
+    def __init__(self, method: str, path: str, headers: Dict[str, str]):
+        """
+        Initialize the request context.
+
+        Args:
+            method: The HTTP method of the request.
+            path: The path of the request.
+            headers: The request headers, with lower-case names.
+        """
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.started_at = time.perf_counter()
+        self.response_headers: Dict[str, str] = {}
+        # Seconds spent in each stage of the request, e.g. "queue" or "llm"
+        self.timings: Dict[str, float] = {}
+        # time.monotonic() after which nobody waits for the response, if the request has a deadline
+        self.deadline: Optional[float] = None
+
+    def header(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        """
+        Get a request header.
+
+        Args:
+            name: The header name (case-insensitive).
+            default: The value to return if the header is missing.
+
+        Returns:
+            The header value, or the default.
+        """
+        return self.headers.get(name.lower(), default)
+
+    def add_timing(self, stage: str, seconds: float) -> None:
+        """
+        Record time spent in a stage. Repeated stages are added up.
+
+        Args:
+            stage: The stage name, a valid Server-Timing metric name.
+            seconds: The time spent, in seconds.
+        """
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    def stage_timings(self) -> Dict[str, float]:
+        """
+        Get the stage timings so far, with the request total and the unattributed time.
+
+        Returns:
+            Milliseconds per stage. "total" is the time since the request arrived and
+            "overhead" the part of it outside the queues and the chain, i.e. request
+            parsing, serialization and the API layers.
+        """
+        total = time.perf_counter() - self.started_at
+        timings = dict(self.timings)
+        if "chain" in timings:
+            waited = timings.get("queue", 0.0) + timings.get("batch", 0.0)
+            timings["overhead"] = max(0.0, total - timings["chain"] - waited)
+        timings["total"] = total
+        return {stage: seconds * 1000 for stage, seconds in timings.items()}
+
+class _SharedHeaders(dict):
+    """Response headers that are also set on every request sharing the work."""
+
+    def __init__(self, shared: "SharedRequestContext"):
+        super().__init__()
+        self._shared = shared
+
+    def __setitem__(self, name: str, value: str) -> None:
+        super().__setitem__(name, value)
+        for context in list(self._shared.contexts):
+            context.response_headers[name] = value
+
+class SharedRequestContext:
+    """
+    The request context of work shared by several requests, such as a coalesced backend call.
+
+    It stands in for a RequestContext while the shared work runs. Stage timings
+    and response headers recorded in the meantime go to every request attached
+    to it at that moment; request headers are read from the first one.
+    """
+
+    def __init__(self):
+        """Initialize a shared context without requests."""
+        self.contexts: List[RequestContext] = []
+        self.response_headers: Dict[str, str] = _SharedHeaders(self)
+        # The work goes on as long as any of the requests waits for it
+        self.deadline: Optional[float] = None
+
+    def attach(self, context: Optional[RequestContext]) -> None:
+        """
+        Add a request waiting for the shared work.
+
+        Args:
+            context: The context of the request, or None outside of an HTTP request.
+        """
+        if context is not None and context not in self.contexts:
+            self.contexts.append(context)
+
+    def detach(self, context: Optional[RequestContext]) -> None:
+        """
+        Remove a request that no longer waits for the shared work.
+
+        Args:
+            context: The context of the request, or None outside of an HTTP request.
+        """
+        if context in self.contexts:
+            self.contexts.remove(context)
+
+    def header(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        """
+        Get a request header of the first request.
+
+        Args:
+            name: The header name (case-insensitive).
+            default: The value to return if the header is missing.
+
+        Returns:
+            The header value, or the default.
+        """
+        return self.contexts[0].header(name, default) if self.contexts else default
+
+    def add_timing(self, stage: str, seconds: float) -> None:
+        """
+        Record time spent in a stage, for every request attached.
+
+        Args:
+            stage: The stage name, a valid Server-Timing metric name.
+            seconds: The time spent, in seconds.
+        """
+        for context in list(self.contexts):
+            context.add_timing(stage, seconds)
+
+def start_task(coroutine: Coroutine[Any, Any, Any], context: Any = None) -> "asyncio.Task":
+    """
+    Run a coroutine in a new task with its own request context.
+
+    A task created directly copies the context variables of its creator, so
+    the work would be attributed to the request that happened to start it.
+
+    Args:
+        coroutine: The coroutine to run.
+        context: The RequestContext or SharedRequestContext of the task, or None
+            for work that belongs to no request.
+
+    Returns:
+        The task.
+    """
+    def create() -> "asyncio.Task":
+        _current_request.set(context)
+        return asyncio.ensure_future(coroutine)
+
+    return contextvars.copy_context().run(create)
+
+def format_server_timing(timings: Dict[str, float]) -> str:
+    """
+    Format stage timings as a Server-Timing header value.
+
+    Args:
+        timings: Milliseconds per stage.
+
+    Returns:
+        The header value, e.g. "queue;dur=0.4, llm;dur=812.0".
+    """
+    return ", ".join(f"{stage};dur={milliseconds:.1f}" for stage, milliseconds in timings.items())
+
+def get_request_context() -> Optional[RequestContext]:
+    """
+    Get the context of the request currently being served.
+
+    Returns:
+        The RequestContext, the SharedRequestContext of work shared by several
+        requests, or None when called outside of an HTTP request.
+    """
+    return _current_request.get()
+
+class RequestContextMiddleware:
+    """
+    ASGI middleware that publishes a RequestContext for every HTTP request.
+
+    Response headers added to the context before the response starts are sent
+    along with the response. So are the stage timings recorded until then, in a
+    Server-Timing header; for a streamed response these only cover the stages
+    before the first byte, and the complete timings are logged at the end.
+    """
+
+    def __init__(self, app: Any):
+        """
+        Initialize the middleware.
+
+        Args:
+            app: The ASGI application to wrap.
+        """
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {
+            name.decode("latin-1").lower(): value.decode("latin-1")
+            for name, value in scope.get("headers", [])
+        }
+        context = RequestContext(scope.get("method", ""), scope.get("path", ""), headers)
+        token = _current_request.set(context)
+
+        async def send_with_headers(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                if context.timings:
+                    context.response_headers["Server-Timing"] = format_server_timing(context.stage_timings())
+                if context.response_headers:
+                    raw_headers = list(message.get("headers", []))
+                    for name, value in context.response_headers.items():
+                        raw_headers.append((name.encode("latin-1"), value.encode("latin-1")))
+                    message = {**message, "headers": raw_headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            _current_request.reset(token)
+            if context.timings:
+                logger.info(
+                    f"{context.method} {context.path} stage timings (ms): "
+                    f"{format_server_timing(context.stage_timings())}"
+                )
@@ -0,0 +1,353 @@
+"""
+In-memory response cache for the Llama 2 chatbot API.
+
+This module provides a bounded LRU cache with per-entry TTL and a size cap in
+bytes, and a chain wrapper that answers repeated prompts from the cache instead
+of calling the language model again.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+from langchain.schema.runnable import Runnable, RunnableConfig
+
+from src.modules.api.request_context import get_request_context
+from src.modules.llm.chain_wrapper import ChainWrapper, join_chunks
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Request header used by clients to control caching of a single request
+CACHE_CONTROL_HEADER = "X-Cache-Control"
+# Response header reporting whether the response was served from the cache
+CACHE_STATUS_HEADER = "X-Cache"
+
+# Values accepted in the cache control header
+CACHE_MODE_DEFAULT = "default"
+CACHE_MODE_BYPASS = "bypass"    # neither read nor write the cache
+CACHE_MODE_REFRESH = "refresh"  # skip the lookup but store the new response
+
+def normalize_input(user_input: Any) -> Any:
+    """
+    Normalize a chain input so that trivially different prompts share a cache entry.
+
+    Leading and trailing whitespace is removed and inner runs of whitespace are
+    collapsed to a single space.
+
+    Args:
+        user_input: The chain input, usually a dict like {"input": "..."}.
+
+    Returns:
+        The normalized input.
+    """
+    if isinstance(user_input, str):
+        return " ".join(user_input.split())
+    if isinstance(user_input, dict):
+        return {key: normalize_input(value) for key, value in user_input.items()}
+    return user_input
+
+def make_cache_key(
+    user_input: Any,
+    model_config: Dict[str, Any],
+    config: Optional[RunnableConfig] = None,
+) -> str:
+    """
+    Build the cache key for a chain input.
+
+    Args:
+        user_input: The chain input.
+        model_config: The model name, system prompt and sampling parameters of the
+            service that produces the response.
+        config: The runnable config of the request. Its configurable fields are part
+            of the key, since they can change the output.
+
+    Returns:
+        A hex digest identifying the request.
+    """
+    configurable = (config or {}).get("configurable") or {}
+    payload = json.dumps(
+        {"input": normalize_input(user_input), "model": model_config, "configurable": configurable},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _estimate_size(value: Any) -> int:
+    """Estimate the memory footprint of a cached value in bytes."""
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    return len(json.dumps(value, default=str).encode("utf-8"))
+
+class _CacheEntry:
+    """A cached value with its size and expiry time."""
+
+    __slots__ = ("value", "size", "expires_at")
+
+    def __init__(self, value: Any, size: int, expires_at: float):
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+
+class ResponseCache:
+    """
+    Bounded LRU cache with per-entry TTL and a total size cap in bytes.
+    """
+
+    # Lookups and stores only touch memory, so async callers run them inline
+    blocking = False
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int = 16 * 1024 * 1024,
+        ttl_seconds: float = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize the response cache.
+
+        Args:
+            max_entries: The maximum number of entries. Defaults to 1024.
+            max_bytes: The maximum total size of the cached values. Defaults to 16 MiB.
+            ttl_seconds: How long an entry stays valid. Defaults to 300 seconds.
+            clock: The time source, in seconds. Defaults to time.monotonic.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.bypasses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Look up a cached value.
+
+        Args:
+            key: The cache key.
+
+        Returns:
+            The cached value, or None if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires_at <= self._clock():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def put(self, key: str, value: Any) -> bool:
+        """
+        Store a value, evicting least recently used entries as needed.
+
+        Args:
+            key: The cache key.
+            value: The value to cache.
+
+        Returns:
+            True if the value was stored, False if it is larger than the whole cache.
+        """
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return False
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _CacheEntry(value, size, self._clock() + self.ttl_seconds)
+            self._size_bytes += size
+            while len(self._entries) > self.max_entries or self._size_bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+        return True
+
+    def invalidate(self, key: str) -> None:
+        """
+        Remove an entry from the cache.
+
+        Args:
+            key: The cache key.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self) -> None:
+        """Remove all entries from the cache."""
+        with self._lock:
+            self._entries.clear()
+            self._size_bytes = 0
+
+    def record_bypass(self) -> None:
+        """Count a request that skipped the cache lookup."""
+        with self._lock:
+            self.bypasses += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the cache statistics.
+
+        Returns:
+            A dictionary with the hit, miss, eviction and size counters.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self._size_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "bypasses": self.bypasses,
+            }
+
+    def _remove(self, key: str) -> None:
+        """Remove an entry. The caller must hold the lock."""
+        entry = self._entries.pop(key)
+        self._size_bytes -= entry.size
+
+class CachedRunnable(ChainWrapper):
+    """
+    Chain wrapper that serves repeated requests from a ResponseCache.
+
+    Clients can send the X-Cache-Control header with "bypass" to skip the cache
+    entirely, or "refresh" to force a new generation that replaces the cached one.
+    """
+
+    def __init__(self, bound: Runnable, cache: ResponseCache, model_config: Dict[str, Any]):
+        """
+        Initialize the cached runnable.
+
+        Args:
+            bound: The chain to cache.
+            cache: The cache to store responses in, a ResponseCache or a DiskResponseCache.
+            model_config: The model settings that are part of the cache key.
+        """
+        super().__init__(bound)
+        self.cache = cache
+        self.model_config = model_config
+
+    def _cache_mode(self) -> str:
+        """Get the cache mode requested by the current HTTP request."""
+        context = get_request_context()
+        if context is None:
+            return CACHE_MODE_DEFAULT
+        mode = (context.header(CACHE_CONTROL_HEADER) or CACHE_MODE_DEFAULT).strip().lower()
+        if mode not in (CACHE_MODE_BYPASS, CACHE_MODE_REFRESH):
+            return CACHE_MODE_DEFAULT
+        return mode
+
+    def _lookup(self, key: str, mode: str) -> Optional[Any]:
+        """Look up a response, honouring the cache mode and reporting the result."""
+        if mode != CACHE_MODE_DEFAULT:
+            self.cache.record_bypass()
+            cached = None
+        else:
+            cached = self.cache.get(key)
+        self._report(cached, mode)
+        return cached
+
+    async def _alookup(self, key: str, mode: str) -> Optional[Any]:
+        """Look up a response like _lookup, off the event loop if the cache does I/O."""
+        if mode != CACHE_MODE_DEFAULT or not self.cache.blocking:
+            return self._lookup(key, mode)
+        cached = await asyncio.to_thread(self.cache.get, key)
+        self._report(cached, mode)
+        return cached
+
+    def _report(self, cached: Optional[Any], mode: str) -> None:
+        """Report the cache status of the current HTTP request."""
+        context = get_request_context()
+        if context is not None:
+            if cached is not None:
+                status = "HIT"
+            elif mode != CACHE_MODE_DEFAULT:
+                status = mode.upper()
+            else:
+                status = "MISS"
+            context.response_headers[CACHE_STATUS_HEADER] = status
+
+    def _store(self, key: str, mode: str, output: Any) -> None:
+        """Store a response unless the request bypasses the cache."""
+        if mode != CACHE_MODE_BYPASS and output is not None:
+            self.cache.put(key, output)
+
+    async def _astore(self, key: str, mode: str, output: Any) -> None:
+        """Store a response like _store, off the event loop if the cache does I/O."""
+        if self.cache.blocking and mode != CACHE_MODE_BYPASS and output is not None:
+            await asyncio.to_thread(self.cache.put, key, output)
+        else:
+            self._store(key, mode, output)
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        key = make_cache_key(input, self.model_config, config)
+        mode = self._cache_mode()
+        cached = self._lookup(key, mode)
+        if cached is not None:
+            return cached
+        output = self.bound.invoke(input, config, **kwargs)
+        self._store(key, mode, output)
+        return output
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        key = make_cache_key(input, self.model_config, config)
+        mode = self._cache_mode()
+        cached = await self._alookup(key, mode)
+        if cached is not None:
+            return cached
+        output = await self.bound.ainvoke(input, config, **kwargs)
+        await self._astore(key, mode, output)
+        return output
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Iterator[Any]:
+        key = make_cache_key(input, self.model_config, config)
+        mode = self._cache_mode()
+        cached = self._lookup(key, mode)
+        if cached is not None:
+            yield cached
+            return
+        chunks = []
+        for chunk in self.bound.stream(input, config, **kwargs):
+            chunks.append(chunk)
+            yield chunk
+        # Only complete streams are cached
+        self._store(key, mode, join_chunks(chunks))
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> AsyncIterator[Any]:
+        key = make_cache_key(input, self.model_config, config)
+        mode = self._cache_mode()
+        cached = await self._alookup(key, mode)
+        if cached is not None:
+            yield cached
+            return
+        chunks = []
+        async for chunk in self.bound.astream(input, config, **kwargs):
+            chunks.append(chunk)
+            yield chunk
+        # Only complete streams are cached
+        await self._astore(key, mode, join_chunks(chunks))
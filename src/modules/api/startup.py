@@ -0,0 +1,120 @@
+"""
+Startup timing for the Llama 2 chatbot API.
+
+This module records how long each phase of the server startup takes, from the
+first import of this module, and provides a middleware that answers generation
+requests with 503 while the backend is still being initialized in the background.
+"""
+
+import json
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Tuple, Union
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class StartupTimer:
+    """
+    Durations of the startup phases and times of the startup milestones.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        """
+        Initialize the timer. Milestones are measured from this moment.
+
+        Args:
+            clock: The time source, in seconds. Defaults to time.perf_counter.
+        """
+        self._clock = clock
+        self.started_at = clock()
+        self.phases: Dict[str, float] = {}
+        self.milestones: Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Time a startup phase.
+
+        Args:
+            name: The phase name, e.g. "imports".
+        """
+        started = self._clock()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + self._clock() - started
+
+    def mark(self, milestone: str) -> None:
+        """
+        Record that a milestone was reached, e.g. "accepting_requests".
+
+        Args:
+            milestone: The milestone name.
+        """
+        self.milestones[milestone] = self._clock() - self.started_at
+        logger.info(f"Startup: {milestone} after {self.milestones[milestone] * 1000:.0f} ms ({self.describe()})")
+
+    def describe(self) -> str:
+        """Summarize the phase durations for the log."""
+        return ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.phases.items())
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the startup timings.
+
+        Returns:
+            The phase durations and the milestone times, in milliseconds.
+        """
+        return {
+            "phases_ms": {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()},
+            "milestones_ms": {name: round(seconds * 1000, 1) for name, seconds in self.milestones.items()},
+        }
+
+# Timer of this process, started when the server modules are first imported
+startup_timer = StartupTimer()
+
+class ReadinessMiddleware:
+    """
+    ASGI middleware that rejects generation requests until the backend is ready.
+    """
+
+    def __init__(
+        self,
+        app: Any,
+        is_ready: Callable[[], bool],
+        path_prefix: Union[str, Tuple[str, ...]] = "/llama/",
+        retry_after: int = 1,
+    ):
+        """
+        Initialize the middleware.
+
+        Args:
+            app: The ASGI application to wrap.
+            is_ready: Returns whether the backend is ready.
+            path_prefix: The path prefix of the generation endpoints, or a tuple of
+                prefixes. Defaults to "/llama/".
+            retry_after: The Retry-After value of the 503 response, in seconds. Defaults to 1.
+        """
+        self.app = app
+        self.is_ready = is_ready
+        self.path_prefix = path_prefix
+        self.retry_after = retry_after
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or self.is_ready() or not scope.get("path", "").startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        body = json.dumps({"detail": "The model backend is starting, please retry shortly"}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"retry-after", str(self.retry_after).encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
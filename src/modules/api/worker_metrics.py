@@ -0,0 +1,142 @@
+"""
+Metrics aggregation across the worker processes of the API server.
+
+With several workers, each process has its own metrics, and a scrape of
+/metrics reaches one worker at random. This module lets every worker save the
+state of its metrics to a directory shared by the workers, and render the sum
+over all workers when scraped. Counters and histograms of workers that exited
+are kept, so totals never go backwards; their gauges are dropped.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.modules.api.metrics import Gauge, MetricsRegistry
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Time between two saves of a worker's metrics, in seconds
+FLUSH_INTERVAL = 5.0
+
+def clear_metrics_directory(directory: str) -> None:
+    """
+    Create the shared metrics directory, removing the files of a previous run.
+
+    Args:
+        directory: The directory.
+    """
+    path = Path(directory)
+    path.mkdir(parents=True, exist_ok=True)
+    for file in path.glob("worker-*.json"):
+        file.unlink(missing_ok=True)
+
+class WorkerMetrics:
+    """
+    Saves the metrics of one worker process and adds up those of all workers.
+    """
+
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        directory: str,
+        worker_id: Optional[str] = None,
+        flush_interval: float = FLUSH_INTERVAL,
+    ):
+        """
+        Initialize the worker metrics.
+
+        Args:
+            registry: The metrics of this worker.
+            directory: The directory shared by the workers.
+            worker_id: The name of this worker's file. Defaults to the process id.
+            flush_interval: The time between two saves, in seconds. A worker whose
+                file is older than three intervals is considered gone. Defaults to 5.
+        """
+        self.registry = registry
+        self.directory = Path(directory)
+        self.worker_id = worker_id or str(os.getpid())
+        self.flush_interval = flush_interval
+        self.path = self.directory / f"worker-{self.worker_id}.json"
+        self._task: Optional[asyncio.Task] = None
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def flush(self, alive: bool = True) -> None:
+        """
+        Save the state of this worker's metrics.
+
+        Args:
+            alive: Whether the worker keeps running. Defaults to True.
+        """
+        data = json.dumps({"worker": self.worker_id, "alive": alive, "metrics": self.registry.state()})
+        # Write then rename, so readers never see a partial file
+        temporary = self.path.with_suffix(".tmp")
+        temporary.write_text(data)
+        os.replace(temporary, self.path)
+
+    def collect(self) -> List[Dict[str, Dict[str, Any]]]:
+        """
+        Read the saved metrics of every worker.
+
+        Returns:
+            The metric states of every worker, without the gauges of the workers
+            that exited or stopped saving.
+        """
+        states = []
+        stale_before = time.time() - 3 * self.flush_interval
+        for file in self.directory.glob("worker-*.json"):
+            try:
+                modified = file.stat().st_mtime
+                data = json.loads(file.read_text())
+            except (OSError, ValueError) as e:
+                logger.warning(f"Failed to read the worker metrics in {file}: {str(e)}")
+                continue
+            metrics = data["metrics"]
+            if not data.get("alive", True) or modified < stale_before:
+                metrics = {
+                    name: state for name, state in metrics.items()
+                    if not isinstance(self.registry.get(name), Gauge)
+                }
+            states.append(metrics)
+        return states
+
+    def expose(self) -> str:
+        """
+        Render the metrics of all workers, added up, in the Prometheus text format.
+
+        Returns:
+            The exposition text.
+        """
+        self.flush()
+        return self.registry.expose(self.collect())
+
+    async def _run(self) -> None:
+        """Save the metrics periodically."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                logger.warning(f"Failed to save the worker metrics to {self.path}: {str(e)}")
+
+    def start(self) -> None:
+        """Start saving the metrics periodically on the running event loop."""
+        if self._task is None:
+            self.flush()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def aclose(self) -> None:
+        """Stop the periodic saves, and save the final counters of this worker."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.flush(alive=False)
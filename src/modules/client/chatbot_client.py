@@ -0,0 +1,466 @@
+"""
+HTTP clients for the Llama 2 chatbot API.
+
+This module provides a synchronous client built on a pooled requests session and
+an asynchronous client built on httpx. Neither depends on Streamlit, so they can
+also be used for backend-to-backend calls.
+"""
+
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
+from urllib.parse import urlsplit, urlunsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_URL = "http://localhost:8000/llama/invoke"
+
+# Request header naming the conversation, for the /chat endpoints of the API
+SESSION_ID_HEADER = "X-Session-ID"
+# Request header telling the API how long the client waits, so it stops generating after that
+REQUEST_TIMEOUT_HEADER = "X-Request-Timeout"
+
+# Methods that are safe to retry after the request may have reached the server
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+# Status codes worth retrying for idempotent requests
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+
+def build_input(message: str) -> Dict[str, str]:
+    """
+    Build the chain input for a user message.
+
+    Args:
+        message: The message to send to the chatbot.
+
+    Returns:
+        The input expected by the /llama chain.
+    """
+    return {"input": message}
+
+def endpoint_url(api_url: str, endpoint: str) -> str:
+    """
+    Get the URL of another endpoint of the same LangServe route.
+
+    Args:
+        api_url: The URL of the /invoke endpoint.
+        endpoint: The endpoint name, e.g. "stream" or "batch".
+
+    Returns:
+        The API URL with its last path segment replaced by the endpoint name.
+    """
+    base_url = api_url.rstrip("/")
+    if base_url.endswith("/invoke"):
+        base_url = base_url[: -len("/invoke")]
+    return f"{base_url}/{endpoint}"
+
+def health_url(api_url: str) -> str:
+    """
+    Get the URL of the API's health check endpoint.
+
+    Args:
+        api_url: The URL of any endpoint of the API.
+
+    Returns:
+        The root URL of the server.
+    """
+    parts = urlsplit(api_url)
+    return urlunsplit((parts.scheme, parts.netloc, "/", "", ""))
+
+class SSEParser:
+    """
+    Incremental parser for the server-sent events of the LangServe /stream endpoint.
+    """
+
+    def __init__(self):
+        """Initialize the parser."""
+        self.event: Optional[str] = None
+        self.data_lines: List[str] = []
+
+    def feed(self, line: str) -> Optional[Tuple[str, Any]]:
+        """
+        Process one line of the event stream.
+
+        Args:
+            line: The line, without its line terminator.
+
+        Returns:
+            The event name and its decoded data when the line completes an event, else None.
+        """
+        if line.startswith("event:"):
+            self.event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            self.data_lines.append(line[len("data:"):].strip())
+        elif line == "" and self.event is not None:
+            # A blank line ends the event
+            data = json.loads("\n".join(self.data_lines)) if self.data_lines else None
+            event = self.event
+            self.event = None
+            self.data_lines = []
+            return event, data
+        return None
+
+class ChatbotClient:
+    """
+    Client for interacting with the Llama 2 chatbot API.
+
+    Requests go through one requests session, so TCP connections are kept alive
+    and reused. Idempotent requests are retried with exponential backoff and
+    jitter; connection failures are retried for every request.
+    """
+
+    def __init__(
+        self,
+        api_url: str = DEFAULT_API_URL,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 120.0,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        pool_maxsize: int = 10,
+        session_id: Optional[str] = None,
+        deadline: Optional[float] = None,
+    ):
+        """
+        Initialize the chatbot client.
+
+        Args:
+            api_url: The URL of the chatbot API. Defaults to "http://localhost:8000/llama/invoke".
+            connect_timeout: The timeout for opening a connection, in seconds. Defaults to 3.05.
+            read_timeout: The timeout for reading the response, in seconds. Defaults to 120.
+            max_retries: The maximum number of retries. Defaults to 3.
+            backoff_factor: The base of the exponential backoff between retries, in
+                seconds. Defaults to 0.5.
+            pool_maxsize: The maximum number of pooled connections. Defaults to 10.
+            session_id: Optional conversation id sent with every request. The /chat
+                endpoints then continue that conversation.
+            deadline: Optional time the API has to answer each request, in seconds,
+                after which it stops generating. Defaults to None, for the API's default.
+        """
+        self.api_url = api_url
+        self.session_id = session_id
+        self.timeout = (connect_timeout, read_timeout)
+        self.last_timings: Dict[str, float] = {}
+        self.session = requests.Session()
+        if deadline is not None:
+            self.session.headers[REQUEST_TIMEOUT_HEADER] = f"{deadline:g}"
+        if session_id is not None:
+            self.session.headers[SESSION_ID_HEADER] = session_id
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            backoff_jitter=backoff_factor,
+            allowed_methods=IDEMPOTENT_METHODS,
+            status_forcelist=RETRY_STATUS_CODES,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def send_message(self, message: str) -> Union[str, Dict[str, Any]]:
+        """
+        Send a message to the chatbot API and get a response.
+
+        Args:
+            message: The message to send to the chatbot.
+
+        Returns:
+            The response from the chatbot API, either as a string (error) or as a dictionary (success).
+        """
+        try:
+            payload = {"input": build_input(message)}
+            response = self.session.post(self.api_url, json=payload, timeout=self.timeout)
+
+            if response.status_code == 200:
+                return response.json()
+            else:
+                return f"Error: API returned status code {response.status_code}"
+        except Exception as e:
+            logger.error(f"Error connecting to API: {str(e)}")
+            return f"Error connecting to API: {str(e)}"
+
+    def send_many(self, messages: List[str], batch_size: int = 32) -> Union[str, List[Any]]:
+        """
+        Send several messages through the /batch endpoint.
+
+        Args:
+            messages: The messages to send.
+            batch_size: The maximum number of messages per request. Defaults to 32.
+
+        Returns:
+            The outputs in the order of the messages, or an error string.
+        """
+        outputs: List[Any] = []
+        try:
+            for start in range(0, len(messages), batch_size):
+                payload = {"inputs": [build_input(message) for message in messages[start:start + batch_size]]}
+                response = self.session.post(endpoint_url(self.api_url, "batch"), json=payload, timeout=self.timeout)
+                if response.status_code != 200:
+                    return f"Error: API returned status code {response.status_code}"
+                outputs.extend(response.json()["output"])
+            return outputs
+        except Exception as e:
+            logger.error(f"Error connecting to API: {str(e)}")
+            return f"Error connecting to API: {str(e)}"
+
+    def stream_message(self, message: str) -> Iterator[str]:
+        """
+        Send a message to the chatbot API and yield the response as it is generated.
+
+        The response is read from the LangServe /stream endpoint (server-sent events).
+        Once the stream ends, last_timings holds the time to first token ("ttft")
+        and the total latency ("total"), in seconds.
+
+        Args:
+            message: The message to send to the chatbot.
+
+        Yields:
+            The chunks of the response text.
+
+        Raises:
+            RuntimeError: If the API returns an error status or an error event.
+        """
+        started = time.perf_counter()
+        self.last_timings = {}
+        payload = {"input": build_input(message)}
+        response = self.session.post(
+            endpoint_url(self.api_url, "stream"),
+            json=payload,
+            headers={"Accept": "text/event-stream"},
+            stream=True,
+            timeout=self.timeout,
+        )
+
+        try:
+            if response.status_code != 200:
+                raise RuntimeError(f"API returned status code {response.status_code}")
+
+            parser = SSEParser()
+            for line in response.iter_lines(decode_unicode=True):
+                parsed = parser.feed(line)
+                if parsed is None:
+                    continue
+                event, data = parsed
+                if event == "data" and isinstance(data, str):
+                    if "ttft" not in self.last_timings:
+                        self.last_timings["ttft"] = time.perf_counter() - started
+                    yield data
+                elif event == "error":
+                    raise RuntimeError(f"API stream failed: {data}")
+                elif event == "end":
+                    break
+        finally:
+            response.close()
+            self.last_timings["total"] = time.perf_counter() - started
+
+    def check_health(self) -> requests.Response:
+        """
+        Call the API's health check endpoint.
+
+        Returns:
+            The HTTP response.
+        """
+        return self.session.get(health_url(self.api_url), timeout=self.timeout)
+
+    def get_history(self) -> Optional[List[Dict[str, str]]]:
+        """
+        Get the messages of this client's conversation kept by the API.
+
+        Returns:
+            The messages, oldest first, or None if there is no session id, the API
+            does not know the session or cannot be reached.
+        """
+        if self.session_id is None:
+            return None
+        try:
+            response = self.session.get(f"{health_url(self.api_url)}sessions/{self.session_id}", timeout=self.timeout)
+        except Exception as e:
+            logger.error(f"Error connecting to API: {str(e)}")
+            return None
+        if response.status_code != 200:
+            return None
+        return response.json().get("messages")
+
+    def close(self) -> None:
+        """Close the pooled connections."""
+        self.session.close()
+
+class AsyncChatbotClient:
+    """
+    Asynchronous client for the Llama 2 chatbot API, built on a pooled httpx client.
+
+    Connection failures are retried with exponential backoff and jitter, since the
+    request never reached the server. Other failures are only retried for
+    idempotent requests.
+    """
+
+    def __init__(
+        self,
+        api_url: str = DEFAULT_API_URL,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 120.0,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        max_connections: int = 100,
+        transport: Any = None,
+        session_id: Optional[str] = None,
+        deadline: Optional[float] = None,
+    ):
+        """
+        Initialize the asynchronous chatbot client.
+
+        Args:
+            api_url: The URL of the chatbot API. Defaults to "http://localhost:8000/llama/invoke".
+            connect_timeout: The timeout for opening a connection, in seconds. Defaults to 3.05.
+            read_timeout: The timeout for reading the response, in seconds. Defaults to 120.
+            max_retries: The maximum number of retries. Defaults to 3.
+            backoff_factor: The base of the exponential backoff between retries, in
+                seconds. Defaults to 0.5.
+            max_connections: The maximum number of pooled connections. Defaults to 100.
+            transport: Optional httpx transport to use instead of the network.
+            session_id: Optional conversation id sent with every request. The /chat
+                endpoints then continue that conversation.
+            deadline: Optional time the API has to answer each request, in seconds,
+                after which it stops generating. Defaults to None, for the API's default.
+        """
+        self.api_url = api_url
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        headers = {}
+        if deadline is not None:
+            headers[REQUEST_TIMEOUT_HEADER] = f"{deadline:g}"
+        if session_id is not None:
+            headers[SESSION_ID_HEADER] = session_id
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport,
+            headers=headers,
+        )
+
+    def _backoff(self, attempt: int) -> float:
+        """Get the delay before a retry, with full jitter."""
+        return random.uniform(0, self.backoff_factor * (2 ** attempt))
+
+    async def _request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """Send a request, retrying the failures that are safe to retry."""
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.ConnectError:
+                if attempt == self.max_retries:
+                    raise
+            except httpx.TransportError:
+                if not idempotent or attempt == self.max_retries:
+                    raise
+            else:
+                if not idempotent or response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    return response
+            await asyncio.sleep(self._backoff(attempt))
+        raise RuntimeError("unreachable")
+
+    async def send_message(self, message: str) -> Union[str, Dict[str, Any]]:
+        """
+        Send a message to the chatbot API and get a response.
+
+        Args:
+            message: The message to send to the chatbot.
+
+        Returns:
+            The response from the chatbot API, either as a string (error) or as a dictionary (success).
+        """
+        try:
+            response = await self._request("POST", self.api_url, json={"input": build_input(message)})
+            if response.status_code == 200:
+                return response.json()
+            return f"Error: API returned status code {response.status_code}"
+        except Exception as e:
+            logger.error(f"Error connecting to API: {str(e)}")
+            return f"Error connecting to API: {str(e)}"
+
+    async def send_many(self, messages: List[str], batch_size: int = 32) -> Union[str, List[Any]]:
+        """
+        Send several messages through the /batch endpoint, one request per batch, concurrently.
+
+        Args:
+            messages: The messages to send.
+            batch_size: The maximum number of messages per request. Defaults to 32.
+
+        Returns:
+            The outputs in the order of the messages, or an error string.
+        """
+        async def send_batch(batch: List[str]) -> httpx.Response:
+            payload = {"inputs": [build_input(message) for message in batch]}
+            return await self._request("POST", endpoint_url(self.api_url, "batch"), json=payload)
+
+        try:
+            responses = await asyncio.gather(*[
+                send_batch(messages[start:start + batch_size])
+                for start in range(0, len(messages), batch_size)
+            ])
+            outputs: List[Any] = []
+            for response in responses:
+                if response.status_code != 200:
+                    return f"Error: API returned status code {response.status_code}"
+                outputs.extend(response.json()["output"])
+            return outputs
+        except Exception as e:
+            logger.error(f"Error connecting to API: {str(e)}")
+            return f"Error connecting to API: {str(e)}"
+
+    async def stream_message(self, message: str) -> AsyncIterator[str]:
+        """
+        Send a message to the chatbot API and yield the response as it is generated.
+
+        Args:
+            message: The message to send to the chatbot.
+
+        Yields:
+            The chunks of the response text.
+
+        Raises:
+            RuntimeError: If the API returns an error status or an error event.
+        """
+        payload = {"input": build_input(message)}
+        headers = {"Accept": "text/event-stream"}
+        async with self.client.stream("POST", endpoint_url(self.api_url, "stream"), json=payload, headers=headers) as response:
+            if response.status_code != 200:
+                raise RuntimeError(f"API returned status code {response.status_code}")
+            parser = SSEParser()
+            async for line in response.aiter_lines():
+                parsed = parser.feed(line)
+                if parsed is None:
+                    continue
+                event, data = parsed
+                if event == "data" and isinstance(data, str):
+                    yield data
+                elif event == "error":
+                    raise RuntimeError(f"API stream failed: {data}")
+                elif event == "end":
+                    break
+
+    async def check_health(self) -> httpx.Response:
+        """
+        Call the API's health check endpoint.
+
+        Returns:
+            The HTTP response.
+        """
+        return await self._request("GET", health_url(self.api_url))
+
+    async def aclose(self) -> None:
+        """Close the pooled connections."""
+        await self.client.aclose()
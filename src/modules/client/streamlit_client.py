@@ -5,51 +5,16 @@ This module provides a Streamlit web interface to interact with the Llama 2 chat
 """
 
 import streamlit as st
-import requests
 import logging
-import json
-from typing import Dict, Any, Union, Optional
+import time
+import uuid
+from typing import Dict, Any
+from src.modules.client.chatbot_client import ChatbotClient
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class ChatbotClient:
-    """
-    Client for interacting with the Llama 2 chatbot API.
-    """
-    
-    def __init__(self, api_url: str = "http://localhost:8000/llama/invoke"):
-        """
-        Initialize the chatbot client.
-        
-        Args:
-            api_url: The URL of the chatbot API. Defaults to "http://localhost:8000/llama/invoke".
-        """
-        self.api_url = api_url
-    
-    def send_message(self, message: str) -> Union[str, Dict[str, Any]]:
-        """
-        Send a message to the chatbot API and get a response.
-        
-        Args:
-            message: The message to send to the chatbot.
-            
-        Returns:
-            The response from the chatbot API, either as a string (error) or as a dictionary (success).
-        """
-        try:
-            payload = {"input": message}
-            response = requests.post(self.api_url, json=payload)
-            
-            if response.status_code == 200:
-                return response.json()
-            else:
-                return f"Error: API returned status code {response.status_code}"
-        except Exception as e:
-            logger.error(f"Error connecting to API: {str(e)}")
-            return f"Error connecting to API: {str(e)}"
-
 def initialize_page():
     """Initialize Streamlit page configuration."""
     st.set_page_config(
@@ -68,15 +33,29 @@ def initialize_session_state():
     if "messages" not in st.session_state:
         st.session_state.messages = []
     
-    # Initialize API URL
+    # Stream responses token by token by default
+    if "streaming" not in st.session_state:
+        st.session_state.streaming = True
+    
+    # Initialize API URL; the /chat endpoints keep the conversation on the server
     if "api_url" not in st.session_state:
-        st.session_state.api_url = "http://localhost:8000/llama/invoke"
+        st.session_state.api_url = "http://localhost:8000/chat/invoke"
+    
+    # Name the conversation of this browser session; the id is in the URL, so
+    # reloading the page continues the conversation kept by the API
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = st.query_params.get("session") or uuid.uuid4().hex
+        st.query_params["session"] = st.session_state.session_id
     
     # Initialize client
     if "client" not in st.session_state or st.session_state.api_url != st.session_state.current_api_url:
+        if "client" in st.session_state:
+            st.session_state.client.close()
         st.session_state.current_api_url = st.session_state.api_url
-        st.session_state.client = ChatbotClient(st.session_state.api_url)
+        st.session_state.client = ChatbotClient(st.session_state.api_url, session_id=st.session_state.session_id)
         logger.info(f"ChatbotClient initialized with API URL: {st.session_state.api_url}")
+        if not st.session_state.messages:
+            st.session_state.messages = st.session_state.client.get_history() or []
 
 def setup_sidebar():
     """Set up the sidebar with API configuration."""
@@ -88,12 +67,13 @@ def setup_sidebar():
             st.session_state.api_url = api_url
             initialize_session_state()
         
+        st.session_state.streaming = st.toggle("Stream responses", value=st.session_state.streaming)
+        
         st.info("Make sure the API server is running before using this client.")
         
         if st.button("Test Connection"):
             try:
-                test_url = "/".join(st.session_state.api_url.split("/")[:-1])
-                response = requests.get(test_url)
+                response = st.session_state.client.check_health()
                 if response.status_code == 200:
                     st.success("API connection successful!")
                 else:
@@ -101,11 +81,58 @@ def setup_sidebar():
             except Exception as e:
                 st.error(f"API connection failed: {str(e)}")
 
+def format_timings(timings: Dict[str, float]) -> str:
+    """
+    Format the latency figures of a response for display.
+    
+    Args:
+        timings: The timings recorded by ChatbotClient.stream_message.
+        
+    Returns:
+        A short caption with the time to first token and the total latency.
+    """
+    parts = []
+    if "ttft" in timings:
+        parts.append(f"first token {timings['ttft']:.2f}s")
+    if "total" in timings:
+        parts.append(f"total {timings['total']:.2f}s")
+    return " · ".join(parts)
+
 def display_chat_history():
     """Display the chat history."""
     for message in st.session_state.messages:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
+            if message.get("timings"):
+                st.caption(format_timings(message["timings"]))
+
+def stream_response(prompt: str, message_placeholder) -> Dict[str, Any]:
+    """
+    Stream the response to a prompt into the chat placeholder.
+    
+    Args:
+        prompt: The user's message.
+        message_placeholder: The Streamlit placeholder to render the response into.
+        
+    Returns:
+        The chat history entry for the response.
+    """
+    client = st.session_state.client
+    assistant_response = ""
+    try:
+        for chunk in client.stream_message(prompt):
+            assistant_response += chunk
+            message_placeholder.markdown(assistant_response + "▌")
+        message_placeholder.markdown(assistant_response)
+    except Exception as e:
+        logger.error(f"Error streaming from API: {str(e)}")
+        assistant_response = f"Error connecting to API: {str(e)}"
+        message_placeholder.error(assistant_response)
+        return {"role": "assistant", "content": assistant_response}
+    
+    timings = dict(client.last_timings)
+    st.caption(format_timings(timings))
+    return {"role": "assistant", "content": assistant_response, "timings": timings}
 
 def handle_user_input():
     """Handle user input and generate responses."""
@@ -121,20 +148,28 @@ def handle_user_input():
         with st.chat_message("assistant"):
             message_placeholder = st.empty()
             
+            if st.session_state.streaming:
+                st.session_state.messages.append(stream_response(prompt, message_placeholder))
+                return
+            
             with st.spinner("Calling API..."):
+                started = time.perf_counter()
                 response = st.session_state.client.send_message(prompt)
+                timings = {"total": time.perf_counter() - started}
                 
                 # Check if response is a string (error) or a dict (success)
                 if isinstance(response, str):
                     message_placeholder.error(response)
                     assistant_response = response
+                    timings = {}
                 else:
                     # Extract the response from the API output
-                    assistant_response = response
+                    assistant_response = response.get("output", response)
                     message_placeholder.markdown(assistant_response)
+                    st.caption(format_timings(timings))
         
         # Add assistant response to chat history
-        st.session_state.messages.append({"role": "assistant", "content": assistant_response})
+        st.session_state.messages.append({"role": "assistant", "content": assistant_response, "timings": timings})
 
 def display_instructions():
     """Display usage instructions."""
@@ -0,0 +1,199 @@
+"""
+Async-native LangChain LLM for Ollama.
+
+This module provides an LLM that talks to the Ollama HTTP API through a shared
+OllamaClient, so that generations run on the event loop over pooled keep-alive
+connections instead of occupying a worker thread each.
+"""
+
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, ClassVar, Dict, Iterator, List, Optional, Union
+
+from langchain.callbacks.manager import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain.llms.base import LLM
+from langchain.schema.output import Generation, GenerationChunk, LLMResult
+
+from src.modules.llm.ollama_client import DEFAULT_OLLAMA_URL, OllamaClient
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class AsyncOllama(LLM):
+    """
+    Ollama LLM with native async invoke, stream and batch support.
+
+    Batches are generated concurrently, so Ollama can serve them in parallel when
+    it is configured with several parallel slots (OLLAMA_NUM_PARALLEL).
+    """
+
+    model: str = "llama2"
+    """The name of the Ollama model."""
+
+    base_url: str = DEFAULT_OLLAMA_URL
+    """The URL of the Ollama server, used when no client is given."""
+
+    client: Any = None
+    """The OllamaClient used for requests. Created from base_url if not given."""
+
+    temperature: Optional[float] = None
+    top_k: Optional[int] = None
+    top_p: Optional[float] = None
+    num_predict: Optional[int] = None
+    num_ctx: Optional[int] = None
+    stop: Optional[List[str]] = None
+
+    keep_alive: Optional[Union[int, str]] = None
+    """How long Ollama keeps the model loaded after the request, e.g. "5m", or -1 for ever."""
+
+    supports_context: ClassVar[bool] = True
+    """Whether generations accept and return the Ollama "context" of a conversation."""
+
+    def model_post_init(self, __context: Any) -> None:
+        if self.client is None:
+            self.client = OllamaClient(base_url=self.base_url)
+
+    @property
+    def _llm_type(self) -> str:
+        return "ollama-async"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model": self.model, "base_url": self.client.base_url, **self._options()}
+
+    def _options(self, stop: Optional[List[str]] = None, **kwargs: Any) -> Dict[str, Any]:
+        """Build the Ollama "options" object for a request."""
+        options = {
+            "temperature": self.temperature,
+            "top_k": self.top_k,
+            "top_p": self.top_p,
+            "num_predict": self.num_predict,
+            "num_ctx": self.num_ctx,
+            "stop": stop if stop is not None else self.stop,
+        }
+        options.update(kwargs.get("options", {}))
+        return {key: value for key, value in options.items() if value is not None}
+
+    def _payload(self, stop: Optional[List[str]], **kwargs: Any) -> Dict[str, Any]:
+        """
+        Build the request fields other than model and prompt.
+
+        The "context" of an earlier response continues that conversation, so only
+        the new prompt is processed; "system" sets the system prompt.
+        """
+        payload: Dict[str, Any] = {"options": self._options(stop, **kwargs)}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        for field in ("context", "system"):
+            if kwargs.get(field) is not None:
+                payload[field] = kwargs[field]
+        return payload
+
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        for data in self.client.generate_stream(self.model, prompt, **self._payload(stop, **kwargs)):
+            chunk = _to_chunk(data, keep_context="context" in kwargs)
+            if run_manager and chunk.text:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[GenerationChunk]:
+        async for data in self.client.agenerate_stream(self.model, prompt, **self._payload(stop, **kwargs)):
+            chunk = _to_chunk(data, keep_context="context" in kwargs)
+            if run_manager and chunk.text:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        return "".join(chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs))
+
+    def _generate(
+        self,
+        prompts: List[str],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> LLMResult:
+        # Unlike _call, this keeps the statistics of the final chunk
+        return LLMResult(generations=[
+            [_join(list(self._stream(prompt, stop, run_manager, **kwargs)))] for prompt in prompts
+        ])
+
+    async def _agenerate_one(
+        self,
+        prompt: str,
+        stop: Optional[List[str]],
+        run_manager: Optional[AsyncCallbackManagerForLLMRun],
+        **kwargs: Any,
+    ) -> Generation:
+        """Generate the completion of a single prompt."""
+        return _join([chunk async for chunk in self._astream(prompt, stop, run_manager, **kwargs)])
+
+    async def _agenerate(
+        self,
+        prompts: List[str],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> LLMResult:
+        generations = await _gather_or_cancel(
+            [self._agenerate_one(prompt, stop, run_manager, **kwargs) for prompt in prompts]
+        )
+        return LLMResult(generations=[[generation] for generation in generations])
+
+async def _gather_or_cancel(coroutines: List[Awaitable[Any]]) -> List[Any]:
+    """
+    Run coroutines concurrently and return their results in order.
+
+    Unlike a plain asyncio.gather, the first error cancels the coroutines still
+    running, so that a failed prompt of a batch does not leave its siblings
+    generating for nobody. The error is raised once they have stopped.
+    """
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        # Let the cancelled generations close their streams and release their hosts
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+def _join(chunks: List[GenerationChunk]) -> Generation:
+    """Combine the streamed chunks of a completion, keeping the statistics of the final one."""
+    generation_info = None
+    for chunk in chunks:
+        if chunk.generation_info:
+            generation_info = chunk.generation_info
+    return Generation(text="".join(chunk.text for chunk in chunks), generation_info=generation_info)
+
+def _to_chunk(data: Dict[str, Any], keep_context: bool = False) -> GenerationChunk:
+    """
+    Convert an Ollama response line to a GenerationChunk.
+
+    The conversation context of the final line is only kept when keep_context is
+    set, for callers that continue the conversation; it holds every token so far.
+    """
+    generation_info = None
+    if data.get("done"):
+        # The final line carries the timing and token statistics
+        dropped = ("response",) if keep_context else ("response", "context")
+        generation_info = {key: value for key, value in data.items() if key not in dropped}
+    return GenerationChunk(text=data.get("response", ""), generation_info=generation_info)
@@ -0,0 +1,50 @@
+"""
+Backend detection for the Llama 2 chatbot.
+
+This module checks whether an Ollama server is reachable by probing its HTTP
+API with a short timeout. It only uses the standard library, so it can run at
+startup before any of the heavy LLM libraries are imported.
+"""
+
+import logging
+import os
+import urllib.error
+import urllib.request
+from typing import Optional
+
+from src.config.environment_config import OLLAMA_BASE_URL, OLLAMA_PROBE_TIMEOUT, get_float_setting
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_OLLAMA_URL = "http://localhost:11434"
+
+def get_ollama_base_url() -> str:
+    """
+    Get the URL of the Ollama server.
+
+    Returns:
+        The value of OLLAMA_BASE_URL, or "http://localhost:11434" if it is not set.
+    """
+    return os.getenv(OLLAMA_BASE_URL) or DEFAULT_OLLAMA_URL
+
+def check_ollama_available(base_url: Optional[str] = None, timeout: Optional[float] = None) -> bool:
+    """
+    Check whether an Ollama server answers on its HTTP API.
+
+    Args:
+        base_url: The URL of the Ollama server. Defaults to OLLAMA_BASE_URL.
+        timeout: The probe timeout in seconds. Defaults to OLLAMA_PROBE_TIMEOUT, or 0.5.
+
+    Returns:
+        True if the server answered /api/version, False otherwise.
+    """
+    url = f"{(base_url or get_ollama_base_url()).rstrip('/')}/api/version"
+    if timeout is None:
+        timeout = get_float_setting(OLLAMA_PROBE_TIMEOUT, 0.5)
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.status == 200
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        logger.info(f"Ollama is not reachable at {url}: {e}")
+        return False
@@ -0,0 +1,286 @@
+"""
+Offline bulk inference over JSONL files for the Llama 2 chatbot.
+
+This module runs every prompt of a JSONL file through the chain of the Ollama
+service (or the simulated one) with bounded concurrency and optional batching,
+without going through the API. Results are appended to a JSONL file as they
+complete, and that file is the checkpoint: a rerun skips the prompts it already
+holds, so an interrupted run resumes where it stopped. Progress, throughput and
+the estimated time left are logged while the run goes on.
+
+Usage:
+    python -m src.modules.llm.bulk_inference prompts.jsonl results.jsonl --concurrency 8
+    python -m src.modules.llm.bulk_inference prompts.jsonl results.jsonl --backend simulated
+
+Each input line is a JSON object with the prompt in "input" and an optional
+"id", or a JSON string. Lines without an id are identified by their line number.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional, Set, TextIO, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+def read_prompts(path: str, input_field: str = "input", id_field: str = "id") -> Iterator[Tuple[Any, str]]:
+    """
+    Read the prompts of a JSONL file, one line at a time.
+
+    Args:
+        path: The path of the JSONL file.
+        input_field: The field holding the prompt. Defaults to "input".
+        id_field: The field holding the id of the prompt. Defaults to "id".
+
+    Yields:
+        The id and the prompt of every non-empty line.
+
+    Raises:
+        ValueError: If a line is not valid JSON or has no prompt.
+    """
+    with open(path, encoding="utf-8") as input_file:
+        for number, line in enumerate(input_file, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"Line {number} of {path} is not valid JSON: {str(e)}")
+            if isinstance(record, str):
+                yield number, record
+                continue
+            if not isinstance(record, dict) or not isinstance(record.get(input_field), str):
+                raise ValueError(f"Line {number} of {path} has no {input_field!r} string")
+            yield record.get(id_field, number), record[input_field]
+
+def count_lines(path: str) -> int:
+    """Count the non-empty lines of a file, without parsing them."""
+    with open(path, encoding="utf-8") as input_file:
+        return sum(1 for line in input_file if line.strip())
+
+def load_checkpoint(path: str) -> Set[str]:
+    """
+    Read the ids already in a results file, dropping a line cut short by an interruption.
+
+    Args:
+        path: The path of the results file.
+
+    Returns:
+        The ids of the completed prompts, as strings.
+    """
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path, "rb+") as results_file:
+        data = results_file.read()
+        # A run killed mid-write leaves a partial last line; appending after it would corrupt the file
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            logger.warning(f"Removing an incomplete last line from {path}")
+            results_file.truncate(end)
+        for line in data[:end].splitlines():
+            if line.strip():
+                done.add(str(json.loads(line)["id"]))
+    return done
+
+class Progress:
+    """
+    Counts completed prompts and logs throughput and the estimated time left.
+    """
+
+    def __init__(self, total: int, skipped: int = 0):
+        """
+        Initialize the progress.
+
+        Args:
+            total: The number of prompts of this run.
+            skipped: The number of prompts completed by earlier runs.
+        """
+        self.total = total
+        self.skipped = skipped
+        self.completed = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+
+    def report(self) -> str:
+        """Get a line describing the progress of the run."""
+        elapsed = time.perf_counter() - self.started
+        done = self.completed + self.failed
+        rate = done / elapsed if elapsed > 0 else 0.0
+        remaining = self.total - done
+        eta = f"{remaining / rate:.0f} s" if rate > 0 else "unknown"
+        percent = 100.0 * done / self.total if self.total else 100.0
+        earlier = f", {self.skipped} done earlier" if self.skipped else ""
+        return (
+            f"{done}/{self.total} prompts ({percent:.1f}%), {self.failed} failed{earlier}, "
+            f"{rate:.2f} prompts/s, ETA {eta}"
+        )
+
+async def _log_progress(progress: Progress, interval: float) -> None:
+    """Log the progress periodically."""
+    while True:
+        await asyncio.sleep(interval)
+        logger.info(progress.report())
+
+def _write(output: TextIO, record: Dict[str, Any]) -> None:
+    """Append a record to a JSONL file and flush it, so that it survives an interruption."""
+    output.write(json.dumps(record, ensure_ascii=False) + "\n")
+    output.flush()
+
+async def run_bulk(
+    chain: Any,
+    prompts: Iterator[Tuple[Any, str]],
+    output: TextIO,
+    errors: TextIO,
+    progress: Progress,
+    concurrency: int = 8,
+    batch_size: int = 1,
+    config: Optional[Dict[str, Any]] = None,
+) -> None:
+    """
+    Run prompts through a chain, writing the results as they complete.
+
+    Args:
+        chain: The chain, taking {"input": str}.
+        prompts: The ids and prompts to run.
+        output: The file the results are appended to.
+        errors: The file the failures are appended to.
+        progress: The progress to update.
+        concurrency: The number of calls to the chain in flight. Defaults to 8.
+        batch_size: The number of prompts per call; more than 1 uses abatch.
+            Defaults to 1.
+        config: The runnable config of every call, if any.
+    """
+    async def worker() -> None:
+        while True:
+            batch: List[Tuple[Any, str]] = []
+            # The iterator is shared by the workers; each takes the next prompts
+            for item in prompts:
+                batch.append(item)
+                if len(batch) == batch_size:
+                    break
+            if not batch:
+                return
+            started = time.perf_counter()
+            inputs = [{"input": prompt} for _, prompt in batch]
+            try:
+                if batch_size > 1:
+                    results = await chain.abatch(inputs, config, return_exceptions=True)
+                else:
+                    results = [await chain.ainvoke(inputs[0], config)]
+            except Exception as e:
+                # E.g. an input over the length limit; in a batch, only its own result is an error
+                results = [e] * len(batch)
+            seconds = round(time.perf_counter() - started, 3)
+            for (prompt_id, prompt), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    progress.failed += 1
+                    _write(errors, {"id": prompt_id, "input": prompt, "error": f"{type(result).__name__}: {result}"})
+                else:
+                    progress.completed += 1
+                    _write(output, {"id": prompt_id, "input": prompt, "output": result, "seconds": seconds})
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+def create_service(backend: str, model: str, concurrency: int) -> Any:
+    """
+    Create the LLM service whose chain runs the prompts.
+
+    Args:
+        backend: "ollama" or "simulated".
+        model: The name of the Ollama model.
+        concurrency: The number of calls in flight, which sizes the connection pool.
+
+    Returns:
+        The LLM service.
+    """
+    if backend == "simulated":
+        from src.modules.llm.simulated_service import SimulatedService
+        return SimulatedService()
+    from src.modules.llm.backend_detection import get_ollama_base_url
+    from src.modules.llm.ollama_client import OllamaClient
+    from src.modules.llm.ollama_service import OllamaService
+    client = OllamaClient(base_url=get_ollama_base_url(), max_connections=concurrency, max_keepalive_connections=concurrency)
+    return OllamaService(model_name=model, client=client)
+
+async def _run(args: argparse.Namespace) -> int:
+    """Run the prompts of the input file that the results file does not hold yet."""
+    done = load_checkpoint(args.output)
+    total = count_lines(args.input)
+    progress = Progress(total - len(done), skipped=len(done))
+    if done:
+        logger.info(f"Resuming: {len(done)} of {total} prompts are already in {args.output}")
+    prompts = (
+        (prompt_id, prompt)
+        for prompt_id, prompt in read_prompts(args.input, args.input_field, args.id_field)
+        if str(prompt_id) not in done
+    )
+    service = create_service(args.backend, args.model, args.concurrency)
+    config = {"configurable": {"max_tokens": args.max_tokens}} if args.max_tokens is not None else None
+    reporter = asyncio.create_task(_log_progress(progress, args.progress_seconds))
+    try:
+        with open(args.output, "a", encoding="utf-8") as output, open(args.errors, "a", encoding="utf-8") as errors:
+            await run_bulk(
+                service.get_chain(),
+                prompts,
+                output,
+                errors,
+                progress,
+                concurrency=args.concurrency,
+                batch_size=args.batch_size,
+                config=config,
+            )
+    finally:
+        reporter.cancel()
+        close = getattr(service, "aclose", None)
+        if close is not None:
+            await close()
+    logger.info(progress.report())
+    if progress.failed:
+        logger.warning(f"{progress.failed} prompts failed, see {args.errors}; rerun to retry them")
+    return 1 if progress.failed else 0
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse the command line arguments."""
+    parser = argparse.ArgumentParser(description="Run the prompts of a JSONL file through the chatbot chain")
+    parser.add_argument("input", help="JSONL file of prompts")
+    parser.add_argument("output", help="JSONL file the results are appended to; also the checkpoint")
+    parser.add_argument("--errors", help="JSONL file the failures are appended to, defaults to OUTPUT.errors")
+    parser.add_argument("--backend", choices=("ollama", "simulated"), default="ollama")
+    parser.add_argument("--model", default="llama2", help="Ollama model name")
+    parser.add_argument("--concurrency", type=int, default=8, help="Calls to the chain in flight")
+    parser.add_argument("--batch-size", type=int, default=1, help="Prompts per call")
+    parser.add_argument("--max-tokens", type=int, default=None, help="Maximum tokens per response")
+    parser.add_argument("--input-field", default="input", help="Field holding the prompt")
+    parser.add_argument("--id-field", default="id", help="Field holding the prompt id")
+    parser.add_argument("--progress-seconds", type=float, default=5.0, help="Time between progress lines")
+    args = parser.parse_args(argv)
+    args.errors = args.errors or f"{args.output}.errors"
+    if args.concurrency < 1 or args.batch_size < 1:
+        parser.error("--concurrency and --batch-size must be at least 1")
+    return args
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Run the bulk inference from the command line.
+
+    Returns:
+        The exit code: 1 if some prompts failed, 0 otherwise.
+    """
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    # Keep per-request logs of the HTTP client out of the progress lines
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    try:
+        return asyncio.run(_run(args))
+    except KeyboardInterrupt:
+        logger.warning(f"Interrupted; rerun the same command to resume from {args.output}")
+        return 130
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""
+Base class for runnables that wrap the chatbot chain.
+
+This module provides a Runnable that delegates to an inner chain, so that extra
+layers (caching, coalescing, ...) can be stacked in front of the chain without
+changing the input and output schemas that LangServe exposes.
+"""
+
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain.schema.runnable import Runnable, RunnableConfig
+
+
+class ChainWrapper(Runnable):
+    """
+    Runnable that forwards every call to a wrapped runnable.
+
+    Subclasses override the calls they want to intercept and rely on this class
+    for everything else, including the schema information used by LangServe.
+    """
+
+    def __init__(self, bound: Runnable):
+        """
+        Initialize the wrapper.
+
+        Args:
+            bound: The runnable to delegate to.
+        """
+        self.bound = bound
+
+    @property
+    def InputType(self) -> Any:
+        return self.bound.InputType
+
+    @property
+    def OutputType(self) -> Any:
+        return self.bound.OutputType
+
+    def get_input_schema(self, config: Optional[RunnableConfig] = None) -> Any:
+        return self.bound.get_input_schema(config)
+
+    def get_output_schema(self, config: Optional[RunnableConfig] = None) -> Any:
+        return self.bound.get_output_schema(config)
+
+    @property
+    def config_specs(self) -> List[Any]:
+        return self.bound.config_specs
+
+    def get_name(self, suffix: Optional[str] = None, *, name: Optional[str] = None) -> str:
+        return self.bound.get_name(suffix, name=name)
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return self.bound.invoke(input, config, **kwargs)
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return await self.bound.ainvoke(input, config, **kwargs)
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Iterator[Any]:
+        yield from self.bound.stream(input, config, **kwargs)
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> AsyncIterator[Any]:
+        async for chunk in self.bound.astream(input, config, **kwargs):
+            yield chunk
+
+
+def join_chunks(chunks: List[Any]) -> Any:
+    """
+    Combine streamed chunks into the value a non-streaming call would return.
+
+    Args:
+        chunks: The chunks in the order they were produced.
+
+    Returns:
+        The combined output, or None if there were no chunks.
+    """
+    if not chunks:
+        return None
+    output = chunks[0]
+    for chunk in chunks[1:]:
+        output = output + chunk
+    return output
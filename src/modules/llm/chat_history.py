@@ -0,0 +1,287 @@
+"""
+Token-budgeted history for the chat sessions.
+
+This module keeps the history of a chat session within a token budget. When the
+messages of a session exceed the budget, the oldest turns are compacted out of
+the history and folded into a rolling summary by a background thread, so the
+request path never waits for the summary. The prompt history is then built from
+the summary and the most recent messages, and never exceeds the given budget.
+"""
+
+import logging
+import math
+import queue
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from src.modules.llm.chat_sessions import ChatSession
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below between a user and an assistant in a few sentences. "
+    "Keep the names, facts, preferences and decisions the assistant needs to continue it.\n\n"
+    "{conversation}\n\nSummary:"
+)
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of Llama 2 tokens of a text.
+
+    Args:
+        text: The text.
+
+    Returns:
+        The estimated number of tokens, at about 4 characters per token.
+    """
+    return math.ceil(len(text) / 4)
+
+class HistoryManager:
+    """
+    Keeps the history of chat sessions within a token budget.
+
+    Sessions whose messages exceed max_history_tokens are compacted to half of
+    the budget, whole turns at a time, always keeping the last turn. With
+    summarize enabled, the compacted turns are folded into the session's summary
+    in the background; until then they stay available to the prompt. Without it,
+    or when the summary fails, they are dropped.
+    """
+
+    def __init__(
+        self,
+        max_history_tokens: int = 1536,
+        max_summary_tokens: int = 256,
+        summarize: bool = True,
+        count_tokens: Callable[[str], int] = estimate_tokens,
+        message_overhead_tokens: int = 4,
+    ):
+        """
+        Initialize the manager.
+
+        Args:
+            max_history_tokens: The number of history tokens above which a session
+                is compacted. Defaults to 1536.
+            max_summary_tokens: The maximum length of a summary, in tokens. Defaults to 256.
+            summarize: Whether to summarize the compacted turns instead of dropping
+                them. Defaults to True.
+            count_tokens: Counts the tokens of a text. Defaults to estimate_tokens.
+            message_overhead_tokens: The tokens the prompt template adds around each
+                message, e.g. its role. Defaults to 4.
+        """
+        self.max_history_tokens = max_history_tokens
+        self.max_summary_tokens = max_summary_tokens
+        self.summarize = summarize
+        self.count_tokens = count_tokens
+        self.message_overhead_tokens = message_overhead_tokens
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Tuple[ChatSession, Any]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self.compactions = 0
+        self.summaries = 0
+        self.summary_failures = 0
+        self.dropped_messages = 0
+
+    def add(self, session: "ChatSession", messages: List[Tuple[str, str]]) -> None:
+        """
+        Add messages to a session's history.
+
+        Args:
+            session: The session.
+            messages: The (role, content) messages to add.
+        """
+        with self._lock:
+            for role, content in messages:
+                session.messages.append((role, content))
+                session.message_tokens.append(self.count_tokens(content))
+
+    def state(self, session: "ChatSession") -> Dict[str, Any]:
+        """
+        Get the history of a session in a form that can be saved.
+
+        Args:
+            session: The session.
+
+        Returns:
+            The summary, and the messages with their token counts, compacted ones first.
+        """
+        with self._lock:
+            return {
+                "summary": session.summary,
+                "messages": [list(message) for message in session.pending + session.messages],
+                "message_tokens": session.pending_tokens + session.message_tokens,
+            }
+
+    def restore(self, session: "ChatSession", state: Dict[str, Any]) -> None:
+        """
+        Restore the history of a session saved by state.
+
+        Args:
+            session: The session, with an empty history.
+            state: The saved history.
+        """
+        with self._lock:
+            session.summary = state.get("summary")
+            session.messages = [(role, content) for role, content in state.get("messages", [])]
+            session.message_tokens = list(state.get("message_tokens", []))
+            if len(session.message_tokens) != len(session.messages):
+                session.message_tokens = [self.count_tokens(content) for _, content in session.messages]
+
+    def trim(self, session: "ChatSession", max_messages: int) -> None:
+        """
+        Drop the oldest messages of a session beyond a maximum number.
+
+        Args:
+            session: The session.
+            max_messages: The number of messages to keep.
+        """
+        with self._lock:
+            dropped = max(0, len(session.messages) - max_messages)
+            if dropped:
+                del session.messages[:dropped]
+                del session.message_tokens[:dropped]
+                self.dropped_messages += dropped
+
+    def compact(self, session: "ChatSession", llm: Any = None) -> None:
+        """
+        Move the oldest turns of a session out of its history if it exceeds the budget.
+
+        Args:
+            session: The session.
+            llm: The LLM that summarizes the compacted turns, if any.
+        """
+        with self._lock:
+            if sum(session.message_tokens) <= self.max_history_tokens:
+                return
+            target = self.max_history_tokens // 2
+            moved = 0
+            # Move whole turns, always keeping the last one
+            while len(session.messages) - moved > 2 and sum(session.message_tokens[moved:]) > target:
+                moved += 2
+            if not moved:
+                return
+            session.pending.extend(session.messages[:moved])
+            session.pending_tokens.extend(session.message_tokens[:moved])
+            del session.messages[:moved]
+            del session.message_tokens[:moved]
+            self.compactions += 1
+            if not (self.summarize and llm is not None):
+                self.dropped_messages += len(session.pending)
+                session.pending.clear()
+                session.pending_tokens.clear()
+                return
+            if session.summarizing:
+                # The running summary picks these turns up when it finishes
+                return
+            session.summarizing = True
+        self._submit(session, llm)
+
+    def _submit(self, session: "ChatSession", llm: Any) -> None:
+        """Queue the summary of a session, starting the background worker if needed."""
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="chat-history-summary", daemon=True)
+                self._worker.start()
+        self._queue.put((session, llm))
+
+    def _run(self) -> None:
+        """Summarize the queued sessions, one at a time."""
+        while True:
+            session, llm = self._queue.get()
+            try:
+                self._summarize(session, llm)
+            finally:
+                self._queue.task_done()
+
+    def _summarize(self, session: "ChatSession", llm: Any) -> None:
+        """Fold the pending turns of a session into its summary."""
+        with self._lock:
+            pending = list(session.pending)
+            previous = session.summary
+        lines = [f"Earlier summary: {previous}"] if previous else []
+        lines.extend(f"{'User' if role == 'user' else 'Assistant'}: {content}" for role, content in pending)
+        try:
+            summary = self._truncate(str(llm.invoke(SUMMARY_PROMPT.format(conversation="\n".join(lines)))).strip())
+        except Exception as e:
+            logger.warning(f"Failed to summarize session {session.session_id}, dropping {len(pending)} messages: {str(e)}")
+            summary = previous
+            with self._lock:
+                self.summary_failures += 1
+                self.dropped_messages += len(pending)
+        else:
+            with self._lock:
+                self.summaries += 1
+        with self._lock:
+            session.summary = summary or None
+            del session.pending[:len(pending)]
+            del session.pending_tokens[:len(pending)]
+            # Turns compacted while the summary was running get their own pass
+            session.summarizing = bool(session.pending)
+            resubmit = session.summarizing
+        if resubmit:
+            self._submit(session, llm)
+
+    def _truncate(self, text: str) -> str:
+        """Shorten a summary to at most max_summary_tokens tokens."""
+        if self.count_tokens(text) <= self.max_summary_tokens:
+            return text
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count_tokens(text[:middle]) <= self.max_summary_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return text[:low]
+
+    def prompt_history(self, session: "ChatSession", max_tokens: int) -> List[Tuple[str, str]]:
+        """
+        Get the messages of a session to put in the prompt.
+
+        Args:
+            session: The session.
+            max_tokens: The number of tokens the history may take.
+
+        Returns:
+            The summary, as a system message, followed by the most recent messages,
+            in at most max_tokens tokens.
+        """
+        with self._lock:
+            summary = session.summary
+            messages = session.pending + session.messages
+            tokens = session.pending_tokens + session.message_tokens
+        history: List[Tuple[str, str]] = []
+        if summary:
+            summary_message = f"Summary of the earlier conversation: {summary}"
+            summary_tokens = self.count_tokens(summary_message) + self.message_overhead_tokens
+            if summary_tokens <= max_tokens:
+                max_tokens -= summary_tokens
+                history.append(("system", summary_message))
+        start = len(messages)
+        while start > 0 and tokens[start - 1] + self.message_overhead_tokens <= max_tokens:
+            start -= 1
+            max_tokens -= tokens[start] + self.message_overhead_tokens
+        return history + messages[start:]
+
+    def wait(self) -> None:
+        """Block until the queued summaries are done."""
+        self._queue.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the manager's counters.
+
+        Returns:
+            The budget, and the number of compactions, summaries, failed summaries
+            and messages dropped from the history.
+        """
+        with self._lock:
+            return {
+                "max_history_tokens": self.max_history_tokens,
+                "compactions": self.compactions,
+                "summaries": self.summaries,
+                "summary_failures": self.summary_failures,
+                "dropped_messages": self.dropped_messages,
+                "pending_summaries": self._queue.unfinished_tasks,
+            }
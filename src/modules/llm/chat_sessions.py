@@ -0,0 +1,566 @@
+"""
+Conversation sessions for the Llama 2 chatbot.
+
+This module provides an in-memory store of chat sessions and a runnable that
+continues the session named by the "session_id" metadata of each call. With an
+LLM that supports it (Ollama), the session keeps the "context" returned by the
+previous turn, so a new turn only processes the new message instead of the
+whole conversation. Other LLMs get the conversation history in the prompt, kept
+within a token budget by the history manager. Sessions paged out of memory can be
+kept in a SQLiteSessionStorage.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain.schema.output import LLMResult
+from langchain.schema.runnable import Runnable, RunnableConfig
+
+from src.modules.llm.chain_wrapper import ChainWrapper
+from src.modules.llm.chat_history import HistoryManager
+from src.modules.llm.length_limits import with_max_tokens
+from src.modules.llm.ollama_pool import SESSION_ID_METADATA_KEY
+from src.modules.llm.session_storage import SQLiteSessionStorage
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class ChatSession:
+    """
+    The messages and the model context of one conversation.
+    """
+
+    def __init__(self, session_id: str, now: float):
+        """
+        Initialize an empty session.
+
+        Args:
+            session_id: The id of the session.
+            now: The current time of the store's clock.
+        """
+        self.session_id = session_id
+        self.messages: List[Tuple[str, str]] = []
+        self.message_tokens: List[int] = []
+        # Compacted messages waiting to be folded into the summary
+        self.pending: List[Tuple[str, str]] = []
+        self.pending_tokens: List[int] = []
+        self.summary: Optional[str] = None
+        self.summarizing = False
+        self.context: Optional[List[int]] = None
+        self.created_at = now
+        self.last_used = now
+        self.turns = 0
+        # Serializes the turns of the session, so that each one continues the last
+        self.lock = threading.Lock()
+        self.async_lock = asyncio.Lock()
+
+    def history(self) -> List[Dict[str, str]]:
+        """Get the messages of the session, oldest first."""
+        return [{"role": role, "content": content} for role, content in self.messages]
+
+class ChatSessionStore:
+    """
+    In-memory store of chat sessions with idle expiry and memory limits.
+
+    Sessions unused for idle_seconds expire, and the least recently used session
+    is evicted when there are more than max_sessions. With a storage, expired and
+    evicted sessions are paged out to it instead of being lost, and loaded back
+    into memory on their next use; close() saves the sessions still in memory.
+    Resident memory is bounded by max_sessions either way. A context longer than
+    max_context_tokens is dropped; the next turn then sends the history instead.
+    Prompts built from a session, context or history, stay within max_prompt_tokens.
+
+    The storage is only called outside the store's lock, and the async methods
+    call it from a worker thread, so that its I/O does not block the event loop.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 1000,
+        idle_seconds: float = 1800.0,
+        max_context_tokens: int = 8192,
+        max_messages: int = 100,
+        max_prompt_tokens: int = 3072,
+        history: Optional[HistoryManager] = None,
+        storage: Optional[SQLiteSessionStorage] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize the store.
+
+        Args:
+            max_sessions: The maximum number of sessions kept. Defaults to 1000.
+            idle_seconds: How long an unused session is kept. Defaults to 1800 seconds.
+            max_context_tokens: The maximum number of context tokens kept per session.
+                Defaults to 8192.
+            max_messages: The maximum number of messages kept per session, oldest
+                dropped first. Defaults to 100.
+            max_prompt_tokens: The maximum length of the prompt of a turn, leaving
+                room for the response in the model's context window. Defaults to 3072.
+            history: The manager keeping the session histories within a token budget.
+                Defaults to a HistoryManager with its default budget.
+            storage: Optional storage of the sessions paged out of memory.
+            clock: The time source, in seconds. Defaults to time.monotonic.
+        """
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.max_context_tokens = max_context_tokens
+        self.max_messages = max_messages
+        self.max_prompt_tokens = max_prompt_tokens
+        self.history = history or HistoryManager()
+        self.storage = storage
+        self._clock = clock
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        # Sessions removed from memory whose save has not finished yet
+        self._saving: Dict[str, ChatSession] = {}
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.context_turns = 0
+        self.prompt_tokens = 0
+        self.reused_tokens = 0
+        self.context_resets = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.loads = 0
+
+    def _state(self, session: ChatSession) -> Dict[str, Any]:
+        """Get the state of a session to save."""
+        return {
+            "session_id": session.session_id,
+            "turns": session.turns,
+            "context": session.context,
+            **self.history.state(session),
+        }
+
+    def _removed(self, sessions: List[ChatSession]) -> List[ChatSession]:
+        """Mark sessions removed from memory as being saved. Called with the lock held."""
+        if self.storage is not None:
+            for session in sessions:
+                self._saving[session.session_id] = session
+        return sessions
+
+    def _page_out(self, sessions: List[ChatSession]) -> None:
+        """Save sessions removed from memory, if there is a storage. Called without the lock held."""
+        if self.storage is None or not sessions:
+            return
+        try:
+            self.storage.save([self._state(session) for session in sessions])
+        except Exception as e:
+            logger.error(f"Failed to save {len(sessions)} chat sessions: {str(e)}")
+        finally:
+            with self._lock:
+                for session in sessions:
+                    if self._saving.get(session.session_id) is session:
+                        del self._saving[session.session_id]
+
+    def _load(self, session_id: str, now: float) -> Optional[ChatSession]:
+        """Load a session paged out to the storage, if any. Called without the lock held."""
+        if self.storage is None:
+            return None
+        try:
+            state = self.storage.load(session_id)
+        except Exception as e:
+            logger.error(f"Failed to load chat session {session_id}: {str(e)}")
+            return None
+        if state is None:
+            return None
+        session = ChatSession(session_id, now)
+        session.turns = state.get("turns", 0)
+        session.context = state.get("context")
+        self.history.restore(session, state)
+        return session
+
+    def _expire(self, now: float) -> List[ChatSession]:
+        """Remove the sessions that have been idle for too long, returning them. Called with the lock held."""
+        expired = []
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_used < self.idle_seconds:
+                break
+            del self._sessions[session.session_id]
+            expired.append(session)
+            self.expirations += 1
+        return self._removed(expired)
+
+    def get(self, session_id: str, create: bool = True) -> Optional[ChatSession]:
+        """
+        Get a session and mark it as used.
+
+        Args:
+            session_id: The id of the session.
+            create: Whether to create the session if it does not exist. Defaults to True.
+
+        Returns:
+            The session, or None if it does not exist and create is False.
+        """
+        with self._lock:
+            now = self._clock()
+            removed = self._expire(now)
+            session = self._resident(session_id, now)
+            removed += self._evict()
+        self._page_out(removed)
+        if session is not None:
+            return session
+
+        # Paged out or unknown; read the storage without holding the lock
+        loaded = self._load(session_id, now)
+        with self._lock:
+            # Another call may have loaded or created the session in the meantime
+            session = self._resident(session_id, now)
+            if session is None:
+                if loaded is not None:
+                    session = loaded
+                    self.loads += 1
+                elif create:
+                    session = ChatSession(session_id, now)
+                else:
+                    return None
+                self._sessions[session_id] = session
+            removed = self._evict()
+        self._page_out(removed)
+        return session
+
+    def _resident(self, session_id: str, now: float) -> Optional[ChatSession]:
+        """Get a session in memory, or one still being saved, and mark it as used. Called with the lock held."""
+        session = self._sessions.get(session_id)
+        if session is not None:
+            self._sessions.move_to_end(session_id)
+        else:
+            # A session whose save is in flight is newer than its saved state
+            session = self._saving.get(session_id)
+            if session is None:
+                return None
+            self._sessions[session_id] = session
+        session.last_used = now
+        return session
+
+    def _evict(self) -> List[ChatSession]:
+        """Remove the least recently used sessions over max_sessions, returning them. Called with the lock held."""
+        evicted = []
+        while len(self._sessions) > self.max_sessions:
+            _, session = self._sessions.popitem(last=False)
+            evicted.append(session)
+            self.evictions += 1
+        return self._removed(evicted)
+
+    async def aget(self, session_id: str, create: bool = True) -> Optional[ChatSession]:
+        """
+        Get a session like get(), calling the storage from a worker thread.
+
+        Args:
+            session_id: The id of the session.
+            create: Whether to create the session if it does not exist. Defaults to True.
+
+        Returns:
+            The session, or None if it does not exist and create is False.
+        """
+        if self.storage is None:
+            return self.get(session_id, create)
+        return await asyncio.to_thread(self.get, session_id, create)
+
+    def record_turn(
+        self,
+        session: ChatSession,
+        user_input: str,
+        response: str,
+        generation_info: Optional[Dict[str, Any]] = None,
+        llm: Any = None,
+    ) -> None:
+        """
+        Add a finished turn to its session.
+
+        Args:
+            session: The session of the turn.
+            user_input: The user's message.
+            response: The model's response.
+            generation_info: The statistics of the generation, with the new context if any.
+            llm: The LLM that summarizes the turns compacted out of the history, if any.
+        """
+        generation_info = generation_info or {}
+        context = generation_info.get("context")
+        with self._lock:
+            if session.context is not None:
+                self.context_turns += 1
+                self.reused_tokens += len(session.context)
+            self.turns += 1
+            self.prompt_tokens += generation_info.get("prompt_eval_count") or 0
+            if context is not None and len(context) > self.max_context_tokens:
+                logger.info(f"Context of session {session.session_id} exceeds {self.max_context_tokens} tokens, dropping it")
+                self.context_resets += 1
+                context = None
+            session.context = context
+            session.turns += 1
+            session.last_used = self._clock()
+        self.history.add(session, [("user", user_input), ("assistant", response)])
+        self.history.trim(session, self.max_messages)
+        self.history.compact(session, llm)
+        with self._lock:
+            # A session paged out during its turn was saved without it
+            paged_out = self._sessions.get(session.session_id) is not session
+            if paged_out:
+                self._removed([session])
+        if paged_out:
+            self._page_out([session])
+
+    async def arecord_turn(
+        self,
+        session: ChatSession,
+        user_input: str,
+        response: str,
+        generation_info: Optional[Dict[str, Any]] = None,
+        llm: Any = None,
+    ) -> None:
+        """
+        Add a finished turn to its session like record_turn(), calling the storage from a worker thread.
+
+        Args:
+            session: The session of the turn.
+            user_input: The user's message.
+            response: The model's response.
+            generation_info: The statistics of the generation, with the new context if any.
+            llm: The LLM that summarizes the turns compacted out of the history, if any.
+        """
+        if self.storage is None:
+            self.record_turn(session, user_input, response, generation_info, llm)
+        else:
+            await asyncio.to_thread(self.record_turn, session, user_input, response, generation_info, llm)
+
+    def reset_context(self, session: ChatSession) -> None:
+        """
+        Drop the context of a session, so that its next turn sends the history.
+
+        Args:
+            session: The session.
+        """
+        with self._lock:
+            if session.context is not None:
+                self.context_resets += 1
+                session.context = None
+
+    def delete(self, session_id: str) -> bool:
+        """
+        Delete a session.
+
+        Args:
+            session_id: The id of the session.
+
+        Returns:
+            True if the session existed.
+        """
+        with self._lock:
+            deleted = self._sessions.pop(session_id, None) is not None
+            deleted = self._saving.pop(session_id, None) is not None or deleted
+        if self.storage is not None:
+            deleted = self.storage.delete(session_id) or deleted
+        return deleted
+
+    async def adelete(self, session_id: str) -> bool:
+        """
+        Delete a session like delete(), calling the storage from a worker thread.
+
+        Args:
+            session_id: The id of the session.
+
+        Returns:
+            True if the session existed.
+        """
+        if self.storage is None:
+            return self.delete(session_id)
+        return await asyncio.to_thread(self.delete, session_id)
+
+    def close(self) -> None:
+        """Save the sessions still in memory to the storage, if any, and close it."""
+        with self._lock:
+            sessions = self._removed(list(self._sessions.values()))
+        self._page_out(sessions)
+        if self.storage is not None:
+            self.storage.close()
+            self.storage = None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the store's counters.
+
+        Returns:
+            The number of sessions and turns, how many turns continued a context,
+            the prompt tokens processed and the context tokens that were reused
+            instead, the context resets, expirations and evictions, and the
+            sessions loaded back from the storage.
+        """
+        with self._lock:
+            removed = self._expire(self._clock())
+        self._page_out(removed)
+        stored = len(self.storage) if self.storage is not None else None
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "turns": self.turns,
+                "context_turns": self.context_turns,
+                "prompt_tokens": self.prompt_tokens,
+                "reused_context_tokens": self.reused_tokens,
+                "context_resets": self.context_resets,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "loads": self.loads,
+                "stored_sessions": stored,
+                "max_prompt_tokens": self.max_prompt_tokens,
+                "history": self.history.stats(),
+            }
+
+class _GenerationInfoCapture(BaseCallbackHandler):
+    """Callback handler that keeps the generation info of the LLM run."""
+
+    run_inline = True
+
+    def __init__(self):
+        self.generation_info: Optional[Dict[str, Any]] = None
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        if response.generations and response.generations[0]:
+            self.generation_info = response.generations[0][0].generation_info
+
+def _user_input(input: Any) -> str:
+    """Get the user's message from a chain input."""
+    return input["input"] if isinstance(input, dict) else str(input)
+
+def _session_id(config: Optional[RunnableConfig]) -> Optional[str]:
+    """Get the session id from the metadata of a call, if any."""
+    return ((config or {}).get("metadata") or {}).get(SESSION_ID_METADATA_KEY)
+
+class SessionChatRunnable(ChainWrapper):
+    """
+    Runnable that continues the conversation of the session named in the call's metadata.
+
+    Calls without a session id are answered by the stateless chain it wraps.
+    Turns of one session are serialized, so that each one sees the previous one.
+    With max_tokens_field, the LLM calls of the turns honour the "max_tokens"
+    configurable field of the call, as the stateless chain does.
+    """
+
+    def __init__(
+        self,
+        chain: Runnable,
+        llm: Any,
+        sessions: ChatSessionStore,
+        system_prompt: str,
+        max_tokens_field: Optional[str] = None,
+        stop_field: Optional[str] = None,
+    ):
+        """
+        Initialize the runnable.
+
+        Args:
+            chain: The stateless chain, with {"input": str} input and str output.
+            llm: The LLM of the chain.
+            sessions: The store of the sessions.
+            system_prompt: The system prompt of the conversation.
+            max_tokens_field: The name of the LLM's output length setting, set from
+                the "max_tokens" configurable field, if any (see with_max_tokens).
+            stop_field: The name of the LLM's stop sequences setting, set from the
+                "stop" configurable field, if any.
+        """
+        super().__init__(chain)
+        self.llm = llm
+        self.generation_llm = llm if max_tokens_field is None else with_max_tokens(llm, max_tokens_field, stop_field)
+        self.sessions = sessions
+        self.system_prompt = system_prompt
+        self.supports_context = getattr(llm, "supports_context", False)
+        self.system_prompt_tokens = (
+            sessions.history.count_tokens(system_prompt) + sessions.history.message_overhead_tokens
+        )
+        self.history_template = ChatPromptTemplate.from_messages([
+            ("system", system_prompt),
+            MessagesPlaceholder("history"),
+            ("human", "{input}"),
+        ])
+
+    def _prepare(self, session: ChatSession, user_input: str) -> Tuple[Runnable, Any, _GenerationInfoCapture]:
+        """
+        Build the LLM call of a turn.
+
+        Returns:
+            The runnable to call, its input, and the handler capturing the generation info.
+        """
+        capture = _GenerationInfoCapture()
+        history = self.sessions.history
+        input_tokens = history.count_tokens(user_input) + history.message_overhead_tokens
+        if session.context is not None and len(session.context) + input_tokens > self.sessions.max_prompt_tokens:
+            logger.info(f"Context of session {session.session_id} would exceed the prompt limit, sending the history")
+            self.sessions.reset_context(session)
+        if self.supports_context and (session.context is not None or not session.messages):
+            # Ollama applies the model's template; the context carries the conversation so far
+            if session.context is not None:
+                params = {"context": session.context}
+            else:
+                params = {"context": None, "system": self.system_prompt}
+            return self.generation_llm.bind(**params).with_config(callbacks=[capture]), user_input, capture
+        budget = self.sessions.max_prompt_tokens - self.system_prompt_tokens - input_tokens
+        messages = history.prompt_history(session, max(0, budget))
+        prompt = self.history_template.invoke({"input": user_input, "history": messages})
+        params = {"context": None} if self.supports_context else {}
+        return self.generation_llm.bind(**params).with_config(callbacks=[capture]), prompt, capture
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        session_id = _session_id(config)
+        if session_id is None:
+            return self.bound.invoke(input, config, **kwargs)
+        session = self.sessions.get(session_id)
+        user_input = _user_input(input)
+        with session.lock:
+            llm, prompt, capture = self._prepare(session, user_input)
+            response = llm.invoke(prompt, config)
+            self.sessions.record_turn(session, user_input, response, capture.generation_info, self.llm)
+        return response
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        session_id = _session_id(config)
+        if session_id is None:
+            return await self.bound.ainvoke(input, config, **kwargs)
+        session = await self.sessions.aget(session_id)
+        user_input = _user_input(input)
+        async with session.async_lock:
+            llm, prompt, capture = self._prepare(session, user_input)
+            response = await llm.ainvoke(prompt, config)
+            await self.sessions.arecord_turn(session, user_input, response, capture.generation_info, self.llm)
+        return response
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Iterator[Any]:
+        session_id = _session_id(config)
+        if session_id is None:
+            yield from self.bound.stream(input, config, **kwargs)
+            return
+        session = self.sessions.get(session_id)
+        user_input = _user_input(input)
+        with session.lock:
+            llm, prompt, capture = self._prepare(session, user_input)
+            chunks = []
+            for chunk in llm.stream(prompt, config):
+                chunks.append(chunk)
+                yield chunk
+            self.sessions.record_turn(session, user_input, "".join(chunks), capture.generation_info, self.llm)
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> AsyncIterator[Any]:
+        session_id = _session_id(config)
+        if session_id is None:
+            async for chunk in self.bound.astream(input, config, **kwargs):
+                yield chunk
+            return
+        session = await self.sessions.aget(session_id)
+        user_input = _user_input(input)
+        async with session.async_lock:
+            llm, prompt, capture = self._prepare(session, user_input)
+            chunks = []
+            async for chunk in llm.astream(prompt, config):
+                chunks.append(chunk)
+                yield chunk
+            await self.sessions.arecord_turn(session, user_input, "".join(chunks), capture.generation_info, self.llm)
@@ -1,11 +1,13 @@
 """
 HuggingFace service for interacting with open-source models.
 
-This module provides a fallback when Ollama is not available.
+This module provides a fallback when Ollama is not available: a model served by
+the Hugging Face inference endpoints, or a model loaded from a local directory and
+run in-process when LOCAL_MODEL_PATH is set.
 """
 
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, Optional
 import os
 
 from langchain.prompts import ChatPromptTemplate
@@ -13,22 +15,45 @@ from langchain_community.llms import HuggingFaceEndpoint
 from langchain.schema.output_parser import StrOutputParser
 from langchain.schema.runnable import Runnable
 
+from src.modules.llm.chat_sessions import ChatSessionStore, SessionChatRunnable
+from src.modules.llm.length_limits import LengthLimitedRunnable, LengthLimits, prompt_tokens, with_max_tokens
+from src.modules.llm.local_transformers import LocalModel, LocalTransformersLLM
+from src.modules.llm.semantic_cache import SemanticCache, SemanticCacheRunnable
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# System prompt used by the chat template
+DEFAULT_SYSTEM_PROMPT = "You are a helpful, friendly AI assistant. Be concise and clear in your responses."
+
 class HuggingFaceService:
     """
     Service for interacting with HuggingFace models as a fallback for Ollama.
     """
 
-    def __init__(self, model_name: str = "google/flan-t5-small"):
+    def __init__(
+        self,
+        model_name: str = "google/flan-t5-small",
+        semantic_cache: Optional[SemanticCache] = None,
+        length_limits: Optional[LengthLimits] = None,
+        local_model: Optional[LocalModel] = None,
+    ):
         """
         Initialize the HuggingFace service.
         
         Args:
             model_name: The name of the model to use. Defaults to "google/flan-t5-small".
+            semantic_cache: Optional cache that answers prompts similar to earlier ones.
+            length_limits: The token limits of the inputs. Defaults to limits configured
+                from the environment variables.
+            local_model: The in-process model to generate with instead of the
+                inference endpoint. Defaults to the model at LOCAL_MODEL_PATH, if set.
         """
-        self.model_name = model_name
+        self.local_model = local_model if local_model is not None else LocalModel.from_environment()
+        self.model_name = self.local_model.model_name if self.local_model is not None else model_name
+        self.system_prompt = DEFAULT_SYSTEM_PROMPT
+        self.semantic_cache = semantic_cache
+        self.length_limits = length_limits if length_limits is not None else LengthLimits.from_environment()
         self.llm = None
         self.chain = None
         self._initialize_llm()
@@ -38,6 +63,11 @@ class HuggingFaceService:
         """
         Initialize the HuggingFace model.
         """
+        if self.local_model is not None:
+            self.llm = LocalTransformersLLM(local_model=self.local_model, temperature=0.7, max_new_tokens=512)
+            logger.info(f"Successfully initialized local transformers model {self.model_name}")
+            return
+        
         try:
             # Use smaller local model by default
             self.llm = HuggingFaceEndpoint(
@@ -56,12 +86,19 @@ class HuggingFaceService:
         """
         # Create a chat template
         chat_template = ChatPromptTemplate.from_messages([
-            ("system", "You are a helpful, friendly AI assistant. Be concise and clear in your responses."),
+            ("system", self.system_prompt),
             ("human", "{input}")
         ])
         
-        # Build the chain
-        self.chain = chat_template | self.llm | StrOutputParser()
+        # Build the chain; the length admission sets the response length through "max_tokens"
+        self.chain = chat_template | with_max_tokens(self.llm, "max_new_tokens") | StrOutputParser()
+        
+        # Answer near-duplicate prompts from the semantic cache when one is configured
+        if self.semantic_cache is not None:
+            self.chain = SemanticCacheRunnable(self.chain, self.semantic_cache)
+        
+        # Reject over-length inputs before they reach the backend or the cache
+        self.chain = LengthLimitedRunnable(self.chain, self.length_limits, prompt_tokens(self.length_limits, self.system_prompt))
         
     def generate_response(self, user_input: str) -> str:
         """
@@ -79,6 +116,23 @@ class HuggingFaceService:
             logger.error(f"Error generating response: {str(e)}")
             return f"Sorry, I encountered an error: {str(e)}"
     
+    def stream_response(self, user_input: str) -> Iterator[str]:
+        """
+        Generate a response to the user input, yielding it as it is produced.
+        
+        Args:
+            user_input: The user's input message.
+            
+        Yields:
+            The chunks of the generated response.
+        """
+        try:
+            for chunk in self.chain.stream({"input": user_input}):
+                yield chunk
+        except Exception as e:
+            logger.error(f"Error streaming response: {str(e)}")
+            yield f"Sorry, I encountered an error: {str(e)}"
+    
     def get_chain(self) -> Runnable:
         """
         Get the language model chain.
@@ -86,4 +140,40 @@ class HuggingFaceService:
         Returns:
             The language model chain.
         """
-        return self.chain 
\ No newline at end of file
+        return self.chain 
+    
+    def get_session_chain(self, sessions: ChatSessionStore) -> Runnable:
+        """
+        Get a chain that continues the conversation of the session named in each call.
+        
+        Args:
+            sessions: The store of the conversation sessions.
+            
+        Returns:
+            The session-aware chain. The session id is read from the "session_id"
+            metadata of the call; calls without one are answered statelessly.
+        """
+        system_tokens = prompt_tokens(self.length_limits, self.system_prompt)
+        return LengthLimitedRunnable(
+            SessionChatRunnable(self.chain, self.llm, sessions, self.system_prompt, "max_new_tokens"),
+            self.length_limits,
+            system_tokens,
+            max_input_tokens=sessions.max_prompt_tokens - system_tokens,
+        )
+    
+    def get_model_config(self) -> Dict[str, Any]:
+        """
+        Get the settings that determine the model's output.
+        
+        Returns:
+            The backend, model name, system prompt and sampling parameters.
+        """
+        return {
+            "backend": "transformers" if self.local_model is not None else "huggingface",
+            "model": self.model_name,
+            "system_prompt": self.system_prompt,
+            "temperature": self.llm.temperature,
+            "max_new_tokens": self.llm.max_new_tokens,
+            "context_window": self.length_limits.context_window,
+            "max_output_tokens": self.length_limits.max_output_tokens,
+        }
\ No newline at end of file
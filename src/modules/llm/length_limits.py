@@ -0,0 +1,452 @@
+"""
+Input length admission for the Llama 2 chatbot chains.
+
+This module checks the length of every input in tokens before it reaches the
+backend: inputs that cannot fit the model's context window are rejected, or
+truncated if configured, and the maximum number of generated tokens is set so
+that prompt and response together fit the window. The maximum is passed to the
+LLM through the "max_tokens" configurable field. Callers can also lower it, and
+end the response at stop sequences given in the "stop" configurable field.
+"""
+
+import logging
+import os
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
+
+from langchain.schema.runnable import ConfigurableField, Runnable, RunnableConfig
+from langchain.schema.runnable.config import patch_config
+from langchain.schema.runnable.utils import ConfigurableFieldSpec
+
+from src.config.environment_config import (
+    LLM_CONTEXT_WINDOW,
+    LLM_INPUT_OVERFLOW,
+    LLM_MAX_INPUT_TOKENS,
+    LLM_MAX_OUTPUT_TOKENS,
+    TOKENIZER_PATH,
+    get_int_setting,
+)
+from src.modules.llm.chain_wrapper import ChainWrapper
+from src.modules.llm.token_counter import InputTooLongError, TokenCounter
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Configurable field holding the maximum number of tokens to generate
+MAX_TOKENS_FIELD = "max_tokens"
+# Configurable field holding the sequences that end the response
+STOP_FIELD = "stop"
+
+# Tokens the chat template and the model's prompt format add around the messages
+TEMPLATE_OVERHEAD_TOKENS = 32
+
+def with_max_tokens(llm: Runnable, field: str, stop_field: Optional[str] = None) -> Runnable:
+    """
+    Expose the LLM's output length setting as the "max_tokens" configurable field.
+
+    Args:
+        llm: The LLM.
+        field: The name of its output length setting, e.g. "num_predict".
+        stop_field: The name of its stop sequences setting, if it has one, which is
+            then exposed as the "stop" configurable field so that the backend
+            itself stops at them.
+
+    Returns:
+        The LLM with the configurable fields.
+    """
+    fields = {field: ConfigurableField(
+        id=MAX_TOKENS_FIELD,
+        name="Max tokens",
+        description="The maximum number of tokens to generate",
+    )}
+    if stop_field is not None:
+        fields[stop_field] = ConfigurableField(
+            id=STOP_FIELD,
+            name="Stop sequences",
+            description="Sequences that end the response",
+        )
+    return llm.configurable_fields(**fields)
+
+class LengthLimits:
+    """
+    Token limits of the model's context window, and the counters of their checks.
+    """
+
+    def __init__(
+        self,
+        counter: Optional[TokenCounter] = None,
+        context_window: int = 4096,
+        max_input_tokens: Optional[int] = None,
+        max_output_tokens: Optional[int] = 1024,
+        truncate: bool = False,
+        min_output_tokens: int = 256,
+    ):
+        """
+        Initialize the limits.
+
+        Args:
+            counter: The token counter. Defaults to an estimating TokenCounter.
+            context_window: The number of tokens the model attends to, prompt and
+                response together. Defaults to 4096, as in Llama 2.
+            max_input_tokens: The maximum length of a user input. Defaults to what
+                the window leaves after the prompt and min_output_tokens.
+            max_output_tokens: The maximum number of tokens to generate, or None to
+                let the response fill the window. Defaults to 1024.
+            truncate: Whether to truncate inputs over the limit instead of
+                rejecting them. Defaults to False.
+            min_output_tokens: The number of tokens kept free for the response when
+                deriving max_input_tokens. Defaults to 256.
+        """
+        self.counter = counter or TokenCounter()
+        self.context_window = context_window
+        self.max_input_tokens = max_input_tokens
+        self.max_output_tokens = max_output_tokens
+        self.truncate = truncate
+        self.min_output_tokens = min_output_tokens
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.fast_path = 0
+        self.rejected = 0
+        self.truncated = 0
+
+    @classmethod
+    def from_environment(cls) -> "LengthLimits":
+        """
+        Create limits configured from the environment variables.
+
+        Returns:
+            The limits, with the tokenizer at TOKENIZER_PATH if it is set.
+        """
+        max_output_tokens = get_int_setting(LLM_MAX_OUTPUT_TOKENS, 1024)
+        return cls(
+            counter=TokenCounter.from_path(os.getenv(TOKENIZER_PATH, "").strip() or None),
+            context_window=get_int_setting(LLM_CONTEXT_WINDOW, 4096),
+            max_input_tokens=get_int_setting(LLM_MAX_INPUT_TOKENS, 0) or None,
+            max_output_tokens=max_output_tokens if max_output_tokens > 0 else None,
+            truncate=os.getenv(LLM_INPUT_OVERFLOW, "reject").strip().lower() == "truncate",
+        )
+
+    def input_limit(self, prompt_tokens: int) -> int:
+        """
+        Get the maximum input length with a given prompt around it.
+
+        Args:
+            prompt_tokens: The tokens of the prompt other than the input.
+
+        Returns:
+            The maximum number of input tokens.
+        """
+        limit = self.context_window - prompt_tokens - self.min_output_tokens
+        if self.max_input_tokens is not None:
+            limit = min(limit, self.max_input_tokens)
+        return max(0, limit)
+
+    def check(
+        self,
+        text: str,
+        prompt_tokens: int,
+        requested: Optional[int] = None,
+        max_input_tokens: Optional[int] = None,
+    ) -> Tuple[str, int]:
+        """
+        Admit an input, truncating it if configured.
+
+        Args:
+            text: The user input.
+            prompt_tokens: The tokens of the prompt other than the input.
+            requested: The maximum number of output tokens asked for by the caller, if any.
+            max_input_tokens: An input limit lower than the configured one, if any.
+
+        Returns:
+            The input to send, and the maximum number of tokens to generate.
+
+        Raises:
+            InputTooLongError: If the input is over the limit and truncation is disabled.
+        """
+        limit = self.input_limit(prompt_tokens)
+        if max_input_tokens is not None:
+            limit = max(0, min(limit, max_input_tokens))
+        max_output = self.max_output_tokens
+        if requested is not None and requested >= 0:
+            max_output = requested if max_output is None else min(requested, max_output)
+        bound = self.counter.upper_bound(text)
+        if max_output is not None and bound <= limit and prompt_tokens + bound + max_output <= self.context_window:
+            # Fits with the full output budget, without tokenizing
+            with self._lock:
+                self.checked += 1
+                self.fast_path += 1
+            return text, max_output
+        tokens = self.counter.count(text)
+        truncated = False
+        if tokens > limit:
+            if not self.truncate:
+                with self._lock:
+                    self.checked += 1
+                    self.rejected += 1
+                logger.info(f"Rejected an input of {tokens} tokens, the maximum is {limit}")
+                raise InputTooLongError(tokens, limit)
+            logger.info(f"Truncating an input of {tokens} tokens to {limit}")
+            text = self.counter.truncate(text, limit)
+            tokens = self.counter.count(text)
+            truncated = True
+        budget = self.context_window - prompt_tokens - tokens
+        with self._lock:
+            self.checked += 1
+            self.truncated += truncated
+        return text, budget if max_output is None else min(max_output, budget)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the limits and the counters of the checks.
+
+        Returns:
+            The context window and output limit, the numbers of checked, rejected
+            and truncated inputs and of checks answered without tokenizing, and the
+            token counter's statistics.
+        """
+        with self._lock:
+            return {
+                "context_window": self.context_window,
+                "max_input_tokens": self.max_input_tokens,
+                "max_output_tokens": self.max_output_tokens,
+                "truncate": self.truncate,
+                "checked": self.checked,
+                "fast_path": self.fast_path,
+                "rejected": self.rejected,
+                "truncated": self.truncated,
+                "counter": self.counter.stats(),
+            }
+
+def _input_text(input: Any) -> Optional[str]:
+    """Get the user input of a chain input, if it is text."""
+    text = input.get("input") if isinstance(input, dict) else input
+    return text if isinstance(text, str) else None
+
+def _stop_sequences(config: Optional[RunnableConfig]) -> List[str]:
+    """Get the stop sequences of a call, from the "stop" configurable field."""
+    stop = ((config or {}).get("configurable") or {}).get(STOP_FIELD)
+    if isinstance(stop, str):
+        stop = [stop]
+    return [sequence for sequence in stop or [] if isinstance(sequence, str) and sequence]
+
+def _cut_at_stop(text: str, stop: List[str]) -> Tuple[str, bool]:
+    """Cut a text before the first stop sequence it contains, and tell whether it had one."""
+    positions = [text.find(sequence) for sequence in stop if sequence in text]
+    if not positions:
+        return text, False
+    return text[:min(positions)], True
+
+def prompt_tokens(limits: LengthLimits, system_prompt: str) -> int:
+    """
+    Get the tokens a chat prompt adds to the user input.
+
+    Args:
+        limits: The token limits, with the counter to use.
+        system_prompt: The system prompt of the chat template.
+
+    Returns:
+        The tokens of the system prompt and of the prompt format.
+    """
+    return limits.counter.count(system_prompt) + TEMPLATE_OVERHEAD_TOKENS
+
+class LengthLimitedRunnable(ChainWrapper):
+    """
+    Chain wrapper that admits inputs by length and caps the response length.
+
+    The chain takes {"input": str}. When set_max_tokens is enabled, the maximum
+    number of tokens to generate is set in the "max_tokens" configurable field,
+    so the chain's LLM must expose it (see with_max_tokens).
+
+    The response is also cut before the first of the stop sequences given in the
+    "stop" configurable field, for backends that do not stop at them by
+    themselves. A stream is closed at the stop sequence, which ends the generation.
+    """
+
+    def __init__(
+        self,
+        bound: Runnable,
+        limits: LengthLimits,
+        prompt_tokens: int,
+        set_max_tokens: bool = True,
+        max_input_tokens: Optional[int] = None,
+    ):
+        """
+        Initialize the wrapper.
+
+        Args:
+            bound: The chain to protect.
+            limits: The token limits.
+            prompt_tokens: The tokens the chain's prompt adds to the input.
+            set_max_tokens: Whether to set the "max_tokens" configurable field. Defaults to True.
+            max_input_tokens: An input limit lower than the configured one, e.g. for
+                chains that add a conversation history to the prompt.
+        """
+        super().__init__(bound)
+        self.limits = limits
+        self.prompt_tokens = prompt_tokens
+        self.set_max_tokens = set_max_tokens
+        self.max_input_tokens = max_input_tokens
+
+    @property
+    def config_specs(self) -> List[Any]:
+        specs = list(self.bound.config_specs)
+        if not any(spec.id == STOP_FIELD for spec in specs):
+            specs.append(ConfigurableFieldSpec(
+                id=STOP_FIELD,
+                annotation=Optional[List[str]],
+                name="Stop sequences",
+                description="Sequences that end the response",
+                default=None,
+            ))
+        return specs
+
+    def _admit(self, input: Any, config: Optional[RunnableConfig]) -> Tuple[Any, Optional[RunnableConfig]]:
+        """Check an input, returning the input and the config to call the chain with."""
+        text = _input_text(input)
+        if text is None:
+            return input, config
+        configurable = (config or {}).get("configurable") or {}
+        admitted, max_tokens = self.limits.check(
+            text, self.prompt_tokens, configurable.get(MAX_TOKENS_FIELD), self.max_input_tokens
+        )
+        if admitted is not text:
+            input = {**input, "input": admitted} if isinstance(input, dict) else admitted
+        if self.set_max_tokens:
+            config = patch_config(config, configurable={**configurable, MAX_TOKENS_FIELD: max_tokens})
+        return input, config
+
+    @staticmethod
+    def _stop(output: Any, config: Optional[RunnableConfig]) -> Any:
+        """Cut a text output at the stop sequences of its call."""
+        stop = _stop_sequences(config)
+        if not stop or not isinstance(output, str):
+            return output
+        return _cut_at_stop(output, stop)[0]
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        input, config = self._admit(input, config)
+        return self._stop(self.bound.invoke(input, config, **kwargs), config)
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        input, config = self._admit(input, config)
+        return self._stop(await self.bound.ainvoke(input, config, **kwargs), config)
+
+    def _admit_all(
+        self,
+        inputs: List[Any],
+        config: Optional[Union[RunnableConfig, List[RunnableConfig]]],
+        return_exceptions: bool,
+    ) -> Tuple[List[Any], List[Optional[RunnableConfig]], List[Optional[InputTooLongError]]]:
+        """
+        Check the inputs of a batch.
+
+        Without return_exceptions, one input over the limit fails the batch. With
+        it, the error of each rejected input is returned at its index instead.
+        """
+        configs = config if isinstance(config, list) else [config] * len(inputs)
+        admitted_inputs, admitted_configs, errors = [], [], []
+        for input, config in zip(inputs, configs):
+            try:
+                input, config = self._admit(input, config)
+            except InputTooLongError as e:
+                if not return_exceptions:
+                    raise
+                errors.append(e)
+                continue
+            admitted_inputs.append(input)
+            admitted_configs.append(config)
+            errors.append(None)
+        return admitted_inputs, admitted_configs, errors
+
+    def _merge(
+        self,
+        outputs: List[Any],
+        configs: List[Optional[RunnableConfig]],
+        errors: List[Optional[InputTooLongError]],
+    ) -> List[Any]:
+        """Put the outputs of the admitted inputs and the errors of the rejected ones in input order."""
+        results = iter(self._stop(output, config) for output, config in zip(outputs, configs))
+        return [next(results) if error is None else error for error in errors]
+
+    def batch(
+        self,
+        inputs: List[Any],
+        config: Any = None,
+        *,
+        return_exceptions: bool = False,
+        **kwargs: Any,
+    ) -> List[Any]:
+        # Keep the admitted inputs together, so the chain's LLM still receives them in one call
+        inputs, configs, errors = self._admit_all(inputs, config, return_exceptions)
+        outputs = self.bound.batch(inputs, configs, return_exceptions=return_exceptions, **kwargs) if inputs else []
+        return self._merge(outputs, configs, errors)
+
+    async def abatch(
+        self,
+        inputs: List[Any],
+        config: Any = None,
+        *,
+        return_exceptions: bool = False,
+        **kwargs: Any,
+    ) -> List[Any]:
+        inputs, configs, errors = self._admit_all(inputs, config, return_exceptions)
+        outputs = await self.bound.abatch(inputs, configs, return_exceptions=return_exceptions, **kwargs) if inputs else []
+        return self._merge(outputs, configs, errors)
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Iterator[Any]:
+        input, config = self._admit(input, config)
+        stop = _stop_sequences(config)
+        chunks = self.bound.stream(input, config, **kwargs)
+        if not stop:
+            yield from chunks
+            return
+        # Hold back the end of the text while it could be the start of a stop sequence
+        held = max(len(sequence) for sequence in stop) - 1
+        pending = ""
+        try:
+            for chunk in chunks:
+                if not isinstance(chunk, str):
+                    yield chunk
+                    continue
+                text, stopped = _cut_at_stop(pending + chunk, stop)
+                if stopped:
+                    if text:
+                        yield text
+                    return
+                pending = text[max(0, len(text) - held):] if held else ""
+                if len(text) > len(pending):
+                    yield text[:len(text) - len(pending)]
+            if pending:
+                yield pending
+        finally:
+            chunks.close()
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> AsyncIterator[Any]:
+        input, config = self._admit(input, config)
+        stop = _stop_sequences(config)
+        chunks = self.bound.astream(input, config, **kwargs)
+        if not stop:
+            async for chunk in chunks:
+                yield chunk
+            return
+        # Hold back the end of the text while it could be the start of a stop sequence
+        held = max(len(sequence) for sequence in stop) - 1
+        pending = ""
+        try:
+            async for chunk in chunks:
+                if not isinstance(chunk, str):
+                    yield chunk
+                    continue
+                text, stopped = _cut_at_stop(pending + chunk, stop)
+                if stopped:
+                    if text:
+                        yield text
+                    return
+                pending = text[max(0, len(text) - held):] if held else ""
+                if len(text) > len(pending):
+                    yield text[:len(text) - len(pending)]
+            if pending:
+                yield pending
+        finally:
+            # Closing the stream ends the generation in the backend
+            await chunks.aclose()
@@ -0,0 +1,531 @@
+"""
+Local in-process transformers backend for the Llama 2 chatbot.
+
+This module runs a Hugging Face model from a local directory on the CPU, with no
+network access. Concurrent requests are batched dynamically: a scheduler thread
+collects the requests that arrive within a short window, groups them by prompt
+length so that little compute is spent on padding, and generates each group in
+one call. Tokens are streamed to every request of a batch as they are decoded.
+
+transformers and torch are only imported when a model is loaded.
+"""
+
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+
+from langchain.callbacks.manager import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain.llms.base import LLM
+from langchain.schema.output import Generation, GenerationChunk, LLMResult
+
+from src.config.environment_config import (
+    LOCAL_MODEL_MAX_BATCH_SIZE,
+    LOCAL_MODEL_MAX_WAIT_MS,
+    LOCAL_MODEL_PATH,
+    LOCAL_MODEL_THREADS,
+    get_float_setting,
+    get_int_setting,
+)
+from src.modules.llm.async_ollama import _gather_or_cancel
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+def group_by_length(
+    lengths: Sequence[int],
+    max_padding: float = 0.25,
+    min_padding_tokens: int = 16,
+) -> List[List[int]]:
+    """
+    Group prompts by length, so that each group is padded as little as possible.
+
+    Args:
+        lengths: The number of tokens of every prompt.
+        max_padding: The padding allowed in a group, as a fraction of its longest
+            prompt. Defaults to 0.25.
+        min_padding_tokens: The padding always allowed, in tokens, so that short
+            prompts of different lengths still share a batch. Defaults to 16.
+
+    Returns:
+        The indexes of the prompts of every group, shortest prompts first.
+    """
+    groups: List[List[int]] = []
+    for index in sorted(range(len(lengths)), key=lengths.__getitem__):
+        if groups and lengths[index] - lengths[groups[-1][0]] <= max(min_padding_tokens, max_padding * lengths[index]):
+            groups[-1].append(index)
+        else:
+            groups.append([index])
+    return groups
+
+class _Request:
+    """A generation request, and the channel its output is delivered through."""
+
+    __slots__ = (
+        "prompt", "prompt_tokens", "max_new_tokens", "temperature",
+        "tokens", "text_length", "finished", "cancelled", "_queue", "_loop",
+    )
+
+    def __init__(self, prompt: str, prompt_tokens: int, max_new_tokens: int, temperature: float, loop=None):
+        self.prompt = prompt
+        self.prompt_tokens = prompt_tokens
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.tokens: List[int] = []
+        self.text_length = 0
+        self.finished = False
+        self.cancelled = False
+        self._loop = loop
+        self._queue: Any = asyncio.Queue() if loop is not None else queue.Queue()
+
+    def emit(self, item: Any) -> None:
+        """Deliver an output line, an error or the end marker, from any thread."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, item)
+        else:
+            self._queue.put(item)
+
+    def finish(self, reason: str) -> None:
+        """Deliver the final line, with the statistics of the generation, and the end marker."""
+        self.finished = True
+        self.emit({
+            "response": "",
+            "done": True,
+            "done_reason": reason,
+            "prompt_eval_count": self.prompt_tokens,
+            "eval_count": len(self.tokens),
+        })
+        self.emit(None)
+
+    def cancel(self) -> None:
+        """Give up the request, so that it leaves the queue or its batch. No-op once finished."""
+        if not self.finished:
+            self.cancelled = True
+            self.finished = True
+
+class _BatchStreamer:
+    """
+    Receives the tokens of a batched generation and streams the text of every row.
+
+    It implements the streamer interface of transformers' generate: put() is
+    called with the prompt first, then with one token per row at every step.
+    """
+
+    def __init__(self, tokenizer: Any, requests: List[_Request]):
+        self.tokenizer = tokenizer
+        self.requests = requests
+        self.eos_token_ids = {tokenizer.eos_token_id, tokenizer.pad_token_id} - {None}
+        self._prompt_seen = False
+
+    def put(self, value: Any) -> None:
+        if not self._prompt_seen:
+            # The prompt, or the decoder start tokens of an encoder-decoder model
+            self._prompt_seen = True
+            return
+        for request, token in zip(self.requests, value.tolist()):
+            if request.finished:
+                continue
+            token = token[0] if isinstance(token, list) else token
+            if token in self.eos_token_ids:
+                self._flush(request)
+                request.finish("stop")
+                continue
+            request.tokens.append(token)
+            self._flush(request, partial=True)
+            if len(request.tokens) >= request.max_new_tokens:
+                self._flush(request)
+                request.finish("length")
+
+    def end(self) -> None:
+        for request in self.requests:
+            if not request.finished:
+                self._flush(request)
+                request.finish("length" if len(request.tokens) >= request.max_new_tokens else "stop")
+
+    @property
+    def all_finished(self) -> bool:
+        """Whether every row has reached its end of text or its token limit, or was cancelled."""
+        return all(request.finished for request in self.requests)
+
+    def _flush(self, request: _Request, partial: bool = False) -> None:
+        """Deliver the text decoded since the last delivery."""
+        text = self.tokenizer.decode(request.tokens, skip_special_tokens=True)
+        # An incomplete multi-byte character decodes to U+FFFD; wait for the next token
+        if partial and text.endswith("\ufffd"):
+            return
+        if len(text) > request.text_length:
+            request.emit({"response": text[request.text_length:], "done": False})
+            request.text_length = len(text)
+
+class LocalModel:
+    """
+    A Hugging Face model served in-process, with dynamic batching of concurrent requests.
+    """
+
+    def __init__(
+        self,
+        model: Any,
+        tokenizer: Any,
+        model_name: str = "local",
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+    ):
+        """
+        Initialize the model and start its scheduler thread.
+
+        Args:
+            model: The loaded transformers model.
+            tokenizer: Its tokenizer, padding on the left for decoder-only models.
+            model_name: The name reported for the model. Defaults to "local".
+            max_batch_size: The maximum number of requests generated together. Defaults to 8.
+            max_wait_ms: How long the scheduler waits for more requests after the
+                first one of a batch, in milliseconds. Defaults to 10.
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+        self.model_name = model_name
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.prompt_tokens = 0
+        self.padding_tokens = 0
+        self.cancelled = 0
+        self._scheduler = threading.Thread(target=self._run, name="local-model-scheduler", daemon=True)
+        self._scheduler.start()
+
+    @classmethod
+    def from_path(
+        cls,
+        path: str,
+        threads: int = 0,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+    ) -> "LocalModel":
+        """
+        Load a model and its tokenizer from a local directory.
+
+        Args:
+            path: The directory of the model.
+            threads: The number of CPU threads generation uses, 0 for torch's
+                default of one per core. Defaults to 0.
+            max_batch_size: The maximum number of requests generated together. Defaults to 8.
+            max_wait_ms: How long to wait for more requests to batch, in milliseconds.
+                Defaults to 10.
+
+        Returns:
+            The model.
+        """
+        import torch
+        from transformers import AutoConfig, AutoModelForCausalLM, AutoModelForSeq2SeqLM, AutoTokenizer
+
+        if threads > 0:
+            torch.set_num_threads(threads)
+            try:
+                # Batches already keep the intra-op threads busy
+                torch.set_num_interop_threads(1)
+            except RuntimeError:
+                pass
+        started = time.perf_counter()
+        config = AutoConfig.from_pretrained(path, local_files_only=True)
+        model_class = AutoModelForSeq2SeqLM if config.is_encoder_decoder else AutoModelForCausalLM
+        # Decoder-only models continue the prompt, so batches are padded on the left
+        tokenizer = AutoTokenizer.from_pretrained(path, local_files_only=True, padding_side="left")
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        model = model_class.from_pretrained(path, local_files_only=True, torch_dtype=torch.float32)
+        model.eval()
+        logger.info(
+            f"Loaded {path} in {time.perf_counter() - started:.1f} s, "
+            f"generating with {torch.get_num_threads()} threads"
+        )
+        return cls(model, tokenizer, os.path.basename(os.path.normpath(path)), max_batch_size, max_wait_ms)
+
+    @classmethod
+    def from_environment(cls) -> Optional["LocalModel"]:
+        """
+        Load the model configured by the LOCAL_MODEL_* environment variables.
+
+        Returns:
+            The model at LOCAL_MODEL_PATH, or None if it is not set.
+        """
+        path = os.getenv(LOCAL_MODEL_PATH, "").strip()
+        if not path:
+            return None
+        return cls.from_path(
+            path,
+            threads=get_int_setting(LOCAL_MODEL_THREADS, 0),
+            max_batch_size=get_int_setting(LOCAL_MODEL_MAX_BATCH_SIZE, 8),
+            max_wait_ms=get_float_setting(LOCAL_MODEL_MAX_WAIT_MS, 10.0),
+        )
+
+    def _submit(self, prompt: str, max_new_tokens: int, temperature: float, loop=None) -> _Request:
+        """Queue a request for the scheduler."""
+        prompt_tokens = len(self.tokenizer(prompt)["input_ids"])
+        request = _Request(prompt, prompt_tokens, max_new_tokens, temperature, loop)
+        self._queue.put(request)
+        return request
+
+    def generate(self, prompt: str, max_new_tokens: int = 256, temperature: float = 0.0) -> Iterator[Dict[str, Any]]:
+        """
+        Generate a response, blocking until each part of it is decoded.
+
+        Args:
+            prompt: The prompt.
+            max_new_tokens: The maximum number of tokens to generate. Defaults to 256.
+            temperature: The sampling temperature, 0 for greedy decoding. Defaults to 0.
+
+        Yields:
+            Lines like those of Ollama's /api/generate: the text in "response", and
+            a final line with "done" set and the token counts.
+        """
+        return self._drain(self._submit(prompt, max_new_tokens, temperature))
+
+    def agenerate(self, prompt: str, max_new_tokens: int = 256, temperature: float = 0.0) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Generate a response without blocking the event loop.
+
+        Args:
+            prompt: The prompt.
+            max_new_tokens: The maximum number of tokens to generate. Defaults to 256.
+            temperature: The sampling temperature, 0 for greedy decoding. Defaults to 0.
+
+        Yields:
+            The same lines as generate().
+        """
+        return self._adrain(self._submit(prompt, max_new_tokens, temperature, asyncio.get_running_loop()))
+
+    def _drain(self, request: _Request) -> Iterator[Dict[str, Any]]:
+        """Yield the output of a request; a caller that stops reading cancels it."""
+        try:
+            while True:
+                item = request._queue.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self._cancel(request)
+
+    async def _adrain(self, request: _Request) -> AsyncIterator[Dict[str, Any]]:
+        """Yield the output of a request; a caller that is cancelled or stops reading cancels it."""
+        try:
+            while True:
+                item = await request._queue.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self._cancel(request)
+
+    def _cancel(self, request: _Request) -> None:
+        """Cancel a request that has not finished, counting it."""
+        if not request.finished:
+            request.cancel()
+            with self._lock:
+                self.cancelled += 1
+
+    def _run(self) -> None:
+        """Collect the queued requests into batches and generate them."""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            # Requests whose caller went away while they were queued are dropped
+            batch = [request for request in batch if not request.finished]
+            # Requests with different sampling settings cannot share a generate call
+            by_temperature: Dict[float, List[_Request]] = {}
+            for request in batch:
+                by_temperature.setdefault(request.temperature, []).append(request)
+            for requests in by_temperature.values():
+                for group in group_by_length([request.prompt_tokens for request in requests]):
+                    self._generate([requests[index] for index in group])
+
+    def _generate(self, requests: List[_Request]) -> None:
+        """Generate the responses of a group of requests in one call."""
+        import torch
+        from transformers import StoppingCriteria, StoppingCriteriaList
+
+        streamer = _BatchStreamer(self.tokenizer, requests)
+
+        class _AllFinished(StoppingCriteria):
+            # Stop early once every row is done or cancelled, e.g. with lower limits than the longest
+            def __call__(self, input_ids, scores, **kwargs):
+                return streamer.all_finished
+
+        longest = max(request.prompt_tokens for request in requests)
+        with self._lock:
+            self.requests += len(requests)
+            self.batches += 1
+            self.prompt_tokens += sum(request.prompt_tokens for request in requests)
+            self.padding_tokens += sum(longest - request.prompt_tokens for request in requests)
+        temperature = requests[0].temperature
+        sampling = {"do_sample": True, "temperature": temperature} if temperature > 0 else {"do_sample": False}
+        try:
+            inputs = self.tokenizer([request.prompt for request in requests], return_tensors="pt", padding=True)
+            with torch.inference_mode():
+                self.model.generate(
+                    **inputs,
+                    max_new_tokens=max(request.max_new_tokens for request in requests),
+                    pad_token_id=self.tokenizer.pad_token_id,
+                    streamer=streamer,
+                    stopping_criteria=StoppingCriteriaList([_AllFinished()]),
+                    **sampling,
+                )
+        except Exception as e:
+            logger.error(f"Failed to generate a batch of {len(requests)} requests: {str(e)}")
+            for request in requests:
+                if not request.finished:
+                    request.finished = True
+                    request.emit(e)
+                    request.emit(None)
+            return
+        streamer.end()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the batching counters.
+
+        Returns:
+            The numbers of requests and batches, the mean batch size, and the share
+            of the batched prompt tokens that were padding.
+        """
+        with self._lock:
+            total = self.prompt_tokens + self.padding_tokens
+            return {
+                "model": self.model_name,
+                "requests": self.requests,
+                "cancelled": self.cancelled,
+                "batches": self.batches,
+                "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+                "padding_ratio": self.padding_tokens / total if total else 0.0,
+                "queued": self._queue.qsize(),
+            }
+
+def _to_chunk(data: Dict[str, Any]) -> GenerationChunk:
+    """Convert a generation line to a LangChain chunk, with the statistics on the final one."""
+    if not data.get("done"):
+        return GenerationChunk(text=data["response"])
+    return GenerationChunk(text="", generation_info={key: value for key, value in data.items() if key != "response"})
+
+def _join(chunks: List[GenerationChunk]) -> Generation:
+    """Combine the chunks of a response into one generation."""
+    text = "".join(chunk.text for chunk in chunks)
+    info = chunks[-1].generation_info if chunks else None
+    return Generation(text=text, generation_info=info)
+
+class LocalTransformersLLM(LLM):
+    """
+    LangChain LLM backed by an in-process LocalModel.
+
+    Concurrent calls, from threads or from the event loop, are batched together
+    by the model's scheduler.
+    """
+
+    local_model: Any = None
+    """The LocalModel that generates the text."""
+
+    max_new_tokens: int = 256
+    """The maximum number of tokens per response."""
+
+    temperature: float = 0.7
+    """The sampling temperature, 0 for greedy decoding."""
+
+    @property
+    def _llm_type(self) -> str:
+        return "local_transformers"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {
+            "model": self.local_model.model_name,
+            "max_new_tokens": self.max_new_tokens,
+            "temperature": self.temperature,
+        }
+
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        for data in self.local_model.generate(prompt, self.max_new_tokens, self.temperature):
+            chunk = _to_chunk(data)
+            if run_manager and chunk.text:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[GenerationChunk]:
+        async for data in self.local_model.agenerate(prompt, self.max_new_tokens, self.temperature):
+            chunk = _to_chunk(data)
+            if run_manager and chunk.text:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        return "".join(chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs))
+
+    def _generate(
+        self,
+        prompts: List[str],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> LLMResult:
+        # Submit every prompt before waiting, so that the scheduler batches them
+        model = self.local_model
+        requests = [model._submit(prompt, self.max_new_tokens, self.temperature) for prompt in prompts]
+        generations = []
+        try:
+            for request in requests:
+                chunks = []
+                for data in model._drain(request):
+                    chunk = _to_chunk(data)
+                    if run_manager and chunk.text:
+                        run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                    chunks.append(chunk)
+                generations.append([_join(chunks)])
+        finally:
+            # After a failure, the requests not read yet leave the queue or their batch
+            for request in requests:
+                model._cancel(request)
+        return LLMResult(generations=generations)
+
+    async def _agenerate(
+        self,
+        prompts: List[str],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> LLMResult:
+        async def generate(prompt: str) -> Generation:
+            return _join([chunk async for chunk in self._astream(prompt, stop, run_manager, **kwargs)])
+
+        generations = await _gather_or_cancel([generate(prompt) for prompt in prompts])
+        return LLMResult(generations=[[generation] for generation in generations])
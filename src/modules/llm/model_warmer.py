@@ -0,0 +1,197 @@
+"""
+Model preloading and keep-alive for Ollama.
+
+This module provides a warmer that loads the model on every Ollama host at
+startup and keeps it loaded: it checks the running models (/api/ps) in the
+background, reloads the model after Ollama evicted it, and refreshes its
+keep-alive shortly before it expires when no traffic has done so.
+"""
+
+import asyncio
+import logging
+import re
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from src.modules.llm.ollama_client import OllamaClient, keep_alive_seconds
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+def parse_expires_at(value: Optional[str]) -> Optional[float]:
+    """
+    Convert the expires_at date of an /api/ps entry to a Unix timestamp.
+
+    Args:
+        value: The date in ISO 8601 format, with up to nanosecond precision.
+
+    Returns:
+        The timestamp in seconds, or None if the date is missing or invalid.
+    """
+    if not value:
+        return None
+    # datetime only accepts microseconds and, before Python 3.11, no "Z" suffix
+    value = re.sub(r"(\.\d{6})\d+", r"\1", value).replace("Z", "+00:00")
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+def _matches(entry: Dict[str, Any], model: str) -> bool:
+    """Whether an /api/ps entry is the given model; an untagged name means ":latest"."""
+    names = {entry.get("name"), entry.get("model")}
+    return model in names or (":" not in model and f"{model}:latest" in names)
+
+class ModelWarmer:
+    """
+    Loads a model on Ollama hosts ahead of traffic and keeps it loaded.
+
+    Requests pin the model with the same keep_alive, so the warmer only sends a
+    refresh when a host has been idle for nearly the whole keep-alive period.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        clients: Dict[str, OllamaClient],
+        keep_alive: Any = "30m",
+        check_interval: float = 30.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Initialize the warmer.
+
+        Args:
+            model: The name of the Ollama model.
+            clients: The client of every Ollama host, by base URL.
+            keep_alive: How long Ollama keeps the model loaded when idle, as in the
+                Ollama API ("30m", 1800, or -1 for ever). Defaults to "30m".
+            check_interval: The time between two checks of the running models, in
+                seconds. Defaults to 30.
+            clock: The wall-clock time source, in seconds. Defaults to time.time.
+        """
+        self.model = model
+        self.clients = clients
+        self.keep_alive = keep_alive
+        self.keep_alive_seconds = keep_alive_seconds(keep_alive, 300.0)
+        self.check_interval = check_interval
+        self._clock = clock
+        self._hosts: Dict[str, Dict[str, Any]] = {
+            base_url: {"warm": False, "expires_at": None, "loads": 0, "last_load_seconds": None, "last_error": None}
+            for base_url in clients
+        }
+        self._task: Optional[asyncio.Task] = None
+        self._warmed_up = asyncio.Event()
+
+    def _is_warm(self, host: Dict[str, Any]) -> bool:
+        """Whether a host has the model loaded, as far as the last check knows."""
+        expires_at = host["expires_at"]
+        return host["warm"] and (expires_at is None or expires_at > self._clock())
+
+    @property
+    def warm(self) -> bool:
+        """Whether at least one host has the model loaded."""
+        return any(self._is_warm(host) for host in self._hosts.values())
+
+    async def _load(self, base_url: str) -> None:
+        """Load the model on a host, or extend its keep-alive, with an empty prompt."""
+        host = self._hosts[base_url]
+        started = time.perf_counter()
+        try:
+            await self.clients[base_url].apost("/api/generate", {
+                "model": self.model,
+                "prompt": "",
+                "keep_alive": self.keep_alive,
+            })
+        except Exception as e:
+            host.update(warm=False, last_error=str(e))
+            logger.warning(f"Failed to load {self.model} on {base_url}: {str(e)}")
+            return
+        host["last_load_seconds"] = time.perf_counter() - started
+        host["loads"] += 1
+        host.update(warm=True, last_error=None, expires_at=(
+            None if self.keep_alive_seconds is None else self._clock() + self.keep_alive_seconds
+        ))
+        logger.info(f"Loaded {self.model} on {base_url} in {host['last_load_seconds']:.2f} s")
+
+    async def _check(self, base_url: str) -> None:
+        """Reload the model on a host if it was evicted, or refresh it if it expires soon."""
+        host = self._hosts[base_url]
+        try:
+            running = await self.clients[base_url].aget("/api/ps")
+        except Exception as e:
+            host.update(warm=False, last_error=str(e))
+            logger.warning(f"Failed to check the running models on {base_url}: {str(e)}")
+            return
+        entry = next((entry for entry in running.get("models", []) if _matches(entry, self.model)), None)
+        if entry is None:
+            if host["warm"]:
+                logger.info(f"{self.model} was unloaded on {base_url}, loading it again")
+            host["warm"] = False
+            await self._load(base_url)
+            return
+        host.update(warm=True, expires_at=parse_expires_at(entry.get("expires_at")))
+        # Refresh when the model would expire before the check after next
+        if host["expires_at"] is not None and host["expires_at"] - self._clock() < 2 * self.check_interval:
+            await self._load(base_url)
+
+    async def warm_up(self) -> None:
+        """Load the model on every host concurrently."""
+        await asyncio.gather(*(self._load(base_url) for base_url in self.clients))
+
+    async def check(self) -> None:
+        """Check every host concurrently, reloading or refreshing the model as needed."""
+        await asyncio.gather(*(self._check(base_url) for base_url in self.clients))
+
+    async def _run(self) -> None:
+        """Warm the model up, then check it periodically."""
+        await self.warm_up()
+        self._warmed_up.set()
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self.check()
+
+    def start(self) -> None:
+        """Start warming the model in the background on the running event loop."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def wait_warm(self) -> None:
+        """Wait until the background task has tried to load the model on every host."""
+        if self._task is not None:
+            await self._warmed_up.wait()
+
+    async def aclose(self) -> None:
+        """Stop the background task."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the warm state of every host.
+
+        Returns:
+            The model, the keep-alive, whether any host is warm and the state of each host.
+        """
+        now = self._clock()
+        return {
+            "model": self.model,
+            "keep_alive": self.keep_alive,
+            "warm": self.warm,
+            "hosts": {
+                base_url: {
+                    "warm": self._is_warm(host),
+                    "expires_in_seconds": None if host["expires_at"] is None else max(0.0, host["expires_at"] - now),
+                    "loads": host["loads"],
+                    "last_load_seconds": host["last_load_seconds"],
+                    "last_error": host["last_error"],
+                }
+                for base_url, host in self._hosts.items()
+            },
+        }
@@ -0,0 +1,265 @@
+"""
+HTTP client for the Ollama REST API.
+
+This module provides a client that keeps pooled keep-alive connections to an
+Ollama server and offers both synchronous and asynchronous calls.
+"""
+
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+import httpx
+
+from src.modules.llm.backend_detection import DEFAULT_OLLAMA_URL
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+def keep_alive_seconds(keep_alive: Any, default: Optional[float]) -> Optional[float]:
+    """
+    Convert an Ollama keep_alive value ("5m", "30s", 300, -1, 0) to seconds.
+
+    Args:
+        keep_alive: The keep_alive value of a request.
+        default: The number of seconds used when keep_alive is not set.
+
+    Returns:
+        The number of seconds, or None to keep the model loaded for ever.
+    """
+    if keep_alive is None or keep_alive == "":
+        return default
+    if isinstance(keep_alive, str):
+        units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        for suffix in ("ms", "s", "m", "h"):
+            if keep_alive.endswith(suffix):
+                seconds = float(keep_alive[:-len(suffix)]) * units[suffix]
+                break
+        else:
+            seconds = float(keep_alive)
+    else:
+        seconds = float(keep_alive)
+    return None if seconds < 0 else seconds
+
+class OllamaResponseError(ValueError):
+    """
+    Error returned by the Ollama server, as a status code or in the response stream.
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        """
+        Initialize the error.
+
+        Args:
+            message: The error message.
+            status_code: The HTTP status code, or None for an error in the response stream.
+        """
+        super().__init__(message)
+        self.status_code = status_code
+
+class OllamaClient:
+    """
+    Pooled client for the Ollama HTTP API.
+
+    The synchronous and asynchronous httpx clients are created on first use and
+    reused for every later call, so connections stay open between requests.
+    """
+
+    def __init__(
+        self,
+        base_url: str = DEFAULT_OLLAMA_URL,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 300.0,
+        transport: Any = None,
+    ):
+        """
+        Initialize the Ollama client.
+
+        Args:
+            base_url: The URL of the Ollama server. Defaults to "http://localhost:11434".
+            max_connections: The maximum number of open connections. Defaults to 100.
+            max_keepalive_connections: The maximum number of idle connections kept
+                open. Defaults to 20.
+            connect_timeout: The timeout for opening a connection, in seconds. Defaults to 5.
+            read_timeout: The maximum time between two chunks of a response, in
+                seconds. Defaults to 300.
+            transport: Optional httpx transport to use instead of the network.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.transport = transport
+        self._client: Optional[httpx.Client] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.Client:
+        """The pooled synchronous HTTP client."""
+        if self._client is None:
+            self._client = httpx.Client(
+                base_url=self.base_url,
+                limits=self.limits,
+                timeout=self.timeout,
+                transport=self.transport,
+            )
+        return self._client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        """The pooled asynchronous HTTP client."""
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=self.limits,
+                timeout=self.timeout,
+                transport=self.transport,
+            )
+        return self._async_client
+
+    @staticmethod
+    def _check_response(response: httpx.Response, body: str) -> None:
+        """Raise an error for an unsuccessful Ollama response."""
+        if response.status_code != 200:
+            raise OllamaResponseError(
+                f"Ollama call failed with status code {response.status_code}. Details: {body}",
+                response.status_code,
+            )
+
+    @staticmethod
+    def _parse_line(line: str) -> Optional[Dict[str, Any]]:
+        """Parse one line of an Ollama streaming response."""
+        if not line.strip():
+            return None
+        data = json.loads(line)
+        if "error" in data:
+            raise OllamaResponseError(f"Ollama call failed: {data['error']}")
+        return data
+
+    def stream(self, path: str, payload: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """
+        Call a streaming endpoint and yield the decoded response lines.
+
+        Args:
+            path: The API path, e.g. "/api/generate".
+            payload: The JSON request body.
+
+        Yields:
+            One dictionary per line of the response.
+        """
+        with self.client.stream("POST", path, json={**payload, "stream": True}) as response:
+            if response.status_code != 200:
+                self._check_response(response, response.read().decode("utf-8", "replace"))
+            for line in response.iter_lines():
+                data = self._parse_line(line)
+                if data is not None:
+                    yield data
+
+    async def astream(self, path: str, payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Call a streaming endpoint asynchronously and yield the decoded response lines.
+
+        Args:
+            path: The API path, e.g. "/api/generate".
+            payload: The JSON request body.
+
+        Yields:
+            One dictionary per line of the response.
+        """
+        async with self.async_client.stream("POST", path, json={**payload, "stream": True}) as response:
+            if response.status_code != 200:
+                body = (await response.aread()).decode("utf-8", "replace")
+                self._check_response(response, body)
+            async for line in response.aiter_lines():
+                data = self._parse_line(line)
+                if data is not None:
+                    yield data
+
+    async def aget(self, path: str) -> Dict[str, Any]:
+        """
+        Call a GET endpoint asynchronously, such as /api/ps.
+
+        Args:
+            path: The API path.
+
+        Returns:
+            The decoded JSON response.
+        """
+        response = await self.async_client.get(path)
+        self._check_response(response, response.text)
+        return response.json()
+
+    def post(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Call a non-streaming endpoint.
+
+        Args:
+            path: The API path.
+            payload: The JSON request body.
+
+        Returns:
+            The decoded JSON response.
+        """
+        response = self.client.post(path, json={**payload, "stream": False})
+        self._check_response(response, response.text)
+        return response.json()
+
+    async def apost(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Call a non-streaming endpoint asynchronously.
+
+        Args:
+            path: The API path.
+            payload: The JSON request body.
+
+        Returns:
+            The decoded JSON response.
+        """
+        response = await self.async_client.post(path, json={**payload, "stream": False})
+        self._check_response(response, response.text)
+        return response.json()
+
+    def generate_stream(self, model: str, prompt: str, **params: Any) -> Iterator[Dict[str, Any]]:
+        """
+        Stream a completion from /api/generate.
+
+        Args:
+            model: The model name.
+            prompt: The prompt text.
+            **params: Further request fields, such as "options", "context" or "keep_alive".
+
+        Yields:
+            The response chunks. The last one has "done" set and carries the statistics.
+        """
+        return self.stream("/api/generate", {"model": model, "prompt": prompt, **params})
+
+    def agenerate_stream(self, model: str, prompt: str, **params: Any) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream a completion from /api/generate asynchronously.
+
+        Args:
+            model: The model name.
+            prompt: The prompt text.
+            **params: Further request fields, such as "options", "context" or "keep_alive".
+
+        Returns:
+            An async iterator over the response chunks.
+        """
+        return self.astream("/api/generate", {"model": model, "prompt": prompt, **params})
+
+    def close(self) -> None:
+        """Close the synchronous connection pool."""
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self) -> None:
+        """Close both connection pools."""
+        self.close()
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
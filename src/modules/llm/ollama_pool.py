@@ -0,0 +1,330 @@
+"""
+Load balancing across several Ollama hosts.
+
+This module provides a pool of Ollama hosts with least-outstanding-requests
+routing, passive health tracking, ejection and re-admission of failing hosts and
+optional session affinity, plus an LLM that routes every generation through it.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+import httpx
+from langchain.callbacks.manager import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain.schema.output import GenerationChunk
+
+from src.modules.llm.async_ollama import AsyncOllama, _to_chunk
+from src.modules.llm.ollama_client import OllamaClient, OllamaResponseError
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Metadata key holding the conversation id used for session affinity
+SESSION_ID_METADATA_KEY = "session_id"
+
+def _is_host_failure(error: BaseException) -> bool:
+    """
+    Whether an error counts against the health of the host that raised it.
+
+    Connection errors, timeouts and 5xx responses are the host's fault; a 4xx
+    response or an error reported for the request, such as an unknown model, is not.
+    """
+    if isinstance(error, httpx.TransportError):
+        return True
+    return isinstance(error, OllamaResponseError) and (error.status_code or 0) >= 500
+
+class OllamaHost:
+    """
+    One Ollama server in the pool, with its load and health statistics.
+    """
+
+    def __init__(self, base_url: str, client: OllamaClient):
+        """
+        Initialize the host.
+
+        Args:
+            base_url: The URL of the Ollama server.
+            client: The pooled client for the server.
+        """
+        self.base_url = base_url
+        self.client = client
+        self.outstanding = 0
+        self.latency_ewma: Optional[float] = None
+        self.error_rate_ewma = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        # Set after an ejection, until the host serves a request successfully
+        self.on_probation = False
+
+    def is_available(self, now: float) -> bool:
+        """Whether the host may receive requests."""
+        return self.ejected_until <= now
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        """Get the host's statistics."""
+        return {
+            "base_url": self.base_url,
+            "available": self.is_available(now),
+            "outstanding": self.outstanding,
+            "latency_ewma_seconds": self.latency_ewma,
+            "error_rate_ewma": self.error_rate_ewma,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+class OllamaHostPool:
+    """
+    Pool of Ollama hosts with health-aware least-outstanding-requests routing.
+
+    Health is tracked passively from real traffic: an exponentially weighted
+    moving average (EWMA) of the error rate and of the time to first token.
+    A host whose error rate EWMA crosses the threshold, or that fails several
+    times in a row, is ejected for ejection_seconds. After that it is admitted
+    again; a further failure ejects it for twice as long, up to max_ejection_seconds.
+    """
+
+    def __init__(
+        self,
+        base_urls: List[str],
+        client_factory: Callable[[str], OllamaClient] = OllamaClient,
+        ewma_alpha: float = 0.2,
+        error_rate_threshold: float = 0.5,
+        max_consecutive_failures: int = 3,
+        ejection_seconds: float = 10.0,
+        max_ejection_seconds: float = 300.0,
+        session_affinity: bool = True,
+        max_sessions: int = 10000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize the host pool.
+
+        Args:
+            base_urls: The URLs of the Ollama servers.
+            client_factory: Creates the client for a base URL. Defaults to OllamaClient.
+            ewma_alpha: The weight of the newest sample in the moving averages. Defaults to 0.2.
+            error_rate_threshold: The error rate EWMA that ejects a host. Defaults to 0.5.
+            max_consecutive_failures: The number of failures in a row that ejects a host.
+                Defaults to 3.
+            ejection_seconds: How long a host is first ejected for. Defaults to 10 seconds.
+            max_ejection_seconds: The longest ejection after repeated failures.
+                Defaults to 300 seconds.
+            session_affinity: Whether requests of one session stick to one host, so that
+                it can reuse the model state it already has. Defaults to True.
+            max_sessions: The maximum number of remembered session assignments.
+                Defaults to 10000.
+            clock: The time source, in seconds. Defaults to time.monotonic.
+        """
+        if not base_urls:
+            raise ValueError("At least one Ollama base URL is required")
+        self.hosts = [OllamaHost(url.rstrip("/"), client_factory(url)) for url in base_urls]
+        self.ewma_alpha = ewma_alpha
+        self.error_rate_threshold = error_rate_threshold
+        self.max_consecutive_failures = max_consecutive_failures
+        self.ejection_seconds = ejection_seconds
+        self.max_ejection_seconds = max_ejection_seconds
+        self.session_affinity = session_affinity
+        self.max_sessions = max_sessions
+        self._clock = clock
+        self._sessions: "OrderedDict[str, OllamaHost]" = OrderedDict()
+        self._ejection_counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, session_id: Optional[str] = None, exclude: Optional[List[OllamaHost]] = None) -> OllamaHost:
+        """
+        Choose a host for a request and count the request as outstanding on it.
+
+        Args:
+            session_id: Optional conversation id for session affinity.
+            exclude: Hosts that must not be chosen, e.g. ones that just failed.
+
+        Returns:
+            The chosen host. Every call must be matched by a call to release().
+        """
+        with self._lock:
+            now = self._clock()
+            excluded = exclude or []
+            remaining = [host for host in self.hosts if host not in excluded] or self.hosts
+            candidates = [host for host in remaining if host.is_available(now)]
+            if not candidates:
+                # Fail open: rather than rejecting the request, use the host that comes back soonest
+                candidates = [min(remaining, key=lambda host: host.ejected_until)]
+
+            host = None
+            if self.session_affinity and session_id is not None:
+                pinned = self._sessions.get(session_id)
+                if pinned in candidates:
+                    host = pinned
+            if host is None:
+                host = min(
+                    candidates,
+                    key=lambda candidate: (candidate.outstanding, candidate.latency_ewma or 0.0),
+                )
+            if self.session_affinity and session_id is not None:
+                self._sessions[session_id] = host
+                self._sessions.move_to_end(session_id)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+
+            host.outstanding += 1
+            host.requests += 1
+            return host
+
+    def release(self, host: OllamaHost, latency: Optional[float], failed: bool) -> None:
+        """
+        Record the outcome of a request and stop counting it as outstanding.
+
+        Args:
+            host: The host returned by acquire().
+            latency: The time to first token in seconds, or None if there was none.
+            failed: Whether the request failed because of the host.
+        """
+        with self._lock:
+            host.outstanding -= 1
+            alpha = self.ewma_alpha
+            host.error_rate_ewma = alpha * (1.0 if failed else 0.0) + (1 - alpha) * host.error_rate_ewma
+            if latency is not None:
+                host.latency_ewma = latency if host.latency_ewma is None else alpha * latency + (1 - alpha) * host.latency_ewma
+
+            if not failed:
+                host.consecutive_failures = 0
+                host.on_probation = False
+                self._ejection_counts.pop(host.base_url, None)
+                return
+
+            host.failures += 1
+            host.consecutive_failures += 1
+            if (
+                host.on_probation
+                or host.error_rate_ewma >= self.error_rate_threshold
+                or host.consecutive_failures >= self.max_consecutive_failures
+            ):
+                self._eject(host)
+
+    def _eject(self, host: OllamaHost) -> None:
+        """Take a host out of rotation. The caller must hold the lock."""
+        count = self._ejection_counts.get(host.base_url, 0)
+        duration = min(self.ejection_seconds * (2 ** count), self.max_ejection_seconds)
+        self._ejection_counts[host.base_url] = count + 1
+        host.ejected_until = self._clock() + duration
+        # Start from a clean slate once it is re-admitted, but eject it again on its first failure
+        host.consecutive_failures = 0
+        host.error_rate_ewma = 0.0
+        host.on_probation = True
+        logger.warning(f"Ejecting Ollama host {host.base_url} for {duration:.0f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the pool statistics.
+
+        Returns:
+            A dictionary with the statistics of every host.
+        """
+        with self._lock:
+            now = self._clock()
+            return {
+                "hosts": [host.stats(now) for host in self.hosts],
+                "sessions": len(self._sessions),
+            }
+
+    async def aclose(self) -> None:
+        """Close the connections of every host."""
+        for host in self.hosts:
+            await host.client.aclose()
+
+def _session_id(run_manager: Any) -> Optional[str]:
+    """Get the session id from the metadata of the run, if any."""
+    metadata = getattr(run_manager, "metadata", None) or {}
+    return metadata.get(SESSION_ID_METADATA_KEY)
+
+class RoutedOllama(AsyncOllama):
+    """
+    AsyncOllama that sends each generation to a host chosen by an OllamaHostPool.
+
+    The session id for affinity is read from the "session_id" metadata of the run.
+    A request that fails before its first token is retried on another host.
+    """
+
+    pool: Any = None
+    """The OllamaHostPool to route requests through."""
+
+    @property
+    def _llm_type(self) -> str:
+        return "ollama-routed"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model": self.model, "hosts": [host.base_url for host in self.pool.hosts], **self._options()}
+
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        payload = self._payload(stop, **kwargs)
+        tried: List[OllamaHost] = []
+        while True:
+            host = self.pool.acquire(_session_id(run_manager), exclude=tried)
+            started = time.perf_counter()
+            latency = None
+            failed = False
+            try:
+                for data in host.client.generate_stream(self.model, prompt, **payload):
+                    if latency is None:
+                        latency = time.perf_counter() - started
+                    chunk = _to_chunk(data, keep_context="context" in kwargs)
+                    if run_manager and chunk.text:
+                        run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                    yield chunk
+                return
+            except Exception as error:
+                failed = _is_host_failure(error)
+                if not failed:
+                    raise
+                tried.append(host)
+                if latency is not None or len(tried) >= len(self.pool.hosts):
+                    raise
+                logger.warning(f"Ollama host {host.base_url} failed, retrying on another host")
+            finally:
+                self.pool.release(host, latency, failed)
+
+    async def _astream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[GenerationChunk]:
+        payload = self._payload(stop, **kwargs)
+        tried: List[OllamaHost] = []
+        while True:
+            host = self.pool.acquire(_session_id(run_manager), exclude=tried)
+            started = time.perf_counter()
+            latency = None
+            failed = False
+            try:
+                async for data in host.client.agenerate_stream(self.model, prompt, **payload):
+                    if latency is None:
+                        latency = time.perf_counter() - started
+                    chunk = _to_chunk(data, keep_context="context" in kwargs)
+                    if run_manager and chunk.text:
+                        await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                    yield chunk
+                return
+            except Exception as error:
+                failed = _is_host_failure(error)
+                if not failed:
+                    raise
+                tried.append(host)
+                if latency is not None or len(tried) >= len(self.pool.hosts):
+                    raise
+                logger.warning(f"Ollama host {host.base_url} failed, retrying on another host")
+            finally:
+                self.pool.release(host, latency, failed)
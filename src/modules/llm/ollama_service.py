@@ -5,57 +5,161 @@ This module provides functionality to connect to and query the Llama 2 model via
 """
 
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, Optional, Union
 
 from langchain.prompts import ChatPromptTemplate
 from langchain_community.llms.ollama import Ollama
 from langchain.schema.output_parser import StrOutputParser
 from langchain.schema.runnable import Runnable
 
+from src.modules.llm.async_ollama import AsyncOllama
+from src.modules.llm.chat_sessions import ChatSessionStore, SessionChatRunnable
+from src.modules.llm.length_limits import LengthLimitedRunnable, LengthLimits, prompt_tokens, with_max_tokens
+from src.modules.llm.model_warmer import ModelWarmer
+from src.modules.llm.ollama_client import OllamaClient
+from src.modules.llm.ollama_pool import OllamaHostPool, RoutedOllama
+from src.modules.llm.semantic_cache import SemanticCache, SemanticCacheRunnable
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# System prompt used by the chat template
+DEFAULT_SYSTEM_PROMPT = "You are a helpful, friendly AI assistant. Be concise and clear in your responses."
+
+# Keep-alive of a preloaded model when none is configured
+DEFAULT_PRELOAD_KEEP_ALIVE = "30m"
+
 class OllamaService:
     """
     Service for interacting with Ollama-hosted Llama 2 model.
     """
 
-    def __init__(self, model_name: str = "llama2"):
+    def __init__(
+        self,
+        model_name: str = "llama2",
+        semantic_cache: Optional[SemanticCache] = None,
+        client: Optional[OllamaClient] = None,
+        host_pool: Optional[OllamaHostPool] = None,
+        keep_alive: Optional[Union[int, str]] = None,
+        preload: bool = False,
+        warm_check_seconds: float = 30.0,
+        length_limits: Optional[LengthLimits] = None,
+    ):
         """
         Initialize the Ollama service.
         
         Args:
             model_name: The name of the model to use. Defaults to "llama2".
+            semantic_cache: Optional cache that answers prompts similar to earlier ones.
+            client: Optional pooled Ollama client. When given, the async-native
+                AsyncOllama backend is used instead of the LangChain Ollama wrapper.
+            host_pool: Optional pool of Ollama hosts. When given, every request is routed
+                to one of its hosts; this takes precedence over client.
+            keep_alive: How long Ollama keeps the model loaded after a request, e.g.
+                "30m" or -1 for ever. Defaults to "30m" when preloading, and to
+                Ollama's own setting otherwise.
+            preload: Whether to load the model when the service starts and keep it
+                loaded while idle. Defaults to False.
+            warm_check_seconds: The time between two checks that the preloaded model
+                is still loaded, in seconds. Defaults to 30.
+            length_limits: The token limits of the inputs. Defaults to limits configured
+                from the environment variables.
         """
         self.model_name = model_name
+        self.system_prompt = DEFAULT_SYSTEM_PROMPT
+        self.semantic_cache = semantic_cache
+        self.length_limits = length_limits if length_limits is not None else LengthLimits.from_environment()
+        self.client = client
+        self.host_pool = host_pool
+        self.keep_alive = keep_alive if keep_alive is not None or not preload else DEFAULT_PRELOAD_KEEP_ALIVE
         self.llm = None
         self.chain = None
+        self.warmer: Optional[ModelWarmer] = None
+        self._warmer_client: Optional[OllamaClient] = None
         self._initialize_llm()
         self._build_chain()
+        if preload:
+            self._create_warmer(warm_check_seconds)
     
     def _initialize_llm(self) -> None:
         """
         Initialize the Llama 2 model through Ollama.
         """
         try:
-            self.llm = Ollama(model=self.model_name)
+            # Ollama applies its own keep-alive to requests that do not set one
+            params = {"keep_alive": self.keep_alive} if self.keep_alive is not None else {}
+            if self.host_pool is not None:
+                self.llm = RoutedOllama(model=self.model_name, pool=self.host_pool, **params)
+            elif self.client is not None:
+                self.llm = AsyncOllama(model=self.model_name, client=self.client, **params)
+            else:
+                self.llm = Ollama(model=self.model_name, **params)
             logger.info(f"Successfully initialized Ollama with model {self.model_name}")
         except Exception as e:
             logger.error(f"Failed to initialize Ollama: {str(e)}")
             raise
     
+    def _create_warmer(self, check_interval: float) -> None:
+        """
+        Create the warmer that preloads the model on every Ollama host.
+        
+        Args:
+            check_interval: The time between two checks of the running models, in seconds.
+        """
+        if self.host_pool is not None:
+            clients = {host.base_url: host.client for host in self.host_pool.hosts}
+        elif self.client is not None:
+            clients = {self.client.base_url: self.client}
+        else:
+            # The LangChain wrapper has no pooled client; use one for the warm-up only
+            self._warmer_client = OllamaClient(base_url=self.llm.base_url)
+            clients = {self._warmer_client.base_url: self._warmer_client}
+        self.warmer = ModelWarmer(
+            self.model_name,
+            clients,
+            keep_alive=self.keep_alive,
+            check_interval=check_interval,
+        )
+    
+    async def astart(self) -> None:
+        """Start the background work of the service: preloading the model, if enabled."""
+        if self.warmer is not None:
+            self.warmer.start()
+    
+    async def wait_warm(self) -> None:
+        """Wait until the model has been preloaded, if preloading is enabled."""
+        if self.warmer is not None:
+            await self.warmer.wait_warm()
+    
+    def is_warm(self) -> Optional[bool]:
+        """
+        Check whether the model is loaded on at least one Ollama host.
+        
+        Returns:
+            Whether the model is warm, or None if preloading is disabled.
+        """
+        return self.warmer.warm if self.warmer is not None else None
+    
     def _build_chain(self) -> None:
         """
         Build the language model chain with chat prompt template.
         """
         # Create a chat template
         chat_template = ChatPromptTemplate.from_messages([
-            ("system", "You are a helpful, friendly AI assistant. Be concise and clear in your responses."),
+            ("system", self.system_prompt),
             ("human", "{input}")
         ])
         
-        # Build the chain
-        self.chain = chat_template | self.llm | StrOutputParser()
+        # Build the chain; the length admission sets the response length through "max_tokens",
+        # and Ollama stops at the caller's "stop" sequences itself
+        self.chain = chat_template | with_max_tokens(self.llm, "num_predict", stop_field="stop") | StrOutputParser()
+        
+        # Answer near-duplicate prompts from the semantic cache when one is configured
+        if self.semantic_cache is not None:
+            self.chain = SemanticCacheRunnable(self.chain, self.semantic_cache)
+        
+        # Reject over-length inputs before they reach the backend or the cache
+        self.chain = LengthLimitedRunnable(self.chain, self.length_limits, prompt_tokens(self.length_limits, self.system_prompt))
         
     def generate_response(self, user_input: str) -> str:
         """
@@ -73,6 +177,23 @@ class OllamaService:
             logger.error(f"Error generating response: {str(e)}")
             return f"Sorry, I encountered an error: {str(e)}"
     
+    def stream_response(self, user_input: str) -> Iterator[str]:
+        """
+        Generate a response to the user input, yielding it as it is produced.
+        
+        Args:
+            user_input: The user's input message.
+            
+        Yields:
+            The chunks of the generated response.
+        """
+        try:
+            for chunk in self.chain.stream({"input": user_input}):
+                yield chunk
+        except Exception as e:
+            logger.error(f"Error streaming response: {str(e)}")
+            yield f"Sorry, I encountered an error: {str(e)}"
+    
     def get_chain(self) -> Runnable:
         """
         Get the language model chain.
@@ -80,4 +201,53 @@ class OllamaService:
         Returns:
             The language model chain.
         """
-        return self.chain 
\ No newline at end of file
+        return self.chain 
+    
+    def get_session_chain(self, sessions: ChatSessionStore) -> Runnable:
+        """
+        Get a chain that continues the conversation of the session named in each call.
+        
+        Args:
+            sessions: The store of the conversation sessions.
+            
+        Returns:
+            The session-aware chain. The session id is read from the "session_id"
+            metadata of the call; calls without one are answered statelessly.
+        """
+        system_tokens = prompt_tokens(self.length_limits, self.system_prompt)
+        return LengthLimitedRunnable(
+            SessionChatRunnable(self.chain, self.llm, sessions, self.system_prompt, "num_predict", stop_field="stop"),
+            self.length_limits,
+            system_tokens,
+            max_input_tokens=sessions.max_prompt_tokens - system_tokens,
+        )
+    
+    async def aclose(self) -> None:
+        """Stop the warmer and close the pooled connections of the Ollama client or host pool, if any."""
+        if self.warmer is not None:
+            await self.warmer.aclose()
+        if self._warmer_client is not None:
+            await self._warmer_client.aclose()
+        if self.client is not None:
+            await self.client.aclose()
+        if self.host_pool is not None:
+            await self.host_pool.aclose()
+    
+    def get_model_config(self) -> Dict[str, Any]:
+        """
+        Get the settings that determine the model's output.
+        
+        Returns:
+            The backend, model name, system prompt and sampling parameters.
+        """
+        return {
+            "backend": "ollama",
+            "model": self.model_name,
+            "system_prompt": self.system_prompt,
+            "temperature": self.llm.temperature,
+            "top_k": self.llm.top_k,
+            "top_p": self.llm.top_p,
+            "num_predict": self.llm.num_predict,
+            "context_window": self.length_limits.context_window,
+            "max_output_tokens": self.length_limits.max_output_tokens,
+        }
\ No newline at end of file
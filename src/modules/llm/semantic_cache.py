@@ -0,0 +1,401 @@
+"""
+Semantic cache for the Llama 2 chatbot chain.
+
+This module provides a cache that matches prompts by embedding similarity rather
+than exact text, so that paraphrased questions can reuse an earlier answer.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+from langchain.schema.runnable import Runnable, RunnableConfig
+
+from src.modules.llm.chain_wrapper import ChainWrapper, join_chunks
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Number of recent latency samples kept for the percentile statistics
+LATENCY_SAMPLE_SIZE = 1000
+
+def _percentile(samples: Sequence[float], percent: float) -> float:
+    """Get a percentile of the samples, or 0.0 if there are none."""
+    if not samples:
+        return 0.0
+    return float(np.percentile(np.asarray(samples), percent))
+
+class SemanticCache:
+    """
+    Bounded cache of answers indexed by the embedding of their prompt.
+
+    Prompts are embedded with a LangChain Embeddings model and stored as unit
+    vectors in a preallocated NumPy matrix, so that a lookup is a single matrix
+    product. When the cache is full, the least recently used entry is replaced.
+    Each entry can carry a key, such as the generation settings of its answer,
+    and only matches lookups with the same key.
+    """
+
+    def __init__(self, embeddings: Any, similarity_threshold: float = 0.92, capacity: int = 1000):
+        """
+        Initialize the semantic cache.
+
+        Args:
+            embeddings: The LangChain Embeddings model used to embed prompts.
+            similarity_threshold: The minimum cosine similarity for a hit. Defaults to 0.92.
+            capacity: The maximum number of cached answers. Defaults to 1000.
+        """
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self.capacity = capacity
+        self._vectors: Optional[np.ndarray] = None
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+        self._prompts: List[Optional[str]] = [None] * capacity
+        self._answers: List[Any] = [None] * capacity
+        self._keys: List[Optional[str]] = [None] * capacity
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lookup_seconds: deque = deque(maxlen=LATENCY_SAMPLE_SIZE)
+        self._generation_seconds: deque = deque(maxlen=LATENCY_SAMPLE_SIZE)
+
+    @staticmethod
+    def _normalize(vectors: Any) -> np.ndarray:
+        """Convert embeddings to a float32 matrix of unit vectors."""
+        matrix = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def embed(self, prompts: List[str]) -> np.ndarray:
+        """
+        Embed prompts with a single call to the embeddings model.
+
+        Args:
+            prompts: The prompts to embed.
+
+        Returns:
+            A matrix with one unit vector per prompt.
+        """
+        return self._normalize(self.embeddings.embed_documents(prompts))
+
+    async def aembed(self, prompts: List[str]) -> np.ndarray:
+        """
+        Embed prompts asynchronously with a single call to the embeddings model.
+
+        Args:
+            prompts: The prompts to embed.
+
+        Returns:
+            A matrix with one unit vector per prompt.
+        """
+        return self._normalize(await self.embeddings.aembed_documents(prompts))
+
+    def search(
+        self,
+        vectors: np.ndarray,
+        started: Optional[float] = None,
+        keys: Optional[List[Optional[str]]] = None,
+    ) -> List[Optional[Any]]:
+        """
+        Find cached answers for already embedded prompts.
+
+        Args:
+            vectors: A matrix of unit vectors, as returned by embed().
+            started: The time.perf_counter() value when the lookup began, so that the
+                recorded lookup latency includes the embedding. Defaults to now.
+            keys: The key of each lookup; only entries added with the same key
+                match. Defaults to None for every lookup.
+
+        Returns:
+            For each vector, the cached answer if one is similar enough, else None.
+        """
+        if started is None:
+            started = time.perf_counter()
+        if keys is None:
+            keys = [None] * len(vectors)
+        results: List[Optional[Any]] = [None] * len(vectors)
+        with self._lock:
+            if self._size:
+                similarities = vectors @ self._vectors[: self._size].T
+                entry_keys = self._keys[: self._size]
+                for key in set(keys):
+                    other = np.fromiter((entry_key != key for entry_key in entry_keys), dtype=bool, count=self._size)
+                    if other.any():
+                        rows = [row for row, row_key in enumerate(keys) if row_key == key]
+                        similarities[np.ix_(rows, other)] = -np.inf
+                best = similarities.argmax(axis=1)
+                now = time.monotonic()
+                for row, index in enumerate(best):
+                    if similarities[row, index] >= self.similarity_threshold:
+                        results[row] = self._answers[index]
+                        self._last_used[index] = now
+            hits = sum(result is not None for result in results)
+            self.hits += hits
+            self.misses += len(results) - hits
+            self._lookup_seconds.append(time.perf_counter() - started)
+        return results
+
+    def lookup(self, prompt: str, key: Optional[str] = None) -> Optional[Any]:
+        """
+        Find the cached answer for a prompt.
+
+        Args:
+            prompt: The prompt to look up.
+            key: The key the answer must have been added with. Defaults to None.
+
+        Returns:
+            The cached answer, or None if no cached prompt is similar enough.
+        """
+        return self.lookup_many([prompt], [key])[0]
+
+    def lookup_many(self, prompts: List[str], keys: Optional[List[Optional[str]]] = None) -> List[Optional[Any]]:
+        """
+        Find cached answers for several prompts, embedding them in one batch.
+
+        Args:
+            prompts: The prompts to look up.
+            keys: The key of each prompt. Defaults to None for every prompt.
+
+        Returns:
+            For each prompt, the cached answer or None.
+        """
+        started = time.perf_counter()
+        return self.search(self.embed(prompts), started, keys)
+
+    def add(self, prompt: str, answer: Any, vector: Optional[np.ndarray] = None, key: Optional[str] = None) -> None:
+        """
+        Store an answer for a prompt.
+
+        Args:
+            prompt: The prompt that produced the answer.
+            answer: The answer to cache.
+            vector: The prompt's unit vector, if it was already embedded.
+            key: The key that lookups must have to match the answer. Defaults to None.
+        """
+        if vector is None:
+            vector = self.embed([prompt])[0]
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.capacity, vector.shape[-1]), dtype=np.float32)
+            if self._size < self.capacity:
+                index = self._size
+                self._size += 1
+            else:
+                index = int(self._last_used.argmin())
+                self.evictions += 1
+            self._vectors[index] = vector
+            self._prompts[index] = prompt
+            self._answers[index] = answer
+            self._keys[index] = key
+            self._last_used[index] = time.monotonic()
+
+    def record_generation(self, seconds: float) -> None:
+        """
+        Record how long a generation took on a cache miss.
+
+        Args:
+            seconds: The generation time in seconds.
+        """
+        with self._lock:
+            self._generation_seconds.append(seconds)
+
+    def clear(self) -> None:
+        """Remove all entries from the cache."""
+        with self._lock:
+            self._size = 0
+            self._prompts = [None] * self.capacity
+            self._answers = [None] * self.capacity
+            self._keys = [None] * self.capacity
+            self._last_used[:] = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the cache statistics.
+
+        Returns:
+            A dictionary with the hit rate, lookup latency and generation latency.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            lookup_seconds = list(self._lookup_seconds)
+            generation_seconds = list(self._generation_seconds)
+            return {
+                "entries": self._size,
+                "capacity": self.capacity,
+                "similarity_threshold": self.similarity_threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "lookup_ms_p50": _percentile(lookup_seconds, 50) * 1000,
+                "lookup_ms_p95": _percentile(lookup_seconds, 95) * 1000,
+                "generation_ms_p50": _percentile(generation_seconds, 50) * 1000,
+                "generation_ms_p95": _percentile(generation_seconds, 95) * 1000,
+            }
+
+def _prompt_text(user_input: Any) -> str:
+    """Get the text to embed from a chain input."""
+    if isinstance(user_input, dict):
+        return str(user_input.get("input", ""))
+    return str(user_input)
+
+def _config_key(config: Optional[RunnableConfig]) -> Optional[str]:
+    """Get the cache key of a call's configurable fields, such as max_tokens and stop, if any."""
+    configurable = (config or {}).get("configurable") or {}
+    if not configurable:
+        return None
+    return json.dumps(configurable, sort_keys=True, default=str)
+
+class SemanticCacheRunnable(ChainWrapper):
+    """
+    Chain wrapper that answers prompts similar to earlier ones from a SemanticCache.
+
+    Answers are only reused for calls with the same configurable fields, since
+    these change the output (e.g. max_tokens and stop).
+    """
+
+    def __init__(self, bound: Runnable, cache: SemanticCache):
+        """
+        Initialize the semantic cache runnable.
+
+        Args:
+            bound: The chain to cache.
+            cache: The semantic cache to use.
+        """
+        super().__init__(bound)
+        self.cache = cache
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        prompt = _prompt_text(input)
+        key = _config_key(config)
+        lookup_started = time.perf_counter()
+        vectors = self.cache.embed([prompt])
+        cached = self.cache.search(vectors, lookup_started, [key])[0]
+        if cached is not None:
+            return cached
+        started = time.perf_counter()
+        output = self.bound.invoke(input, config, **kwargs)
+        self.cache.record_generation(time.perf_counter() - started)
+        self.cache.add(prompt, output, vectors[0], key)
+        return output
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        prompt = _prompt_text(input)
+        key = _config_key(config)
+        lookup_started = time.perf_counter()
+        vectors = await self.cache.aembed([prompt])
+        cached = self.cache.search(vectors, lookup_started, [key])[0]
+        if cached is not None:
+            return cached
+        started = time.perf_counter()
+        output = await self.bound.ainvoke(input, config, **kwargs)
+        self.cache.record_generation(time.perf_counter() - started)
+        self.cache.add(prompt, output, vectors[0], key)
+        return output
+
+    def batch(
+        self,
+        inputs: List[Any],
+        config: Optional[Any] = None,
+        *,
+        return_exceptions: bool = False,
+        **kwargs: Any,
+    ) -> List[Any]:
+        if not inputs:
+            return []
+        prompts = [_prompt_text(item) for item in inputs]
+        configs = config if isinstance(config, list) else [config] * len(inputs)
+        keys = [_config_key(item) for item in configs]
+        lookup_started = time.perf_counter()
+        vectors = self.cache.embed(prompts)
+        outputs = self.cache.search(vectors, lookup_started, keys)
+        misses = [index for index, output in enumerate(outputs) if output is None]
+        if misses:
+            started = time.perf_counter()
+            generated = self.bound.batch(
+                [inputs[index] for index in misses],
+                [configs[index] for index in misses],
+                return_exceptions=return_exceptions,
+                **kwargs,
+            )
+            self.cache.record_generation(time.perf_counter() - started)
+            for index, output in zip(misses, generated):
+                outputs[index] = output
+                if not isinstance(output, Exception):
+                    self.cache.add(prompts[index], output, vectors[index], keys[index])
+        return outputs
+
+    async def abatch(
+        self,
+        inputs: List[Any],
+        config: Optional[Any] = None,
+        *,
+        return_exceptions: bool = False,
+        **kwargs: Any,
+    ) -> List[Any]:
+        if not inputs:
+            return []
+        prompts = [_prompt_text(item) for item in inputs]
+        configs = config if isinstance(config, list) else [config] * len(inputs)
+        keys = [_config_key(item) for item in configs]
+        lookup_started = time.perf_counter()
+        vectors = await self.cache.aembed(prompts)
+        outputs = self.cache.search(vectors, lookup_started, keys)
+        misses = [index for index, output in enumerate(outputs) if output is None]
+        if misses:
+            started = time.perf_counter()
+            generated = await self.bound.abatch(
+                [inputs[index] for index in misses],
+                [configs[index] for index in misses],
+                return_exceptions=return_exceptions,
+                **kwargs,
+            )
+            self.cache.record_generation(time.perf_counter() - started)
+            for index, output in zip(misses, generated):
+                outputs[index] = output
+                if not isinstance(output, Exception):
+                    self.cache.add(prompts[index], output, vectors[index], keys[index])
+        return outputs
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Iterator[Any]:
+        prompt = _prompt_text(input)
+        key = _config_key(config)
+        lookup_started = time.perf_counter()
+        vectors = self.cache.embed([prompt])
+        cached = self.cache.search(vectors, lookup_started, [key])[0]
+        if cached is not None:
+            yield cached
+            return
+        started = time.perf_counter()
+        chunks = []
+        for chunk in self.bound.stream(input, config, **kwargs):
+            chunks.append(chunk)
+            yield chunk
+        self.cache.record_generation(time.perf_counter() - started)
+        if chunks:
+            self.cache.add(prompt, join_chunks(chunks), vectors[0], key)
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> AsyncIterator[Any]:
+        prompt = _prompt_text(input)
+        key = _config_key(config)
+        lookup_started = time.perf_counter()
+        vectors = await self.cache.aembed([prompt])
+        cached = self.cache.search(vectors, lookup_started, [key])[0]
+        if cached is not None:
+            yield cached
+            return
+        started = time.perf_counter()
+        chunks = []
+        async for chunk in self.bound.astream(input, config, **kwargs):
+            chunks.append(chunk)
+            yield chunk
+        self.cache.record_generation(time.perf_counter() - started)
+        if chunks:
+            self.cache.add(prompt, join_chunks(chunks), vectors[0], key)
@@ -0,0 +1,166 @@
+"""
+SQLite storage for the chat sessions.
+
+This module provides the spill tier of the chat session store: sessions paged
+out of memory, and every session still in memory at shutdown, are saved to a
+single SQLite database in WAL mode, so they survive restarts and resident
+memory stays bounded however many users have chatted. The model context of a
+session is stored as packed 32-bit integers rather than JSON.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Minimum time between two removals of expired sessions, in seconds
+PURGE_INTERVAL = 3600.0
+
+def pack_context(context: Optional[list]) -> Optional[bytes]:
+    """Pack a model context into bytes, 4 bytes per token."""
+    return None if context is None else array("I", context).tobytes()
+
+def unpack_context(data: Optional[bytes]) -> Optional[list]:
+    """Unpack a model context packed by pack_context."""
+    if data is None:
+        return None
+    context = array("I")
+    context.frombytes(data)
+    return context.tolist()
+
+class SQLiteSessionStorage:
+    """
+    Chat session states saved in a SQLite database, by session id.
+
+    One connection is shared by the threads of the process. Several processes
+    may open the same file: WAL mode lets readers proceed while one writes.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        retention_seconds: float = 7 * 24 * 3600.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Open the database, creating it if needed, and remove expired sessions.
+
+        Args:
+            path: The path of the database file.
+            retention_seconds: How long a session is kept after its last use.
+                Defaults to 7 days.
+            clock: The wall-clock time source, in seconds. Defaults to time.time.
+        """
+        self.path = path
+        self.retention_seconds = retention_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # In WAL mode, NORMAL only syncs at checkpoints, which keeps writes cheap
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS chat_sessions ("
+            "session_id TEXT PRIMARY KEY, state TEXT NOT NULL, context BLOB, updated_at REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS chat_sessions_updated_at ON chat_sessions (updated_at)")
+        self._last_purge = 0.0
+        self.purge()
+
+    def save(self, states: Iterable[Dict[str, Any]]) -> None:
+        """
+        Save session states, replacing the saved ones with the same ids.
+
+        Args:
+            states: The session states, with a "session_id" and an optional "context".
+        """
+        now = self._clock()
+        rows = []
+        for state in states:
+            state = dict(state)
+            context = state.pop("context", None)
+            rows.append((state["session_id"], json.dumps(state), pack_context(context), now))
+        if not rows:
+            return
+        with self._lock:
+            self._connection.execute("BEGIN")
+            try:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO chat_sessions (session_id, state, context, updated_at) VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+        if now - self._last_purge >= PURGE_INTERVAL:
+            self.purge()
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Load the state of a session.
+
+        Args:
+            session_id: The id of the session.
+
+        Returns:
+            The session state, or None if the session is not saved or has expired.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT state, context FROM chat_sessions WHERE session_id = ? AND updated_at >= ?",
+                (session_id, self._clock() - self.retention_seconds),
+            ).fetchone()
+        if row is None:
+            return None
+        state = json.loads(row[0])
+        state["context"] = unpack_context(row[1])
+        return state
+
+    def delete(self, session_id: str) -> bool:
+        """
+        Delete a saved session.
+
+        Args:
+            session_id: The id of the session.
+
+        Returns:
+            True if the session was saved.
+        """
+        with self._lock:
+            cursor = self._connection.execute("DELETE FROM chat_sessions WHERE session_id = ?", (session_id,))
+        return cursor.rowcount > 0
+
+    def purge(self) -> int:
+        """
+        Delete the sessions unused for longer than the retention period.
+
+        Returns:
+            The number of sessions deleted.
+        """
+        now = self._clock()
+        with self._lock:
+            cursor = self._connection.execute(
+                "DELETE FROM chat_sessions WHERE updated_at < ?", (now - self.retention_seconds,)
+            )
+            self._last_purge = now
+        if cursor.rowcount:
+            logger.info(f"Removed {cursor.rowcount} expired chat sessions from {self.path}")
+        return cursor.rowcount
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM chat_sessions").fetchone()[0]
+
+    def close(self) -> None:
+        """Close the database."""
+        with self._lock:
+            self._connection.close()
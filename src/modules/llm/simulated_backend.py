@@ -0,0 +1,589 @@
+"""
+Deterministic simulated LLM backend for offline performance testing.
+
+This module provides a model that generates text with realistic timing but
+without any hardware: a one-off load time, a prefill latency per input token,
+a decode rate in tokens per second, a limit on concurrent generations and
+injected errors. The same prompt always produces the same text. The model can
+be used in-process through SimulatedLLM, or served over HTTP with the Ollama
+/api/generate and /api/chat endpoints:
+
+    python -m src.modules.llm.simulated_backend --port 11434
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, ClassVar, Dict, Iterator, List, Optional
+
+from langchain.callbacks.manager import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain.llms.base import LLM
+from langchain.schema.output import Generation, GenerationChunk, LLMResult
+
+from src.config.environment_config import (
+    SIMULATED_DECODE_TOKENS_PER_SECOND,
+    SIMULATED_ERROR_RATE,
+    SIMULATED_LOAD_SECONDS,
+    SIMULATED_MAX_CONCURRENCY,
+    SIMULATED_OUTPUT_TOKENS,
+    SIMULATED_PREFILL_MS_PER_TOKEN,
+    SIMULATED_SEED,
+    get_float_setting,
+    get_int_setting,
+)
+from src.modules.llm.async_ollama import _gather_or_cancel, _join, _to_chunk
+from src.modules.llm.ollama_client import keep_alive_seconds
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Words the simulated model writes its answers with
+VOCABULARY = (
+    "the model answers your question with a short and helpful reply about "
+    "llamas language data systems latency tokens memory servers users time "
+    "simple clear example result because however therefore also very well"
+).split()
+
+def count_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens in a text, at about four characters per token.
+
+    Args:
+        text: The text.
+
+    Returns:
+        The estimated token count, at least 1.
+    """
+    return max(1, math.ceil(len(text) / 4))
+
+class SimulationError(Exception):
+    """
+    Injected failure of a simulated generation.
+    """
+
+class SimulatedModel:
+    """
+    Timing and text model of a simulated LLM server.
+
+    Synchronous and asynchronous generations have separate concurrency limits
+    of max_concurrency each; a server normally only uses one of the two.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "simulated",
+        load_seconds: float = 0.0,
+        prefill_ms_per_token: float = 0.5,
+        decode_tokens_per_second: float = 50.0,
+        output_tokens: int = 64,
+        max_concurrency: int = 0,
+        error_rate: float = 0.0,
+        keep_alive_seconds: Optional[float] = 300.0,
+        seed: int = 0,
+    ):
+        """
+        Initialize the simulated model.
+
+        Args:
+            model_name: The name reported for the model. Defaults to "simulated".
+            load_seconds: The time to load the model before its first generation, and
+                again after it was unloaded. Defaults to 0.
+            prefill_ms_per_token: The prompt processing time per input token, in
+                milliseconds. Defaults to 0.5.
+            decode_tokens_per_second: The generation speed. Defaults to 50.
+            output_tokens: The natural response length; a smaller num_predict cuts the
+                response short, as a real model stops at its end-of-text token.
+                Defaults to 64.
+            max_concurrency: The number of generations served at once; further ones
+                wait. 0 means unlimited. Defaults to 0.
+            error_rate: The fraction of generations that fail. Defaults to 0.
+            keep_alive_seconds: How long the model stays loaded when idle, None for
+                ever. Defaults to 300 seconds, like Ollama.
+            seed: The seed of the error injection. Defaults to 0.
+        """
+        self.model_name = model_name
+        self.load_seconds = load_seconds
+        self.prefill_ms_per_token = prefill_ms_per_token
+        self.decode_tokens_per_second = decode_tokens_per_second
+        self.output_tokens = output_tokens
+        self.max_concurrency = max_concurrency
+        self.error_rate = error_rate
+        self.keep_alive_seconds = keep_alive_seconds
+        self.seed = seed
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._loaded_until: Optional[float] = None
+        self._ready_at = 0.0
+        self._thread_slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency > 0 else None
+        self._async_slots: Optional[asyncio.Semaphore] = None
+        self.active = 0
+
+    @classmethod
+    def from_environment(cls, model_name: str = "simulated") -> "SimulatedModel":
+        """
+        Create a simulated model configured from the SIMULATED_* environment variables.
+
+        Args:
+            model_name: The name reported for the model.
+
+        Returns:
+            The simulated model.
+        """
+        return cls(
+            model_name=model_name,
+            load_seconds=get_float_setting(SIMULATED_LOAD_SECONDS, 0.0),
+            prefill_ms_per_token=get_float_setting(SIMULATED_PREFILL_MS_PER_TOKEN, 0.5),
+            decode_tokens_per_second=get_float_setting(SIMULATED_DECODE_TOKENS_PER_SECOND, 50.0),
+            output_tokens=get_int_setting(SIMULATED_OUTPUT_TOKENS, 64),
+            max_concurrency=get_int_setting(SIMULATED_MAX_CONCURRENCY, 0),
+            error_rate=get_float_setting(SIMULATED_ERROR_RATE, 0.0),
+            seed=get_int_setting(SIMULATED_SEED, 0),
+        )
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the model is loaded."""
+        return self._loaded_until is not None and self._loaded_until > time.monotonic()
+
+    @property
+    def expires_at(self) -> Optional[datetime]:
+        """When the idle model will be unloaded, or None if it is not loaded."""
+        if not self.loaded:
+            return None
+        if self._loaded_until == float("inf"):
+            # Ollama reports a date far in the future for models kept loaded for ever
+            return datetime(2318, 1, 1, tzinfo=timezone.utc)
+        return datetime.now(timezone.utc) + timedelta(seconds=self._loaded_until - time.monotonic())
+
+    def answer(self, prompt: str, num_tokens: int) -> List[str]:
+        """
+        Get the deterministic answer to a prompt.
+
+        Args:
+            prompt: The prompt text.
+            num_tokens: The number of tokens to produce.
+
+        Returns:
+            The tokens of the answer.
+        """
+        words = random.Random(zlib.crc32(prompt.encode("utf-8"))).choices(VOCABULARY, k=num_tokens)
+        return [word if index == 0 else f" {word}" for index, word in enumerate(words)]
+
+    def _plan(self, prompt: str, context: Optional[List[int]], num_predict: Optional[int], keep_alive: Any) -> Dict[str, Any]:
+        """
+        Decide the outcome and the timing of a generation.
+
+        Returns:
+            The load time, prefill time, tokens and statistics of the generation.
+
+        Raises:
+            SimulationError: If an error is injected.
+        """
+        with self._lock:
+            if self.error_rate > 0 and self._random.random() < self.error_rate:
+                raise SimulationError("Simulated backend error")
+            now = time.monotonic()
+            if not self.loaded:
+                self._ready_at = now + self.load_seconds
+            # Generations arriving while the model loads wait for the same load
+            load_seconds = max(0.0, self._ready_at - now)
+            # The model stays loaded while it generates; keep_alive counts from the end
+            self._loaded_until = float("inf")
+            self.active += 1
+
+        # Tokens already in the context are cached by the server and not processed again
+        prompt_tokens = count_tokens(prompt)
+        limited = num_predict is not None and 0 <= num_predict < self.output_tokens
+        num_tokens = num_predict if limited else self.output_tokens
+        # An empty prompt only loads the model, as in Ollama
+        load_only = not prompt and not context
+        tokens = [] if load_only else self.answer(prompt, num_tokens)
+        prompt_ids = [zlib.crc32(f"{prompt}:{index}".encode("utf-8")) & 0xFFFF for index in range(prompt_tokens)]
+        output_ids = [zlib.crc32(token.encode("utf-8")) & 0xFFFF for token in tokens]
+        return {
+            "load_seconds": load_seconds,
+            "prefill_seconds": prompt_tokens * self.prefill_ms_per_token / 1000,
+            "token_interval": 1 / self.decode_tokens_per_second if self.decode_tokens_per_second > 0 else 0.0,
+            "tokens": tokens,
+            "prompt_tokens": prompt_tokens,
+            "context": list(context or []) + prompt_ids + output_ids,
+            "done_reason": "load" if load_only else "length" if limited else "stop",
+        }
+
+    def _finish(self, keep_alive: Any) -> None:
+        """Record the end of a generation and start the keep-alive period when idle."""
+        with self._lock:
+            self.active -= 1
+            if self.active == 0:
+                seconds = keep_alive_seconds(keep_alive, self.keep_alive_seconds)
+                self._loaded_until = float("inf") if seconds is None else time.monotonic() + seconds
+
+    def _chunk(self, text: str) -> Dict[str, Any]:
+        """Build one line of an Ollama generate response."""
+        return {
+            "model": self.model_name,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "response": text,
+            "done": False,
+        }
+
+    def _final(self, plan: Dict[str, Any], started: float, decode_started: float) -> Dict[str, Any]:
+        """Build the last line of an Ollama generate response, with the statistics."""
+        ended = time.perf_counter()
+        to_ns = lambda seconds: int(seconds * 1e9)
+        return {
+            **self._chunk(""),
+            "done": True,
+            "done_reason": plan["done_reason"],
+            "context": plan["context"],
+            "total_duration": to_ns(ended - started),
+            "load_duration": to_ns(plan["load_seconds"]),
+            "prompt_eval_count": plan["prompt_tokens"],
+            "prompt_eval_duration": to_ns(plan["prefill_seconds"]),
+            "eval_count": len(plan["tokens"]),
+            "eval_duration": to_ns(ended - decode_started),
+        }
+
+    def generate(
+        self,
+        prompt: str,
+        context: Optional[List[int]] = None,
+        num_predict: Optional[int] = None,
+        keep_alive: Any = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Generate a completion, blocking between tokens.
+
+        Args:
+            prompt: The prompt text.
+            context: Optional context returned by an earlier generation.
+            num_predict: Optional maximum number of tokens.
+            keep_alive: Optional time the model stays loaded afterwards, as in Ollama.
+
+        Yields:
+            The response lines in the Ollama /api/generate format.
+
+        Raises:
+            SimulationError: If an error is injected.
+        """
+        if self._thread_slots is not None:
+            self._thread_slots.acquire()
+        try:
+            started = time.perf_counter()
+            plan = self._plan(prompt, context, num_predict, keep_alive)
+        except BaseException:
+            if self._thread_slots is not None:
+                self._thread_slots.release()
+            raise
+        try:
+            time.sleep(plan["load_seconds"] + plan["prefill_seconds"])
+            decode_started = time.perf_counter()
+            for index, token in enumerate(plan["tokens"]):
+                # Sleep until the token is due, so that delays do not accumulate
+                time.sleep(max(0.0, decode_started + index * plan["token_interval"] - time.perf_counter()))
+                yield self._chunk(token)
+            yield self._final(plan, started, decode_started)
+        finally:
+            self._finish(keep_alive)
+            if self._thread_slots is not None:
+                self._thread_slots.release()
+
+    async def agenerate(
+        self,
+        prompt: str,
+        context: Optional[List[int]] = None,
+        num_predict: Optional[int] = None,
+        keep_alive: Any = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Generate a completion without blocking the event loop.
+
+        Args:
+            prompt: The prompt text.
+            context: Optional context returned by an earlier generation.
+            num_predict: Optional maximum number of tokens.
+            keep_alive: Optional time the model stays loaded afterwards, as in Ollama.
+
+        Yields:
+            The response lines in the Ollama /api/generate format.
+
+        Raises:
+            SimulationError: If an error is injected.
+        """
+        if self.max_concurrency > 0 and self._async_slots is None:
+            self._async_slots = asyncio.Semaphore(self.max_concurrency)
+        if self._async_slots is not None:
+            await self._async_slots.acquire()
+        try:
+            started = time.perf_counter()
+            plan = self._plan(prompt, context, num_predict, keep_alive)
+        except BaseException:
+            if self._async_slots is not None:
+                self._async_slots.release()
+            raise
+        try:
+            await asyncio.sleep(plan["load_seconds"] + plan["prefill_seconds"])
+            decode_started = time.perf_counter()
+            for index, token in enumerate(plan["tokens"]):
+                await asyncio.sleep(max(0.0, decode_started + index * plan["token_interval"] - time.perf_counter()))
+                yield self._chunk(token)
+            yield self._final(plan, started, decode_started)
+        finally:
+            self._finish(keep_alive)
+            if self._async_slots is not None:
+                self._async_slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the settings and state of the model.
+
+        Returns:
+            A dictionary with the timing settings and the current load.
+        """
+        return {
+            "model": self.model_name,
+            "loaded": self.loaded,
+            "active": self.active,
+            "load_seconds": self.load_seconds,
+            "prefill_ms_per_token": self.prefill_ms_per_token,
+            "decode_tokens_per_second": self.decode_tokens_per_second,
+            "output_tokens": self.output_tokens,
+            "max_concurrency": self.max_concurrency,
+            "error_rate": self.error_rate,
+        }
+
+class SimulatedLLM(LLM):
+    """
+    LangChain LLM backed by an in-process SimulatedModel.
+
+    It reports the same generation statistics as the Ollama backends.
+    """
+
+    simulator: Any = None
+    """The SimulatedModel that generates the text. Created with defaults if not given."""
+
+    num_predict: Optional[int] = None
+    """Optional maximum number of tokens per response."""
+
+    supports_context: ClassVar[bool] = True
+    """Whether generations accept and return the context of a conversation, as in Ollama."""
+
+    def model_post_init(self, __context: Any) -> None:
+        if self.simulator is None:
+            self.simulator = SimulatedModel()
+
+    @property
+    def _llm_type(self) -> str:
+        return "simulated"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model": self.simulator.model_name, "num_predict": self.num_predict}
+
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        num_predict = kwargs.get("num_predict", self.num_predict)
+        for data in self.simulator.generate(prompt, context=kwargs.get("context"), num_predict=num_predict):
+            chunk = _to_chunk(data, keep_context="context" in kwargs)
+            if run_manager and chunk.text:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[GenerationChunk]:
+        num_predict = kwargs.get("num_predict", self.num_predict)
+        async for data in self.simulator.agenerate(prompt, context=kwargs.get("context"), num_predict=num_predict):
+            chunk = _to_chunk(data, keep_context="context" in kwargs)
+            if run_manager and chunk.text:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        return "".join(chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs))
+
+    def _generate(
+        self,
+        prompts: List[str],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> LLMResult:
+        # Unlike _call, this keeps the statistics of the final chunk
+        return LLMResult(generations=[
+            [_join(list(self._stream(prompt, stop, run_manager, **kwargs)))] for prompt in prompts
+        ])
+
+    async def _agenerate(
+        self,
+        prompts: List[str],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> LLMResult:
+        async def generate(prompt: str) -> Generation:
+            return _join([chunk async for chunk in self._astream(prompt, stop, run_manager, **kwargs)])
+
+        generations = await _gather_or_cancel([generate(prompt) for prompt in prompts])
+        return LLMResult(generations=[[generation] for generation in generations])
+
+def _chat_prompt(messages: List[Dict[str, Any]]) -> str:
+    """Flatten the messages of an /api/chat request into one prompt."""
+    return "\n".join(f"{message.get('role', 'user')}: {message.get('content', '')}" for message in messages)
+
+def create_app(model: SimulatedModel):
+    """
+    Create an HTTP server application that speaks the Ollama API.
+
+    Every model name is accepted and served by the simulated model.
+
+    Args:
+        model: The simulated model.
+
+    Returns:
+        The FastAPI application.
+    """
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+    app = FastAPI(title="Simulated Ollama")
+
+    async def respond(body: Dict[str, Any], prompt: str, to_line):
+        """Run a generation and return it streamed as NDJSON or as one JSON object."""
+        options = body.get("options") or {}
+        lines = model.agenerate(
+            prompt,
+            context=body.get("context"),
+            num_predict=options.get("num_predict"),
+            keep_alive=body.get("keep_alive"),
+        )
+        try:
+            # Fail before the response starts, as Ollama does for load errors
+            first = await lines.__anext__()
+        except SimulationError as e:
+            return JSONResponse({"error": str(e)}, status_code=500)
+
+        if body.get("stream", True):
+            async def stream():
+                yield json.dumps(to_line(first)) + "\n"
+                async for data in lines:
+                    yield json.dumps(to_line(data)) + "\n"
+            return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+        parts = [first]
+        async for data in lines:
+            parts.append(data)
+        final = to_line(parts[-1])
+        text = "".join(part["response"] for part in parts)
+        if "message" in final:
+            final["message"]["content"] = text
+        else:
+            final["response"] = text
+        return JSONResponse(final)
+
+    @app.get("/")
+    async def root():
+        return PlainTextResponse("Ollama is running")
+
+    @app.get("/api/version")
+    async def version():
+        return {"version": "0.0.0-simulated"}
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": model.model_name, "model": model.model_name, "size": 0}]}
+
+    @app.get("/api/ps")
+    async def running():
+        expires_at = model.expires_at
+        if expires_at is None:
+            return {"models": []}
+        return {"models": [{
+            "name": model.model_name,
+            "model": model.model_name,
+            "expires_at": expires_at.isoformat(),
+        }]}
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+
+        def to_line(data: Dict[str, Any]) -> Dict[str, Any]:
+            return {**data, "model": body.get("model", model.model_name)}
+
+        return await respond(body, body.get("prompt", ""), to_line)
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+
+        def to_line(data: Dict[str, Any]) -> Dict[str, Any]:
+            line = {key: value for key, value in data.items() if key not in ("response", "context")}
+            line["model"] = body.get("model", model.model_name)
+            line["message"] = {"role": "assistant", "content": data["response"]}
+            return line
+
+        return await respond(body, _chat_prompt(body.get("messages", [])), to_line)
+
+    @app.get("/simulation/stats")
+    async def simulation_stats():
+        return model.stats()
+
+    return app
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run the simulated Ollama server from the command line."""
+    import uvicorn
+
+    defaults = SimulatedModel.from_environment()
+    parser = argparse.ArgumentParser(description="Serve a simulated LLM over the Ollama API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--model", default="simulated", help="Model name reported by the server")
+    parser.add_argument("--load-seconds", type=float, default=defaults.load_seconds)
+    parser.add_argument("--prefill-ms-per-token", type=float, default=defaults.prefill_ms_per_token)
+    parser.add_argument("--decode-tokens-per-second", type=float, default=defaults.decode_tokens_per_second)
+    parser.add_argument("--output-tokens", type=int, default=defaults.output_tokens)
+    parser.add_argument("--max-concurrency", type=int, default=defaults.max_concurrency)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    args = parser.parse_args(argv)
+
+    model = SimulatedModel(
+        model_name=args.model,
+        load_seconds=args.load_seconds,
+        prefill_ms_per_token=args.prefill_ms_per_token,
+        decode_tokens_per_second=args.decode_tokens_per_second,
+        output_tokens=args.output_tokens,
+        max_concurrency=args.max_concurrency,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    logger.info(f"Serving simulated model on http://{args.host}:{args.port}")
+    uvicorn.run(create_app(model), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,160 @@
+"""
+Simulated service for offline performance testing.
+
+This module provides a service with the same interface as OllamaService that is
+backed by an in-process simulated model instead of a real LLM.
+"""
+
+import logging
+from typing import Dict, Any, Iterator, Optional
+
+from langchain.prompts import ChatPromptTemplate
+from langchain.schema.output_parser import StrOutputParser
+from langchain.schema.runnable import Runnable
+
+from src.modules.llm.chat_sessions import ChatSessionStore, SessionChatRunnable
+from src.modules.llm.length_limits import LengthLimitedRunnable, LengthLimits, prompt_tokens, with_max_tokens
+from src.modules.llm.semantic_cache import SemanticCache, SemanticCacheRunnable
+from src.modules.llm.simulated_backend import SimulatedLLM, SimulatedModel
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# System prompt used by the chat template
+DEFAULT_SYSTEM_PROMPT = "You are a helpful, friendly AI assistant. Be concise and clear in your responses."
+
+class SimulatedService:
+    """
+    Service for interacting with a simulated model.
+    """
+
+    def __init__(
+        self,
+        simulator: Optional[SimulatedModel] = None,
+        semantic_cache: Optional[SemanticCache] = None,
+        length_limits: Optional[LengthLimits] = None,
+    ):
+        """
+        Initialize the simulated service.
+
+        Args:
+            simulator: The simulated model. Defaults to one configured from the
+                SIMULATED_* environment variables.
+            semantic_cache: Optional cache that answers prompts similar to earlier ones.
+            length_limits: The token limits of the inputs. Defaults to limits configured
+                from the environment variables.
+        """
+        self.simulator = simulator if simulator is not None else SimulatedModel.from_environment()
+        self.model_name = self.simulator.model_name
+        self.system_prompt = DEFAULT_SYSTEM_PROMPT
+        self.semantic_cache = semantic_cache
+        self.length_limits = length_limits if length_limits is not None else LengthLimits.from_environment()
+        self.llm = None
+        self.chain = None
+        self._initialize_llm()
+        self._build_chain()
+
+    def _initialize_llm(self) -> None:
+        """
+        Initialize the simulated LLM.
+        """
+        self.llm = SimulatedLLM(simulator=self.simulator)
+        logger.info(f"Initialized simulated model {self.model_name}")
+
+    def _build_chain(self) -> None:
+        """
+        Build the language model chain with chat prompt template.
+        """
+        # Create a chat template
+        chat_template = ChatPromptTemplate.from_messages([
+            ("system", self.system_prompt),
+            ("human", "{input}")
+        ])
+
+        # Build the chain; the length admission sets the response length through "max_tokens"
+        self.chain = chat_template | with_max_tokens(self.llm, "num_predict") | StrOutputParser()
+
+        # Answer near-duplicate prompts from the semantic cache when one is configured
+        if self.semantic_cache is not None:
+            self.chain = SemanticCacheRunnable(self.chain, self.semantic_cache)
+
+        # Reject over-length inputs before they reach the backend or the cache
+        self.chain = LengthLimitedRunnable(self.chain, self.length_limits, prompt_tokens(self.length_limits, self.system_prompt))
+
+    def generate_response(self, user_input: str) -> str:
+        """
+        Generate a response to the user input.
+
+        Args:
+            user_input: The user's input message.
+
+        Returns:
+            The generated response from the model.
+        """
+        try:
+            return self.chain.invoke({"input": user_input})
+        except Exception as e:
+            logger.error(f"Error generating response: {str(e)}")
+            return f"Sorry, I encountered an error: {str(e)}"
+
+    def stream_response(self, user_input: str) -> Iterator[str]:
+        """
+        Generate a response to the user input, yielding it as it is produced.
+
+        Args:
+            user_input: The user's input message.
+
+        Yields:
+            The chunks of the generated response.
+        """
+        try:
+            for chunk in self.chain.stream({"input": user_input}):
+                yield chunk
+        except Exception as e:
+            logger.error(f"Error streaming response: {str(e)}")
+            yield f"Sorry, I encountered an error: {str(e)}"
+
+    def get_chain(self) -> Runnable:
+        """
+        Get the language model chain.
+
+        Returns:
+            The language model chain.
+        """
+        return self.chain
+
+    def get_session_chain(self, sessions: ChatSessionStore) -> Runnable:
+        """
+        Get a chain that continues the conversation of the session named in each call.
+
+        Args:
+            sessions: The store of the conversation sessions.
+            
+        Returns:
+            The session-aware chain. The session id is read from the "session_id"
+            metadata of the call; calls without one are answered statelessly.
+        """
+        system_tokens = prompt_tokens(self.length_limits, self.system_prompt)
+        return LengthLimitedRunnable(
+            SessionChatRunnable(self.chain, self.llm, sessions, self.system_prompt, "num_predict"),
+            self.length_limits,
+            system_tokens,
+            max_input_tokens=sessions.max_prompt_tokens - system_tokens,
+        )
+
+    def get_model_config(self) -> Dict[str, Any]:
+        """
+        Get the settings that determine the model's output.
+
+        Returns:
+            The backend, model name, system prompt and simulated timings.
+        """
+        return {
+            "backend": "simulated",
+            "model": self.model_name,
+            "system_prompt": self.system_prompt,
+            "num_predict": self.llm.num_predict,
+            "output_tokens": self.simulator.output_tokens,
+            "context_window": self.length_limits.context_window,
+            "max_output_tokens": self.length_limits.max_output_tokens,
+        }
@@ -6,10 +6,12 @@ This module provides a Streamlit web interface to interact with the Llama 2 mode
 
 import streamlit as st
 import logging
-import subprocess
-import sys
 import os
-from src.config.environment_config import load_environment
+import time
+import uuid
+from typing import Any, Dict, Iterable, Iterator, Tuple
+from src.config.environment_config import CHAT_SESSION_DB_PATH, LLM_BACKEND, load_environment
+from src.modules.llm.backend_detection import check_ollama_available
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -18,28 +20,8 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_environment()
 
-def check_ollama_installed():
-    """Check if Ollama is installed and available in PATH."""
-    try:
-        if sys.platform.startswith('win'):
-            # Windows
-            result = subprocess.run(['where', 'ollama'], 
-                                   stdout=subprocess.PIPE, 
-                                   stderr=subprocess.PIPE,
-                                   text=True,
-                                   check=False)
-        else:
-            # Linux/Mac
-            result = subprocess.run(['which', 'ollama'], 
-                                   stdout=subprocess.PIPE, 
-                                   stderr=subprocess.PIPE,
-                                   text=True,
-                                   check=False)
-        
-        return result.returncode == 0
-    except Exception as e:
-        logger.error(f"Error checking Ollama installation: {str(e)}")
-        return False
+# Minimum time between two redraws of a streaming response, in seconds
+STREAM_REFRESH_INTERVAL = 0.05
 
 def initialize_page():
     """Initialize Streamlit page configuration."""
@@ -53,14 +35,34 @@ def initialize_page():
     st.title("🦙 Llama 2 Chatbot")
     st.subheader("A simple chatbot using Langchain and Ollama")
 
+@st.cache_resource
+def get_session_store():
+    """
+    Get the chat session store shared by the browser sessions of this process.
+    
+    Returns:
+        The store, backed by the SQLite database at CHAT_SESSION_DB_PATH if it is set,
+        so that conversations survive restarts.
+    """
+    from src.modules.llm.chat_sessions import ChatSessionStore
+    from src.modules.llm.session_storage import SQLiteSessionStorage
+    db_path = os.getenv(CHAT_SESSION_DB_PATH, "").strip()
+    return ChatSessionStore(max_sessions=100, storage=SQLiteSessionStorage(db_path) if db_path else None)
+
 def initialize_session_state():
     """Initialize the session state for chat history."""
     if "messages" not in st.session_state:
         st.session_state.messages = []
     
     if "llm_service" not in st.session_state:
-        # Check if Ollama is installed
-        if check_ollama_installed():
+        if os.getenv(LLM_BACKEND, "auto").strip().lower() == "simulated":
+            # Offline stand-in for performance testing
+            from src.modules.llm.simulated_service import SimulatedService
+            st.session_state.llm_service = SimulatedService()
+            st.session_state.using_ollama = False
+            logger.info("SimulatedService initialized")
+        # Check if the Ollama server answers
+        elif check_ollama_available():
             try:
                 from src.modules.llm.ollama_service import OllamaService
                 st.session_state.llm_service = OllamaService()
@@ -71,8 +73,20 @@ def initialize_session_state():
                 st.error(f"Failed to initialize Ollama. Falling back to alternative model: {str(e)}")
                 initialize_fallback_service()
         else:
-            st.warning("⚠️ Ollama is not installed or not in your PATH. Falling back to an alternative model.")
+            st.warning("⚠️ Ollama is not running or not reachable. Falling back to an alternative model.")
             initialize_fallback_service()
+    
+    if "chat_chain" not in st.session_state and "llm_service" in st.session_state:
+        # Keep the conversation in a session, so that each turn continues the previous ones.
+        # The session id is in the URL, so reloading the page continues the conversation.
+        store = get_session_store()
+        session_id = st.query_params.get("session") or uuid.uuid4().hex
+        st.query_params["session"] = session_id
+        st.session_state.chat_session_id = session_id
+        st.session_state.chat_chain = st.session_state.llm_service.get_session_chain(store)
+        session = store.get(session_id, create=False)
+        if session is not None and not st.session_state.messages:
+            st.session_state.messages = session.history()
 
 def initialize_fallback_service():
     """Initialize a fallback service when Ollama is not available."""
@@ -100,11 +114,84 @@ def initialize_fallback_service():
         logger.error(f"Failed to initialize fallback service: {str(e)}")
         st.error(f"Failed to initialize any language model service: {str(e)}")
 
+def format_stream_stats(stats: Dict[str, float]) -> str:
+    """
+    Format the streaming statistics of a response for display.
+    
+    Args:
+        stats: The statistics returned by render_stream.
+        
+    Returns:
+        A short caption with the time to first token and the generation speed.
+    """
+    parts = []
+    if "ttft" in stats:
+        parts.append(f"first token {stats['ttft']:.2f}s")
+    if "tokens_per_second" in stats:
+        parts.append(f"{stats['tokens_per_second']:.1f} tokens/s")
+    return " · ".join(parts)
+
+def render_stream(chunks: Iterable[str], placeholder: Any, refresh_interval: float = STREAM_REFRESH_INTERVAL) -> Tuple[str, Dict[str, float]]:
+    """
+    Render a streamed response into a placeholder, redrawing at most once per interval.
+    
+    Args:
+        chunks: The chunks of the response.
+        placeholder: The Streamlit placeholder to render into.
+        refresh_interval: The minimum time between two redraws, in seconds.
+        
+    Returns:
+        The full response text and its statistics: time to first token ("ttft"),
+        total time ("total") and generation speed ("tokens_per_second"). Each
+        streamed chunk is counted as one token.
+    """
+    started = time.perf_counter()
+    first_chunk_at = None
+    last_render = 0.0
+    response = ""
+    chunk_count = 0
+    
+    for chunk in chunks:
+        now = time.perf_counter()
+        if first_chunk_at is None:
+            first_chunk_at = now
+        response += chunk
+        chunk_count += 1
+        if now - last_render >= refresh_interval:
+            placeholder.markdown(response + "▌")
+            last_render = now
+    
+    finished = time.perf_counter()
+    placeholder.markdown(response)
+    
+    stats = {"total": finished - started}
+    if first_chunk_at is not None:
+        stats["ttft"] = first_chunk_at - started
+        generation_time = finished - first_chunk_at
+        if chunk_count > 1 and generation_time > 0:
+            stats["tokens_per_second"] = (chunk_count - 1) / generation_time
+    return response, stats
+
+def stream_chat(prompt: str) -> Iterator[str]:
+    """
+    Stream the response to a message, continuing the conversation of this browser session.
+    
+    Args:
+        prompt: The user's message.
+        
+    Yields:
+        The chunks of the response.
+    """
+    config = {"metadata": {"session_id": st.session_state.chat_session_id}}
+    yield from st.session_state.chat_chain.stream({"input": prompt}, config=config)
+
 def display_chat_history():
     """Display the chat history."""
     for message in st.session_state.messages:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
+            if message.get("stats"):
+                st.caption(format_stream_stats(message["stats"]))
 
 def handle_user_input():
     """Handle user input and generate responses."""
@@ -120,25 +207,24 @@ def handle_user_input():
         with st.chat_message("assistant"):
             message_placeholder = st.empty()
             
-            # Generate response
-            with st.spinner("Thinking..."):
-                try:
-                    if "llm_service" in st.session_state:
-                        response = st.session_state.llm_service.generate_response(prompt)
-                        message_placeholder.markdown(response)
-                        
-                        # Add assistant response to chat history
-                        st.session_state.messages.append({"role": "assistant", "content": response})
-                    else:
-                        error_msg = "No language model service available. Please check the logs."
-                        message_placeholder.error(error_msg)
-                        logger.error(error_msg)
-                        st.session_state.messages.append({"role": "assistant", "content": error_msg})
-                except Exception as e:
-                    error_msg = f"Error generating response: {str(e)}"
+            # Generate response, rendering it as it streams in
+            try:
+                if "chat_chain" in st.session_state:
+                    response, stats = render_stream(stream_chat(prompt), message_placeholder)
+                    st.caption(format_stream_stats(stats))
+                    
+                    # Add assistant response to chat history
+                    st.session_state.messages.append({"role": "assistant", "content": response, "stats": stats})
+                else:
+                    error_msg = "No language model service available. Please check the logs."
                     message_placeholder.error(error_msg)
                     logger.error(error_msg)
                     st.session_state.messages.append({"role": "assistant", "content": error_msg})
+            except Exception as e:
+                error_msg = f"Error generating response: {str(e)}"
+                message_placeholder.error(error_msg)
+                logger.error(error_msg)
+                st.session_state.messages.append({"role": "assistant", "content": error_msg})
 
 def display_instructions():
     """Display usage instructions."""
@@ -0,0 +1,169 @@
+"""
+Token counting for the Llama 2 chatbot.
+
+This module provides a token counter that uses the model's tokenizer when one
+is available locally and a characters-per-token estimate otherwise. Exact counts
+are memoized, and a byte-length upper bound answers most "does this fit" checks
+without tokenizing at all.
+"""
+
+import functools
+import logging
+import math
+from typing import Any, Dict, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+def load_tokenizer(path: str) -> Any:
+    """
+    Load a Hugging Face tokenizer from a local directory or the local cache.
+
+    Args:
+        path: The directory or model name of the tokenizer.
+
+    Returns:
+        The tokenizer, or None if transformers is not installed or the tokenizer
+        cannot be loaded without the network.
+    """
+    try:
+        from transformers import AutoTokenizer
+    except ImportError:
+        logger.warning("transformers is not installed, estimating token counts")
+        return None
+    try:
+        return AutoTokenizer.from_pretrained(path, local_files_only=True)
+    except Exception as e:
+        logger.warning(f"Failed to load the tokenizer from {path}, estimating token counts: {str(e)}")
+        return None
+
+class InputTooLongError(ValueError):
+    """
+    Raised when an input does not fit the model's context window.
+
+    It is defined here rather than with the length limits so that the API can
+    handle it without importing LangChain.
+    """
+
+    def __init__(self, tokens: int, max_tokens: int):
+        """
+        Initialize the error.
+
+        Args:
+            tokens: The number of tokens of the input.
+            max_tokens: The maximum number of input tokens.
+        """
+        super().__init__(f"The input is {tokens} tokens long, the maximum is {max_tokens}")
+        self.tokens = tokens
+        self.max_tokens = max_tokens
+
+class TokenCounter:
+    """
+    Counts the tokens of texts, exactly with a tokenizer or by estimate without one.
+    """
+
+    def __init__(self, tokenizer: Any = None, chars_per_token: float = 4.0, cache_size: int = 4096):
+        """
+        Initialize the counter.
+
+        Args:
+            tokenizer: Optional Hugging Face tokenizer of the model.
+            chars_per_token: The average number of characters per token, used
+                without a tokenizer. Defaults to 4, about right for Llama 2 on English.
+            cache_size: The number of texts whose exact count is memoized. Defaults to 4096.
+        """
+        self.tokenizer = tokenizer
+        self.chars_per_token = chars_per_token
+        self._count_exact = functools.lru_cache(maxsize=cache_size)(self._encode_length)
+
+    @property
+    def exact(self) -> bool:
+        """Whether the counts come from the model's tokenizer."""
+        return self.tokenizer is not None
+
+    def _encode_length(self, text: str) -> int:
+        """Count the tokens of a text with the tokenizer."""
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def count(self, text: str) -> int:
+        """
+        Count the tokens of a text.
+
+        Args:
+            text: The text.
+
+        Returns:
+            The number of tokens, without special tokens.
+        """
+        if not text:
+            return 0
+        if self.tokenizer is None:
+            return math.ceil(len(text) / self.chars_per_token)
+        return self._count_exact(text)
+
+    def upper_bound(self, text: str) -> int:
+        """
+        Get a cheap upper bound of the token count of a text.
+
+        With a tokenizer, every token but a leading word marker covers at least one
+        byte, so the UTF-8 length plus one bounds the count. Without one, the
+        estimate is returned.
+
+        Args:
+            text: The text.
+
+        Returns:
+            A number of tokens that the text does not exceed.
+        """
+        if self.tokenizer is None:
+            return self.count(text)
+        length = len(text) if text.isascii() else len(text.encode("utf-8"))
+        return length + 1
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        Shorten a text to at most a number of tokens, keeping its beginning.
+
+        Args:
+            text: The text.
+            max_tokens: The maximum number of tokens.
+
+        Returns:
+            The text, or its longest prefix within max_tokens.
+        """
+        if self.upper_bound(text) <= max_tokens:
+            return text
+        if self.tokenizer is None:
+            return text[:int(max_tokens * self.chars_per_token)]
+        ids = self.tokenizer.encode(text, add_special_tokens=False)
+        if len(ids) <= max_tokens:
+            return text
+        return self.tokenizer.decode(ids[:max_tokens], skip_special_tokens=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the counter's settings and memoization counters.
+
+        Returns:
+            Whether counts are exact, and the hits, misses and size of the memo.
+        """
+        info = self._count_exact.cache_info()
+        return {
+            "exact": self.exact,
+            "cache_hits": info.hits,
+            "cache_misses": info.misses,
+            "cache_size": info.currsize,
+        }
+
+    @classmethod
+    def from_path(cls, path: Optional[str]) -> "TokenCounter":
+        """
+        Create a counter with the tokenizer at a path, estimating when there is none.
+
+        Args:
+            path: The directory or model name of the tokenizer, or None.
+
+        Returns:
+            The token counter.
+        """
+        return cls(tokenizer=load_tokenizer(path) if path else None)
@@ -0,0 +1,336 @@
+"""
+Load-test benchmark for the /llama API.
+
+This module starts ApiService in-process on a local port with the simulated
+backend (or targets a running server with --url), drives /llama/invoke,
+/llama/batch and /llama/stream at a ladder of concurrency levels and reports
+throughput, latency percentiles, time to first token and error rate as JSON.
+With --baseline, the results are compared with a stored run and regressions
+beyond the tolerance are reported with a non-zero exit code.
+
+Usage:
+    python -m tests.benchmark.load_test --concurrency 1,4,16 --output results.json
+    python -m tests.benchmark.load_test --baseline results.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import platform
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+import httpx
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+ENDPOINTS = ("invoke", "batch", "stream")
+
+def percentile(values: Sequence[float], fraction: float) -> Optional[float]:
+    """
+    Get a percentile with the nearest-rank method.
+
+    Args:
+        values: The observed values.
+        fraction: The percentile as a fraction, e.g. 0.95.
+
+    Returns:
+        The percentile, or None if there are no values.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = min(len(ordered), max(1, math.ceil(fraction * len(ordered))))
+    return ordered[rank - 1]
+
+def summarize(values: Sequence[float]) -> Dict[str, Optional[float]]:
+    """Summarize durations in seconds as milliseconds."""
+    to_ms = lambda value: None if value is None else round(value * 1000, 2)
+    return {
+        "p50": to_ms(percentile(values, 0.50)),
+        "p95": to_ms(percentile(values, 0.95)),
+        "p99": to_ms(percentile(values, 0.99)),
+        "mean": to_ms(sum(values) / len(values)) if values else None,
+    }
+
+class InProcessServer:
+    """
+    ApiService served by uvicorn on a free local port in a background thread.
+    """
+
+    def __init__(self, simulator):
+        """
+        Initialize the server.
+
+        Args:
+            simulator: The SimulatedModel serving the requests.
+        """
+        self.simulator = simulator
+        self.url: Optional[str] = None
+        self._server = None
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "InProcessServer":
+        import uvicorn
+        from src.modules.api.api_service import ApiService
+        from src.modules.llm.simulated_service import SimulatedService
+
+        app = ApiService(llm_service=SimulatedService(self.simulator)).get_app()
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        self._server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, name="benchmark-server", daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            if not self._thread.is_alive():
+                raise RuntimeError("The benchmark server failed to start")
+            time.sleep(0.01)
+        self.url = f"http://127.0.0.1:{port}"
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._server.should_exit = True
+        self._thread.join()
+
+async def _send(client: httpx.AsyncClient, endpoint: str, prompt: str, batch_size: int) -> Optional[float]:
+    """
+    Send one request and return its time to first token.
+
+    Raises:
+        RuntimeError: If the request failed.
+    """
+    started = time.perf_counter()
+    if endpoint == "stream":
+        async with client.stream("POST", "/llama/stream", json={"input": {"input": prompt}}) as response:
+            if response.status_code != 200:
+                raise RuntimeError(f"HTTP {response.status_code}")
+            event = None
+            first_token = None
+            async for line in response.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                    if event == "error":
+                        raise RuntimeError("Stream error event")
+                elif line.startswith("data:") and event == "data" and first_token is None:
+                    first_token = time.perf_counter() - started
+            return first_token
+
+    if endpoint == "batch":
+        body = {"inputs": [{"input": f"{prompt} #{index}"} for index in range(batch_size)]}
+    else:
+        body = {"input": {"input": prompt}}
+    response = await client.post(f"/llama/{endpoint}", json=body)
+    if response.status_code != 200:
+        raise RuntimeError(f"HTTP {response.status_code}")
+    return time.perf_counter() - started
+
+async def run_level(url: str, endpoint: str, concurrency: int, requests: int, batch_size: int, warmup: int) -> Dict[str, Any]:
+    """
+    Drive one endpoint with a closed loop of concurrent clients.
+
+    Args:
+        url: The base URL of the API.
+        endpoint: "invoke", "batch" or "stream".
+        concurrency: The number of concurrent clients.
+        requests: The number of measured requests.
+        batch_size: The number of inputs per batch request.
+        warmup: The number of unmeasured requests sent first.
+
+    Returns:
+        The results of the level.
+    """
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    timeout = httpx.Timeout(120.0, connect=5.0)
+    # Unique prompts and a cache bypass, so that every request reaches the backend
+    headers = {"X-Cache-Control": "bypass"}
+    run_id = f"{endpoint}-{concurrency}-{time.time_ns()}"
+    latencies: List[float] = []
+    ttfts: List[float] = []
+    errors: Dict[str, int] = {}
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout, headers=headers) as client:
+        for index in range(warmup):
+            try:
+                await _send(client, endpoint, f"warmup {run_id} {index}", batch_size)
+            except Exception:
+                pass
+
+        pending = iter(range(requests))
+
+        async def worker() -> None:
+            for index in pending:
+                started = time.perf_counter()
+                try:
+                    ttft = await _send(client, endpoint, f"benchmark {run_id} {index}", batch_size)
+                except Exception as e:
+                    key = str(e) if isinstance(e, RuntimeError) else type(e).__name__
+                    errors[key] = errors.get(key, 0) + 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+                if ttft is not None:
+                    ttfts.append(ttft)
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - started
+
+    items = len(latencies) * (batch_size if endpoint == "batch" else 1)
+    error_count = sum(errors.values())
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": error_count,
+        "error_rate": round(error_count / requests, 4) if requests else 0.0,
+        "error_types": errors,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "items_per_second": round(items / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": summarize(latencies),
+        "ttft_ms": summarize(ttfts),
+    }
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    """
+    Compare results with a baseline run.
+
+    Args:
+        results: The results of this run.
+        baseline: The results of the baseline run.
+        tolerance: The allowed relative degradation, e.g. 0.15 for 15%.
+
+    Returns:
+        A description of every regression, empty if there is none.
+    """
+    reference = {(entry["endpoint"], entry["concurrency"]): entry for entry in baseline}
+    regressions = []
+    for entry in results:
+        base = reference.get((entry["endpoint"], entry["concurrency"]))
+        if base is None:
+            continue
+        label = f"{entry['endpoint']} @ {entry['concurrency']}"
+        if entry["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{label}: throughput {base['throughput_rps']} -> {entry['throughput_rps']} req/s")
+        for metric in ("latency_ms", "ttft_ms"):
+            for key in ("p95", "p99"):
+                before, after = base[metric].get(key), entry[metric].get(key)
+                if before is not None and after is not None and after > before * (1 + tolerance):
+                    regressions.append(f"{label}: {metric} {key} {before} -> {after}")
+        if entry["error_rate"] > base["error_rate"] + 0.01:
+            regressions.append(f"{label}: error rate {base['error_rate']} -> {entry['error_rate']}")
+    return regressions
+
+async def run_benchmark(url: str, endpoints: List[str], levels: List[int], args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """Run every endpoint at every concurrency level."""
+    results = []
+    for endpoint in endpoints:
+        for concurrency in levels:
+            result = await run_level(url, endpoint, concurrency, args.requests, args.batch_size, args.warmup)
+            logger.info(
+                f"{endpoint:>6} c={concurrency:<3} {result['throughput_rps']:>8.2f} req/s  "
+                f"p50={result['latency_ms']['p50']} p95={result['latency_ms']['p95']} "
+                f"p99={result['latency_ms']['p99']} ms  ttft p50={result['ttft_ms']['p50']} ms  "
+                f"errors={result['error_rate']:.1%}"
+            )
+            results.append(result)
+    return results
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse the command line."""
+    parser = argparse.ArgumentParser(description="Load-test the /llama API")
+    parser.add_argument("--url", help="Benchmark a running server instead of an in-process one")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="Comma-separated endpoints")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=50, help="Measured requests per level")
+    parser.add_argument("--warmup", type=int, default=2, help="Unmeasured requests per level")
+    parser.add_argument("--batch-size", type=int, default=4, help="Inputs per /batch request")
+    parser.add_argument("--prefill-ms-per-token", type=float, default=0.5, help="Simulated prompt processing time")
+    parser.add_argument("--decode-tokens-per-second", type=float, default=200.0, help="Simulated generation speed")
+    parser.add_argument("--tokens", type=int, default=32, help="Simulated tokens per response")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="Simulated parallel slots, 0 for unlimited")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Simulated fraction of failed generations")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    parser.add_argument("--baseline", help="Compare with the JSON report of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative degradation")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Run the benchmark from the command line.
+
+    Returns:
+        The exit code: 1 if a regression was found, 0 otherwise.
+    """
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    # Keep per-request logs of the server and the HTTP client out of the report
+    for name in ("httpx", "src"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    endpoints = [endpoint.strip() for endpoint in args.endpoints.split(",") if endpoint.strip()]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        raise SystemExit(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    if args.url:
+        results = asyncio.run(run_benchmark(args.url.rstrip("/"), endpoints, levels, args))
+    else:
+        from src.modules.llm.simulated_backend import SimulatedModel
+
+        simulator = SimulatedModel(
+            prefill_ms_per_token=args.prefill_ms_per_token,
+            decode_tokens_per_second=args.decode_tokens_per_second,
+            output_tokens=args.tokens,
+            max_concurrency=args.max_concurrency,
+            error_rate=args.error_rate,
+        )
+        with InProcessServer(simulator) as server:
+            results = asyncio.run(run_benchmark(server.url, endpoints, levels, args))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "target": args.url or "in-process simulated backend",
+            "settings": {
+                "requests": args.requests,
+                "batch_size": args.batch_size,
+                "prefill_ms_per_token": args.prefill_ms_per_token,
+                "decode_tokens_per_second": args.decode_tokens_per_second,
+                "tokens": args.tokens,
+                "max_concurrency": args.max_concurrency,
+                "error_rate": args.error_rate,
+            },
+        },
+        "results": results,
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+        report["regressions"] = compare(results, baseline, args.tolerance)
+        for regression in report["regressions"]:
+            logger.warning(f"REGRESSION {regression}")
+        exit_code = 1 if report["regressions"] else 0
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
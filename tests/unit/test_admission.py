@@ -0,0 +1,138 @@
+"""
+Unit tests for admission control.
+
+This module contains tests for the AdmissionController and AdmissionMiddleware.
+"""
+
+import asyncio
+import unittest
+from src.modules.api.admission import AdmissionController, AdmissionExpired, AdmissionMiddleware, AdmissionRejected
+from tests.unit.test_response_cache import FakeClock
+
+class TestAdmissionController(unittest.TestCase):
+    """
+    Test cases for the AdmissionController class.
+    """
+
+    def test_queue_then_reject(self):
+        """Test that requests queue for a slot and are rejected once the queue is full."""
+        async def run():
+            controller = AdmissionController(max_concurrency=1, max_queue=1)
+            await controller.acquire()
+            waiting = asyncio.ensure_future(controller.acquire())
+            await asyncio.sleep(0)
+            with self.assertRaises(AdmissionRejected):
+                await controller.acquire()
+            controller.release(2.0)
+            await waiting
+            return controller
+
+        controller = asyncio.run(run())
+
+        self.assertEqual(controller.active, 1)
+        self.assertEqual(controller.admitted, 2)
+        self.assertEqual(controller.rejected, 1)
+
+    def test_retry_after_from_drain_rate(self):
+        """Test that Retry-After is the time needed to drain the queue."""
+        # Arrange
+        controller = AdmissionController(max_concurrency=2, max_queue=10)
+        controller.active = 1
+        controller.release(4.0)
+
+        # Act
+        retry_after = controller.retry_after()
+
+        # Assert
+        self.assertEqual(controller.drain_rate(), 0.5)
+        self.assertEqual(retry_after, 2)
+
+    def test_cancelled_waiter_leaves_queue(self):
+        """Test that a cancelled waiter does not keep its place in the queue."""
+        async def run():
+            controller = AdmissionController(max_concurrency=1, max_queue=1)
+            await controller.acquire()
+            waiting = asyncio.ensure_future(controller.acquire())
+            await asyncio.sleep(0)
+            waiting.cancel()
+            await asyncio.sleep(0)
+            controller.release()
+            return controller
+
+        controller = asyncio.run(run())
+
+        self.assertEqual(controller.queued, 0)
+        self.assertEqual(controller.active, 0)
+
+    def test_waiter_cancelled_before_release_runs(self):
+        """Test that a waiter cancelled just before a release still leaves with CancelledError."""
+        async def run():
+            controller = AdmissionController(max_concurrency=1, max_queue=1)
+            await controller.acquire()
+            waiting = asyncio.ensure_future(controller.acquire())
+            await asyncio.sleep(0)
+            waiting.cancel()
+            # The release skips the cancelled waiter before its task resumes
+            controller.release()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiting
+            return controller
+
+        controller = asyncio.run(run())
+
+        self.assertEqual(controller.abandoned, 1)
+        self.assertEqual(controller.queued, 0)
+        self.assertEqual(controller.active, 0)
+
+    def test_expired_waiter_is_skipped(self):
+        """Test that a freed slot goes past a waiter whose deadline has passed."""
+        async def run():
+            clock = FakeClock()
+            controller = AdmissionController(max_concurrency=1, max_queue=2, clock=clock)
+            await controller.acquire()
+            expiring = asyncio.ensure_future(controller.acquire(deadline=5))
+            waiting = asyncio.ensure_future(controller.acquire(deadline=60))
+            await asyncio.sleep(0)
+            clock.now = 10
+            controller.release()
+            with self.assertRaises(AdmissionExpired):
+                await expiring
+            await waiting
+            with self.assertRaises(AdmissionExpired):
+                await controller.acquire(deadline=5)
+            return controller
+
+        controller = asyncio.run(run())
+
+        self.assertEqual(controller.active, 1)
+        self.assertEqual(controller.admitted, 2)
+        self.assertEqual(controller.expired, 2)
+
+class TestAdmissionMiddleware(unittest.TestCase):
+    """
+    Test cases for the AdmissionMiddleware class.
+    """
+
+    def test_rejection_response(self):
+        """Test that a rejected request gets a 429 with Retry-After."""
+        # Arrange
+        async def app(scope, receive, send):
+            raise AssertionError("The request should not reach the app")
+
+        controller = AdmissionController(max_concurrency=1, max_queue=0)
+        controller.active = 1
+        middleware = AdmissionMiddleware(app, controller)
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        # Act
+        asyncio.run(middleware({"type": "http", "method": "POST", "path": "/llama/invoke"}, None, send))
+
+        # Assert
+        self.assertEqual(messages[0]["status"], 429)
+        self.assertIn((b"retry-after", b"1"), messages[0]["headers"])
+
+if __name__ == '__main__':
+    unittest.main()
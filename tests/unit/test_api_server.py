@@ -0,0 +1,99 @@
+"""
+Unit tests for the API server runner.
+
+This module contains tests for the app factory, the default number of worker
+processes and the split of the admission limits between the workers.
+"""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from src.modules.api import api_server
+
+class TestCreateApp(unittest.TestCase):
+    """
+    Test cases for the create_app factory.
+    """
+
+    @patch("src.modules.api.api_server.ApiService")
+    def test_production_app_initializes_backend_first(self, mock_service):
+        """Test that a production worker initializes its backend before serving."""
+        with patch.dict(os.environ, {"API_RELOAD": "false"}):
+            app = api_server.create_app()
+
+        mock_service.assert_called_once_with(lazy=False, wait_until_warm=True)
+        self.assertIs(app, mock_service.return_value.get_app.return_value)
+
+    @patch("src.modules.api.api_server.ApiService")
+    def test_reload_app_is_lazy(self, mock_service):
+        """Test that the development app keeps the default lazy startup."""
+        with patch.dict(os.environ, {"API_RELOAD": "true"}):
+            api_server.create_app()
+
+        mock_service.assert_called_once_with()
+
+class TestDefaultWorkers(unittest.TestCase):
+    """
+    Test cases for the default_workers function.
+    """
+
+    @patch("src.modules.api.api_server.os.sched_getaffinity", return_value={0, 1, 2, 3}, create=True)
+    def test_one_worker_per_cpu_without_sessions(self, _):
+        """Test that the server runs one worker per CPU when chat sessions are disabled."""
+        with patch.dict(os.environ, {"LLM_BACKEND": "ollama", "CHAT_SESSIONS_ENABLED": "false"}):
+            self.assertEqual(api_server.default_workers(), 4)
+
+    @patch("src.modules.api.api_server.os.sched_getaffinity", return_value={0, 1, 2, 3}, create=True)
+    def test_one_worker_with_sessions_or_huggingface(self, _):
+        """Test that chat sessions, even stored in SQLite, and the Hugging Face backend get one worker."""
+        settings = [
+            {"LLM_BACKEND": "ollama", "CHAT_SESSIONS_ENABLED": "true"},
+            {"LLM_BACKEND": "ollama", "CHAT_SESSIONS_ENABLED": "true", "CHAT_SESSION_DB_PATH": "/tmp/sessions.db"},
+            {"LLM_BACKEND": "huggingface", "CHAT_SESSIONS_ENABLED": "false"},
+        ]
+        for environment in settings:
+            with patch.dict(os.environ, environment):
+                self.assertEqual(api_server.default_workers(), 1, environment)
+
+class TestScaleAdmissionLimits(unittest.TestCase):
+    """
+    Test cases for the scale_admission_limits function.
+    """
+
+    def test_limits_are_split_between_workers(self):
+        """Test that each worker gets its share of the configured or default limits, at least 1."""
+        # Arrange
+        environment = {"ADMISSION_MAX_CONCURRENCY": "6"}
+
+        # Act
+        with patch.dict(os.environ, environment):
+            os.environ.pop("ADMISSION_MAX_QUEUE", None)
+            api_server.scale_admission_limits(4)
+            limits = (os.environ["ADMISSION_MAX_CONCURRENCY"], os.environ["ADMISSION_MAX_QUEUE"])
+            api_server.scale_admission_limits(100)
+            floor = os.environ["ADMISSION_MAX_CONCURRENCY"]
+
+        # Assert
+        self.assertEqual(limits, ("1", "16"))
+        self.assertEqual(floor, "1")
+
+    @patch("src.modules.api.api_server.uvicorn.run")
+    def test_run_server_scales_limits_for_several_workers(self, mock_run):
+        """Test that run_server splits the admission limits when it starts several workers."""
+        with tempfile.TemporaryDirectory() as directory:
+            environment = {
+                "ADMISSION_MAX_CONCURRENCY": "16",
+                "ADMISSION_MAX_QUEUE": "64",
+                "API_RELOAD": "false",
+                "METRICS_MULTIPROC_DIR": directory,
+            }
+            with patch.dict(os.environ, environment):
+                api_server.run_server(workers=4)
+                limits = (os.environ["ADMISSION_MAX_CONCURRENCY"], os.environ["ADMISSION_MAX_QUEUE"])
+
+        self.assertEqual(limits, ("4", "16"))
+        self.assertEqual(mock_run.call_args.kwargs["workers"], 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""
+Unit tests for the async Ollama backend.
+
+This module contains tests for the AsyncOllama LLM and the OllamaClient it uses.
+"""
+
+import asyncio
+import json
+import unittest
+import httpx
+from src.modules.llm.async_ollama import AsyncOllama
+from src.modules.llm.ollama_client import OllamaClient
+
+def ollama_handler(request):
+    """Answer /api/generate like Ollama, echoing the prompt in two chunks."""
+    body = json.loads(request.content)
+    lines = [
+        {"response": "echo: ", "done": False},
+        {"response": body["prompt"], "done": False},
+        {"response": "", "done": True, "eval_count": 2, "options": body.get("options")},
+    ]
+    content = "\n".join(json.dumps(line) for line in lines)
+    return httpx.Response(200, content=content)
+
+class TestAsyncOllama(unittest.TestCase):
+    """
+    Test cases for the AsyncOllama class.
+    """
+
+    def setUp(self):
+        self.client = OllamaClient(transport=httpx.MockTransport(ollama_handler))
+        self.llm = AsyncOllama(model="llama2", client=self.client, temperature=0.1)
+
+    def test_invoke(self):
+        """Test that invoke joins the streamed response."""
+        self.assertEqual(self.llm.invoke("hi"), "echo: hi")
+
+    def test_ainvoke_and_abatch(self):
+        """Test the async entry points."""
+        async def run():
+            single = await self.llm.ainvoke("hi")
+            batch = await self.llm.abatch(["a", "b"])
+            chunks = [chunk async for chunk in self.llm.astream("c")]
+            await self.client.aclose()
+            return single, batch, chunks
+
+        single, batch, chunks = asyncio.run(run())
+
+        self.assertEqual(single, "echo: hi")
+        self.assertEqual(batch, ["echo: a", "echo: b"])
+        self.assertEqual("".join(chunks), "echo: c")
+
+    def test_error_status_raises(self):
+        """Test that an error response from Ollama raises a ValueError."""
+        client = OllamaClient(transport=httpx.MockTransport(
+            lambda request: httpx.Response(404, json={"error": "model not found"})
+        ))
+        llm = AsyncOllama(model="missing", client=client)
+
+        with self.assertRaises(ValueError) as context:
+            llm.invoke("hi")
+        self.assertIn("404", str(context.exception))
+
+    def test_failed_prompt_cancels_the_others(self):
+        """Test that when one prompt of a batch fails, the generations still running are cancelled."""
+        # Arrange
+        cancelled = []
+
+        async def handler(request):
+            if json.loads(request.content)["prompt"] == "bad":
+                return httpx.Response(400, json={"error": "invalid prompt"})
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(request)
+                raise
+
+        llm = AsyncOllama(model="llama2", client=OllamaClient(transport=httpx.MockTransport(handler)))
+
+        # Act
+        async def run():
+            with self.assertRaises(ValueError):
+                await asyncio.wait_for(llm.agenerate(["slow", "bad", "slow"]), timeout=5)
+            # Counted before asyncio.run cancels whatever is left over
+            return len(cancelled)
+
+        stopped = asyncio.run(run())
+
+        # Assert
+        self.assertEqual(stopped, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+"""
+Unit tests for micro-batching.
+
+This module contains tests for the MicroBatcher class.
+"""
+
+import asyncio
+import unittest
+from langchain.schema.runnable import RunnableLambda
+from src.modules.api.batching import MicroBatcher
+from src.modules.api.request_context import RequestContext, _current_request, get_request_context
+
+class RecordingChain(RunnableLambda):
+    """Runnable that records the size of every batch it receives."""
+
+    def __init__(self):
+        super().__init__(lambda value: f"answer to {value['input']}")
+        self.batch_sizes = []
+
+    async def abatch(self, inputs, config=None, **kwargs):
+        self.batch_sizes.append(len(inputs))
+        return await super().abatch(inputs, config, **kwargs)
+
+class TestMicroBatcher(unittest.TestCase):
+    """
+    Test cases for the MicroBatcher class.
+    """
+
+    def test_concurrent_invokes_are_batched(self):
+        """Test that concurrent invokes within the window are sent as one batch."""
+        # Arrange
+        chain = RecordingChain()
+        batcher = MicroBatcher(chain, max_batch_size=8, max_wait_ms=20)
+
+        async def run():
+            return await asyncio.gather(*[batcher.ainvoke({"input": str(i)}) for i in range(3)])
+
+        # Act
+        results = asyncio.run(run())
+
+        # Assert
+        self.assertEqual(results, ["answer to 0", "answer to 1", "answer to 2"])
+        self.assertEqual(chain.batch_sizes, [3])
+        self.assertEqual(batcher.stats()["batch_size"]["count"], 1)
+
+    def test_batch_timings_go_to_each_request(self):
+        """Test that each request records its own batch wait and call, and none of the batch's stages."""
+        # Arrange
+        def answer(value):
+            context = get_request_context()
+            if context is not None:
+                context.add_timing("llm", 1.0)
+            return value["input"]
+
+        batcher = MicroBatcher(RunnableLambda(answer), max_batch_size=8, max_wait_ms=20)
+        contexts = [RequestContext("POST", "/llama/invoke", {}) for _ in range(2)]
+
+        async def request(context, text):
+            _current_request.set(context)
+            return await batcher.ainvoke({"input": text})
+
+        async def run():
+            return await asyncio.gather(*(request(context, str(index)) for index, context in enumerate(contexts)))
+
+        # Act
+        asyncio.run(run())
+
+        # Assert
+        for context in contexts:
+            self.assertEqual(set(context.timings), {"batch", "chain"})
+            self.assertGreater(context.timings["batch"], 0.01)
+
+    def test_full_batch_is_dispatched_immediately(self):
+        """Test that reaching max_batch_size dispatches without waiting for the window."""
+        # Arrange
+        chain = RecordingChain()
+        batcher = MicroBatcher(chain, max_batch_size=2, max_wait_ms=10000)
+
+        async def run():
+            return await asyncio.wait_for(
+                asyncio.gather(*[batcher.ainvoke({"input": str(i)}) for i in range(4)]), 1
+            )
+
+        # Act
+        results = asyncio.run(run())
+
+        # Assert
+        self.assertEqual(len(results), 4)
+        self.assertEqual(chain.batch_sizes, [2, 2])
+
+if __name__ == '__main__':
+    unittest.main()
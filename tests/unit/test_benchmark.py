@@ -0,0 +1,52 @@
+"""
+Unit tests for the load-test benchmark.
+
+This module contains tests for the percentile and baseline comparison helpers.
+"""
+
+import unittest
+from tests.benchmark.load_test import compare, percentile
+
+def result(throughput, p95, error_rate=0.0):
+    """Build a benchmark result entry."""
+    latency = {"p50": p95 / 2, "p95": p95, "p99": p95, "mean": p95 / 2}
+    return {
+        "endpoint": "invoke",
+        "concurrency": 4,
+        "throughput_rps": throughput,
+        "latency_ms": latency,
+        "ttft_ms": latency,
+        "error_rate": error_rate,
+    }
+
+class TestBenchmarkHelpers(unittest.TestCase):
+    """
+    Test cases for the benchmark helpers.
+    """
+
+    def test_percentile(self):
+        """Test nearest-rank percentiles."""
+        values = list(range(1, 101))
+
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertIsNone(percentile([], 0.5))
+
+    def test_compare_within_tolerance(self):
+        """Test that small variations are not reported."""
+        regressions = compare([result(95, 105)], [result(100, 100)], tolerance=0.1)
+
+        self.assertEqual(regressions, [])
+
+    def test_compare_flags_regressions(self):
+        """Test that throughput, latency and error rate regressions are reported."""
+        # Act
+        regressions = compare([result(50, 200, error_rate=0.1)], [result(100, 100)], tolerance=0.1)
+
+        # Assert
+        self.assertTrue(any("throughput" in regression for regression in regressions))
+        self.assertTrue(any("latency_ms p95" in regression for regression in regressions))
+        self.assertTrue(any("error rate" in regression for regression in regressions))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+"""
+Unit tests for the bulk inference CLI.
+
+This module contains tests for running JSONL prompts through a chain, for
+resuming an interrupted run from its results file, and for the failure of a
+single prompt in a batch.
+"""
+
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from src.modules.llm.bulk_inference import main
+from src.modules.llm.length_limits import LengthLimits
+from src.modules.llm.simulated_backend import SimulatedModel
+from src.modules.llm.simulated_service import SimulatedService
+
+class TestBulkInference(unittest.TestCase):
+    """
+    Test cases for the bulk inference CLI.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.input = os.path.join(self.directory.name, "prompts.jsonl")
+        self.output = os.path.join(self.directory.name, "results.jsonl")
+        with open(self.input, "w", encoding="utf-8") as input_file:
+            for index in range(10):
+                input_file.write(json.dumps({"id": f"q{index}", "input": f"question {index}"}) + "\n")
+            input_file.write(json.dumps("a prompt without id") + "\n")
+        simulator = SimulatedModel(prefill_ms_per_token=0, decode_tokens_per_second=0, output_tokens=4)
+        self.service = SimulatedService(simulator=simulator)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _run(self, *args):
+        with patch("src.modules.llm.bulk_inference.create_service", return_value=self.service):
+            return main([self.input, self.output, "--backend", "simulated", *args])
+
+    def _results(self):
+        with open(self.output, encoding="utf-8") as results_file:
+            return [json.loads(line) for line in results_file]
+
+    def test_runs_every_prompt(self):
+        """Test that every prompt gets one result, with batching and concurrency."""
+        # Act
+        exit_code = self._run("--concurrency", "3", "--batch-size", "2")
+
+        # Assert
+        results = self._results()
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(sorted(str(result["id"]) for result in results), sorted([f"q{i}" for i in range(10)] + ["11"]))
+        self.assertTrue(all(len(result["output"].split()) == 4 for result in results))
+
+    def test_resumes_after_interruption(self):
+        """Test that a rerun skips completed prompts and drops a partially written line."""
+        # Arrange
+        with open(self.output, "w", encoding="utf-8") as results_file:
+            results_file.write(json.dumps({"id": "q0", "input": "question 0", "output": "earlier"}) + "\n")
+            results_file.write('{"id": "q1", "inp')
+
+        # Act
+        exit_code = self._run()
+
+        # Assert
+        results = self._results()
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(len(results), 11)
+        self.assertEqual(results[0]["output"], "earlier")
+        self.assertEqual(len({str(result["id"]) for result in results}), 11)
+
+    def test_over_long_prompt_fails_alone(self):
+        """Test that a prompt over the length limit fails without failing the rest of its batch."""
+        # Arrange
+        with open(self.input, "a", encoding="utf-8") as input_file:
+            input_file.write(json.dumps({"id": "long", "input": "word " * 200}) + "\n")
+        self.service = SimulatedService(
+            simulator=SimulatedModel(prefill_ms_per_token=0, decode_tokens_per_second=0, output_tokens=4),
+            length_limits=LengthLimits(max_input_tokens=32),
+        )
+
+        # Act
+        exit_code = self._run("--batch-size", "4")
+
+        # Assert
+        with open(f"{self.output}.errors", encoding="utf-8") as errors_file:
+            errors = [json.loads(line) for line in errors_file]
+        self.assertEqual(exit_code, 1)
+        self.assertEqual(len(self._results()), 11)
+        self.assertEqual([error["id"] for error in errors], ["long"])
+        self.assertTrue(errors[0]["error"].startswith("InputTooLongError"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+"""
+Unit tests for the chat history manager.
+
+This module contains tests for keeping the history of chat sessions within a
+token budget by compacting and summarizing the oldest turns.
+"""
+
+import threading
+import unittest
+from src.modules.llm.chat_history import HistoryManager, estimate_tokens
+from src.modules.llm.chat_sessions import ChatSession, ChatSessionStore
+from src.modules.llm.simulated_backend import SimulatedModel
+from src.modules.llm.simulated_service import SimulatedService
+
+class _Summarizer:
+    """Summarizer that records its prompts and waits to be released."""
+
+    def __init__(self, summary: str = "The user is called Sam."):
+        self.summary = summary
+        self.prompts = []
+        self.release = threading.Event()
+
+    def invoke(self, prompt: str) -> str:
+        self.prompts.append(prompt)
+        self.release.wait(5)
+        return self.summary
+
+def _add_turns(manager: HistoryManager, session: ChatSession, count: int, llm=None) -> None:
+    """Add turns of 10 + 10 tokens to a session, compacting after each one."""
+    for i in range(count):
+        manager.add(session, [("user", f"question {i:02d}".ljust(40)), ("assistant", f"answer {i:02d}".ljust(40))])
+        manager.compact(session, llm)
+
+class TestHistoryManager(unittest.TestCase):
+    """
+    Test cases for the HistoryManager class.
+    """
+
+    def test_compacted_turns_are_summarized_in_background(self):
+        """Test that compacted turns stay in the prompt until the summary replaces them."""
+        # Arrange
+        manager = HistoryManager(max_history_tokens=60)
+        session = ChatSession("a", 0.0)
+        summarizer = _Summarizer()
+
+        # Act
+        _add_turns(manager, session, 4, summarizer)
+        during = manager.prompt_history(session, 1000)
+        summarizer.release.set()
+        manager.wait()
+        after = manager.prompt_history(session, 1000)
+
+        # Assert
+        self.assertEqual(len(session.messages), 2)
+        self.assertEqual(len(during), 8)
+        self.assertIn("question 00", summarizer.prompts[0])
+        self.assertEqual(after[0], ("system", "Summary of the earlier conversation: The user is called Sam."))
+        self.assertEqual(after[1:], session.messages)
+        self.assertEqual(manager.stats()["summaries"], 1)
+
+    def test_prompt_history_fits_budget(self):
+        """Test that the prompt history keeps the most recent messages that fit the budget."""
+        # Arrange
+        manager = HistoryManager(max_history_tokens=1000)
+        session = ChatSession("a", 0.0)
+        _add_turns(manager, session, 5)
+
+        # Act
+        history = manager.prompt_history(session, 50)
+
+        # Assert
+        self.assertEqual(history, session.messages[-3:])
+        used = sum(estimate_tokens(content) + manager.message_overhead_tokens for _, content in history)
+        self.assertLessEqual(used, 50)
+
+    def test_compacted_turns_dropped_without_summarizer(self):
+        """Test that compacted turns are dropped when there is nothing to summarize them."""
+        # Arrange
+        manager = HistoryManager(max_history_tokens=60, summarize=False)
+        session = ChatSession("a", 0.0)
+
+        # Act
+        _add_turns(manager, session, 4, _Summarizer())
+
+        # Assert
+        self.assertEqual(session.pending, [])
+        self.assertIsNone(session.summary)
+        self.assertEqual(manager.stats()["dropped_messages"], 6)
+
+    def test_long_context_falls_back_to_history(self):
+        """Test that a context that would exceed the prompt limit is replaced by the history."""
+        # Arrange
+        store = ChatSessionStore(max_prompt_tokens=120, history=HistoryManager(summarize=False))
+        chain = SimulatedService(SimulatedModel(decode_tokens_per_second=0, output_tokens=60)).get_session_chain(store)
+        config = {"metadata": {"session_id": "a"}}
+
+        # Act
+        chain.invoke({"input": "Tell me about llamas " * 12}, config=config)
+        first_prompt_tokens = store.stats()["prompt_tokens"]
+        chain.invoke({"input": "And alpacas?"}, config=config)
+
+        # Assert
+        stats = store.stats()
+        self.assertEqual(stats["context_resets"], 1)
+        self.assertEqual(stats["context_turns"], 0)
+        self.assertLessEqual(stats["prompt_tokens"] - first_prompt_tokens, 120)
+        self.assertEqual(store.get("a").turns, 2)
+
+if __name__ == '__main__':
+    unittest.main()
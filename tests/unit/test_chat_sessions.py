@@ -0,0 +1,156 @@
+"""
+Unit tests for the chat sessions.
+
+This module contains tests for the ChatSessionStore and for continuing
+conversations with and without the model's context.
+"""
+
+import asyncio
+import unittest
+from typing import Any, List, Optional
+from langchain.llms.base import LLM
+from src.modules.llm.chat_sessions import ChatSessionStore
+from src.modules.llm.length_limits import LengthLimits
+from src.modules.llm.simulated_backend import SimulatedModel
+from src.modules.llm.simulated_service import SimulatedService
+
+class _RecordingLLM(LLM):
+    """LLM without context support that answers "ok" and records its prompts."""
+
+    # Any, so that the configured copies of the LLM record into the same list
+    prompts: Any = None
+    num_predict: Optional[int] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "recording"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        self.prompts.append(prompt)
+        return "ok"
+
+def _config(session_id: str):
+    """Build the config of a call in a session."""
+    return {"metadata": {"session_id": session_id}}
+
+class TestChatSessionStore(unittest.TestCase):
+    """
+    Test cases for the ChatSessionStore class.
+    """
+
+    def test_expiry_and_eviction(self):
+        """Test that idle sessions expire and the least recently used one is evicted."""
+        # Arrange
+        now = [0.0]
+        store = ChatSessionStore(max_sessions=2, idle_seconds=10, clock=lambda: now[0])
+
+        # Act
+        store.get("a")
+        store.get("b")
+        store.get("a")
+        store.get("c")
+        evicted = store.get("b", create=False)
+        now[0] = 20.0
+        expired = store.get("a", create=False)
+
+        # Assert
+        self.assertIsNone(evicted)
+        self.assertIsNone(expired)
+        self.assertEqual(store.stats()["evictions"], 1)
+        self.assertEqual(store.stats()["expirations"], 2)
+
+    def test_context_limit(self):
+        """Test that a context over the limit is dropped while the messages are kept."""
+        # Arrange
+        store = ChatSessionStore(max_context_tokens=3, max_messages=2)
+        session = store.get("a")
+
+        # Act
+        store.record_turn(session, "hi", "hello", {"context": [1, 2]})
+        kept = session.context
+        store.record_turn(session, "more", "sure", {"context": [1, 2, 3, 4]})
+
+        # Assert
+        self.assertEqual(kept, [1, 2])
+        self.assertIsNone(session.context)
+        self.assertEqual(session.history(), [{"role": "user", "content": "more"}, {"role": "assistant", "content": "sure"}])
+        self.assertEqual(store.stats()["context_resets"], 1)
+
+class TestSessionChat(unittest.TestCase):
+    """
+    Test cases for the SessionChatRunnable class.
+    """
+
+    def test_context_reuse(self):
+        """Test that later turns only process the new message."""
+        # Arrange
+        store = ChatSessionStore()
+        service = SimulatedService(SimulatedModel(decode_tokens_per_second=0, output_tokens=4))
+        chain = service.get_session_chain(store)
+        first_message = "Tell me a long story about llamas " * 10
+
+        # Act
+        chain.invoke({"input": first_message}, config=_config("a"))
+        first_prompt_tokens = store.stats()["prompt_tokens"]
+        streamed = list(chain.stream({"input": "And then?"}, config=_config("a")))
+        asyncio.run(chain.ainvoke({"input": "Why?"}, config=_config("a")))
+
+        # Assert
+        stats = store.stats()
+        self.assertEqual(stats["turns"], 3)
+        self.assertEqual(stats["context_turns"], 2)
+        self.assertEqual(stats["prompt_tokens"] - first_prompt_tokens, 4)
+        self.assertGreater(stats["reused_context_tokens"], first_prompt_tokens)
+        history = store.get("a").history()
+        self.assertEqual(len(history), 6)
+        self.assertEqual(history[3]["content"], "".join(streamed))
+
+    def test_history_without_context_support(self):
+        """Test that an LLM without context support gets the history in the prompt."""
+        # Arrange
+        llm = _RecordingLLM(prompts=[])
+        service = SimulatedService()
+        service.llm = llm
+        chain = service.get_session_chain(ChatSessionStore())
+
+        # Act
+        chain.invoke({"input": "My name is Sam"}, config=_config("a"))
+        chain.invoke({"input": "What is my name?"}, config=_config("a"))
+
+        # Assert
+        self.assertIn("Human: My name is Sam\nAI: ok\nHuman: What is my name?", llm.prompts[-1])
+
+    def test_without_session_id(self):
+        """Test that calls without a session id are answered statelessly."""
+        # Arrange
+        store = ChatSessionStore()
+        chain = SimulatedService(SimulatedModel(decode_tokens_per_second=0)).get_session_chain(store)
+
+        # Act
+        response = chain.invoke({"input": "hi"})
+
+        # Assert
+        self.assertTrue(response)
+        self.assertEqual(len(store), 0)
+
+    def test_turns_honour_max_tokens(self):
+        """Test that session turns are capped by the output limit and by the caller's max_tokens."""
+        # Arrange
+        service = SimulatedService(
+            SimulatedModel(decode_tokens_per_second=0, output_tokens=50),
+            length_limits=LengthLimits(max_output_tokens=8),
+        )
+        chain = service.get_session_chain(ChatSessionStore())
+
+        # Act
+        capped = chain.invoke({"input": "hi"}, config=_config("a"))
+        requested = asyncio.run(chain.ainvoke(
+            {"input": "hi again"}, config={**_config("a"), "configurable": {"max_tokens": 3}}
+        ))
+
+        # Assert
+        self.assertEqual(len(capped.split()), 8)
+        self.assertEqual(len(requested.split()), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,8 +4,11 @@ Unit tests for the ChatbotClient class.
 This module contains tests for the ChatbotClient class used in the Streamlit client.
 """
 
+import asyncio
 import unittest
 from unittest.mock import patch, MagicMock
+import httpx
+from src.modules.client.chatbot_client import AsyncChatbotClient
 from src.modules.client.streamlit_client import ChatbotClient
 
 class TestChatbotClient(unittest.TestCase):
@@ -24,7 +27,7 @@ class TestChatbotClient(unittest.TestCase):
         client = ChatbotClient(custom_url)
         self.assertEqual(client.api_url, custom_url)
     
-    @patch('src.modules.client.streamlit_client.requests.post')
+    @patch('src.modules.client.chatbot_client.requests.Session.post')
     def test_send_message_success(self, mock_post):
         """Test that send_message correctly sends requests and handles successful responses."""
         # Arrange
@@ -41,11 +44,12 @@ class TestChatbotClient(unittest.TestCase):
         # Assert
         mock_post.assert_called_once_with(
             "http://localhost:8000/llama/invoke", 
-            json={"input": "Test message"}
+            json={"input": {"input": "Test message"}},
+            timeout=(3.05, 120.0)
         )
         self.assertEqual(response, {"output": "Test response"})
     
-    @patch('src.modules.client.streamlit_client.requests.post')
+    @patch('src.modules.client.chatbot_client.requests.Session.post')
     def test_send_message_error_status(self, mock_post):
         """Test that send_message correctly handles error status codes."""
         # Arrange
@@ -63,7 +67,7 @@ class TestChatbotClient(unittest.TestCase):
         self.assertIn("Error", response)
         self.assertIn("500", response)
     
-    @patch('src.modules.client.streamlit_client.requests.post')
+    @patch('src.modules.client.chatbot_client.requests.Session.post')
     def test_send_message_exception(self, mock_post):
         """Test that send_message correctly handles exceptions during the API call."""
         # Arrange
@@ -79,5 +83,127 @@ class TestChatbotClient(unittest.TestCase):
         self.assertIn("Error connecting to API", response)
         self.assertIn("Connection error", response)
 
+    @patch('src.modules.client.chatbot_client.requests.Session.post')
+    def test_stream_message(self, mock_post):
+        """Test that stream_message yields the data events of the SSE stream."""
+        # Arrange
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.iter_lines.return_value = iter([
+            "event: metadata", 'data: {"run_id": "1"}', "",
+            "event: data", 'data: "Hello"', "",
+            "event: data", 'data: " world"', "",
+            "event: end", "",
+        ])
+        mock_post.return_value = mock_response
+        
+        client = ChatbotClient()
+        
+        # Act
+        chunks = list(client.stream_message("Test message"))
+        
+        # Assert
+        self.assertEqual(chunks, ["Hello", " world"])
+        self.assertEqual(mock_post.call_args[0][0], "http://localhost:8000/llama/stream")
+        self.assertEqual(mock_post.call_args[1]["json"], {"input": {"input": "Test message"}})
+        self.assertIn("ttft", client.last_timings)
+        self.assertIn("total", client.last_timings)
+    
+    @patch('src.modules.client.chatbot_client.requests.Session.post')
+    def test_stream_message_error_event(self, mock_post):
+        """Test that stream_message raises on an error event."""
+        # Arrange
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.iter_lines.return_value = iter([
+            "event: error", 'data: {"status_code": 500, "message": "Internal Server Error"}', "",
+        ])
+        mock_post.return_value = mock_response
+        
+        client = ChatbotClient()
+        
+        # Act / Assert
+        with self.assertRaises(RuntimeError):
+            list(client.stream_message("Test message"))
+
+    @patch('src.modules.client.chatbot_client.requests.Session.post')
+    def test_send_many(self, mock_post):
+        """Test that send_many posts the messages to /batch in chunks."""
+        # Arrange
+        first = MagicMock(status_code=200)
+        first.json.return_value = {"output": ["A", "B"]}
+        second = MagicMock(status_code=200)
+        second.json.return_value = {"output": ["C"]}
+        mock_post.side_effect = [first, second]
+        
+        client = ChatbotClient()
+        
+        # Act
+        outputs = client.send_many(["a", "b", "c"], batch_size=2)
+        
+        # Assert
+        self.assertEqual(outputs, ["A", "B", "C"])
+        self.assertEqual(mock_post.call_args_list[0][0][0], "http://localhost:8000/llama/batch")
+        self.assertEqual(mock_post.call_args_list[1][1]["json"], {"inputs": [{"input": "c"}]})
+    
+    def test_session_retries_only_idempotent_methods(self):
+        """Test that the pooled session retries GET but not POST on read errors."""
+        retry = ChatbotClient().session.get_adapter("http://localhost").max_retries
+        
+        self.assertTrue(retry.is_retry("GET", 503))
+        self.assertFalse(retry.is_retry("POST", 503))
+    
+    @patch('src.modules.client.chatbot_client.requests.Session.get')
+    def test_check_health_uses_server_root(self, mock_get):
+        """Test that the health check calls the root URL of the API server."""
+        ChatbotClient("http://example.com:8000/llama/invoke").check_health()
+        
+        self.assertEqual(mock_get.call_args[0][0], "http://example.com:8000/")
+
+class TestAsyncChatbotClient(unittest.TestCase):
+    """
+    Test cases for the AsyncChatbotClient class.
+    """
+    
+    def test_send_message_retries_connection_errors(self):
+        """Test that a failed connection is retried and the response returned."""
+        # Arrange
+        attempts = []
+        
+        def handler(request):
+            attempts.append(request)
+            if len(attempts) == 1:
+                raise httpx.ConnectError("refused")
+            return httpx.Response(200, json={"output": "Test response"})
+        
+        client = AsyncChatbotClient(backoff_factor=0, transport=httpx.MockTransport(handler))
+        
+        # Act
+        response = asyncio.run(client.send_message("Test message"))
+        
+        # Assert
+        self.assertEqual(response, {"output": "Test response"})
+        self.assertEqual(len(attempts), 2)
+    
+    def test_deadline_header_only_when_set(self):
+        """Test that the deadline header is sent only by clients given a deadline."""
+        # Arrange
+        headers = []
+        
+        def handler(request):
+            headers.append(request.headers.get("X-Request-Timeout"))
+            return httpx.Response(200, json={"output": "Test response"})
+        
+        transport = httpx.MockTransport(handler)
+        
+        # Act
+        asyncio.run(AsyncChatbotClient(transport=transport).send_message("Test message"))
+        asyncio.run(AsyncChatbotClient(transport=transport, deadline=30).send_message("Test message"))
+        
+        # Assert
+        self.assertEqual(headers, [None, "30"])
+        self.assertNotIn("X-Request-Timeout", ChatbotClient().session.headers)
+        self.assertEqual(ChatbotClient(deadline=2.5).session.headers["X-Request-Timeout"], "2.5")
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
@@ -0,0 +1,127 @@
+"""
+Unit tests for request coalescing.
+
+This module contains tests for the CoalescingRunnable class.
+"""
+
+import asyncio
+import unittest
+from langchain.schema.runnable import RunnableGenerator, RunnableLambda
+from src.modules.api.coalescing import CoalescingRunnable
+from src.modules.api.request_context import RequestContext, _current_request, get_request_context
+
+class TestCoalescingRunnable(unittest.TestCase):
+    """
+    Test cases for the CoalescingRunnable class.
+    """
+
+    def test_concurrent_invokes_share_one_call(self):
+        """Test that identical concurrent invokes result in a single backend call."""
+        # Arrange
+        calls = []
+
+        async def answer(value):
+            calls.append(value)
+            await asyncio.sleep(0.05)
+            return f"answer to {value['input']}"
+
+        runnable = CoalescingRunnable(RunnableLambda(answer), {"model": "llama2"})
+
+        async def run():
+            return await asyncio.gather(
+                runnable.ainvoke({"input": "hello"}),
+                runnable.ainvoke({"input": "hello"}),
+                runnable.ainvoke({"input": "other"}),
+            )
+
+        # Act
+        results = asyncio.run(run())
+
+        # Assert
+        self.assertEqual(results, ["answer to hello", "answer to hello", "answer to other"])
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(runnable.stats()["coalesced_invokes"], 1)
+
+    def test_shared_call_timings_go_to_every_waiter(self):
+        """Test that the stages of a shared call are recorded for each request waiting for it."""
+        # Arrange
+        async def answer(value):
+            await asyncio.sleep(0.05)
+            get_request_context().add_timing("llm", 0.05)
+            return "answer"
+
+        runnable = CoalescingRunnable(RunnableLambda(answer), {"model": "llama2"})
+        contexts = [RequestContext("POST", "/llama/invoke", {}) for _ in range(2)]
+
+        async def request(context):
+            _current_request.set(context)
+            return await runnable.ainvoke({"input": "hello"})
+
+        async def run():
+            return await asyncio.gather(*(request(context) for context in contexts))
+
+        # Act
+        asyncio.run(run())
+
+        # Assert
+        self.assertEqual([context.timings for context in contexts], [{"llm": 0.05}, {"llm": 0.05}])
+        self.assertEqual(runnable.stats()["coalesced_invokes"], 1)
+
+    def test_late_stream_joiner_gets_buffered_prefix(self):
+        """Test that a stream joining mid-way receives all chunks, including earlier ones."""
+        # Arrange
+        started = []
+
+        async def tokens(_):
+            started.append(True)
+            for token in ["a", "b", "c", "d"]:
+                yield token
+                await asyncio.sleep(0.02)
+
+        runnable = CoalescingRunnable(RunnableGenerator(tokens), {"model": "llama2"})
+
+        async def consume(delay):
+            await asyncio.sleep(delay)
+            return [chunk async for chunk in runnable.astream({"input": "hello"})]
+
+        async def run():
+            return await asyncio.gather(consume(0), consume(0.03))
+
+        # Act
+        first, late = asyncio.run(run())
+
+        # Assert
+        self.assertEqual("".join(first), "abcd")
+        self.assertEqual("".join(late), "abcd")
+        self.assertEqual(len(started), 1)
+        self.assertEqual(runnable.stats()["coalesced_streams"], 1)
+
+    def test_abandoned_invoke_cancels_backend_call(self):
+        """Test that the backend call is cancelled when every waiter has gone away."""
+        # Arrange
+        cancelled = []
+
+        async def answer(value):
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+            return "late"
+
+        runnable = CoalescingRunnable(RunnableLambda(answer), {"model": "llama2"})
+
+        async def run():
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(runnable.ainvoke({"input": "hello"}), 0.05)
+            await asyncio.sleep(0.01)
+
+        # Act
+        asyncio.run(run())
+
+        # Assert
+        self.assertEqual(cancelled, [True])
+        self.assertEqual(runnable.stats()["in_flight_invokes"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+"""
+Unit tests for request deadlines and cancellation.
+
+This module contains tests for the RequestDeadlines settings and the
+DeadlineMiddleware, which cancels requests on deadline expiry and disconnect.
+"""
+
+import asyncio
+import unittest
+from src.modules.api.deadlines import DeadlineMiddleware, InvalidTimeout, RequestDeadlines
+
+def make_scope(timeout=None):
+    """Build the scope of a generation request, with an X-Request-Timeout header if given."""
+    headers = [(b"x-request-timeout", timeout.encode("latin-1"))] if timeout is not None else []
+    return {"type": "http", "method": "POST", "path": "/llama/invoke", "headers": headers}
+
+class TestRequestDeadlines(unittest.TestCase):
+    """
+    Test cases for the RequestDeadlines class.
+    """
+
+    def test_timeout_is_capped(self):
+        """Test that timeouts default, are capped at the maximum and must be positive."""
+        # Arrange
+        deadlines = RequestDeadlines(default_timeout=None, max_timeout=60)
+
+        # Act / Assert
+        self.assertEqual(deadlines.timeout("2.5"), 2.5)
+        self.assertEqual(deadlines.timeout("3600"), 60)
+        self.assertEqual(deadlines.timeout(None), 60)
+        with self.assertRaises(InvalidTimeout):
+            deadlines.timeout("-1")
+
+class TestDeadlineMiddleware(unittest.TestCase):
+    """
+    Test cases for the DeadlineMiddleware class.
+    """
+
+    def test_expired_request_is_cancelled(self):
+        """Test that a request running past its deadline is cancelled and gets a 504."""
+        # Arrange
+        cancelled = []
+
+        async def app(scope, receive, send):
+            await receive()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        deadlines = RequestDeadlines()
+        middleware = DeadlineMiddleware(app, deadlines)
+        received = []
+        messages = []
+
+        async def receive():
+            received.append(True)
+            if len(received) == 1:
+                return {"type": "http.request", "body": b"{}", "more_body": False}
+            await asyncio.sleep(10)
+
+        async def send(message):
+            messages.append(message)
+
+        # Act
+        asyncio.run(middleware(make_scope("0.05"), receive, send))
+
+        # Assert
+        self.assertEqual(cancelled, [True])
+        self.assertEqual(messages[0]["status"], 504)
+        self.assertEqual(deadlines.stats()["expired"], 1)
+
+    def test_disconnect_cancels_request(self):
+        """Test that a client disconnect cancels the request without a response."""
+        # Arrange
+        cancelled = []
+
+        async def app(scope, receive, send):
+            await receive()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        deadlines = RequestDeadlines()
+        middleware = DeadlineMiddleware(app, deadlines)
+        received = []
+        sent = []
+
+        async def receive():
+            received.append(True)
+            if len(received) == 1:
+                return {"type": "http.request", "body": b"{}", "more_body": False}
+            await asyncio.sleep(0.05)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        # Act
+        asyncio.run(middleware(make_scope(), receive, send))
+
+        # Assert
+        self.assertEqual(cancelled, [True])
+        self.assertEqual(sent, [])
+        self.assertEqual(deadlines.stats()["cancelled_on_disconnect"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
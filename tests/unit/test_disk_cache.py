@@ -0,0 +1,116 @@
+"""
+Unit tests for the disk-backed response cache.
+
+This module contains tests for the DiskResponseCache class: sharing between
+processes and restarts, expiry and size-based compaction, and its use by the
+async paths of CachedRunnable.
+"""
+
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+from langchain.schema.runnable import RunnableLambda
+from src.modules.api.disk_cache import DiskResponseCache
+from src.modules.api.response_cache import CachedRunnable
+from tests.unit.test_response_cache import FakeClock
+
+class TestDiskResponseCache(unittest.TestCase):
+    """
+    Test cases for the DiskResponseCache class.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "responses.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_shared_and_persistent(self):
+        """Test that an entry stored by one cache is read by another, and after a restart."""
+        # Arrange
+        writer = DiskResponseCache(self.path, compaction_seconds=0)
+        reader = DiskResponseCache(self.path, compaction_seconds=0)
+
+        # Act
+        writer.put("a", {"output": "A"})
+        shared = reader.get("a")
+        writer.close()
+        reader.close()
+        restarted = DiskResponseCache(self.path, compaction_seconds=0)
+
+        # Assert
+        self.assertEqual(shared, {"output": "A"})
+        self.assertEqual(restarted.get("a"), {"output": "A"})
+        self.assertEqual(restarted.stats()["hits"], 1)
+        restarted.close()
+
+    def test_ttl_expiry(self):
+        """Test that entries expire after their TTL and are removed by a compaction."""
+        # Arrange
+        clock = FakeClock()
+        cache = DiskResponseCache(self.path, ttl_seconds=10, compaction_seconds=0, clock=clock)
+        cache.put("a", "A")
+
+        # Act
+        clock.now = 11
+        value = cache.get("a")
+        removed = cache.compact()
+
+        # Assert
+        self.assertIsNone(value)
+        self.assertEqual(removed, 1)
+        self.assertEqual(cache.stats()["entries"], 0)
+        cache.close()
+
+    def test_compaction_evicts_least_recently_used(self):
+        """Test that a compaction keeps the most recently used entries within the size cap."""
+        # Arrange
+        clock = FakeClock()
+        cache = DiskResponseCache(self.path, max_bytes=30, ttl_seconds=3600, compaction_seconds=0, clock=clock)
+        for index, key in enumerate("abcd"):
+            clock.now = index * 100
+            cache.put(key, "x" * 8)
+        clock.now = 1000
+        cache.get("a")
+
+        # Act
+        cache.compact()
+
+        # Assert
+        self.assertEqual(cache.get("a"), "x" * 8)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("d"), "x" * 8)
+        self.assertLessEqual(cache.stats()["size_bytes"], 30)
+        self.assertEqual(cache.stats()["evictions"], 2)
+        cache.close()
+
+    def test_async_lookups_run_off_the_event_loop(self):
+        """Test that ainvoke reads and writes the database from another thread than the loop's."""
+        # Arrange
+        cache = DiskResponseCache(self.path, compaction_seconds=0)
+        threads = []
+        get, put = cache.get, cache.put
+        cache.get = lambda key: threads.append(threading.get_ident()) or get(key)
+        cache.put = lambda key, value: threads.append(threading.get_ident()) or put(key, value)
+        runnable = CachedRunnable(RunnableLambda(lambda value: value["input"].upper()), cache, {"model": "llama2"})
+
+        async def scenario():
+            loop_thread = threading.get_ident()
+            outputs = [await runnable.ainvoke({"input": "hi"}), await runnable.ainvoke({"input": "hi"})]
+            return loop_thread, outputs
+
+        # Act
+        loop_thread, outputs = asyncio.run(scenario())
+
+        # Assert
+        self.assertEqual(outputs, ["HI", "HI"])
+        self.assertEqual(len(threads), 3)
+        self.assertNotIn(loop_thread, threads)
+        self.assertEqual(cache.stats()["hits"], 1)
+        cache.close()
+
+if __name__ == '__main__':
+    unittest.main()
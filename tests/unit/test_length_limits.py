@@ -0,0 +1,99 @@
+"""
+Unit tests for the input length admission.
+
+This module contains tests for the LengthLimits checks and for the
+LengthLimitedRunnable in front of the simulated chain.
+"""
+
+import unittest
+from unittest.mock import MagicMock
+from src.modules.llm.length_limits import InputTooLongError, LengthLimitedRunnable, LengthLimits
+from src.modules.llm.simulated_backend import SimulatedModel
+from src.modules.llm.simulated_service import SimulatedService
+
+class TestLengthLimits(unittest.TestCase):
+    """
+    Test cases for the LengthLimits and LengthLimitedRunnable classes.
+    """
+
+    def test_short_input_takes_fast_path(self):
+        """Test that an input well within the window is admitted with the full output budget."""
+        # Arrange
+        bound = MagicMock()
+        limits = LengthLimits(context_window=4096, max_output_tokens=512)
+        runnable = LengthLimitedRunnable(bound, limits, prompt_tokens=100)
+
+        # Act
+        runnable.invoke({"input": "hello"})
+
+        # Assert
+        config = bound.invoke.call_args[0][1]
+        self.assertEqual(config["configurable"]["max_tokens"], 512)
+        self.assertEqual(limits.stats()["fast_path"], 1)
+
+    def test_requested_max_tokens_is_respected(self):
+        """Test that a lower maximum asked for by the caller is kept, and a higher one capped."""
+        # Arrange
+        limits = LengthLimits(context_window=4096, max_output_tokens=512)
+
+        # Act
+        _, lower = limits.check("hello", 100, requested=20)
+        _, higher = limits.check("hello", 100, requested=4000)
+
+        # Assert
+        self.assertEqual(lower, 20)
+        self.assertEqual(higher, 512)
+
+    def test_long_input_is_rejected_or_truncated(self):
+        """Test that an input over the limit is rejected, or truncated when configured."""
+        # Arrange
+        text = "word " * 400
+        rejecting = LengthLimits(context_window=512, max_output_tokens=128, min_output_tokens=128)
+        truncating = LengthLimits(context_window=512, max_output_tokens=128, min_output_tokens=128, truncate=True)
+
+        # Act
+        with self.assertRaises(InputTooLongError) as raised:
+            rejecting.check(text, 64)
+        admitted, max_output = truncating.check(text, 64)
+
+        # Assert
+        self.assertEqual(raised.exception.max_tokens, 320)
+        self.assertEqual(rejecting.stats()["rejected"], 1)
+        self.assertLessEqual(truncating.counter.count(admitted), 320)
+        self.assertEqual(max_output, 128)
+        self.assertEqual(truncating.stats()["truncated"], 1)
+
+    def test_simulated_chain_caps_the_response(self):
+        """Test that the maximum set by the admission reaches the LLM as num_predict."""
+        # Arrange
+        simulator = SimulatedModel(prefill_ms_per_token=0, decode_tokens_per_second=0, output_tokens=64)
+        service = SimulatedService(simulator=simulator, length_limits=LengthLimits(max_output_tokens=5))
+        chain = service.get_chain()
+
+        # Act
+        capped = chain.invoke({"input": "hello"})
+        requested = chain.invoke({"input": "hello"}, {"configurable": {"max_tokens": 3}})
+
+        # Assert
+        self.assertEqual(len(capped.split()), 5)
+        self.assertEqual(len(requested.split()), 3)
+
+    def test_stream_ends_at_stop_sequence(self):
+        """Test that a stream is cut before a stop sequence split across chunks."""
+        # Arrange
+        simulator = SimulatedModel(prefill_ms_per_token=0, decode_tokens_per_second=0, output_tokens=32)
+        chain = SimulatedService(simulator=simulator).get_chain()
+        full = chain.invoke({"input": "hello"})
+        stop = full.split()[4]
+        expected = full[:full.index(stop)]
+
+        # Act
+        chunks = list(chain.stream({"input": "hello"}, {"configurable": {"stop": [stop]}}))
+        invoked = chain.invoke({"input": "hello"}, {"configurable": {"stop": stop}})
+
+        # Assert
+        self.assertEqual("".join(chunks), expected)
+        self.assertEqual(invoked, expected)
+
+if __name__ == '__main__':
+    unittest.main()
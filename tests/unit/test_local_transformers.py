@@ -0,0 +1,162 @@
+"""
+Unit tests for the local transformers backend.
+
+This module contains tests for the length grouping of batched prompts, the
+streaming of the tokens of a batched generation to each request, and the
+scheduler that batches concurrent requests. The generate call is replaced, so
+that neither transformers nor torch is needed.
+"""
+
+import asyncio
+import threading
+import unittest
+from unittest.mock import patch
+from src.modules.llm.local_transformers import (
+    LocalModel,
+    LocalTransformersLLM,
+    _BatchStreamer,
+    _Request,
+    group_by_length,
+)
+
+class FakeTokens:
+    """Stands in for the token tensor passed to a streamer."""
+
+    def __init__(self, values):
+        self.values = values
+
+    def tolist(self):
+        return self.values
+
+class FakeTokenizer:
+    """Decodes token i to the i-th word; token 0 is the end of text."""
+
+    eos_token_id = 0
+    pad_token_id = 0
+
+    def __call__(self, text):
+        return {"input_ids": text.split()}
+
+    def decode(self, tokens, skip_special_tokens=True):
+        return "".join(f"w{token} " for token in tokens)
+
+class FakeGenerate:
+    """Stands in for LocalModel._generate, recording the groups and answering with the prompt."""
+
+    def __init__(self):
+        self.groups = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, requests):
+        self.groups.append([request.prompt for request in requests])
+        self.release.wait(5)
+        for request in requests:
+            if not request.finished:
+                request.emit({"response": request.prompt.upper(), "done": False})
+                request.finish("stop")
+
+def drain(request):
+    """Get the lines delivered to a request, up to its end marker."""
+    lines = []
+    while True:
+        item = request._queue.get_nowait()
+        if item is None:
+            return lines
+        lines.append(item)
+
+class TestGroupByLength(unittest.TestCase):
+    """
+    Test cases for the group_by_length function.
+    """
+
+    def test_groups_similar_lengths(self):
+        """Test that prompts of similar length share a group and distant ones do not."""
+        # Act
+        groups = group_by_length([100, 10, 400, 12, 110, 30], max_padding=0.25, min_padding_tokens=16)
+
+        # Assert
+        self.assertEqual(groups, [[1, 3], [5], [0, 4], [2]])
+
+class TestBatchStreamer(unittest.TestCase):
+    """
+    Test cases for the _BatchStreamer class.
+    """
+
+    def test_streams_each_row_until_its_end(self):
+        """Test that rows finish at the end of text or at their own token limit."""
+        # Arrange
+        short = _Request("a", 3, max_new_tokens=2, temperature=0.0)
+        stopped = _Request("b", 3, max_new_tokens=8, temperature=0.0)
+        open_ended = _Request("c", 3, max_new_tokens=8, temperature=0.0)
+        streamer = _BatchStreamer(FakeTokenizer(), [short, stopped, open_ended])
+
+        # Act
+        streamer.put(FakeTokens([[1, 1, 1], [2, 2, 2], [3, 3, 3]]))
+        for step in ([5, 6, 7], [5, 0, 7], [5, 0, 7]):
+            streamer.put(FakeTokens(step))
+        streamer.end()
+
+        # Assert
+        short_lines, stopped_lines, open_lines = drain(short), drain(stopped), drain(open_ended)
+        self.assertEqual("".join(line["response"] for line in short_lines), "w5 w5 ")
+        self.assertEqual(short_lines[-1]["done_reason"], "length")
+        self.assertEqual("".join(line["response"] for line in stopped_lines), "w6 ")
+        self.assertEqual(stopped_lines[-1]["done_reason"], "stop")
+        self.assertEqual(open_lines[-1]["eval_count"], 3)
+        self.assertEqual(open_lines[-1]["prompt_eval_count"], 3)
+        self.assertTrue(streamer.all_finished)
+
+class TestLocalModelScheduler(unittest.TestCase):
+    """
+    Test cases for the batching scheduler of the LocalModel class.
+    """
+
+    def test_generate_batches_all_prompts(self):
+        """Test that the prompts of one generate call reach the model as one group."""
+        # Arrange
+        fake = FakeGenerate()
+        with patch.object(LocalModel, "_generate", fake):
+            model = LocalModel(None, FakeTokenizer(), max_batch_size=8, max_wait_ms=50)
+            llm = LocalTransformersLLM(local_model=model, temperature=0.0)
+
+            # Act
+            result = llm.generate(["a", "b", "c", "d"])
+
+        # Assert
+        self.assertEqual(fake.groups, [["a", "b", "c", "d"]])
+        self.assertEqual([generation[0].text for generation in result.generations], ["A", "B", "C", "D"])
+
+    def test_cancelled_request_leaves_the_queue(self):
+        """Test that a request whose caller went away is not generated."""
+        # Arrange
+        fake = FakeGenerate()
+        fake.release.clear()
+
+        async def scenario(model):
+            async def read(stream):
+                return [line async for line in stream]
+
+            reading = asyncio.ensure_future(read(model.agenerate("first", temperature=0.0)))
+            await asyncio.sleep(0.1)
+            # Queued while the first batch is running, then abandoned
+            second = asyncio.ensure_future(model.agenerate("second", temperature=0.0).__anext__())
+            await asyncio.sleep(0.05)
+            second.cancel()
+            await asyncio.gather(second, return_exceptions=True)
+            fake.release.set()
+            return await reading
+
+        with patch.object(LocalModel, "_generate", fake):
+            model = LocalModel(None, FakeTokenizer(), max_wait_ms=1)
+
+            # Act
+            lines = asyncio.run(scenario(model))
+
+        # Assert
+        self.assertEqual(fake.groups, [["first"]])
+        self.assertEqual(lines[0]["response"], "FIRST")
+        self.assertEqual(model.stats()["cancelled"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,218 @@
+"""
+Unit tests for the API metrics.
+
+This module contains tests for the metric primitives, their Prometheus
+exposition, their aggregation across worker processes and the generation and
+stage timing callback handlers.
+"""
+
+import asyncio
+import tempfile
+import unittest
+import httpx
+from langchain.prompts import ChatPromptTemplate
+from langchain.schema.output_parser import StrOutputParser
+from src.modules.api.callbacks import GenerationMetricsCallback, StageTimingCallback
+from src.modules.api.instrumentation import ApiMetrics, endpoint_label
+from src.modules.api.metrics import Counter, Gauge, Histogram, MetricsRegistry
+from src.modules.api.request_context import RequestContext, _current_request, format_server_timing
+from src.modules.api.worker_metrics import WorkerMetrics
+from src.modules.llm.async_ollama import AsyncOllama
+from src.modules.llm.ollama_client import OllamaClient
+from tests.unit.test_async_ollama import ollama_handler
+
+class TestMetricsRegistry(unittest.TestCase):
+    """
+    Test cases for the metric primitives and their exposition.
+    """
+
+    def test_expose(self):
+        """Test that counters and histograms are rendered in the Prometheus text format."""
+        # Arrange
+        registry = MetricsRegistry()
+        counter = registry.register(Counter("requests_total", "Requests", ("status",)))
+        histogram = registry.register(Histogram("latency_seconds", "Latency", (0.1, 1.0)))
+        counter.inc(status=200)
+        counter.inc(status=200)
+        counter.inc(status='5"00')
+        histogram.observe(0.05)
+        histogram.observe(5.0)
+
+        # Act
+        text = registry.expose()
+
+        # Assert
+        self.assertIn("# TYPE requests_total counter", text)
+        self.assertIn('requests_total{status="200"} 2', text)
+        self.assertIn('requests_total{status="5\\"00"} 1', text)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 2', text)
+        self.assertIn("latency_seconds_count 2", text)
+
+    def test_duplicate_name_rejected(self):
+        """Test that two metrics cannot share a name."""
+        registry = MetricsRegistry()
+        registry.register(Counter("requests_total", "Requests"))
+
+        with self.assertRaises(ValueError):
+            registry.register(Counter("requests_total", "Requests"))
+
+    def test_endpoint_label(self):
+        """Test that endpoint labels are bounded."""
+        self.assertEqual(endpoint_label("/llama/invoke"), "invoke")
+        self.assertEqual(endpoint_label("/llama/c/abc123/stream"), "stream")
+        self.assertEqual(endpoint_label("/docs"), "other")
+
+class TestWorkerMetrics(unittest.TestCase):
+    """
+    Test cases for the aggregation of metrics across worker processes.
+    """
+
+    def _registry(self):
+        registry = MetricsRegistry()
+        registry.register(Counter("requests_total", "Requests", ("status",)))
+        registry.register(Gauge("in_flight", "In flight"))
+        registry.register(Histogram("latency_seconds", "Latency", (0.1, 1.0)))
+        return registry
+
+    def test_workers_are_added_up(self):
+        """Test that a scrape of one worker reports the sum over all workers."""
+        # Arrange
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        first, second = self._registry(), self._registry()
+        first.get("requests_total").inc(status=200)
+        second.get("requests_total").inc(2, status=200)
+        second.get("requests_total").inc(status=500)
+        first.get("in_flight").set(1)
+        second.get("in_flight").set(2)
+        first.get("latency_seconds").observe(0.05)
+        second.get("latency_seconds").observe(0.5)
+        WorkerMetrics(second, directory.name, worker_id="2").flush()
+
+        # Act
+        text = WorkerMetrics(first, directory.name, worker_id="1").expose()
+
+        # Assert
+        self.assertIn('requests_total{status="200"} 3', text)
+        self.assertIn('requests_total{status="500"} 1', text)
+        self.assertIn("in_flight 3", text)
+        self.assertIn('latency_seconds_bucket{le="1"} 2', text)
+        self.assertIn("latency_seconds_count 2", text)
+
+    def test_exited_worker_keeps_counters_only(self):
+        """Test that a worker that exited still counts, but no longer reports gauges."""
+        # Arrange
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        first, second = self._registry(), self._registry()
+        second.get("requests_total").inc(status=200)
+        second.get("in_flight").set(2)
+        WorkerMetrics(second, directory.name, worker_id="2").flush(alive=False)
+
+        # Act
+        text = WorkerMetrics(first, directory.name, worker_id="1").expose()
+
+        # Assert
+        self.assertIn('requests_total{status="200"} 1', text)
+        self.assertIn("in_flight 0", text)
+
+class TestGenerationMetricsCallback(unittest.TestCase):
+    """
+    Test cases for the GenerationMetricsCallback class.
+    """
+
+    def test_generation_metrics(self):
+        """Test that a generation records its backend, tokens and time to first token."""
+        # Arrange
+        metrics = ApiMetrics()
+        client = OllamaClient(transport=httpx.MockTransport(ollama_handler))
+        llm = AsyncOllama(model="llama2", client=client).with_config(
+            callbacks=[GenerationMetricsCallback(metrics, "ollama")]
+        )
+
+        # Act
+        llm.invoke("hi")
+
+        # Assert
+        self.assertEqual(metrics.generations.value(backend="ollama"), 1)
+        self.assertEqual(metrics.output_tokens.value(backend="ollama"), 2)
+        self.assertEqual(metrics.time_to_first_token.snapshot()["count"], 1)
+        self.assertEqual(metrics.in_flight.value, 0)
+
+    def test_backend_error(self):
+        """Test that a failed generation is counted by error type."""
+        # Arrange
+        metrics = ApiMetrics()
+        client = OllamaClient(transport=httpx.MockTransport(lambda request: httpx.Response(500)))
+        llm = AsyncOllama(model="llama2", client=client).with_config(
+            callbacks=[GenerationMetricsCallback(metrics, "ollama")]
+        )
+
+        # Act
+        with self.assertRaises(ValueError):
+            llm.invoke("hi")
+
+        # Assert
+        self.assertEqual(metrics.backend_errors.value(backend="ollama", error_type="OllamaResponseError"), 1)
+        self.assertEqual(metrics.in_flight.value, 0)
+
+    def test_cancelled_generation_is_not_a_backend_error(self):
+        """Test that a cancelled generation is counted as a cancellation, not as an error."""
+        # Arrange
+        metrics = ApiMetrics()
+
+        async def slow(request):
+            await asyncio.sleep(10)
+
+        client = OllamaClient(transport=httpx.MockTransport(slow))
+        llm = AsyncOllama(model="llama2", client=client).with_config(
+            callbacks=[GenerationMetricsCallback(metrics, "ollama")]
+        )
+
+        async def run():
+            task = asyncio.ensure_future(llm.ainvoke("hi"))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        # Act
+        asyncio.run(run())
+
+        # Assert
+        self.assertEqual(metrics.cancelled_generations.value(backend="ollama"), 1)
+        self.assertNotIn("llama_backend_errors_total{", metrics.expose())
+        self.assertEqual(metrics.in_flight.value, 0)
+
+class TestStageTimingCallback(unittest.TestCase):
+    """
+    Test cases for the StageTimingCallback class.
+    """
+
+    def test_stage_timings(self):
+        """Test that every stage of the chain is timed on the request context."""
+        # Arrange
+        client = OllamaClient(transport=httpx.MockTransport(ollama_handler))
+        chain = (
+            ChatPromptTemplate.from_messages([("human", "{input}")])
+            | AsyncOllama(model="llama2", client=client)
+            | StrOutputParser()
+        ).with_config(callbacks=[StageTimingCallback()])
+        context = RequestContext("POST", "/llama/invoke", {})
+        token = _current_request.set(context)
+
+        # Act
+        try:
+            chain.invoke({"input": "hi"})
+        finally:
+            _current_request.reset(token)
+        timings = context.stage_timings()
+
+        # Assert
+        self.assertEqual(set(timings), {"prompt", "llm", "parse", "chain", "overhead", "total"})
+        self.assertLessEqual(timings["llm"], timings["chain"])
+        self.assertIn("llm;dur=", format_server_timing(timings))
+
+if __name__ == '__main__':
+    unittest.main()
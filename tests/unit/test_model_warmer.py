@@ -0,0 +1,101 @@
+"""
+Unit tests for the model warmer.
+
+This module contains tests for preloading an Ollama model and keeping it
+loaded, against the simulated Ollama server.
+"""
+
+import asyncio
+import unittest
+import httpx
+from src.modules.llm.model_warmer import ModelWarmer, parse_expires_at
+from src.modules.llm.ollama_client import OllamaClient, keep_alive_seconds
+from src.modules.llm.simulated_backend import SimulatedModel, create_app
+
+def _warmer(model: SimulatedModel, **kwargs) -> ModelWarmer:
+    """Create a warmer for a simulated Ollama server."""
+    client = OllamaClient(base_url="http://sim", transport=httpx.ASGITransport(app=create_app(model)))
+    return ModelWarmer(model.model_name, {"http://sim": client}, **kwargs)
+
+class TestModelWarmer(unittest.TestCase):
+    """
+    Test cases for the ModelWarmer class.
+    """
+
+    def test_warm_up_loads_model(self):
+        """Test that warming up loads the model without generating any tokens."""
+        # Arrange
+        model = SimulatedModel(model_name="llama2", load_seconds=0.05)
+        warmer = _warmer(model, keep_alive="30m")
+
+        # Act
+        asyncio.run(warmer.warm_up())
+
+        # Assert
+        self.assertTrue(model.loaded)
+        self.assertTrue(warmer.warm)
+        host = warmer.stats()["hosts"]["http://sim"]
+        self.assertEqual(host["loads"], 1)
+        self.assertGreaterEqual(host["last_load_seconds"], 0.05)
+        self.assertGreater(host["expires_in_seconds"], 1700)
+
+    def test_check_reloads_evicted_model(self):
+        """Test that a model unloaded by the server is loaded again."""
+        # Arrange
+        model = SimulatedModel(model_name="llama2")
+        warmer = _warmer(model, keep_alive="50ms")
+
+        async def run():
+            await warmer.warm_up()
+            await asyncio.sleep(0.1)
+            evicted = model.loaded
+            await warmer.check()
+            return evicted
+
+        # Act
+        evicted = asyncio.run(run())
+
+        # Assert
+        self.assertFalse(evicted)
+        self.assertEqual(warmer.stats()["hosts"]["http://sim"]["loads"], 2)
+
+    def test_check_refreshes_before_expiry(self):
+        """Test that the keep-alive is refreshed only when it expires before the next checks."""
+        # Arrange
+        long_lived = _warmer(SimulatedModel(model_name="llama2"), keep_alive="30m", check_interval=30)
+        expiring = _warmer(SimulatedModel(model_name="llama2"), keep_alive="30s", check_interval=30)
+
+        async def run(warmer):
+            await warmer.warm_up()
+            await warmer.check()
+            return warmer.stats()["hosts"]["http://sim"]["loads"]
+
+        # Act / Assert
+        self.assertEqual(asyncio.run(run(long_lived)), 1)
+        self.assertEqual(asyncio.run(run(expiring)), 2)
+
+    def test_unreachable_host_is_cold(self):
+        """Test that a failed load leaves the host cold with the error recorded."""
+        # Arrange
+        def refuse(request):
+            raise httpx.ConnectError("connection refused", request=request)
+
+        client = OllamaClient(base_url="http://down", transport=httpx.MockTransport(refuse))
+        warmer = ModelWarmer("llama2", {"http://down": client})
+
+        # Act
+        asyncio.run(warmer.warm_up())
+
+        # Assert
+        self.assertFalse(warmer.warm)
+        self.assertIn("connection refused", warmer.stats()["hosts"]["http://down"]["last_error"])
+
+    def test_parse_keep_alive_and_expiry(self):
+        """Test the conversion of keep_alive values and /api/ps dates."""
+        self.assertEqual(keep_alive_seconds("5m", None), 300)
+        self.assertIsNone(keep_alive_seconds(-1, 300.0))
+        self.assertEqual(parse_expires_at("1970-01-01T00:01:00.123456789Z"), 60.123456)
+        self.assertIsNone(parse_expires_at("not a date"))
+
+if __name__ == '__main__':
+    unittest.main()
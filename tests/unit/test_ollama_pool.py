@@ -0,0 +1,164 @@
+"""
+Unit tests for the Ollama host pool.
+
+This module contains tests for OllamaHostPool routing and health tracking, and
+for the failover of RoutedOllama.
+"""
+
+import unittest
+import httpx
+from src.modules.llm.ollama_client import OllamaClient
+from src.modules.llm.ollama_pool import OllamaHostPool, RoutedOllama
+from tests.unit.test_async_ollama import ollama_handler
+
+class FakeClock:
+    """Manually advanced clock for ejection tests."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestOllamaHostPool(unittest.TestCase):
+    """
+    Test cases for the OllamaHostPool class.
+    """
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.pool = OllamaHostPool(
+            ["http://a:11434", "http://b:11434"],
+            max_consecutive_failures=2,
+            error_rate_threshold=1.0,
+            ejection_seconds=10,
+            clock=self.clock,
+        )
+        self.host_a, self.host_b = self.pool.hosts
+
+    def test_least_outstanding(self):
+        """Test that requests go to the host with the fewest outstanding requests."""
+        # Act
+        first = self.pool.acquire()
+        second = self.pool.acquire()
+        self.pool.release(first, 0.1, failed=False)
+        third = self.pool.acquire()
+
+        # Assert
+        self.assertIsNot(first, second)
+        self.assertIs(third, first)
+
+    def test_session_affinity(self):
+        """Test that requests of one session stay on the same host."""
+        # Arrange
+        pinned = self.pool.acquire("session-1")
+
+        # Act
+        again = self.pool.acquire("session-1")
+        other = self.pool.acquire("session-2")
+
+        # Assert
+        self.assertIs(again, pinned)
+        self.assertIsNot(other, pinned)
+
+    def test_ejection_and_probation(self):
+        """Test that a failing host is ejected, re-admitted and ejected for longer on relapse."""
+        # Arrange
+        for _ in range(2):
+            self.pool.release(self.pool.acquire(exclude=[self.host_b]), None, failed=True)
+
+        # Act / Assert
+        self.assertFalse(self.host_a.is_available(self.clock.now))
+        self.assertIs(self.pool.acquire(), self.host_b)
+
+        self.clock.now = 10
+        self.assertTrue(self.host_a.is_available(self.clock.now))
+        self.pool.release(self.pool.acquire(exclude=[self.host_b]), None, failed=True)
+        self.assertEqual(self.host_a.ejected_until, 30)
+
+    def test_fail_open_when_all_ejected(self):
+        """Test that a host is still returned when every host is ejected."""
+        # Arrange
+        for host in self.pool.hosts:
+            for _ in range(2):
+                self.pool.release(self.pool.acquire(exclude=[h for h in self.pool.hosts if h is not host]), None, failed=True)
+
+        # Act
+        host = self.pool.acquire()
+
+        # Assert
+        self.assertIn(host, self.pool.hosts)
+
+class TestRoutedOllama(unittest.TestCase):
+    """
+    Test cases for the RoutedOllama class.
+    """
+
+    def test_failover_before_first_token(self):
+        """Test that a connection error is retried on another host."""
+        # Arrange
+        def down(request):
+            raise httpx.ConnectError("connection refused", request=request)
+
+        transports = {"http://down:11434": down, "http://up:11434": ollama_handler}
+        pool = OllamaHostPool(
+            list(transports),
+            client_factory=lambda url: OllamaClient(base_url=url, transport=httpx.MockTransport(transports[url])),
+        )
+        llm = RoutedOllama(model="llama2", pool=pool)
+
+        # Act
+        results = [llm.invoke("hi") for _ in range(2)]
+
+        # Assert
+        self.assertEqual(results, ["echo: hi", "echo: hi"])
+        stats = {host["base_url"]: host for host in pool.stats()["hosts"]}
+        self.assertGreaterEqual(stats["http://down:11434"]["failures"], 1)
+        self.assertEqual(stats["http://up:11434"]["failures"], 0)
+
+    def test_request_error_does_not_eject_host(self):
+        """Test that a 400 response fails the request without counting against the host."""
+        # Arrange
+        pool = OllamaHostPool(
+            ["http://a:11434"],
+            max_consecutive_failures=1,
+            client_factory=lambda url: OllamaClient(base_url=url, transport=httpx.MockTransport(
+                lambda request: httpx.Response(400, json={"error": "invalid options"})
+            )),
+        )
+        llm = RoutedOllama(model="llama2", pool=pool)
+
+        # Act
+        for _ in range(3):
+            with self.assertRaises(ValueError):
+                llm.invoke("hi")
+
+        # Assert
+        host = pool.stats()["hosts"][0]
+        self.assertTrue(host["available"])
+        self.assertEqual(host["failures"], 0)
+        self.assertEqual(host["outstanding"], 0)
+
+    def test_server_error_counts_as_host_failure(self):
+        """Test that a 5xx response counts against the host and is retried on another one."""
+        # Arrange
+        transports = {
+            "http://broken:11434": lambda request: httpx.Response(503, text="overloaded"),
+            "http://up:11434": ollama_handler,
+        }
+        pool = OllamaHostPool(
+            list(transports),
+            client_factory=lambda url: OllamaClient(base_url=url, transport=httpx.MockTransport(transports[url])),
+        )
+        llm = RoutedOllama(model="llama2", pool=pool)
+
+        # Act
+        results = [llm.invoke("hi") for _ in range(2)]
+
+        # Assert
+        self.assertEqual(results, ["echo: hi", "echo: hi"])
+        stats = {host["base_url"]: host for host in pool.stats()["hosts"]}
+        self.assertGreaterEqual(stats["http://broken:11434"]["failures"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -50,6 +50,23 @@ class TestOllamaService(unittest.TestCase):
         mock_chain.invoke.assert_called_once_with({"input": "Test input"})
         self.assertEqual(response, "Test response")
     
+    @patch('src.modules.llm.ollama_service.Ollama')
+    def test_stream_response(self, mock_ollama):
+        """Test that stream_response yields the chunks streamed by the chain."""
+        # Arrange
+        mock_chain = MagicMock()
+        mock_chain.stream.return_value = iter(["Test", " response"])
+        
+        service = OllamaService()
+        service.chain = mock_chain
+        
+        # Act
+        chunks = list(service.stream_response("Test input"))
+        
+        # Assert
+        mock_chain.stream.assert_called_once_with({"input": "Test input"})
+        self.assertEqual(chunks, ["Test", " response"])
+    
     @patch('src.modules.llm.ollama_service.Ollama')
     def test_get_chain(self, mock_ollama):
         """Test that get_chain returns the chain."""
@@ -0,0 +1,58 @@
+"""
+Unit tests for the sampling profiler.
+
+This module contains tests for the SamplingProfiler class.
+"""
+
+import threading
+import time
+import unittest
+from src.modules.api.profiling import ProfilerBusy, SamplingProfiler
+
+def busy_wait(stop):
+    """Keep a thread running until stop is set."""
+    while not stop.is_set():
+        time.sleep(0.001)
+
+class TestSamplingProfiler(unittest.TestCase):
+    """
+    Test cases for the SamplingProfiler class.
+    """
+
+    def test_collapsed_stacks(self):
+        """Test that the stacks of other threads are sampled in collapsed format."""
+        # Arrange
+        stop = threading.Event()
+        worker = threading.Thread(target=busy_wait, args=(stop,), name="worker")
+        worker.start()
+        profiler = SamplingProfiler(interval=0.001)
+
+        # Act
+        try:
+            stacks = profiler.profile(0.05)
+        finally:
+            stop.set()
+            worker.join()
+
+        # Assert
+        worker_lines = [line for line in stacks.splitlines() if line.startswith("worker;")]
+        self.assertTrue(worker_lines)
+        frames, count = worker_lines[0].rsplit(" ", 1)
+        self.assertIn("busy_wait (", frames)
+        self.assertGreater(int(count), 0)
+
+    def test_one_profile_at_a_time(self):
+        """Test that a second concurrent profile is refused."""
+        # Arrange
+        profiler = SamplingProfiler()
+        running = threading.Thread(target=profiler.profile, args=(0.2,))
+        running.start()
+        time.sleep(0.05)
+
+        # Act / Assert
+        with self.assertRaises(ProfilerBusy):
+            profiler.profile(0.01)
+        running.join()
+
+if __name__ == '__main__':
+    unittest.main()
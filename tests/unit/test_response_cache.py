@@ -0,0 +1,119 @@
+"""
+Unit tests for the response cache.
+
+This module contains tests for the ResponseCache and CachedRunnable classes.
+"""
+
+import asyncio
+import unittest
+from langchain.schema.runnable import RunnableLambda
+from src.modules.api.response_cache import CachedRunnable, ResponseCache, make_cache_key
+
+class FakeClock:
+    """Manually advanced clock for TTL tests."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestResponseCache(unittest.TestCase):
+    """
+    Test cases for the ResponseCache class.
+    """
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted when the cache is full."""
+        # Arrange
+        cache = ResponseCache(max_entries=2)
+        cache.put("a", "A")
+        cache.put("b", "B")
+        cache.get("a")
+
+        # Act
+        cache.put("c", "C")
+
+        # Assert
+        self.assertEqual(cache.get("a"), "A")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_ttl_expiry(self):
+        """Test that entries expire after their TTL."""
+        # Arrange
+        clock = FakeClock()
+        cache = ResponseCache(ttl_seconds=10, clock=clock)
+        cache.put("a", "A")
+
+        # Act
+        clock.now = 11
+
+        # Assert
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["expirations"], 1)
+
+    def test_size_cap(self):
+        """Test that the total size in bytes stays under the cap."""
+        # Arrange
+        cache = ResponseCache(max_bytes=10)
+
+        # Act
+        cache.put("a", "x" * 6)
+        cache.put("b", "y" * 6)
+        stored = cache.put("c", "z" * 11)
+
+        # Assert
+        self.assertFalse(stored)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), "y" * 6)
+        self.assertLessEqual(cache.stats()["size_bytes"], 10)
+
+    def test_key_normalizes_whitespace(self):
+        """Test that prompts differing only in whitespace share a key."""
+        config = {"model": "llama2"}
+        self.assertEqual(
+            make_cache_key({"input": "  What is  Python? "}, config),
+            make_cache_key({"input": "What is Python?"}, config),
+        )
+        self.assertNotEqual(
+            make_cache_key({"input": "What is Python?"}, config),
+            make_cache_key({"input": "What is Python?"}, {"model": "mistral"}),
+        )
+
+class TestCachedRunnable(unittest.TestCase):
+    """
+    Test cases for the CachedRunnable class.
+    """
+
+    def setUp(self):
+        self.calls = []
+
+        def answer(value):
+            self.calls.append(value)
+            return f"answer to {value['input']}"
+
+        self.runnable = CachedRunnable(RunnableLambda(answer), ResponseCache(), {"model": "llama2"})
+
+    def test_invoke_uses_cache(self):
+        """Test that a repeated invoke is answered from the cache."""
+        first = self.runnable.invoke({"input": "hello"})
+        second = self.runnable.invoke({"input": "hello"})
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(self.runnable.cache.stats()["hits"], 1)
+
+    def test_astream_populates_cache(self):
+        """Test that a completed stream is cached for later invokes."""
+        async def consume():
+            return [chunk async for chunk in self.runnable.astream({"input": "hello"})]
+
+        chunks = asyncio.run(consume())
+        output = asyncio.run(self.runnable.ainvoke({"input": "hello"}))
+
+        self.assertEqual("".join(chunks), output)
+        self.assertEqual(len(self.calls), 1)
+
+if __name__ == '__main__':
+    unittest.main()
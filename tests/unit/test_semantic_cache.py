@@ -0,0 +1,116 @@
+"""
+Unit tests for the semantic cache.
+
+This module contains tests for the SemanticCache and SemanticCacheRunnable classes.
+"""
+
+import unittest
+from langchain.schema.runnable import RunnableLambda
+from src.modules.llm.semantic_cache import SemanticCache, SemanticCacheRunnable
+
+VOCABULARY = ["refund", "policy", "shipping", "time", "weather"]
+
+class KeywordEmbeddings:
+    """Embeds text as keyword counts, so that paraphrases get similar vectors."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [[text.lower().count(word) for word in VOCABULARY] for text in texts]
+
+    async def aembed_documents(self, texts):
+        return self.embed_documents(texts)
+
+class TestSemanticCache(unittest.TestCase):
+    """
+    Test cases for the SemanticCache class.
+    """
+
+    def test_paraphrase_hits(self):
+        """Test that a paraphrased prompt returns the cached answer."""
+        # Arrange
+        cache = SemanticCache(KeywordEmbeddings(), similarity_threshold=0.9)
+        cache.add("what's your refund policy", "30 days")
+
+        # Act
+        hit = cache.lookup("What is the refund policy?")
+        miss = cache.lookup("what is the shipping time?")
+
+        # Assert
+        self.assertEqual(hit, "30 days")
+        self.assertIsNone(miss)
+        self.assertEqual(cache.stats()["hit_rate"], 0.5)
+
+    def test_capacity_evicts_least_recently_used(self):
+        """Test that the least recently used entry is replaced when the cache is full."""
+        # Arrange
+        cache = SemanticCache(KeywordEmbeddings(), capacity=2)
+        cache.add("refund", "A")
+        cache.add("shipping", "B")
+        cache.lookup("refund")
+
+        # Act
+        cache.add("weather", "C")
+
+        # Assert
+        self.assertEqual(cache.lookup("refund"), "A")
+        self.assertIsNone(cache.lookup("shipping"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+class TestSemanticCacheRunnable(unittest.TestCase):
+    """
+    Test cases for the SemanticCacheRunnable class.
+    """
+
+    def test_batch_embeds_once_and_generates_misses_only(self):
+        """Test that batch embeds all prompts in one call and only generates the misses."""
+        # Arrange
+        embeddings = KeywordEmbeddings()
+        cache = SemanticCache(embeddings)
+        cache.add("refund policy", "30 days")
+        generated = []
+
+        def answer(value):
+            generated.append(value["input"])
+            return "generated"
+
+        runnable = SemanticCacheRunnable(RunnableLambda(answer), cache)
+        embeddings.calls = 0
+
+        # Act
+        outputs = runnable.batch([{"input": "the refund policy"}, {"input": "weather"}])
+
+        # Assert
+        self.assertEqual(outputs, ["30 days", "generated"])
+        self.assertEqual(generated, ["weather"])
+        self.assertEqual(embeddings.calls, 1)
+
+    def test_answers_are_reused_only_with_the_same_configurable_fields(self):
+        """Test that a call with another max_tokens or stop does not get a cached answer."""
+        # Arrange
+        calls = []
+
+        def answer(value):
+            calls.append(value["input"])
+            return f"answer {len(calls)}"
+
+        runnable = SemanticCacheRunnable(RunnableLambda(answer), SemanticCache(KeywordEmbeddings()))
+        short = {"configurable": {"max_tokens": 16}}
+        stopped = {"configurable": {"max_tokens": 16, "stop": ["\n"]}}
+
+        # Act
+        first = runnable.invoke({"input": "refund policy"}, short)
+        repeated = runnable.invoke({"input": "the refund policy"}, short)
+        longer = runnable.invoke({"input": "refund policy"}, {"configurable": {"max_tokens": 256}})
+        outputs = runnable.batch([{"input": "refund policy"}, {"input": "refund policy"}], [short, stopped])
+
+        # Assert
+        self.assertEqual(first, "answer 1")
+        self.assertEqual(repeated, "answer 1")
+        self.assertEqual(longer, "answer 2")
+        self.assertEqual(outputs, ["answer 1", "answer 3"])
+
+if __name__ == '__main__':
+    unittest.main()
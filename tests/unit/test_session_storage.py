@@ -0,0 +1,116 @@
+"""
+Unit tests for the SQLite session storage.
+
+This module contains tests for paging chat sessions out of memory to SQLite
+and loading them back, across restarts, without blocking the event loop.
+"""
+
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+from src.modules.llm.chat_sessions import ChatSessionStore
+from src.modules.llm.session_storage import SQLiteSessionStorage
+
+class TestSessionStorage(unittest.TestCase):
+    """
+    Test cases for the ChatSessionStore with a SQLiteSessionStorage.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "sessions.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_evicted_session_is_paged_out_and_back(self):
+        """Test that an evicted session is saved and loaded back on its next use."""
+        # Arrange
+        store = ChatSessionStore(max_sessions=1, storage=SQLiteSessionStorage(self.path))
+        store.record_turn(store.get("a"), "My name is Sam", "Hello Sam", {"context": [1, 2, 70000]})
+
+        # Act
+        store.get("b")
+        resident = len(store)
+        session = store.get("a", create=False)
+
+        # Assert
+        self.assertEqual(resident, 1)
+        self.assertIsNotNone(session)
+        self.assertEqual(session.context, [1, 2, 70000])
+        self.assertEqual(session.history()[1], {"role": "assistant", "content": "Hello Sam"})
+        self.assertEqual(session.turns, 1)
+        self.assertEqual(store.stats()["loads"], 1)
+        store.close()
+
+    def test_sessions_survive_restart(self):
+        """Test that the sessions in memory at shutdown are loaded by the next process."""
+        # Arrange
+        store = ChatSessionStore(storage=SQLiteSessionStorage(self.path))
+        store.record_turn(store.get("a"), "hi", "hello")
+
+        # Act
+        store.close()
+        restarted = ChatSessionStore(storage=SQLiteSessionStorage(self.path))
+        session = restarted.get("a", create=False)
+
+        # Assert
+        self.assertEqual([message["content"] for message in session.history()], ["hi", "hello"])
+        self.assertIsNone(session.context)
+        restarted.close()
+
+    def test_async_calls_use_storage_off_the_loop_and_unlocked(self):
+        """Test that the async methods call the storage from a thread, without the store's lock."""
+        # Arrange
+        storage = SQLiteSessionStorage(self.path)
+        store = ChatSessionStore(max_sessions=1, storage=storage)
+        calls = []
+
+        def recording(method):
+            def call(*args):
+                calls.append((threading.get_ident(), store._lock.locked()))
+                return method(*args)
+            return call
+
+        storage.load = recording(storage.load)
+        storage.save = recording(storage.save)
+
+        async def scenario():
+            session = await store.aget("a")
+            await store.arecord_turn(session, "hi", "hello")
+            await store.aget("b")
+            return threading.get_ident(), await store.aget("a", create=False)
+
+        # Act
+        loop_thread, session = asyncio.run(scenario())
+
+        # Assert
+        self.assertEqual(session.history()[0]["content"], "hi")
+        self.assertGreaterEqual(len(calls), 4)
+        self.assertTrue(all(thread != loop_thread and not locked for thread, locked in calls))
+        store.close()
+
+    def test_delete_and_retention(self):
+        """Test that deleted and expired sessions are removed from the storage."""
+        # Arrange
+        now = [0.0]
+        storage = SQLiteSessionStorage(self.path, retention_seconds=100, clock=lambda: now[0])
+        storage.save([{"session_id": "a", "turns": 1}, {"session_id": "b", "turns": 1}])
+
+        # Act
+        deleted = storage.delete("a")
+        now[0] = 200.0
+        expired = storage.load("b")
+        purged = storage.purge()
+
+        # Assert
+        self.assertTrue(deleted)
+        self.assertIsNone(expired)
+        self.assertEqual(purged, 1)
+        self.assertEqual(len(storage), 0)
+        storage.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+"""
+Unit tests for the simulated LLM backend.
+
+This module contains tests for the SimulatedModel, its LangChain LLM and its
+Ollama-compatible HTTP server.
+"""
+
+import asyncio
+import time
+import unittest
+import httpx
+from src.modules.llm.async_ollama import AsyncOllama
+from src.modules.llm.ollama_client import OllamaClient
+from src.modules.llm.simulated_backend import SimulatedLLM, SimulatedModel, SimulationError, create_app
+
+class TestSimulatedModel(unittest.TestCase):
+    """
+    Test cases for the SimulatedModel class.
+    """
+
+    def test_deterministic_answer_and_statistics(self):
+        """Test that a prompt always gets the same answer and Ollama statistics."""
+        # Arrange
+        model = SimulatedModel(decode_tokens_per_second=0, output_tokens=5)
+
+        # Act
+        first = list(model.generate("hello"))
+        second = list(model.generate("hello"))
+
+        # Assert
+        self.assertEqual(
+            [line["response"] for line in first],
+            [line["response"] for line in second],
+        )
+        final = first[-1]
+        self.assertTrue(final["done"])
+        self.assertEqual(final["eval_count"], 5)
+        self.assertEqual(final["prompt_eval_count"], 2)
+
+    def test_timing(self):
+        """Test that load, prefill and decode times add up."""
+        # Arrange
+        model = SimulatedModel(load_seconds=0.05, prefill_ms_per_token=10, decode_tokens_per_second=100, output_tokens=5)
+
+        # Act
+        started = time.perf_counter()
+        list(model.generate("x" * 20))
+        cold = time.perf_counter() - started
+        started = time.perf_counter()
+        list(model.generate("x" * 20))
+        warm = time.perf_counter() - started
+
+        # Assert: 5 prompt tokens at 10 ms, 4 token intervals at 10 ms, plus the load once
+        self.assertGreaterEqual(cold, 0.14)
+        self.assertGreaterEqual(warm, 0.09)
+        self.assertLess(warm, cold - 0.03)
+
+    def test_concurrency_limit(self):
+        """Test that generations beyond the limit wait for a slot."""
+        model = SimulatedModel(prefill_ms_per_token=0, decode_tokens_per_second=50, output_tokens=3, max_concurrency=1)
+
+        async def run():
+            async def generate():
+                return [line async for line in model.agenerate("hi")]
+            started = time.perf_counter()
+            await asyncio.gather(generate(), generate())
+            return time.perf_counter() - started
+
+        self.assertGreaterEqual(asyncio.run(run()), 0.08)
+
+    def test_error_injection(self):
+        """Test that the error rate makes generations fail."""
+        llm = SimulatedLLM(simulator=SimulatedModel(error_rate=1.0))
+
+        with self.assertRaises(SimulationError):
+            llm.invoke("hi")
+
+class TestSimulatedServer(unittest.TestCase):
+    """
+    Test cases for the Ollama-compatible simulated server.
+    """
+
+    def test_async_ollama_against_server(self):
+        """Test that the Ollama backend works against the simulated server."""
+        # Arrange
+        model = SimulatedModel(prefill_ms_per_token=0, decode_tokens_per_second=0, output_tokens=4)
+        client = OllamaClient(transport=httpx.ASGITransport(app=create_app(model)))
+        llm = AsyncOllama(model="llama2", client=client)
+        expected = "".join(model.answer("hi", 4))
+
+        # Act
+        async def run():
+            result = await llm.ainvoke("hi")
+            await client.aclose()
+            return result
+
+        # Assert
+        self.assertEqual(asyncio.run(run()), expected)
+
+    def test_chat_and_errors(self):
+        """Test the non-streaming chat endpoint and an injected error response."""
+        # Arrange
+        model = SimulatedModel(decode_tokens_per_second=0, output_tokens=3)
+        failing = SimulatedModel(error_rate=1.0)
+
+        async def run():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(model)), base_url="http://sim") as client:
+                chat = await client.post("/api/chat", json={
+                    "model": "llama2",
+                    "messages": [{"role": "user", "content": "hi"}],
+                    "stream": False,
+                })
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(failing)), base_url="http://sim") as client:
+                error = await client.post("/api/generate", json={"model": "llama2", "prompt": "hi"})
+            return chat, error
+
+        # Act
+        chat, error = asyncio.run(run())
+
+        # Assert
+        self.assertEqual(chat.status_code, 200)
+        self.assertEqual(chat.json()["message"]["role"], "assistant")
+        self.assertEqual(len(chat.json()["message"]["content"].split()), 3)
+        self.assertEqual(error.status_code, 500)
+        self.assertIn("error", error.json())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+"""
+Unit tests for the fast startup path.
+
+This module contains tests for the startup timer, the readiness middleware,
+the HTTP probe of the Ollama server and the lazy backend initialization.
+"""
+
+import asyncio
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import httpx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from src.modules.api.api_service import ApiService
+from src.modules.api.startup import ReadinessMiddleware, StartupTimer
+from src.modules.llm.backend_detection import check_ollama_available
+from src.modules.llm.simulated_backend import SimulatedModel
+from src.modules.llm.simulated_service import SimulatedService
+
+class _VersionHandler(BaseHTTPRequestHandler):
+    """Answers /api/version like an Ollama server."""
+
+    def do_GET(self):
+        self.send_response(200 if self.path == "/api/version" else 404)
+        self.end_headers()
+        self.wfile.write(b'{"version": "0.1.0"}')
+
+    def log_message(self, *args):
+        pass
+
+class TestStartupTimer(unittest.TestCase):
+    """
+    Test cases for the StartupTimer class.
+    """
+
+    def test_phases_and_milestones(self):
+        """Test that phases are timed and milestones are measured from the start."""
+        # Arrange
+        now = [10.0]
+        timer = StartupTimer(clock=lambda: now[0])
+
+        # Act
+        with timer.phase("imports"):
+            now[0] += 0.25
+        with timer.phase("backend"):
+            now[0] += 0.5
+        timer.mark("backend_ready")
+
+        # Assert
+        self.assertEqual(timer.stats(), {
+            "phases_ms": {"imports": 250.0, "backend": 500.0},
+            "milestones_ms": {"backend_ready": 750.0},
+        })
+
+class TestBackendDetection(unittest.TestCase):
+    """
+    Test cases for the HTTP probe of the Ollama server.
+    """
+
+    def test_probe(self):
+        """Test that a server answering /api/version is detected, and a closed port is not."""
+        # Arrange
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _VersionHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+
+        # Act
+        available = check_ollama_available(url, timeout=1.0)
+        server.shutdown()
+        server.server_close()
+        unavailable = check_ollama_available(url, timeout=0.2)
+
+        # Assert
+        self.assertTrue(available)
+        self.assertFalse(unavailable)
+
+class TestLazyStartup(unittest.TestCase):
+    """
+    Test cases for the lazy backend initialization.
+    """
+
+    def test_readiness_middleware(self):
+        """Test that generation requests get 503 until the backend is ready."""
+        # Arrange
+        ready = [False]
+        app = FastAPI()
+        app.add_api_route("/llama/invoke", lambda: {"output": "hi"}, methods=["POST"])
+        app.add_api_route("/", lambda: {"status": "online"})
+        app.add_middleware(ReadinessMiddleware, is_ready=lambda: ready[0])
+
+        async def run():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://api") as client:
+                health = await client.get("/")
+                starting = await client.post("/llama/invoke")
+                ready[0] = True
+                started = await client.post("/llama/invoke")
+            return health, starting, started
+
+        # Act
+        health, starting, started = asyncio.run(run())
+
+        # Assert
+        self.assertEqual(health.status_code, 200)
+        self.assertEqual(starting.status_code, 503)
+        self.assertEqual(starting.headers["retry-after"], "1")
+        self.assertEqual(started.status_code, 200)
+
+    def test_backend_initialized_in_background(self):
+        """Test that the routes are added after startup and the phases are reported."""
+        # Arrange
+        llm_service = SimulatedService(SimulatedModel(decode_tokens_per_second=0, output_tokens=3))
+        service = ApiService(llm_service=llm_service, lazy=True, timer=StartupTimer())
+
+        # Act
+        with TestClient(service.get_app()) as client:
+            self.assertEqual(client.get("/").status_code, 200)
+            deadline = time.monotonic() + 10
+            while not service.ready and time.monotonic() < deadline:
+                time.sleep(0.01)
+            response = client.post("/llama/invoke", json={"input": {"input": "hi"}})
+            stats = client.get("/startup/stats").json()
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["output"].split()), 3)
+        self.assertTrue(stats["ready"])
+        self.assertEqual(set(stats["phases_ms"]), {"app", "imports", "backend", "routes"})
+        self.assertIn("backend_ready", stats["milestones_ms"])
+
+if __name__ == '__main__':
+    unittest.main()